@@ -1371,6 +1371,19 @@ class Global(APIBase):
         return {'status': doneCode,
                 'statsList': logutils.Suppressed(statsList)}
 
+    @api.logged(on="api.host")
+    def getAllVmStatsDelta(self, since=None):
+        """
+        Get statistics of all running VMs which changed since the report
+        identified by the `since' token.
+        """
+        hooks.before_get_all_vm_stats()
+        statsList = self._cif.getAllVmStats()
+        statsList = hooks.after_get_all_vm_stats(statsList)
+        statsDelta = self._cif.vm_stats_tracker.delta(statsList, since)
+        return {'status': doneCode,
+                'statsDelta': logutils.Suppressed(statsDelta)}
+
     @api.logged(on="api.host")
     def getAllVmIoTunePolicies(self):
         """
@@ -26,6 +26,7 @@ import json
 import logging
 import os
 import six
+import threading
 
 from vdsm import utils
 from vdsm.common.compat import Enum, pickle
@@ -54,6 +55,17 @@ DEFAULT_VALUES = {'{}': {},
 _log_inconsistency = logging.getLogger("schema.inconsistency").debug
 
 
+def _invalid_type(error):
+    """
+    Return a validator for a type which could not be compiled, failing
+    like the verification of the type.
+    """
+    def _verify_invalid_type(value, identifier):
+        raise error
+
+    return _verify_invalid_type
+
+
 class SchemaNotFound(Exception):
     pass
 
@@ -137,6 +149,10 @@ class Schema(object):
         self._strict_mode = strict_mode
         self._methods = {}
         self._types = {}
+        self._lock = threading.RLock()
+        self._validators = {}
+        self._compiling = {}
+        self._compiled_methods = {}
         try:
             for schema_type in schema_types:
                 with io.open(schema_type.path(), 'rb') as f:
@@ -204,12 +220,6 @@ class Schema(object):
     def get_types(self):
         return utils.picklecopy(self._types)
 
-    def _check_primitive_type(self, t, value, name):
-        condition = PRIMITIVE_TYPES.get(t)
-        if not condition(value):
-            self._report_inconsistency('Parameter %s is not %s type'
-                                       % (name, t))
-
     def _report_inconsistency(self, message):
         if self._strict_mode:
             raise JsonRpcInvalidParamsError(message)
@@ -218,150 +228,271 @@ class Schema(object):
 
     def verify_args(self, rep, args):
         try:
+            arg_names, params = self._method_params(rep)
+
             # check whether there are extra parameters
-            unknown_args = [key for key in args if key not in
-                            self.get_arg_names(rep)]
+            unknown_args = [key for key in args if key not in arg_names]
             if unknown_args:
                 self._report_inconsistency('Following parameters %s were not'
                                            ' recognized' % (unknown_args))
 
             # verify types of provided parameters
-            for param in self.get_args(rep):
-                name = param.get('name')
+            for name, optional, verify in params:
                 arg = args.get(name)
                 if arg is None:
                     # check if missing paramter was defined as optional
-                    if 'defaultvalue' not in param:
+                    if not optional:
                         self._report_inconsistency(
                             'Required parameter %s is not '
                             'provided when calling %s' % (name, rep.id))
                     continue
-                self._verify_type(param, arg, rep.id)
+                verify(arg, rep.id)
         except JsonRpcInvalidParamsError:
             raise
         except Exception:
             self._report_inconsistency('Unexpected issue with request type'
                                        ' verification for %s' % rep.id)
 
+    def _method_params(self, rep):
+        """
+        Return the names of the method parameters, and for every parameter
+        its name, whether it is optional, and its validator.
+        """
+        try:
+            return self._compiled_methods[rep.id]
+        except KeyError:
+            params = self.get_args(rep)
+            compiled = (
+                frozenset(param.get('name') for param in params),
+                [(param.get('name'), 'defaultvalue' in param,
+                  self._validator(param))
+                 for param in params])
+            self._compiled_methods[rep.id] = compiled
+            return compiled
+
     def _verify_type(self, param, value, identifier):
+        self._validator(param)(value, identifier)
+
+    # Validators
+    #
+    # Walking the schema for every verified value is slow, so every type
+    # is compiled once into a validator, a function accepting a value and
+    # the identifier of the verified method or event, and reporting the
+    # inconsistencies found in the value.
+    #
+    # Validators are compiled when first used, and cached by the identity
+    # of the type definition. Since types may be recursive, a validator is
+    # cached before compiling the validators of its members.
+    #
+    # The validators names and arguments are used by
+    # SchemaInconsistencyFormatter to report the verification context.
+
+    def _validator(self, param):
+        try:
+            return self._validators[id(param)][1]
+        except KeyError:
+            pass
+
+        with self._lock:
+            try:
+                return self._validators[id(param)][1]
+            except KeyError:
+                pass
+            try:
+                return self._compiling[id(param)][1]
+            except KeyError:
+                pass
+
+            # Validators are published when the outermost compilation is
+            # done, so other threads never use a partly compiled validator.
+            outermost = not self._compiling
+            compiled = []
+
+            def validator(value, identifier):
+                return compiled[0](value, identifier)
+
+            # Keep a reference to param, so its id is not reused.
+            self._compiling[id(param)] = (param, validator)
+            try:
+                check = self._compile_type(param)
+            except Exception as e:
+                check = _invalid_type(e)
+            compiled.append(check)
+            self._compiling[id(param)] = (param, check)
+
+            if outermost:
+                self._validators.update(self._compiling)
+                self._compiling.clear()
+
+            return check
+
+    def _compile_type(self, param):
+        report = self._report_inconsistency
+
         # check whether a parameter is in a list
         if isinstance(param, list):
-            if not isinstance(value, list):
-                self._report_inconsistency('Parameter %s is not a list'
-                                           % (value))
-            for a in value:
-                self._verify_type(param[0], a, identifier)
-            return
+            verify_item = self._validator(param[0])
+
+            def _verify_list(value, identifier):
+                if not isinstance(value, list):
+                    report('Parameter %s is not a list' % (value))
+                for a in value:
+                    verify_item(a, identifier)
+
+            return _verify_list
+
         # check whether a parameter is defined as primitive type
         elif param in TYPE_KEYS:
-            self._check_primitive_type(param, value, param)
-            return
+            return self._compile_primitive_type(param, param)
 
         # get type and name
         name = param.get('name')
         t = param.get('type')
         if t == 'dict':
             # it seems that there is no other way to have it fixed
-            self._report_inconsistency(
-                'Unsupported type %s in %s please fix' % (t, identifier))
+            def _verify_dict(value, identifier):
+                report('Unsupported type %s in %s please fix'
+                       % (t, identifier))
+
+            return _verify_dict
 
         # check whether it is a primitive type
         elif t in TYPE_KEYS:
-            self._check_primitive_type(t, value, name)
+            return self._compile_primitive_type(t, name)
 
-        else:
-            # if type is a string call type verification method
-            if isinstance(t, six.string_types):
-                self._verify_complex_type(t, param, value, name, identifier)
+        # if type is a string compile type verification method
+        elif isinstance(t, six.string_types):
+            return self._compile_complex_type(t, param, name)
+
+        # if type is in a list we need to get the type and compile
+        # type verification method
+        elif isinstance(t, list):
+            verify_item = self._validator(t[0])
 
-            # if type is in a list we need to get the type and call
-            # type verification method
-            elif isinstance(t, list):
+            def _verify_sequence(value, identifier):
                 if not isinstance(value, (list, tuple)):
-                    self._report_inconsistency('Parameter %s is not a sequence'
-                                               % (value))
+                    report('Parameter %s is not a sequence' % (value))
                 for a in value:
-                    self._verify_type(t[0], a, identifier)
-            else:
-                # call complex type verification
-                self._verify_complex_type(t.get('type'), t, value, name,
-                                          identifier)
+                    verify_item(a, identifier)
+
+            return _verify_sequence
+
+        else:
+            # compile complex type verification
+            return self._compile_complex_type(t.get('type'), t, name)
+
+    def _compile_primitive_type(self, t, name):
+        report = self._report_inconsistency
+        condition = PRIMITIVE_TYPES.get(t)
 
-    def _verify_complex_type(self, t_type, t, arg, name, identifier):
+        def _check_primitive_type(value, identifier, t=t):
+            if not condition(value):
+                report('Parameter %s is not %s type' % (name, t))
+
+        return _check_primitive_type
+
+    def _compile_complex_type(self, t_type, t, name):
         """
-        This method verify whether argument value align with different
-        types we support such as: alias, map, union, enum and object.
+        Compile a validator checking whether argument value align with
+        different types we support such as: alias, map, union, enum and
+        object.
         """
+        report = self._report_inconsistency
+
         if t_type == 'alias':
             # if alias we need to check sourcetype
-            self._check_primitive_type(t.get('sourcetype'), arg, name)
+            check_source = self._compile_primitive_type(t.get('sourcetype'),
+                                                        name)
+
+            def _verify_complex_type(arg, identifier, t_type=t_type):
+                check_source(arg, identifier)
+
         elif t_type == 'map':
             # if map we need to check key and value types
-            for key, value in six.iteritems(arg):
-                self._verify_type(t.get('key-type'), key, identifier)
-                self._verify_type(t.get('value-type'), value, identifier)
+            verify_key = self._validator(t.get('key-type'))
+            verify_value = self._validator(t.get('value-type'))
+
+            def _verify_complex_type(arg, identifier, t_type=t_type):
+                for key, value in six.iteritems(arg):
+                    verify_key(key, identifier)
+                    verify_value(value, identifier)
+
         elif t_type == 'union':
             # if union we need to check whether parameter matches on of the
             # values defined
-            for value in t.get('values'):
-                props = value.get('properties')
-                prop_names = [prop.get('name') for prop in props]
-                if not [key for key in arg if key not in prop_names]:
-                    self._verify_complex_type(value.get('type'), value, arg,
-                                              name, identifier)
-                    return
-            self._report_inconsistency('Provided parameters %s do not match'
-                                       ' any of union %s values'
-                                       % (arg, t.get('name')))
+            values = [
+                (frozenset(prop.get('name')
+                           for prop in value.get('properties')),
+                 self._compile_complex_type(value.get('type'), value, name))
+                for value in t.get('values')]
+            union_name = t.get('name')
+
+            def _verify_complex_type(arg, identifier, t_type=t_type):
+                for prop_names, verify_value in values:
+                    if not [key for key in arg if key not in prop_names]:
+                        verify_value(arg, identifier)
+                        return
+                report('Provided parameters %s do not match any of union %s'
+                       ' values' % (arg, union_name))
+
         elif t_type == 'enum':
             # if enum we need to check whether provided parameter is in values
-            if arg not in t.get('values'):
-                self._report_inconsistency('Provided value "%s" not'
-                                           ' defined in %s enum for'
-                                           ' %s' % (arg,
-                                                    t.get('name'),
-                                                    identifier))
+            enum_values = t.get('values')
+            enum_name = t.get('name')
+
+            def _verify_complex_type(arg, identifier, t_type=t_type):
+                if arg not in enum_values:
+                    report('Provided value "%s" not defined in %s enum for'
+                           ' %s' % (arg, enum_name, identifier))
+
         else:
             # if custom time (object) we need to check whether all the
             # properties match values provided
-            self._verify_object_type(t, arg, identifier)
+            return self._compile_object_type(t)
+
+        return _verify_complex_type
 
-    def _verify_object_type(self, t, arg, identifier):
+    def _compile_object_type(self, t):
+        report = self._report_inconsistency
         props = t.get('properties')
-        prop_names = [prop.get('name') for prop in props]
-        # check if there are any extra prarameters
-        unknown_props = [key for key in arg
-                         if key not in prop_names]
-        if unknown_props:
-            if 'any_string' in prop_names:
-                return
-            self._report_inconsistency('Following parameters %s were not'
-                                       ' recognized' % (unknown_props))
-        # iterate over properties
-        for prop in props:
-            p_name = prop.get('name')
-            a = arg.get(p_name)
-
-            # check whether parameter is defined as optional and
-            # check default type
-            if 'defaultvalue' in prop:
-                value = prop.get('defaultvalue')
-                if value == 'needs updating':
-                    self._report_inconsistency(
-                        'No default value specified for %s parameter in'
-                        ' %s' % (p_name, identifier))
-                if value == 'no-default':
-                    continue
-                if a is None or a == value:
-                    continue
-            else:
-                if a is None:
-                    self._report_inconsistency(
-                        'Required property %s is not provided when calling'
-                        ' %s' % (p_name, identifier))
-                    continue
-            # call type verification
-            self._verify_type(prop, a, identifier)
+        prop_names = frozenset(prop.get('name') for prop in props)
+        any_string = 'any_string' in prop_names
+        checks = [(prop.get('name'), 'defaultvalue' in prop,
+                   prop.get('defaultvalue'), self._validator(prop))
+                  for prop in props]
+
+        def _verify_object_type(arg, identifier, t=t):
+            # check if there are any extra prarameters
+            unknown_props = [key for key in arg
+                             if key not in prop_names]
+            if unknown_props:
+                if any_string:
+                    return
+                report('Following parameters %s were not recognized'
+                       % (unknown_props))
+            # iterate over properties
+            for p_name, optional, value, verify in checks:
+                a = arg.get(p_name)
+
+                # check whether parameter is defined as optional and
+                # check default type
+                if optional:
+                    if value == 'needs updating':
+                        report('No default value specified for %s parameter'
+                               ' in %s' % (p_name, identifier))
+                    if value == 'no-default':
+                        continue
+                    if a is None or a == value:
+                        continue
+                else:
+                    if a is None:
+                        report('Required property %s is not provided when'
+                               ' calling %s' % (p_name, identifier))
+                        continue
+                # call type verification
+                verify(a, identifier)
+
+        return _verify_object_type
 
     def verify_retval(self, rep, ret):
         try:
@@ -44,9 +44,11 @@ import vdsm.common.time
 from vdsm.protocoldetector import MultiProtocolAcceptor
 from vdsm.momIF import MomClient
 from vdsm.virt import events
+from vdsm.virt import extendmanager
 from vdsm.virt import migration
 from vdsm.virt import recovery
 from vdsm.virt import secret
+from vdsm.virt import vmstats
 from vdsm.virt import vmstatus
 from vdsm.virt.vmchannels import Listener
 from vdsm.virt.vmdevices.storage import DISK_TYPE
@@ -95,6 +97,9 @@ class clientIF(object):
         if self.irs:
             self._contEIOVmsCB = partial(clientIF.contEIOVms, proxy(self))
             self.irs.registerDomainStateChangeCallback(self._contEIOVmsCB)
+            self.extend_manager = extendmanager.ExtendManager(self.irs)
+        else:
+            self.extend_manager = None
         self.log = log
         self._recovery = True
         # TODO: The guest agent related code spreads around too much. There is
@@ -111,6 +116,7 @@ class clientIF(object):
         self._subscriptions = defaultdict(list)
         self._scheduler = scheduler
         self._unknown_vm_ids = set()
+        self.vm_stats_tracker = vmstats.StatsTracker()
         if _glusterEnabled:
             self.gluster = gapi.GlusterApi()
         else:
@@ -549,12 +555,21 @@ class clientIF(object):
         return {'status': doneCode, 'alignment': aligning}
 
     def createVm(self, vmParams, vmRecover=False):
-        with self.vmContainerLock:
-            if not vmRecover:
-                if vmParams['vmId'] in self.vmContainer:
-                    return errCode['exist']
+        if vmRecover:
+            # Recovered VMs are created concurrently by the recovery workers,
+            # so we take the lock only for adding the VM to the container.
             vm = Vm(self, vmParams, vmRecover)
             ret = vm.run()
+            if not response.is_error(ret):
+                with self.vmContainerLock:
+                    self.vmContainer[vm.id] = vm
+            return ret
+
+        with self.vmContainerLock:
+            if vmParams['vmId'] in self.vmContainer:
+                return errCode['exist']
+            vm = Vm(self, vmParams)
+            ret = vm.run()
             if not response.is_error(ret):
                 self.vmContainer[vm.id] = vm
             return ret
@@ -586,6 +601,7 @@ class clientIF(object):
 
     def _recoverExistingVms(self):
         start_time = vdsm.common.time.monotonic_time()
+        clock = vdsm.common.time.Clock()
         try:
             self.log.debug('recovery: started')
 
@@ -596,10 +612,12 @@ class clientIF(object):
                       numa.cpu_topology().cores)
             migration.SourceThread.ongoingMigrations.bound = mog
 
-            recovery.all_domains(self)
+            with clock.run("domains"):
+                recovery.all_domains(self)
 
             # recover stage 3: waiting for domains to go up
-            self._waitForDomainsUp()
+            with clock.run("domains-up"):
+                self._waitForDomainsUp()
 
             self._recovery = False
 
@@ -607,12 +625,15 @@ class clientIF(object):
             # and then prepare all volumes.
             # Actually, we need it just to get the resources for future
             # volumes manipulations
-            self._waitForStoragePool()
+            with clock.run("storage-pool"):
+                self._waitForStoragePool()
 
-            self._preparePathsForRecoveredVMs()
+            with clock.run("prepare-paths"):
+                self._preparePathsForRecoveredVMs()
 
-            self.log.info('recovery: completed in %is',
-                          vdsm.common.time.monotonic_time() - start_time)
+            self.log.info('recovery: completed in %is %s',
+                          vdsm.common.time.monotonic_time() - start_time,
+                          clock)
 
         except:
             self.log.exception("recovery: failed")
@@ -706,9 +727,11 @@ class clientIF(object):
             time.sleep(5)
 
     def _preparePathsForRecoveredVMs(self):
-        vm_objects = self.vmContainer.values()
+        vm_objects = list(self.vmContainer.values())
         num_vm_objects = len(vm_objects)
-        for idx, vm_obj in enumerate(vm_objects):
+
+        def prepare(item):
+            idx, vm_obj = item
             # Let's recover as much VMs as possible
             try:
                 # Do not prepare volumes when system goes down
@@ -722,6 +745,11 @@ class clientIF(object):
                     "recovery [%d/%d]: failed for vm %s",
                     idx + 1, num_vm_objects, vm_obj.id)
 
+        # Preparing paths accesses storage, and is done concurrently for
+        # the VMs, like the recovery of the domains.
+        concurrent.tmap(prepare, enumerate(vm_objects),
+                        workers=config.getint('vars', 'recovery_workers'))
+
     def _prepare_network_drive(self, drive, res):
         """
         Fills drive object for network drives with network-specific data.
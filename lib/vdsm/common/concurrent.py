@@ -140,19 +140,37 @@ class Barrier(object):
 Result = namedtuple("Result", ["succeeded", "value"])
 
 
-def tmap(func, iterable):
+def tmap(func, iterable, workers=None):
+    """
+    Run func with every argument from iterable in another thread, and return
+    a list of Result tuples, ordered like iterable.
+
+    If workers is a positive number, use at most workers threads, each
+    calling func with the next argument until all arguments were handled.
+    Otherwise use one thread per argument.
+    """
     args = list(iterable)
     results = [None] * len(args)
-
-    def worker(i, f, arg):
-        try:
-            results[i] = Result(True, f(arg))
-        except Exception as e:
-            results[i] = Result(False, e)
+    if workers is None or workers < 1:
+        workers = len(args)
+    items = enumerate(args)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                try:
+                    i, arg = next(items)
+                except StopIteration:
+                    return
+            try:
+                results[i] = Result(True, func(arg))
+            except Exception as e:
+                results[i] = Result(False, e)
 
     threads = []
-    for i, arg in enumerate(args):
-        t = thread(worker, args=(i, func, arg), name="tmap/%d" % i)
+    for i in range(min(workers, len(args))):
+        t = thread(worker, name="tmap/%d" % i)
         t.start()
         threads.append(t)
 
@@ -55,6 +55,7 @@ def get_stats(cif, sample, multipath=False):
         if multipath:
             decStats['multipathHealth'] = cif.irs.multipath_health()
             del decStats['multipathHealth']['status']
+        decStats['volumeExtension'] = cif.extend_manager.stats()
     else:
         decStats['storageDomains'] = {}
 
@@ -32,6 +32,7 @@ _TIMEOUT = config.getint('rpc', 'worker_timeout')
 _THREADS = config.getint('rpc', 'worker_threads')
 _TASK_PER_WORKER = config.getint('rpc', 'tasks_per_worker')
 _TASKS = _THREADS * _TASK_PER_WORKER
+_PARSE_WORKERS = config.getint('rpc', 'parse_workers')
 
 
 class BindingJsonRpc(object):
@@ -46,7 +47,8 @@ class BindingJsonRpc(object):
         self._server = JsonRpcServer(
             bridge, timeout, cif,
             functools.partial(self._executor.dispatch,
-                              timeout=_TIMEOUT, discard=False))
+                              timeout=_TIMEOUT, discard=False),
+            workers=_PARSE_WORKERS)
         self._reactor = StompReactor(subs)
         self.startReactor()
 
@@ -67,9 +69,11 @@ class BindingJsonRpc(object):
     def start(self):
         self._executor.start()
 
-        t = concurrent.thread(self._server.serve_requests,
-                              name='JsonRpcServer')
-        t.start()
+        for worker in range(self._server.workers):
+            t = concurrent.thread(self._server.serve_requests,
+                                  args=(worker,),
+                                  name='JsonRpcServer/%d' % worker)
+            t.start()
 
     def startReactor(self):
         reactorName = self._reactor.__class__.__name__
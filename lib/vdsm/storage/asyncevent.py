@@ -633,6 +633,57 @@ class BufferedReader(asyncore.file_dispatcher):
         return False
 
 
+class LineReader(asyncore.file_dispatcher):
+    """
+    Read lines from file, invoking a callback for each line, until the file
+    is closed.
+    """
+
+    def __init__(self, fd, line_received, closed, bufsize=4096, map=None):
+        asyncore.file_dispatcher.__init__(self, fd, map=map)
+        filecontrol.set_close_on_exec(self._fileno)
+        self._line_received = line_received
+        self._closed = closed
+        self._bufsize = bufsize
+        self._data = b""
+
+    def handle_read(self):
+        chunk = self.socket.read(self._bufsize)
+        if not chunk:
+            self.handle_close()
+            return
+        self._data += chunk
+        while True:
+            line, sep, rest = self._data.partition(b"\n")
+            if not sep:
+                break
+            self._data = rest
+            self._line_received(line)
+
+    def handle_close(self):
+        # Call closed exactly once.
+        if self._closed:
+            closed = self._closed
+            self._closed = None
+            closed()
+        self.close()
+
+    def handle_error(self):
+        log.exception("Unhandled error in %s", self)
+        self.handle_close()
+
+    def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        # Never call closed if closed by the user.
+        self._closed = None
+        asyncore.file_dispatcher.close(self)
+
+    def writable(self):
+        return False
+
+
 class Reaper(object):
     """
     Wait for process and notify when it has terminated.
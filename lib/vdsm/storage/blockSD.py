@@ -39,11 +39,13 @@ from vdsm.common import concurrent
 from vdsm.common import exception
 from vdsm.common import proc
 from vdsm.common.threadlocal import vars
+from vdsm.common.time import monotonic_time
 from vdsm.config import config
 from vdsm import constants
 from vdsm import utils
 from vdsm.storage import blockdev
 from vdsm.storage import blockVolume
+from vdsm.storage import chainindex
 from vdsm.storage import clusterlock
 from vdsm.storage import constants as sc
 from vdsm.storage import directio
@@ -61,6 +63,7 @@ from vdsm.storage import sd
 from vdsm.storage.compat import sanlock
 from vdsm.storage.mailbox import MAILBOX_SIZE
 from vdsm.storage.persistent import PersistentDict, DictValidator
+from vdsm.storage.volumemetadata import VolumeMetadata
 
 import vdsm.common.supervdsm as svdsm
 
@@ -393,6 +396,114 @@ def metadataValidity(vg):
     return {'mdathreshold': mda_free_ok, 'mdavalid': mda_size_ok}
 
 
+class VolumeMetadataSlots(object):
+    """
+    Read volume metadata slots from the domain metadata volume.
+
+    Requested slots are read in process using direct I/O, reading nearby
+    slots using a single read. Slots read are kept for timeout seconds, and
+    must be invalidated when written.
+    """
+    log = logging.getLogger("storage.Metadata.VolumeMetadataSlots")
+
+    # Alignment of reads, supporting devices with 4k logical block size.
+    ALIGNMENT = 4096
+
+    # Maximum size of a single read.
+    MAX_READ = 1024**2
+
+    def __init__(self, path, timeout, clock=monotonic_time):
+        self._path = path
+        self._timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        # slot -> (expires, data)
+        self._slots = {}
+        # Incremented when slots are invalidated, so data read before
+        # invalidation is not cached.
+        self._generation = 0
+
+    def read(self, slots):
+        """
+        Return a dict mapping slot number to slot data.
+        """
+        now = self._clock()
+        result = {}
+        missing = set()
+        with self._lock:
+            generation = self._generation
+            for slot in slots:
+                entry = self._slots.get(slot)
+                if entry is not None and entry[0] > now:
+                    result[slot] = entry[1]
+                else:
+                    missing.add(slot)
+
+        if not missing:
+            return result
+
+        read = {}
+        for group in self._group(sorted(missing)):
+            read.update(self._read_slots(group))
+        result.update(read)
+
+        if self._timeout > 0:
+            expires = self._clock() + self._timeout
+            with self._lock:
+                if generation == self._generation:
+                    for slot, data in six.iteritems(read):
+                        self._slots[slot] = (expires, data)
+
+        return result
+
+    def invalidate(self, slot):
+        with self._lock:
+            self._slots.pop(slot, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._slots.clear()
+            self._generation += 1
+
+    def _group(self, slots):
+        """
+        Split sorted slots to groups that can be read using one read.
+        """
+        max_slots = self.MAX_READ // sc.METADATA_SIZE
+        group = []
+        for slot in slots:
+            if group and slot - group[0] >= max_slots:
+                yield group
+                group = []
+            group.append(slot)
+        if group:
+            yield group
+
+    def _read_slots(self, slots):
+        start = slots[0] * sc.METADATA_SIZE
+        end = (slots[-1] + 1) * sc.METADATA_SIZE
+        offset = start - start % self.ALIGNMENT
+        size = utils.round(end, self.ALIGNMENT) - offset
+        try:
+            with directio.DirectFile(self._path, "r") as f:
+                f.seek(offset)
+                data = f.read(size)
+        except EnvironmentError as e:
+            self.log.error("Error reading %s (offset=%d, size=%d): %s",
+                           self._path, offset, size, e)
+            raise se.MiscBlockReadException(self._path, offset, size)
+        if len(data) < end - offset:
+            raise se.MiscBlockReadIncomplete(self._path, offset, size)
+        self.log.debug("Read %d volume metadata slots from %s (offset=%d, "
+                       "size=%d)", len(slots), self._path, offset, size)
+        result = {}
+        for slot in slots:
+            pos = slot * sc.METADATA_SIZE - offset
+            result[slot] = data[pos:pos + sc.METADATA_SIZE]
+        return result
+
+
 class BlockStorageDomainManifest(sd.StorageDomainManifest):
     # TODO: replace with a property that will compute the value in runtime.
     mountpoint = os.path.join(sc.REPO_MOUNT_DIR, sd.BLOCKSD_DIR)
@@ -410,6 +521,10 @@ class BlockStorageDomainManifest(sd.StorageDomainManifest):
         # BlockStorageDomain. The lock should not be used elsewhere.
         self.metadata_lock = threading.Lock()
 
+        self._volume_metadata = VolumeMetadataSlots(
+            self.metadata_volume_path(),
+            config.getfloat("irs", "block_volume_metadata_cache_timeout"))
+
         try:
             self.logBlkSize = self.getMetaParam(DMDK_LOGBLKSIZE)
             self.phyBlkSize = self.getMetaParam(DMDK_PHYBLKSIZE)
@@ -775,6 +890,24 @@ class BlockStorageDomainManifest(sd.StorageDomainManifest):
         vols, rems = self.getAllVolumesImages()
         return vols
 
+    def getVolumesTree(self, imgUUID):
+        """
+        Overrides StorageDomainManifest method, using the volumes LV tags.
+        """
+        vols = _getVolsTree(self.sdUUID)
+        return {v.name: chainindex.VolumeNode(v.image, v.parent)
+                for v in six.itervalues(vols)
+                if v.image == imgUUID}
+
+    def getImageVolumesStamps(self, imgUUID):
+        """
+        Overrides StorageDomainManifest method, using the volumes LV tags,
+        including the parent tag.
+        """
+        lvs = lvm.lvsByTag(self.sdUUID, sc.TAG_PREFIX_IMAGE + imgUUID)
+        return {lv.name: lv.tags for lv in lvs
+                if sc.TEMP_VOL_LVTAG not in lv.tags}
+
     def getAllImages(self):
         """
         Get the set of all images uuids in the SD.
@@ -808,6 +941,7 @@ class BlockStorageDomainManifest(sd.StorageDomainManifest):
     def refresh(self):
         self.refreshDirTree()
         lvm.invalidateVG(self.sdUUID)
+        self._chains.clear()
         self.replaceMetadata(selectMetadata(self.sdUUID))
 
     _lvTagMetaSlotLock = threading.Lock()
@@ -953,6 +1087,38 @@ class BlockStorageDomainManifest(sd.StorageDomainManifest):
     def metadata_volume_path(self):
         return lvm.lvPath(self.sdUUID, sd.METADATA)
 
+    def read_volume_metadata(self, slots):
+        """
+        Read volume metadata slots using minimal number of reads.
+
+        Returns a dict mapping slot number to slot data.
+        """
+        return self._volume_metadata.read(slots)
+
+    def invalidate_volume_metadata(self, slot):
+        """
+        Must be called after writing volume metadata slot.
+        """
+        self._volume_metadata.invalidate(slot)
+
+    def getVolumesMetadata(self, imgUUID, volUUIDs):
+        """
+        Read the metadata of volumes volUUIDs using minimal number of reads.
+        """
+        slots = {}
+        for volUUID in volUUIDs:
+            slots[volUUID] = int(blockVolume.getVolumeTag(
+                self.sdUUID, volUUID, sc.TAG_PREFIX_MD))
+
+        try:
+            data = self.read_volume_metadata(slots.values())
+        except Exception as e:
+            self.log.error(e, exc_info=True)
+            raise se.VolumeMetadataReadError("%s: %s" % (self.sdUUID, e))
+
+        return {volUUID: VolumeMetadata.from_block(data[slot]).legacy_info()
+                for volUUID, slot in six.iteritems(slots)}
+
 
 class BlockStorageDomain(sd.StorageDomain):
     manifestClass = BlockStorageDomainManifest
@@ -1376,6 +1542,12 @@ class BlockStorageDomain(sd.StorageDomain):
         vgDir = os.path.join("/dev", self.sdUUID)
         return self.createImageLinks(vgDir, imgUUID, volUUIDs)
 
+    def refreshVolumes(self, volUUIDs):
+        """
+        Refresh volumes extended by the SPM, using one lvm command.
+        """
+        lvm.refreshLVs(self.sdUUID, volUUIDs)
+
     def validateMasterMount(self):
         return mount.isMounted(self.getMasterDir())
 
@@ -1640,5 +1812,28 @@ def findDomain(sdUUID):
     return BlockStorageDomain(BlockStorageDomain.findDomainPath(sdUUID))
 
 
+def findDomainPaths(sdUUIDs):
+    """
+    Return dict {sdUUID: vgName} of the domains in sdUUIDs, reading the
+    volume groups using one lvm command.
+    """
+    if not sdUUIDs:
+        return {}
+    paths = {}
+    for vg in lvm.getVGs(list(sdUUIDs)):
+        try:
+            isSD = _isSD(vg)
+        except AttributeError:
+            log.warning("Cannot read vg %s", vg.name)
+            continue
+        if isSD:
+            paths[vg.name] = vg.name
+    return paths
+
+
+def openDomain(vgName):
+    return BlockStorageDomain(vgName)
+
+
 def getStorageDomainsList():
     return [vg.name for vg in lvm.getAllVGs() if _isSD(vg)]
@@ -34,7 +34,6 @@ from vdsm.storage import constants as sc
 from vdsm.storage import directio
 from vdsm.storage import exception as se
 from vdsm.storage import lvm
-from vdsm.storage import misc
 from vdsm.storage import qemuimg
 from vdsm.storage import resourceManager as rm
 from vdsm.storage import task
@@ -104,14 +103,12 @@ class BlockVolumeManifest(volume.VolumeManifest):
         _, offs = metaId
         sd = sdCache.produce_manifest(self.sdUUID)
         try:
-            lines = misc.readblock(sd.metadata_volume_path(),
-                                   offs * sc.METADATA_SIZE,
-                                   sc.METADATA_SIZE)
+            data = sd.read_volume_metadata([offs])[offs]
         except Exception as e:
             self.log.error(e, exc_info=True)
             raise se.VolumeMetadataReadError("%s: %s" % (metaId, e))
 
-        md = VolumeMetadata.from_lines(lines)
+        md = VolumeMetadata.from_block(data)
         return md.legacy_info()
 
     def validateImagePath(self):
@@ -245,9 +242,12 @@ class BlockVolumeManifest(volume.VolumeManifest):
 
         sd = sdCache.produce_manifest(vgname)
         metavol = sd.metadata_volume_path()
-        with directio.DirectFile(metavol, "r+") as f:
-            f.seek(offs * sc.METADATA_SIZE)
-            f.write(data)
+        try:
+            with directio.DirectFile(metavol, "r+") as f:
+                f.seek(offs * sc.METADATA_SIZE)
+                f.write(data)
+        finally:
+            sd.invalidate_volume_metadata(offs)
 
     def changeVolumeTag(self, tagPrefix, uuid):
 
@@ -281,6 +281,9 @@ class BlockVolumeManifest(volume.VolumeManifest):
         LV metadata it may only be performed by an SPM.
         """
         self.changeVolumeTag(sc.TAG_PREFIX_PARENT, puuid)
+        # The image chain is based on the parent tag.
+        sdCache.produce_manifest(self.sdUUID).invalidateImage(
+            self.imgUUID)
 
     def setImage(self, imgUUID):
         """
@@ -0,0 +1,149 @@
+#
+# Copyright 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+"""
+chainindex - index of volume chains in a storage domain
+=======================================================
+
+Finding the chain of an image used to require producing every volume in the
+image to find the leaf, and then reading the parent of every volume in the
+chain. With images with many snapshots this is slow, since every volume
+accesses storage several times.
+
+The index keeps the parent of every volume, grouped by image, so the chain of
+an image can be resolved by walking a dict. An image is loaded on the first
+lookup, using the domain manifest getVolumesTree() method.
+
+Before returning a chain, the index compares the stamps of the image volumes,
+returned by the manifest getImageVolumesStamps() method, with the stamps
+taken when the image was loaded. Getting the stamps is cheaper than reading
+the volumes, and they change when volumes are added or removed, or when the
+parent of a volume is changed, for example by another host. In this case
+the image is reloaded. Operations changing the parent of a volume should
+call invalidate(), in case the stamp did not change yet.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import logging
+import threading
+
+import six
+
+from vdsm.storage import constants as sc
+from vdsm.storage import exception as se
+
+# Volume info returned by manifest getVolumesTree().
+VolumeNode = collections.namedtuple("VolumeNode", "image, parent")
+
+# Image entry in the index.
+# stamps: {volUUID: stamp} returned by getImageVolumesStamps()
+# parents: {volUUID: parentUUID}, not including the template
+_Image = collections.namedtuple("_Image", "stamps, parents")
+
+
+class ChainIndex(object):
+
+    log = logging.getLogger("storage.chainindex")
+
+    def __init__(self, manifest):
+        self._manifest = manifest
+        self._lock = threading.Lock()
+        # {imgUUID: _Image}
+        self._images = {}
+
+    def chain(self, imgUUID, volUUID=None):
+        """
+        Return list of volumes UUIDs in image chain, sorted from base to top,
+        not including the template. The chain ends with volUUID if specified,
+        or with the image leaf volume. If volUUID is the template of the
+        image, return [volUUID].
+        """
+        stamps = self._manifest.getImageVolumesStamps(imgUUID)
+        if not stamps:
+            if volUUID:
+                raise se.VolumeDoesNotExist(volUUID)
+            raise se.ImageDoesNotExistInSD(imgUUID, self._manifest.sdUUID)
+
+        with self._lock:
+            image = self._images.get(imgUUID)
+            if image is None or image.stamps != stamps:
+                image = _Image(stamps, self._loadImage(imgUUID))
+                self._images[imgUUID] = image
+
+        return self._walk(imgUUID, image.parents, volUUID)
+
+    def invalidate(self, imgUUID):
+        """
+        Must be called after changing the parent of a volume in imgUUID.
+        """
+        with self._lock:
+            self._images.pop(imgUUID, None)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+
+    def _loadImage(self, imgUUID):
+        self.log.debug("Loading volume chain for image %s/%s",
+                       self._manifest.sdUUID, imgUUID)
+        tree = self._manifest.getVolumesTree(imgUUID)
+        return {volUUID: node.parent for volUUID, node in six.iteritems(tree)
+                if node.image == imgUUID}
+
+    def _walk(self, imgUUID, parents, volUUID):
+        if volUUID is None:
+            children = set(six.itervalues(parents))
+            leaves = [v for v in parents if v not in children]
+            if len(leaves) != 1:
+                self.log.error("Image %s has invalid leaves %s",
+                               imgUUID, leaves)
+                raise se.ImageIsNotLegalChain(imgUUID)
+            volUUID = leaves[0]
+        elif volUUID not in parents:
+            if volUUID in _templates(parents):
+                return [volUUID]
+            raise se.VolumeDoesNotExist(volUUID)
+
+        chain = []
+        seen = set()
+        while volUUID in parents:
+            # We have seen corrupted chains that cause endless loops here.
+            # https://bugzilla.redhat.com/1125197
+            if volUUID in seen:
+                self.log.error("Image %s volume %s has invalid parent UUID %s",
+                               imgUUID, chain[-1], volUUID)
+                raise se.ImageIsNotLegalChain(imgUUID)
+            seen.add(volUUID)
+            chain.append(volUUID)
+            volUUID = parents[volUUID]
+
+        chain.reverse()
+        return chain
+
+
+def _templates(parents):
+    """
+    Return the set of parents of volumes in parents that are not part of the
+    image. In a legal image this is empty or includes only the template.
+    """
+    return {p for p in six.itervalues(parents)
+            if p not in parents and p != sc.BLANK_UUID}
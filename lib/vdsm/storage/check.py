@@ -27,13 +27,20 @@ CheckService     entry point for starting and stopping path checkers.
 DirectioChecker  checker using dd process for file or block based
                  volumes.
 
+HelperChecker    checker using a pool of long lived reader helper processes,
+                 avoiding a new process for every check.
+
 CheckResult      result object provided to user callback on each check.
 """
 
 from __future__ import absolute_import
 
+import collections
+import functools
 import logging
+import os
 import re
+import sys
 import threading
 
 from vdsm.common import constants
@@ -43,9 +50,14 @@ from vdsm.common.compat import subprocess
 from vdsm.storage import asyncevent
 from vdsm.storage import asyncutils
 from vdsm.storage import exception
+from vdsm.config import config
 
 EXEC_ERROR = 127
 
+# Checker backends
+DD = "dd"
+HELPER = "helper"
+
 _log = logging.getLogger("storage.check")
 
 
@@ -77,12 +89,21 @@ class CheckService(object):
 
     """
 
-    def __init__(self):
+    def __init__(self, backend=None, helpers=None):
+        if backend is None:
+            backend = config.get("irs", "directio_checker")
+        if backend not in (DD, HELPER):
+            raise ValueError("Unsupported checker backend %r" % backend)
+        if helpers is None:
+            helpers = config.getint("irs", "directio_checker_helpers")
         self._lock = threading.Lock()
         self._loop = asyncevent.EventLoop()
         self._thread = concurrent.thread(self._loop.run_forever,
                                          name="check/loop")
         self._checkers = {}
+        self._pool = None
+        if backend == HELPER:
+            self._pool = ReaderPool(self._loop, size=helpers)
 
     def start(self):
         """
@@ -106,6 +127,8 @@ class CheckService(object):
             for checker in self._checkers.values():
                 self._loop.call_soon_threadsafe(checker.stop)
             self._checkers.clear()
+            if self._pool:
+                self._loop.call_soon_threadsafe(self._pool.close)
             self._loop.call_soon_threadsafe(self._loop.stop)
             self._thread.join()
             self._loop.close()
@@ -122,8 +145,12 @@ class CheckService(object):
         with self._lock:
             if path in self._checkers:
                 raise RuntimeError("Already checking path %r" % path)
-            checker = DirectioChecker(self._loop, path, complete,
-                                      interval=interval)
+            if self._pool:
+                checker = HelperChecker(self._loop, path, complete,
+                                        interval=interval, pool=self._pool)
+            else:
+                checker = DirectioChecker(self._loop, path, complete,
+                                          interval=interval)
             self._checkers[path] = checker
         self._loop.call_soon_threadsafe(checker.start)
 
@@ -357,13 +384,16 @@ class DirectioChecker(object):
         elapsed = self._loop.time() - self._check_time
         _log.debug("FINISH check %r (rc=%s, elapsed=%.02f)",
                    self._path, rc, elapsed)
-        result = CheckResult(self._path, rc, self._err, self._check_time,
-                             elapsed)
+        result = self._result(rc, elapsed)
         try:
             self._complete(result)
         except Exception:
             _log.exception("Unhandled error in complete callback")
 
+    def _result(self, rc, elapsed):
+        return CheckResult(self._path, rc, self._err, self._check_time,
+                           elapsed)
+
     def __repr__(self):
         info = [self.__class__.__name__,
                 self._path,
@@ -373,6 +403,230 @@ class DirectioChecker(object):
         return "<%s at 0x%x>" % (" ".join(info), id(self))
 
 
+class HelperChecker(DirectioChecker):
+    """
+    Check path availability using direct I/O in a reader helper process.
+
+    HelperChecker works like DirectioChecker, but instead of starting a dd
+    process for every check, the read is done by a helper from a ReaderPool
+    shared by all checkers.
+    """
+
+    def __init__(self, loop, path, complete, interval=10.0, pool=None):
+        super(HelperChecker, self).__init__(loop, path, complete,
+                                            interval=interval)
+        self._pool = pool
+
+    def _start_process(self):
+        """
+        Starts a read in a reader helper. When the read has completed,
+        _helper_completed will be called.
+        """
+        # Like the dd process, the read request marks a check in progress.
+        self._proc = self._pool.read(self._path, self._helper_completed)
+
+    def _helper_completed(self, rc, data):
+        assert self._state is not IDLE
+        self._err = data
+        self._check_completed(rc)
+
+    def _result(self, rc, elapsed):
+        return ReadResult(self._path, rc, self._err, self._check_time,
+                          elapsed)
+
+
+class ReaderPool(object):
+    """
+    Pool of reader helper processes, doing direct I/O reads for
+    HelperChecker.
+
+    Reads are done by up to size helpers. When all helpers are busy, reads
+    are queued until a helper completes its read. Since a read blocked on
+    inaccessible storage blocks the helper doing it, a new helper is started
+    for a read queued for more than block_timeout seconds. Like the dd
+    backend, a blocked path cannot block checking other paths.
+
+    ReaderPool is not thread safe, and must be used only in the event loop
+    thread.
+    """
+
+    def __init__(self, loop, size=4, block_timeout=1.0):
+        self._loop = loop
+        self._size = size
+        self._block_timeout = block_timeout
+        self._idle = []
+        self._busy = set()
+        self._queue = collections.deque()
+
+    def read(self, path, complete):
+        """
+        Read the first block of path in a helper. When the read completes,
+        complete(rc, data) is invoked. On success rc is 0, and data is the
+        read delay in seconds reported by the helper. On failure data is the
+        error message.
+
+        Returns the read request.
+        """
+        if not isinstance(path, bytes):
+            path = path.encode("utf-8")
+        if b"\n" in path:
+            raise ValueError("Unsupported path %r" % path)
+
+        request = _ReadRequest(path, complete, self._loop.time())
+        helper = self._idle_helper()
+        if helper is None and len(self._busy) < self._size:
+            helper = _ReaderHelper(self._loop)
+
+        if helper:
+            self._start_read(helper, request)
+        else:
+            self._queue.append(request)
+            self._loop.call_later(self._block_timeout, self._check_blocked)
+
+        return request
+
+    def close(self):
+        """
+        Terminate all helpers. Reads in progress complete with an error.
+        """
+        idle, self._idle = self._idle, []
+        busy, self._busy = self._busy, set()
+        queue, self._queue = self._queue, collections.deque()
+        for helper in idle:
+            helper.close()
+        for helper in busy:
+            helper.close()
+        for request in queue:
+            request.complete(EXEC_ERROR, "Reader pool closed")
+
+    def _idle_helper(self):
+        while self._idle:
+            helper = self._idle.pop()
+            if helper.is_alive():
+                return helper
+        return None
+
+    def _start_read(self, helper, request):
+        self._busy.add(helper)
+        helper.read(request.path, functools.partial(
+            self._read_completed, helper, request))
+
+    def _read_completed(self, helper, request, rc, data):
+        self._busy.discard(helper)
+        if helper.is_alive() and self._queue:
+            self._start_read(helper, self._queue.popleft())
+        elif helper.is_alive() and len(self._idle) < self._size:
+            self._idle.append(helper)
+        else:
+            helper.close()
+        request.complete(rc, data)
+
+    def _check_blocked(self):
+        """
+        Called block_timeout seconds after a read was queued. If the read is
+        still queued, the helpers are probably blocked.
+        """
+        now = self._loop.time()
+        while (self._queue and
+               now - self._queue[0].time >= self._block_timeout):
+            request = self._queue.popleft()
+            _log.warning("Reader helpers busy for %.2f seconds, starting "
+                         "another helper (pool=%s)",
+                         now - request.time, self)
+            try:
+                helper = _ReaderHelper(self._loop)
+            except Exception as e:
+                request.complete(EXEC_ERROR,
+                                 "Error starting reader helper: %s" % e)
+            else:
+                self._start_read(helper, request)
+
+    def __repr__(self):
+        return "<%s idle=%d busy=%d queued=%d at 0x%x>" % (
+            self.__class__.__name__, len(self._idle), len(self._busy),
+            len(self._queue), id(self))
+
+
+_ReadRequest = collections.namedtuple("_ReadRequest", "path,complete,time")
+
+
+class _ReaderHelper(object):
+    """
+    A directreader helper process, doing one read at a time.
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._complete = None
+        cmd = [sys.executable, "-m", "vdsm.storage.directreader"]
+        cmd = cmdutils.wrap_command(cmd)
+        self._proc = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=None)
+        self._reader = self._loop.create_dispatcher(
+            asyncevent.LineReader, self._proc.stdout, self._line_received,
+            self._helper_closed)
+        self._alive = True
+        _log.debug("Started reader helper %s", self._proc.pid)
+
+    def is_alive(self):
+        return self._alive
+
+    def read(self, path, complete):
+        assert self._complete is None
+        self._complete = complete
+        try:
+            os.write(self._proc.stdin.fileno(), path + b"\n")
+        except EnvironmentError as e:
+            # The helper has terminated.
+            self._loop.call_soon(self._read_failed,
+                                 "Error writing to reader helper: %s" % e)
+
+    def close(self):
+        """
+        Terminate the helper. A read in progress completes with an error.
+        """
+        if not self._alive:
+            return
+        self._alive = False
+        self._reader.close()
+        self._proc.stdin.close()
+        if self._complete:
+            # The helper may be blocked on storage.
+            _log.debug("Killing reader helper %s", self._proc.pid)
+            self._proc.kill()
+            self._read_failed("Reader helper killed")
+        asyncevent.Reaper(self._loop, self._proc, self._reaped)
+
+    def _line_received(self, line):
+        complete, self._complete = self._complete, None
+        if complete is None:
+            _log.warning("Unexpected reader helper %s response: %r",
+                         self._proc.pid, line)
+            return
+        rc, _, data = line.partition(b" ")
+        try:
+            rc = int(rc)
+        except ValueError:
+            rc = EXEC_ERROR
+            data = "Invalid reader helper response: %r" % line
+        complete(rc, data)
+
+    def _helper_closed(self):
+        _log.warning("Reader helper %s terminated", self._proc.pid)
+        self._alive = False
+        self._proc.stdin.close()
+        self._read_failed("Reader helper terminated")
+        asyncevent.Reaper(self._loop, self._proc, self._reaped)
+
+    def _read_failed(self, reason):
+        complete, self._complete = self._complete, None
+        if complete:
+            complete(EXEC_ERROR, reason)
+
+    def _reaped(self, rc):
+        _log.debug("Reader helper %s exited with %s", self._proc.pid, rc)
+
+
 class CheckResult(object):
 
     _PATTERN = re.compile(br".*, ([\de\-.]+) s,[^,]+")
@@ -406,3 +660,18 @@ class CheckResult(object):
         return "<%s path=%s rc=%d err=%r time=%.2f elapsed=%.2f at 0x%x>" % (
             self.__class__.__name__, self.path, self.rc, self.err, self.time,
             self.elapsed, id(self))
+
+
+class ReadResult(CheckResult):
+    """
+    Result of a check using a reader helper. On success, err is the read
+    delay reported by the helper.
+    """
+
+    def delay(self):
+        if self.rc != 0:
+            raise exception.MiscFileReadException(self.path, self.rc, self.err)
+        try:
+            return float(self.err)
+        except ValueError as e:
+            raise exception.MiscFileReadException(self.path, e)
@@ -0,0 +1,88 @@
+#
+# Copyright 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+"""
+Direct I/O reader helper, used by the storage check service.
+
+The helper runs as a long lived child process of vdsm:
+
+    python -m vdsm.storage.directreader
+
+For every path written to stdin, terminated by a newline, the helper reads
+the first block of the path using direct I/O, and writes one response line
+to stdout:
+
+    0 SECONDS           the read succeeded in SECONDS
+    ERRNO MESSAGE       the read failed
+
+A read blocked on inaccessible storage blocks only the helper doing the read.
+The helper exits when stdin is closed.
+
+This module must not import anything from vdsm, to keep the helper small.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import errno
+import io
+import mmap
+import os
+import sys
+import time
+
+BLOCK_SIZE = 4096
+
+
+def read_block(path, buf):
+    """
+    Read the first block of path into buf using direct I/O. buf must be
+    aligned to the logical block size of the underlying storage.
+    """
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+    with io.FileIO(fd, "r") as f:
+        f.readinto(buf)
+
+
+def serve(rfile, wfile):
+    # mmap memory is page aligned, as required for direct I/O.
+    buf = mmap.mmap(-1, BLOCK_SIZE)
+    for line in iter(rfile.readline, b""):
+        path = line.rstrip(b"\n")
+        start = time.time()
+        try:
+            read_block(path, buf)
+        except EnvironmentError as e:
+            response = "%d %s\n" % (e.errno or errno.EIO, e.strerror)
+        else:
+            response = "0 %.6f\n" % (time.time() - start)
+        wfile.write(response.encode("utf-8"))
+        wfile.flush()
+
+
+def main():
+    # Use binary streams on both python 2 and 3.
+    stdin = getattr(sys.stdin, "buffer", sys.stdin)
+    stdout = getattr(sys.stdout, "buffer", sys.stdout)
+    serve(stdin, stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -624,6 +624,11 @@ class GetFileStatsError(StorageException):
     message = "Cannot get file stats"
 
 
+class StoragePoolMailboxUnavailable(StorageException):
+    code = 331
+    message = "Storage pool has no mailbox"
+
+
 #################################################
 #  Domains Exceptions
 #################################################
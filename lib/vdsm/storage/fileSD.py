@@ -27,6 +27,9 @@ import logging
 import glob
 import fnmatch
 import re
+import stat
+import threading
+import time
 
 from contextlib import contextmanager
 
@@ -35,6 +38,7 @@ import six
 from vdsm import utils
 from vdsm.common import supervdsm
 from vdsm.common.compat import glob_escape
+from vdsm.storage import chainindex
 from vdsm.storage import clusterlock
 from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
@@ -46,6 +50,7 @@ from vdsm.storage import outOfProcess as oop
 from vdsm.storage import sd
 from vdsm.storage import xlease
 from vdsm.storage.persistent import PersistentDict, DictValidator
+from vdsm.storage.volumemetadata import VolumeMetadata
 
 from vdsm import constants
 from vdsm.utils import stripNewLines
@@ -162,6 +167,297 @@ FileSDMetadata = lambda metafile: DictValidator(
     PersistentDict(FileMetadataRW(metafile)), FILE_SD_MD_FIELDS)
 
 
+# Cached state of a directory. volumes is None if the entry is not a
+# directory.
+_DirEntry = collections.namedtuple("_DirEntry", "mtime, racy, volumes")
+
+
+class VolumeCatalog(object):
+    """
+    In memory catalog of the volumes in the images directory of a file
+    storage domain.
+
+    Globbing all the image directories is slow on domains with many volumes.
+    The catalog keeps the volumes of every image directory:
+
+    - Looking up the volumes of one image checks only the images directory
+      mtime and the image directory mtime, rescanning the image directory if
+      it was modified.
+    - Listing all the volumes checks the mtime of every image directory,
+      rescanning only the modified directories, so volumes added to existing
+      images by other hosts are visible.
+    - Listing the images checks only the images directory mtime.
+    - New image directories are scanned using one glob when there are more
+      than one of them, for example on the first listing.
+
+    Operations adding or removing volumes must call invalidate(), so the
+    change is visible even if it did not change the directory mtime.
+
+    Methods accessing storage accept the domain ioprocess pool, since the
+    pool may be replaced during the life of the domain.
+    """
+
+    log = logging.getLogger("storage.VolumeCatalog")
+
+    # A directory modified less than this number of seconds before scanning
+    # it may be modified again without changing its mtime, so it is scanned
+    # again on the next refresh.
+    RACY_WINDOW = 2.0
+
+    def __init__(self, imagesDir, clock=time.time):
+        self._imagesDir = imagesDir
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Images directory mtime when it was listed, or None.
+        self._listing = None
+        # {name: _DirEntry}, volumes is None for entries that are not
+        # directories. New entries are None until scanned.
+        self._dirs = {}
+        self._invalid = set()
+        # Cached volumes, computed when directories change.
+        self._volumes = None
+
+    def volumes(self, oop):
+        """
+        Return dict {volUUID: ((imgUUIDs,), parentUUID)}, see
+        FileStorageDomainManifest.getAllVolumes().
+        """
+        with self._lock:
+            self._refreshListing(oop)
+            if not self._scanUnscanned(oop):
+                # Other hosts may add volumes to existing images without
+                # modifying the images directory.
+                for name in list(self._dirs):
+                    self._scanDir(oop, name)
+            self._scanInvalid(oop)
+            return dict(self._getVolumes())
+
+    def imageVolumes(self, oop, imgUUID):
+        """
+        Return the volumes of imgUUID, including the template, in the same
+        format as volumes().
+        """
+        with self._lock:
+            self._refreshListing(oop)
+            if imgUUID not in self._dirs:
+                return {}
+            self._scanDir(oop, imgUUID)
+            # New directories may include the template of this image.
+            self._scanUnscanned(oop)
+            self._scanInvalid(oop)
+            entry = self._dirs.get(imgUUID)
+            if entry is None or entry.volumes is None:
+                return {}
+            vols = self._getVolumes()
+            return {volUUID: vols[volUUID] for volUUID in entry.volumes}
+
+    def images(self, oop):
+        """
+        Return list of directory names in the images directory.
+        """
+        with self._lock:
+            self._refreshListing(oop)
+            self._scanUnscanned(oop)
+            return [name for name, entry in six.iteritems(self._dirs)
+                    if entry is not None and entry.volumes is not None]
+
+    def invalidate(self, imgUUID):
+        """
+        Must be called after adding or removing volumes in imgUUID, or
+        adding or removing the image directory.
+        """
+        with self._lock:
+            if imgUUID in self._dirs:
+                self._invalid.add(imgUUID)
+            else:
+                self._listing = None
+
+    def _refreshListing(self, oop):
+        """
+        List the images directory if it was modified since it was listed.
+        """
+        now = self._clock()
+
+        # Stat before listing, so a change during the listing is detected
+        # on the next refresh.
+        try:
+            st = oop.os.stat(self._imagesDir)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            # No images yet; list again on the next refresh.
+            if self._dirs:
+                self._dirs.clear()
+                self._volumes = None
+            self._listing = None
+            self._invalid.clear()
+            return
+
+        if (self._listing is not None and not self._listing.racy and
+                self._listing.mtime == st.st_mtime):
+            return
+
+        pattern = os.path.join(glob_escape(self._imagesDir), "*")
+        names = set(os.path.basename(path)
+                    for path in oop.glob.glob(pattern))
+        for name in set(self._dirs) - names:
+            del self._dirs[name]
+            self._invalid.discard(name)
+            self._volumes = None
+        for name in names - set(self._dirs):
+            self._dirs[name] = None
+        self._listing = _DirEntry(
+            st.st_mtime, self._isRacy(st.st_mtime, now), None)
+
+    def _scanAll(self, oop):
+        """
+        Rescan all the image directories using one glob.
+        """
+        now = self._clock()
+
+        # Stat before globbing, so a change during the glob is detected on
+        # the next scan.
+        stats = {}
+        for name in list(self._dirs):
+            st = self._statDir(oop, name)
+            if st is not None:
+                stats[name] = st
+
+        pattern = os.path.join(glob_escape(self._imagesDir), "*", "*.meta")
+        found = collections.defaultdict(list)
+        for metaPath in oop.glob.glob(pattern):
+            imgDir, metaFile = os.path.split(metaPath)
+            found[os.path.basename(imgDir)].append(
+                os.path.splitext(metaFile)[0])
+
+        for name, st in six.iteritems(stats):
+            if stat.S_ISDIR(st.st_mode):
+                volumes = tuple(found.get(name, ()))
+            else:
+                volumes = None
+            self._dirs[name] = _DirEntry(
+                st.st_mtime, self._isRacy(st.st_mtime, now), volumes)
+        self._invalid.clear()
+        self._volumes = None
+
+        self.log.debug("Rescanned %d directories in %s",
+                       len(self._dirs), self._imagesDir)
+
+    def _scanUnscanned(self, oop):
+        """
+        Scan new directories. Return True if all the directories were
+        rescanned.
+        """
+        unscanned = [name for name, entry in six.iteritems(self._dirs)
+                     if entry is None]
+        if len(unscanned) > 1:
+            self._scanAll(oop)
+            return True
+        if unscanned:
+            self._scanDir(oop, unscanned[0])
+        return False
+
+    def _scanInvalid(self, oop):
+        for name in list(self._invalid):
+            self._scanDir(oop, name)
+
+    def _scanDir(self, oop, name):
+        """
+        Rescan directory name if it was modified since it was scanned.
+        """
+        now = self._clock()
+        entry = self._dirs[name]
+        st = self._statDir(oop, name)
+        if st is None:
+            return
+
+        if (entry is not None and not entry.racy and
+                entry.mtime == st.st_mtime and
+                name not in self._invalid):
+            return
+
+        if stat.S_ISDIR(st.st_mode):
+            path = os.path.join(self._imagesDir, name)
+            pattern = os.path.join(glob_escape(path), "*.meta")
+            volumes = tuple(
+                os.path.splitext(os.path.basename(metaPath))[0]
+                for metaPath in oop.glob.glob(pattern))
+        else:
+            volumes = None
+
+        if entry is None or entry.volumes != volumes:
+            self._volumes = None
+        self._dirs[name] = _DirEntry(
+            st.st_mtime, self._isRacy(st.st_mtime, now), volumes)
+        self._invalid.discard(name)
+
+    def _statDir(self, oop, name):
+        """
+        Return the stat of directory name, or None if it was removed.
+        """
+        path = os.path.join(self._imagesDir, name)
+        try:
+            return oop.os.stat(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            del self._dirs[name]
+            self._invalid.discard(name)
+            self._volumes = None
+            return None
+
+    def _isRacy(self, mtime, now):
+        return now - mtime < self.RACY_WINDOW
+
+    def _getVolumes(self):
+        if self._volumes is None:
+            images = {name: entry.volumes
+                      for name, entry in six.iteritems(self._dirs)
+                      if entry is not None and entry.volumes}
+            self._volumes = _imagesToVolumes(images)
+        return self._volumes
+
+
+def _imagesToVolumes(images):
+    """
+    Convert mapping {imgUUID: (volUUIDs,)} of image directories to the
+    getAllVolumes() format.
+    """
+    # Using images to volumes mapping, we can create volumes to images
+    # mapping, detecting template volumes and template images, based on
+    # these rules:
+    #
+    # Template volumes are hard linked in every image directory
+    # which is derived from that template, therefore:
+    #
+    # 1. A template volume which is in use will appear at least twice
+    #    (in the template image dir and in the derived image dir)
+    #
+    # 2. Any volume which appears more than once in the dir tree is
+    #    by definition a template volume.
+    #
+    # 3. Any image which has more than 1 volume is not a template
+    #    image.
+
+    volumes = {}
+    for imgUUID, volUUIDs in six.iteritems(images):
+        for volUUID in volUUIDs:
+            if volUUID in volumes:
+                # This must be a template volume (rule 2)
+                volumes[volUUID]['parent'] = sd.BLANK_UUID
+                if len(volUUIDs) > 1:
+                    # This image is not a template (rule 3)
+                    volumes[volUUID]['imgs'].append(imgUUID)
+                else:
+                    # This image is a template (rule 3)
+                    volumes[volUUID]['imgs'].insert(0, imgUUID)
+            else:
+                volumes[volUUID] = {'imgs': [imgUUID], 'parent': None}
+
+    return dict((k, sd.ImgsPar(tuple(v['imgs']), v['parent']))
+                for k, v in six.iteritems(volumes))
+
+
 class FileStorageDomainManifest(sd.StorageDomainManifest):
     def __init__(self, domainPath, metadata=None):
         # Using glob might look like the simplest thing to do but it isn't
@@ -181,6 +477,9 @@ class FileStorageDomainManifest(sd.StorageDomainManifest):
         if not self.oop.fileUtils.pathExists(self.metafile):
             raise se.StorageDomainMetadataNotFound(self.sdUUID, self.metafile)
 
+        self._volumeCatalog = VolumeCatalog(
+            os.path.join(self.domaindir, sd.DOMAIN_IMAGES))
+
     @classmethod
     def special_volumes(cls, version):
         if cls.supports_external_leases(version):
@@ -243,6 +542,9 @@ class FileStorageDomainManifest(sd.StorageDomainManifest):
         except OSError as e:
             self.log.error("image: %s can't be moved", currImgDir)
             raise se.ImageDeleteError("%s %s" % (imgUUID, str(e)))
+        finally:
+            self.invalidateImage(imgUUID)
+            self._volumeCatalog.invalidate(os.path.basename(toDelDir))
 
     def purgeImage(self, sdUUID, imgUUID, volsImgs, discard):
         self.log.debug("Purging image %s", imgUUID)
@@ -255,6 +557,7 @@ class FileStorageDomainManifest(sd.StorageDomainManifest):
             self._deleteVolumeFile(volPath + fileVolume.META_FILEEXT)
             if self.hasVolumeLeases():
                 self._deleteVolumeFile(volPath + LEASE_FILEEXT)
+        self._volumeCatalog.invalidate(os.path.basename(toDelDir))
         self.log.info("Removing directory: %s", toDelDir)
         try:
             self.oop.os.rmdir(toDelDir)
@@ -294,66 +597,67 @@ class FileStorageDomainManifest(sd.StorageDomainManifest):
         Template volumes have no parent, and thus we report BLANK_UUID as their
         parentUUID.
         """
-        volMetaPattern = os.path.join(glob_escape(self.mountpoint),
-                                      self.sdUUID,
-                                      sd.DOMAIN_IMAGES, "*", "*.meta")
-        volMetaPaths = self.oop.glob.glob(volMetaPattern)
-
-        # First create mapping from images to volumes
-        images = collections.defaultdict(list)
-        for metaPath in volMetaPaths:
-            head, tail = os.path.split(metaPath)
-            volUUID, volExt = os.path.splitext(tail)
-            imgUUID = os.path.basename(head)
-            images[imgUUID].append(volUUID)
-
-        # Using images to volumes mapping, we can create volumes to images
-        # mapping, detecting template volumes and template images, based on
-        # these rules:
-        #
-        # Template volumes are hard linked in every image directory
-        # which is derived from that template, therefore:
-        #
-        # 1. A template volume which is in use will appear at least twice
-        #    (in the template image dir and in the derived image dir)
-        #
-        # 2. Any volume which appears more than once in the dir tree is
-        #    by definition a template volume.
-        #
-        # 3. Any image which has more than 1 volume is not a template
-        #    image.
+        return self._volumeCatalog.volumes(self.oop)
+
+    def getVolsOfImage(self, imgUUID):
+        """
+        Overrides StorageDomainManifest method, using the volume catalog
+        instead of filtering all the domain volumes.
+        """
+        return self._volumeCatalog.imageVolumes(self.oop, imgUUID)
+
+    def invalidateImage(self, imgUUID):
+        sd.StorageDomainManifest.invalidateImage(self, imgUUID)
+        self._volumeCatalog.invalidate(imgUUID)
 
+    def getVolumesTree(self, imgUUID):
+        """
+        Overrides StorageDomainManifest method, reading the metadata of every
+        volume in the image directory. The template volume is linked into
+        every image directory derived from the template, but belongs only to
+        the template image.
+        """
+        pattern = os.path.join(glob_escape(self.getImagePath(imgUUID)),
+                               "*.meta")
         volumes = {}
-        for imgUUID, volUUIDs in six.iteritems(images):
-            for volUUID in volUUIDs:
-                if volUUID in volumes:
-                    # This must be a template volume (rule 2)
-                    volumes[volUUID]['parent'] = sd.BLANK_UUID
-                    if len(volUUIDs) > 1:
-                        # This image is not a template (rule 3)
-                        volumes[volUUID]['imgs'].append(imgUUID)
-                    else:
-                        # This image is a template (rule 3)
-                        volumes[volUUID]['imgs'].insert(0, imgUUID)
-                else:
-                    volumes[volUUID] = {'imgs': [imgUUID], 'parent': None}
+        for metaPath in self.oop.glob.glob(pattern):
+            volUUID = os.path.splitext(os.path.basename(metaPath))[0]
+            try:
+                lines = self.oop.directReadLines(metaPath)
+            except Exception as e:
+                raise se.VolumeMetadataReadError("%s: %s" % (metaPath, e))
+            md = VolumeMetadata.from_lines(lines)
+            volumes[volUUID] = chainindex.VolumeNode(md.image, md.puuid)
 
-        return dict((k, sd.ImgsPar(tuple(v['imgs']), v['parent']))
-                    for k, v in six.iteritems(volumes))
+        return volumes
+
+    def getImageVolumesStamps(self, imgUUID):
+        """
+        Overrides StorageDomainManifest method, using the modification time
+        and size of the volumes metadata files, modified when changing the
+        volume parent.
+        """
+        pattern = os.path.join(glob_escape(self.getImagePath(imgUUID)),
+                               "*.meta")
+        stamps = {}
+        for metaPath in self.oop.glob.glob(pattern):
+            volUUID = os.path.splitext(os.path.basename(metaPath))[0]
+            try:
+                st = self.oop.os.stat(metaPath)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                # Volume removed after listing the image.
+                continue
+            stamps[volUUID] = (st.st_mtime, st.st_ctime, st.st_size)
+        return stamps
 
     def getAllImages(self):
         """
         Fetch the set of the Image UUIDs in the SD.
         """
-        # Get Volumes of an image
-        pattern = os.path.join(self.mountpoint, self.sdUUID, sd.DOMAIN_IMAGES,
-                               UUID_GLOB_PATTERN)
-        files = self.oop.glob.glob(pattern)
-        images = set()
-        for i in files:
-            if self.oop.os.path.isdir(i):
-                images.add(os.path.basename(i))
-        return images
+        return set(fnmatch.filter(self._volumeCatalog.images(self.oop),
+                                  UUID_GLOB_PATTERN))
 
     def getVolumeLease(self, imgUUID, volUUID):
         """
@@ -762,6 +1066,7 @@ class FileStorageDomain(sd.StorageDomain):
                 tVol = os.path.join(basePath, templateImage, volFile)
                 self.log.info("Force linking %s to %s", tVol, tLink)
                 self.oop.utils.forceLink(tVol, tLink)
+            self.invalidateImage(rImg)
 
     def getVolumeClass(self):
         """
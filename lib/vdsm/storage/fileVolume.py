@@ -317,11 +317,29 @@ class FileVolumeManifest(volume.VolumeManifest):
         self.log.debug("Share volume metadata of %s to %s", self.volUUID,
                        dstImgPath)
         self.oop.utils.forceLink(self._getMetaVolumePath(), dstMetaPath)
+        sdCache.produce_manifest(self.sdUUID).invalidateImage(
+            os.path.basename(dstImgPath))
 
         # Link the lease file if the domain uses sanlock
         if sdCache.produce(self.sdUUID).hasVolumeLeases():
             self._shareLease(dstImgPath)
 
+    def setParentMeta(self, puuid):
+        """
+        Set parent volume UUID in Volume metadata.  This operation can be done
+        by an HSM while it is using the volume and by an SPM when no one is
+        using the volume.
+        """
+        self.setMetaParam(sc.PUUID, puuid)
+        sdCache.produce_manifest(self.sdUUID).invalidateImage(
+            self.imgUUID)
+
+    def setParentTag(self, puuid):
+        """
+        For file volumes we do not use any LV tags
+        """
+        pass
+
     @classmethod
     def getImageVolumes(cls, sdUUID, imgUUID):
         """
@@ -536,6 +554,9 @@ class FileVolume(volume.Volume):
             eFound = e
             self.log.error("cannot remove volume's %s metadata",
                            self.volUUID, exc_info=True)
+        finally:
+            sdCache.produce_manifest(self.sdUUID).invalidateImage(
+                self.imgUUID)
 
         raise eFound
 
@@ -548,18 +569,10 @@ class FileVolume(volume.Volume):
         procPool.utils.rmFile(cls.manifestClass.leaseVolumePath(volPath))
 
     def setParentMeta(self, puuid):
-        """
-        Set parent volume UUID in Volume metadata.  This operation can be done
-        by an HSM while it is using the volume and by an SPM when no one is
-        using the volume.
-        """
-        self.setMetaParam(sc.PUUID, puuid)
+        return self._manifest.setParentMeta(puuid)
 
     def setParentTag(self, puuid):
-        """
-        For file volumes we do not use any LV tags
-        """
-        pass
+        return self._manifest.setParentTag(puuid)
 
     @classmethod
     def renameVolumeRollback(cls, taskObj, oldPath, newPath):
@@ -601,6 +614,7 @@ class FileVolume(volume.Volume):
                                                  [metaPath, prevMetaPath]))
         self.log.info("Renaming %s to %s", prevMetaPath, metaPath)
         self.oop.os.rename(prevMetaPath, metaPath)
+        sdCache.produce_manifest(self.sdUUID).invalidateImage(self.imgUUID)
         if recovery:
             name = "Rename lease-volume rollback: " + leasePath
             vars.task.pushRecovery(task.Recovery(name, "fileVolume",
@@ -42,15 +42,31 @@ class GlusterStorageDomain(nfsSD.NfsStorageDomain):
 
     @staticmethod
     def findDomainPath(sdUUID):
-        glusterDomPath = os.path.join(sd.GLUSTERSD_DIR, "*")
-        for tmpSdUUID, domainPath in fileSD.scanDomains(glusterDomPath):
-            if tmpSdUUID == sdUUID:
-                mountpoint = os.path.dirname(domainPath)
-                if mount.isMounted(mountpoint):
-                    return domainPath
-
-        raise se.StorageDomainDoesNotExist(sdUUID)
+        try:
+            return findDomainPaths([sdUUID])[sdUUID]
+        except KeyError:
+            raise se.StorageDomainDoesNotExist(sdUUID)
 
 
 def findDomain(sdUUID):
     return GlusterStorageDomain(GlusterStorageDomain.findDomainPath(sdUUID))
+
+
+def findDomainPaths(sdUUIDs):
+    """
+    Return dict {sdUUID: domainPath} of the domains in sdUUIDs found on
+    mounted gluster volumes, scanning the mounts once.
+    """
+    sdUUIDs = frozenset(sdUUIDs)
+    glusterDomPath = os.path.join(sd.GLUSTERSD_DIR, "*")
+    paths = {}
+    for sdUUID, domainPath in fileSD.scanDomains(glusterDomPath):
+        if sdUUID in sdUUIDs and sdUUID not in paths:
+            mountpoint = os.path.dirname(domainPath)
+            if mount.isMounted(mountpoint):
+                paths[sdUUID] = domainPath
+    return paths
+
+
+def openDomain(domainPath):
+    return GlusterStorageDomain(domainPath)
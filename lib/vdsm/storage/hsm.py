@@ -401,9 +401,17 @@ class HSM(object):
         self.multipathListener.register(self.mpathhealth_monitor)
         self.multipathListener.start()
 
+        self.lvmListener = None
+        if config.getboolean('irs', 'lvm_cache_events'):
+            self.lvmListener = udev.LVMListener()
+            self.lvmListener.register(lvm.CacheMonitor())
+            self.lvmListener.start()
+
         def storageRefresh():
             sdCache.refreshStorage()
-            lvm.bootstrap(skiplvs=blockSD.SPECIAL_LVS_V4)
+            lvm.bootstrap(
+                skiplvs=blockSD.SPECIAL_LVS_V4,
+                useSnapshot=config.getboolean('irs', 'lvm_cache_snapshot'))
             self._ready = True
             self.log.info("FINISH HSM init succeeded in %.2f seconds",
                           monotonic_time() - self._start_time)
@@ -892,28 +900,36 @@ class HSM(object):
     @public
     def sendExtendMsg(self, spUUID, volDict, newSize, callbackFunc):
         """
-        Send an extended message?
+        Send a volume extension request to the SPM using the storage pool
+        mailbox. The request is queued and sent asynchronously.
 
-        :param spUUID: The UUID of the storage pool you want to
-                       send the message to.
+        :param spUUID: The UUID of the storage pool of the volume.
         :type spUUID: UUID
-        :param volDict: ?
-        :param newSize: ?
-        :param callbackFun: A function to run once the operation is done. ?
+        :param volDict: The volume to extend, with the keys "poolID",
+                        "domainID" and "volumeID".
+        :type volDict: dict
+        :param newSize: The requested volume size in bytes.
+        :type newSize: int
+        :param callbackFunc: Called with volDict when the SPM has extended
+                             the volume. The volume must be refreshed before
+                             using the new size.
+
+        :raises: :exc:`storage.exception.StoragePoolUnknown` if this host is
+                 not connected to the storage pool, or
+                 :exc:`storage.exception.StoragePoolMailboxUnavailable` if
+                 the pool has no mailbox.
 
         .. note::
-            If the pool doesn't exist the function will fail silently and the
-            callback will never be called.
-
+            If the request could not be sent, the verb returns an error
+            response and callbackFunc is never called. Callers must handle
+            the error, for example by allowing another request for the
+            volume.
         """
         newSize = misc.validateN(newSize, "newSize") / 2 ** 20
-        try:
-            pool = self.getPool(spUUID)
-        except se.StoragePoolUnknown:
-            pass
-        else:
-            if pool.hsmMailer:
-                pool.hsmMailer.sendExtendMsg(volDict, newSize, callbackFunc)
+        pool = self.getPool(spUUID)
+        if not pool.hsmMailer:
+            raise se.StoragePoolMailboxUnavailable(spUUID)
+        pool.hsmMailer.sendExtendMsg(volDict, newSize, callbackFunc)
 
     def _spmSchedule(self, spUUID, name, func, *args):
         pool = self.getPool(spUUID)
@@ -1493,11 +1509,10 @@ class HSM(object):
         # hence, we need a unique identifier.
         vars.task.getExclusiveLock(STORAGE, "%s_%s" % (imgUUID, sdUUID))
         vars.task.getSharedLock(STORAGE, sdUUID)
-        allVols = dom.getAllVolumes()
-        volsByImg = sd.getVolsOfImage(allVols, imgUUID)
+        volsByImg = dom.getVolsOfImage(imgUUID)
         if not volsByImg:
-            self.log.error("Empty or not found image %s in SD %s. %s",
-                           imgUUID, sdUUID, allVols)
+            self.log.error("Empty or not found image %s in SD %s",
+                           imgUUID, sdUUID)
             raise se.ImageDoesNotExistInSD(imgUUID, sdUUID)
 
         # on data domains, images should not be deleted if they are templates
@@ -2391,7 +2406,7 @@ class HSM(object):
         :param options: unused
 
         :returns: a list of statuses status will be 0 if connection was
-                  successful
+                  successful, and elapsed is the connection time in seconds
         :rtype: dict
         """
         vars.task.setDefaultException(
@@ -2399,27 +2414,28 @@ class HSM(object):
                 "domType=%s, spUUID=%s, conList=%s" %
                 (domType, spUUID, conList)))
 
-        res = []
-        connections = []
+        conObjs = []
         for conDef in conList:
             conInfo = _connectionDict2ConnectionInfo(domType, conDef)
-            conObj = storageServer.ConnectionFactory.createConnection(conInfo)
-            try:
-                self._connectStorageOverIser(conDef, conObj, domType)
-                conObj.connect()
-            except Exception as err:
-                self.log.error(
-                    "Could not connect to storageServer", exc_info=True)
-                status, _ = self._translateConnectionError(err)
-            else:
-                status = 0
-                connections.append(conObj)
+            conObjs.append(
+                storageServer.ConnectionFactory.createConnection(conInfo))
 
-            res.append({'id': conDef["id"], 'status': status})
+        # Connecting may block for long time on unreachable servers, so we
+        # connect concurrently, keeping the results in conList order.
+        res = [None] * len(conList)
+        connections = []
+        workers = config.getint("irs", "connection_workers")
+        items = [(i, domType, conDef, conObj)
+                 for i, (conDef, conObj) in enumerate(zip(conList, conObjs))]
+        for i, status in misc.itmap(self._connectOne, items, workers):
+            res[i] = status
+            if status["status"] == 0:
+                connections.append(conObjs[i])
 
         # In case there were changes in devices size
         # while the VDSM was not connected, we need to
-        # call refreshStorage.
+        # call refreshStorage. This is also the only multipath rescan and
+        # udev settle for all the connections.
         if domType in (sd.FCP_DOMAIN, sd.ISCSI_DOMAIN):
             sdCache.refreshStorage()
 
@@ -2446,6 +2462,28 @@ class HSM(object):
         sdCache.invalidateStorage()
         return dict(statuslist=res)
 
+    def _connectOne(self, item):
+        """
+        Connect one connection of connectStorageServer, returning the index of
+        the connection and its status.
+        """
+        i, domType, conDef, conObj = item
+        start = monotonic_time()
+        try:
+            self._connectStorageOverIser(conDef, conObj, domType)
+            conObj.connect()
+        except Exception as err:
+            self.log.error(
+                "Could not connect to storageServer", exc_info=True)
+            status, _ = self._translateConnectionError(err)
+        else:
+            status = 0
+        elapsed = monotonic_time() - start
+
+        self.log.info("Connection %s status %s in %.2f seconds",
+                      conDef["id"], status, elapsed)
+        return i, {'id': conDef["id"], 'status': status, 'elapsed': elapsed}
+
     @deprecated
     def _connectStorageOverIser(self, conDef, conObj, conTypeId):
         """
@@ -3012,6 +3050,21 @@ class HSM(object):
             sdUUID=sdUUID).produceVolume(imgUUID=imgUUID,
                                          volUUID=volUUID).refreshVolume()
 
+    @public
+    def refreshVolumes(self, sdUUID, spUUID, volUUIDs):
+        """
+        Refresh low level volumes after change in the shared storage
+        initiated from another host, using one operation for all volumes.
+
+        :param sdUUID: The UUID of the storage domain that owns the volumes.
+        :type sdUUID: UUID
+        :param spUUID: The UUID of the storage pool that owns the volumes.
+        :type spUUID: UUID
+        :param volUUIDs: The UUIDs of the volumes you want to refresh.
+        :type volUUIDs: list
+        """
+        sdCache.produce(sdUUID=sdUUID).refreshVolumes(volUUIDs)
+
     @public
     def add_image_ticket(self, ticket):
         imagetickets.add_ticket(ticket)
@@ -3168,15 +3221,14 @@ class HSM(object):
 
         imgVolumesInfo = []
         dom = sdCache.produce(sdUUID)
-        allVols = dom.getAllVolumes()
-        # Filter volumes related to this image
-        imgVolumes = sd.getVolsOfImage(allVols, imgUUID).keys()
+        imgVolumes = dom.getVolsOfImage(imgUUID).keys()
 
         if leafUUID not in imgVolumes:
             raise se.VolumeDoesNotExist(leafUUID)
 
+        volsMetadata = dom.getVolumesMetadata(imgUUID, imgVolumes)
         for volUUID in imgVolumes:
-            legality = dom.produceVolume(imgUUID, volUUID).getLegality()
+            legality = volsMetadata[volUUID].get(sc.LEGALITY, sc.LEGAL_VOL)
             if legality == sc.ILLEGAL_VOL:
                 if allowIllegal:
                     self.log.info("Preparing illegal volume %s", leafUUID)
@@ -3246,11 +3298,10 @@ class HSM(object):
         """
         vars.task.getSharedLock(STORAGE, sdUUID)
         dom = sdCache.produce(sdUUID=sdUUID)
-        vols = dom.getAllVolumes()
         if imgUUID == sc.BLANK_UUID:
-            volUUIDs = vols.keys()
+            volUUIDs = dom.getAllVolumes().keys()
         else:
-            volUUIDs = [k for k, v in vols.iteritems() if imgUUID in v.imgs]
+            volUUIDs = dom.getVolsOfImage(imgUUID).keys()
         return dict(uuidlist=volUUIDs)
 
     @public
@@ -3346,6 +3397,10 @@ class HSM(object):
             self.taskMng.prepareForShutdown()
             oop.stop()
             self.multipathListener.stop()
+            if self.lvmListener:
+                self.lvmListener.stop()
+            if config.getboolean('irs', 'lvm_cache_snapshot'):
+                lvm.saveSnapshot()
         except:
             pass
 
@@ -82,10 +82,9 @@ def _deleteImage(dom, imgUUID, postZero, discard):
 
     Replaces Image.delete() in Image.[copyCollapsed(), move(), multimove()].
     """
-    allVols = dom.getAllVolumes()
-    imgVols = sd.getVolsOfImage(allVols, imgUUID)
+    imgVols = dom.getVolsOfImage(imgUUID)
     if not imgVols:
-        log.warning("No volumes found for image %s. %s", imgUUID, allVols)
+        log.warning("No volumes found for image %s", imgUUID)
         return
     elif postZero:
         dom.zeroImage(dom.sdUUID, imgUUID, imgVols, discard)
@@ -181,67 +180,12 @@ class Image:
         Return the chain of volumes of image as a sorted list
         (not including a shared base (template) if any)
         """
-        chain = []
-        volclass = sdCache.produce(sdUUID).getVolumeClass()
-
-        # Use volUUID when provided
-        if volUUID:
-            srcVol = volclass(self.repoPath, sdUUID, imgUUID, volUUID)
-
-            # For template images include only one volume (the template itself)
-            # NOTE: this relies on the fact that in a template there is only
-            #       one volume
-            if srcVol.isShared():
-                return [srcVol]
-
-        # Find all the volumes when volUUID is not provided
-        else:
-            # Find all volumes of image
-            uuidlist = volclass.getImageVolumes(sdUUID, imgUUID)
-
-            if not uuidlist:
-                raise se.ImageDoesNotExistInSD(imgUUID, sdUUID)
-
-            srcVol = volclass(self.repoPath, sdUUID, imgUUID, uuidlist[0])
-
-            # For template images include only one volume (the template itself)
-            if len(uuidlist) == 1 and srcVol.isShared():
-                return [srcVol]
-
-            # Searching for the leaf
-            for vol in uuidlist:
-                srcVol = volclass(self.repoPath, sdUUID, imgUUID, vol)
-
-                if srcVol.isLeaf():
-                    break
-
-                srcVol = None
-
-            if not srcVol:
-                self.log.error("There is no leaf in the image %s", imgUUID)
-                raise se.ImageIsNotLegalChain(imgUUID)
-
-        # We have seen corrupted chains that cause endless loops here.
-        # https://bugzilla.redhat.com/1125197
-        seen = set()
-
-        # Build up the sorted parent -> child chain
-        while not srcVol.isShared():
-            chain.insert(0, srcVol)
-            seen.add(srcVol.volUUID)
-
-            parentUUID = srcVol.getParent()
-            if parentUUID == sc.BLANK_UUID:
-                break
-
-            if parentUUID in seen:
-                self.log.error("Image %s volume %s has invalid parent UUID %s",
-                               imgUUID, srcVol.volUUID, parentUUID)
-                raise se.ImageIsNotLegalChain(imgUUID)
-
-            srcVol = srcVol.getParentVolume()
-
-        return chain
+        dom = sdCache.produce(sdUUID)
+        volclass = dom.getVolumeClass()
+        # The domain chain index resolves the chain without accessing the
+        # volumes, so we produce only the volumes in the chain.
+        return [volclass(self.repoPath, sdUUID, imgUUID, volID)
+                for volID in dom.getImageChain(imgUUID, volUUID)]
 
     def getTemplate(self, sdUUID, imgUUID):
         """
@@ -1215,8 +1159,7 @@ class Image:
         """
         # Prepare volumes
         dom = sdCache.produce(sdUUID)
-        allVols = dom.getAllVolumes()
-        imgVolumes = sd.getVolsOfImage(allVols, imgUUID).keys()
+        imgVolumes = dom.getVolsOfImage(imgUUID).keys()
         dom.activateVolumes(imgUUID, imgVolumes)
 
         # Walk the volume chain using qemu-img.  Not safe for running VMs
@@ -1261,8 +1204,7 @@ class Image:
                       sdUUID, vmUUID, imgUUID, ancestor, successor,
                       str(postZero), discard)
         sdDom = sdCache.produce(sdUUID)
-        allVols = sdDom.getAllVolumes()
-        volsImgs = sd.getVolsOfImage(allVols, imgUUID)
+        volsImgs = sdDom.getVolsOfImage(imgUUID)
         # Since image namespace should be locked is produce all the volumes is
         # safe. Producing the (eventual) template is safe also.
         # TODO: Split for block and file based volumes for efficiency sake.
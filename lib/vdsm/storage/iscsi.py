@@ -32,6 +32,7 @@ import os
 import re
 
 from collections import namedtuple
+from threading import Lock
 from threading import RLock
 
 from vdsm.config import config
@@ -78,6 +79,12 @@ IscsiSession = namedtuple("IscsiSession", "id, iface, target, credentials")
 
 _iscsiadmTransactionLock = RLock()
 
+# Logging in to a node is done without holding _iscsiadmTransactionLock, so
+# a slow login does not delay other nodes. These locks serialize adding and
+# removing the same node.
+_nodeLocksLock = Lock()
+_nodeLocks = {}  # {(iface name, target address, target iqn): RLock}
+
 log = logging.getLogger('storage.ISCSI')
 
 
@@ -201,23 +208,26 @@ def addIscsiNode(iface, target, credentials=None):
     # bounded iface. Explicitly specifying tpgt on iSCSI login imposes creation
     # of the node record in the new style format which enables to access a
     # portal through multiple ifaces for multipathing.
-    with _iscsiadmTransactionLock:
-        iscsiadm.node_new(iface.name, target.address, target.iqn)
+    with _nodeLock(iface, target):
+        with _iscsiadmTransactionLock:
+            iscsiadm.node_new(iface.name, target.address, target.iqn)
         try:
-            if credentials is not None:
-                for key, value in credentials.getIscsiadmOptions():
-                    key = "node.session." + key
-                    iscsiadm.node_update(iface.name, target.address,
-                                         target.iqn, key, value,
-                                         hideValue=True)
+            with _iscsiadmTransactionLock:
+                if credentials is not None:
+                    for key, value in credentials.getIscsiadmOptions():
+                        key = "node.session." + key
+                        iscsiadm.node_update(iface.name, target.address,
+                                             target.iqn, key, value,
+                                             hideValue=True)
 
-            setRpFilterIfNeeded(iface.netIfaceName, target.portal.hostname,
-                                True)
+                setRpFilterIfNeeded(iface.netIfaceName,
+                                    target.portal.hostname, True)
 
             iscsiadm.node_login(iface.name, target.address, target.iqn)
 
-            iscsiadm.node_update(iface.name, target.address, target.iqn,
-                                 "node.startup", "manual")
+            with _iscsiadmTransactionLock:
+                iscsiadm.node_update(iface.name, target.address, target.iqn,
+                                     "node.startup", "manual")
         except:
             removeIscsiNode(iface, target)
             raise
@@ -227,7 +237,7 @@ def removeIscsiNode(iface, target):
     # Basically this command deleting a node record (see addIscsiNode).
     # Once we create a record in the new style format by specifying a tpgt,
     # we delete it in the same way.
-    with _iscsiadmTransactionLock:
+    with _nodeLock(iface, target), _iscsiadmTransactionLock:
         try:
             iscsiadm.node_disconnect(iface.name, target.address, target.iqn)
         except iscsiadm.IscsiSessionNotFound:
@@ -237,6 +247,15 @@ def removeIscsiNode(iface, target):
         setRpFilterIfNeeded(iface.netIfaceName, target.portal.hostname, False)
 
 
+def _nodeLock(iface, target):
+    key = (iface.name, target.address, target.iqn)
+    with _nodeLocksLock:
+        lock = _nodeLocks.get(key)
+        if lock is None:
+            lock = _nodeLocks[key] = RLock()
+        return lock
+
+
 def addIscsiPortal(iface, portal, credentials=None):
     discoverType = "sendtargets"
 
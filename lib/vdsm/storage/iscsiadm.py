@@ -102,23 +102,26 @@ _RESERVED_INTERFACES = ("default", "tcp", "iser")
 _iscsiadmLock = Lock()
 
 
-def _runCmd(args, hideValue=False, sync=True):
+def _runCmd(args, hideValue=False, sync=True, serialize=True):
     # FIXME: I don't use supervdsm because this entire module has to just be
     # run as root and there is no such feature yet in supervdsm. When such
     # feature exists please change this.
-    with _iscsiadmLock:
-        cmd = [constants.EXT_ISCSIADM] + args
+    cmd = [constants.EXT_ISCSIADM] + args
 
-        printCmd = None
-        if hideValue:
-            printCmd = cmd[:]
-            for i, arg in enumerate(printCmd):
-                if arg != "-v":
-                    continue
+    printCmd = None
+    if hideValue:
+        printCmd = cmd[:]
+        for i, arg in enumerate(printCmd):
+            if arg != "-v":
+                continue
 
-                if i < (len(printCmd) - 1):
-                    printCmd[i + 1] = "****"
+            if i < (len(printCmd) - 1):
+                printCmd[i + 1] = "****"
 
+    if not serialize:
+        return misc.execCmd(cmd, printable=printCmd, sudo=True, sync=sync)
+
+    with _iscsiadmLock:
         return misc.execCmd(cmd, printable=printCmd, sudo=True, sync=sync)
 
 
@@ -323,8 +326,12 @@ def node_disconnect(iface, portal, targetName):
 
 
 def node_login(iface, portal, targetName):
+    # Logging in waits for the target, which may take minutes if the target
+    # is not reachable. iscsid serializes access to the node records, so
+    # logins to different nodes can run in parallel. The caller must not
+    # modify the node while logging in.
     rc, out, err = _runCmd(["-m", "node", "-T", targetName, "-I", iface, "-p",
-                            portal, "-l"])
+                            portal, "-l"], serialize=False)
     if rc == 0:
         return
 
@@ -120,10 +120,9 @@ class LocalFsStorageDomain(fileSD.FileStorageDomain):
 
     @staticmethod
     def findDomainPath(sdUUID):
-        for tmpSdUUID, domainPath in fileSD.scanDomains("_*"):
-            if tmpSdUUID == sdUUID:
-                return domainPath
-        else:
+        try:
+            return findDomainPaths([sdUUID])[sdUUID]
+        except KeyError:
             raise se.StorageDomainDoesNotExist(sdUUID)
 
     def getRealPath(self):
@@ -132,3 +131,20 @@ class LocalFsStorageDomain(fileSD.FileStorageDomain):
 
 def findDomain(sdUUID):
     return LocalFsStorageDomain(LocalFsStorageDomain.findDomainPath(sdUUID))
+
+
+def findDomainPaths(sdUUIDs):
+    """
+    Return dict {sdUUID: domainPath} of the domains in sdUUIDs found in
+    local directories, scanning the directories once.
+    """
+    sdUUIDs = frozenset(sdUUIDs)
+    paths = {}
+    for sdUUID, domainPath in fileSD.scanDomains("_*"):
+        if sdUUID in sdUUIDs and sdUUID not in paths:
+            paths[sdUUID] = domainPath
+    return paths
+
+
+def openDomain(domainPath):
+    return LocalFsStorageDomain(domainPath)
@@ -33,6 +33,7 @@ import re
 import pwd
 import glob
 import grp
+import json
 import logging
 from collections import namedtuple
 import pprint as pp
@@ -40,12 +41,17 @@ import threading
 from itertools import chain
 from subprocess import list2cmdline
 
+import six
+
 from vdsm import constants
+from vdsm.common import fileutils
 from vdsm.storage import devicemapper
 from vdsm.storage import exception as se
 from vdsm.storage import misc
 from vdsm.storage import multipath
+from vdsm.storage import udev
 from vdsm.storage.constants import VG_EXTENT_SIZE_MB, SUPPORTED_BLOCKSIZE
+from vdsm.storage.constants import TAG_PREFIX_IMAGE, TAG_PREFIX_PARENT
 
 from vdsm.config import config
 
@@ -54,8 +60,11 @@ log = logging.getLogger("storage.LVM")
 PV_FIELDS = ("uuid,name,size,vg_name,vg_uuid,pe_start,pe_count,"
              "pe_alloc_count,mda_count,dev_size,mda_used_count")
 VG_FIELDS = ("uuid,name,attr,size,free,extent_size,extent_count,free_count,"
-             "tags,vg_mda_size,vg_mda_free,lv_count,pv_count,pv_name")
+             "tags,vg_mda_size,vg_mda_free,vg_seqno,lv_count,pv_count,"
+             "pv_name")
 LV_FIELDS = "uuid,name,vg_name,attr,size,seg_start_pe,devices,tags"
+# Reported by lvs for detecting VG metadata changes, not part of the LV.
+LVS_VG_FIELDS = "vg_uuid,vg_seqno"
 
 VG_ATTR_BITS = ("permission", "resizeable", "exported",
                 "partial", "allocation", "clustered")
@@ -96,7 +105,7 @@ re_pvName = re.compile(PV_PREFIX + '[^\s\"]+', re.MULTILINE)
 
 PVS_CMD = ("pvs",) + LVM_FLAGS + ("-o", PV_FIELDS)
 VGS_CMD = ("vgs",) + LVM_FLAGS + ("-o", VG_FIELDS)
-LVS_CMD = ("lvs",) + LVM_FLAGS + ("-o", LV_FIELDS)
+LVS_CMD = ("lvs",) + LVM_FLAGS + ("-o", LV_FIELDS + "," + LVS_VG_FIELDS)
 
 # FIXME we must use different METADATA_USER ownership for qemu-unreadable
 # metadata volumes
@@ -130,6 +139,12 @@ VDSM_LVM_CONF = os.path.join(VDSM_LVM_SYSTEM_DIR, "lvm.conf")
 
 USER_DEV_LIST = filter(None, config.get("irs", "lvm_dev_whitelist").split(","))
 
+RELOAD_WINDOW = config.getfloat("irs", "lvm_reload_window")
+
+# Snapshot of the LVM cache, used to restore the cache when vdsm is restarted.
+SNAPSHOT_PATH = os.path.join(VDSM_LVM_SYSTEM_DIR, "cache.json")
+SNAPSHOT_VERSION = 1
+
 
 def _buildFilter(devices):
     strippeds = set(d.strip() for d in devices)
@@ -173,7 +188,8 @@ def _updateLvmConf(conf):
 def _normalizeargs(args=None):
     if args is None:
         args = []
-    elif not hasattr(args, "__iter__"):
+    elif (isinstance(args, six.string_types) or
+          not hasattr(args, "__iter__")):
         args = [args]
 
     return args
@@ -231,6 +247,140 @@ def makeLV(*args):
     return LV(*args)
 
 
+def _parseLvsLine(line):
+    """
+    Parse a line of LVS_CMD output, returning the LV, and the uuid and the
+    metadata sequence number of the VG.
+    """
+    fields = [field.strip() for field in line.split(SEPARATOR)]
+    vg_uuid, vg_seqno = fields[-2:]
+    return makeLV(*fields[:-2]), vg_uuid, vg_seqno
+
+
+def _lvFields(lv):
+    """
+    Return lv as a list of LV_FIELDS strings, reversing makeLV().
+    """
+    return [lv.uuid, lv.name, lv.vg_name, "".join(lv.attr), lv.size,
+            lv.seg_start_pe, lv.devices, ",".join(lv.tags)]
+
+
+def _setLVActive(lv, active):
+    """
+    Return a copy of lv with updated activation state.
+    """
+    if active:
+        attr = lv.attr._replace(state="a")
+        return lv._replace(attr=attr, active=True)
+    else:
+        attr = lv.attr._replace(state="-", devopen="-")
+        return lv._replace(attr=attr, active=False, opened=False)
+
+
+class VGLVs(object):
+    """
+    The cached LVs of a single VG.
+
+    Keeps LV and Stub instances by name, and indexes the LVs by image and
+    parent tags, so looking up the volumes of an image or the children of a
+    volume does not scan the entire VG. Must be modified only under
+    LVMCache._lock.
+    """
+
+    # Tags are short, so comparing tag prefixes is cheaper than startswith().
+    INDEXED_TAG_PREFIXES = frozenset([TAG_PREFIX_IMAGE, TAG_PREFIX_PARENT])
+    PREFIX_LEN = 3
+
+    def __init__(self):
+        self._lvs = {}
+        self._tags = {}
+        self._stubs = set()
+        # True when all the LVs of the VG were loaded.
+        self.complete = False
+        # The VG uuid and metadata sequence number when all the LVs were
+        # loaded.
+        self.vg_uuid = None
+        self.vg_seqno = None
+        # True when the VG metadata may have been modified since the LVs were
+        # loaded. Such LVs must be verified using the VG metadata sequence
+        # number before using them.
+        self.suspect = False
+
+    @property
+    def stale(self):
+        """
+        Return True if the VG LVs must be reloaded before using them.
+        """
+        return not self.complete or bool(self._stubs)
+
+    def get(self, lvName):
+        return self._lvs.get(lvName)
+
+    def add(self, lv):
+        """
+        Add or replace an LV or a Stub.
+        """
+        name = lv.name
+        if name in self._lvs:
+            self.remove(name)
+        self._lvs[name] = lv
+        if isinstance(lv, Stub):
+            self._stubs.add(name)
+        else:
+            tags = self._tags
+            for tag in lv.tags:
+                if tag[:self.PREFIX_LEN] not in self.INDEXED_TAG_PREFIXES:
+                    continue
+                if tag in tags:
+                    tags[tag].add(name)
+                else:
+                    tags[tag] = {name}
+
+    def remove(self, lvName):
+        lv = self._lvs.pop(lvName, None)
+        if lv is None:
+            return None
+        if isinstance(lv, Stub):
+            self._stubs.discard(lvName)
+        else:
+            for tag in lv.tags:
+                names = self._tags.get(tag)
+                if names is None:
+                    continue
+                names.discard(lvName)
+                if not names:
+                    del self._tags[tag]
+        return lv
+
+    def names(self):
+        return list(self._lvs)
+
+    def values(self):
+        return list(self._lvs.values())
+
+    def lvs(self):
+        """
+        Return the LVs, skipping stubs.
+        """
+        if not self._stubs:
+            return list(self._lvs.values())
+        return [lv for lv in self._lvs.values() if not isinstance(lv, Stub)]
+
+    def stubs(self):
+        return [self._lvs[lvName] for lvName in self._stubs]
+
+    def by_tag(self, tag):
+        if tag[:self.PREFIX_LEN] in self.INDEXED_TAG_PREFIXES:
+            return [self._lvs[lvName] for lvName in self._tags.get(tag, ())]
+        return [lv for lv in self.lvs() if tag in lv.tags]
+
+    def __len__(self):
+        return len(self._lvs)
+
+    def __repr__(self):
+        return pp.pformat(self._lvs)
+
+
 class LVMCache(object):
     """
     Keep all the LVM information.
@@ -271,7 +421,8 @@ class LVMCache(object):
         self.invalidateFilter()
         self.flush()
 
-    def __init__(self):
+    def __init__(self, reloadWindow=RELOAD_WINDOW):
+        self._events = False
         self._filterStale = True
         self._extraCfg = None
         self._filterLock = threading.Lock()
@@ -281,7 +432,13 @@ class LVMCache(object):
         self._stalelv = True
         self._pvs = {}
         self._vgs = {}
+        # VG name -> VGLVs
         self._lvs = {}
+        # Reloading single VGs concurrently is done using one command.
+        self._vgsReloader = misc.CoalescingMethod(self._reloadvgsBatch,
+                                                  reloadWindow)
+        self._lvsReloader = misc.CoalescingMethod(self._reloadlvsBatch,
+                                                  reloadWindow)
 
     def cmd(self, cmd, devices=tuple()):
         finalCmd = self._addExtraCfg(cmd, devices)
@@ -305,10 +462,109 @@ class LVMCache(object):
                  pp.pformat(self._vgs),
                  pp.pformat(self._lvs)))
 
-    def bootstrap(self):
+    def bootstrap(self, snapshot=None, skiplvs=()):
+        """
+        Load all PVs, VGs and LVs. If snapshot is given, the LVs of VGs not
+        modified since the snapshot was taken are restored from the snapshot
+        instead of reading them using lvm.
+        """
         self._reloadpvs()
         self._reloadvgs()
-        self._reloadAllLvs()
+        if snapshot is None:
+            self._reloadAllLvs()
+            return
+
+        restored = self._restorelvs(snapshot, skiplvs)
+
+        with self._lock:
+            stale = [vgName for vgName, vg in self._vgs.items()
+                     if not isinstance(vg, Stub) and
+                     (vgName not in self._lvs or self._lvs[vgName].stale)]
+
+        log.info("Restored lvs from snapshot: restored=%s reloading=%s",
+                 restored, stale)
+        if stale:
+            self._loadlvs(stale)
+
+        with self._lock:
+            self._stalelv = False
+
+    def snapshot(self):
+        """
+        Return a snapshot of the LVs of the fully loaded VGs, suitable for
+        serializing to json. The snapshot includes the VG uuid, metadata
+        sequence number and PVs, used to detect if the VG was modified when
+        restoring the snapshot.
+        """
+        vgs = {}
+        with self._lock:
+            for vgName, vglvs in self._lvs.items():
+                if vglvs.stale or vglvs.suspect:
+                    continue
+                vg = self._vgs.get(vgName)
+                if (vg is None or isinstance(vg, Stub) or
+                        vglvs.vg_seqno is None or
+                        vg.uuid != vglvs.vg_uuid or
+                        vg.vg_seqno != vglvs.vg_seqno):
+                    continue
+                vgs[vgName] = {
+                    "uuid": vg.uuid,
+                    "seqno": vg.vg_seqno,
+                    "pvs": sorted(vg.pv_name),
+                    "lvs": [_lvFields(lv) for lv in vglvs.lvs()],
+                }
+        return {"version": SNAPSHOT_VERSION, "vgs": vgs}
+
+    def _restorelvs(self, snapshot, skiplvs=()):
+        """
+        Restore the LVs of VGs not modified since snapshot was taken. Must be
+        called after reloading the VGs.
+
+        The activation state of the LVs is not part of the VG metadata, so it
+        is taken from the device mapper. Since we cannot tell if an active LV
+        is open, active LVs not in skiplvs are added as stubs, reloaded later
+        using lvm.
+
+        Returns the names of the restored VGs.
+        """
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            log.warning("Ignoring lvm cache snapshot version %s",
+                        snapshot.get("version"))
+            return []
+
+        mapped = frozenset(devicemapper.getAllMappedDevices())
+        skiplvs = frozenset(skiplvs)
+        restored = []
+
+        with self._lock:
+            for vgName, vgSnapshot in snapshot["vgs"].items():
+                vgName = str(vgName)
+                vg = self._vgs.get(vgName)
+                if (vg is None or isinstance(vg, Stub) or
+                        vg.uuid != vgSnapshot["uuid"] or
+                        vg.vg_seqno != vgSnapshot["seqno"] or
+                        sorted(vg.pv_name) != vgSnapshot["pvs"]):
+                    log.debug("Not restoring modified vg %s", vgName)
+                    continue
+
+                vglvs = VGLVs()
+                for fields in vgSnapshot["lvs"]:
+                    lv = makeLV(*[str(field) for field in fields])
+                    active = getLvDmName(vgName, lv.name) in mapped
+                    if active and lv.name not in skiplvs:
+                        vglvs.add(Stub(lv.name, True))
+                    else:
+                        if lv.active != active:
+                            lv = _setLVActive(lv, active)
+                        vglvs.add(lv)
+
+                vglvs.complete = True
+                vglvs.vg_uuid = vg.uuid
+                vglvs.vg_seqno = vg.vg_seqno
+                self._lvs[vgName] = vglvs
+                restored.append(vgName)
+
+        return restored
 
     def _reloadpvs(self, pvName=None):
         cmd = list(PVS_CMD)
@@ -341,7 +597,7 @@ class LVMCache(object):
                 self._stalepv = False
                 # Remove stalePVs
                 stalePVs = [staleName for staleName in self._pvs.keys()
-                            if staleName not in updatedPVs.iterkeys()]
+                            if staleName not in updatedPVs]
                 for staleName in stalePVs:
                     log.warning("Removing stale PV: %s", staleName)
                     self._pvs.pop((staleName), None)
@@ -364,15 +620,38 @@ class LVMCache(object):
         return devices
 
     def _reloadvgs(self, vgName=None):
-        cmd = list(VGS_CMD)
         vgNames = _normalizeargs(vgName)
+        if len(vgNames) == 1:
+            return self._vgsReloader(vgNames[0])
+        return self._loadvgs(vgNames)
+
+    def _reloadvgsBatch(self, vgNames):
+        vgs = self._loadvgs(vgNames)
+        return dict((vgName, {vgName: vgs[vgName]} if vgName in vgs else {})
+                    for vgName in vgNames)
+
+    def _loadvgs(self, vgNames):
+        """
+        Load vgNames, or all the VGs if vgNames is empty.
+        """
+        cmd = list(VGS_CMD)
         cmd.extend(vgNames)
 
         rc, out, err = self.cmd(cmd, self._getVGDevs(vgNames))
 
+        if rc != 0 and len(vgNames) > 1:
+            # Single bad VG fails the entire command. Reload every VG
+            # separately so only the bad ones are marked unreadable.
+            log.warning("lvm vgs failed for vgs %s, reloading each vg: "
+                        "%s %s %s", vgNames, rc, out, err)
+            updated = {}
+            for vgName in vgNames:
+                updated.update(self._loadvgs([vgName]))
+            return updated
+
         with self._lock:
             if rc != 0:
-                vgNames = vgNames if vgNames else self._vgs.keys()
+                vgNames = vgNames if vgNames else list(self._vgs)
                 for v in vgNames:
                     if isinstance(self._vgs.get(v), Stub):
                         self._vgs[v] = Unreadable(self._vgs[v].name, True)
@@ -395,7 +674,7 @@ class LVMCache(object):
                     vgsFields[uuid] = fields
                 else:
                     vgsFields[uuid][pvNameIdx].append(pv_name)
-            for fields in vgsFields.itervalues():
+            for fields in six.itervalues(vgsFields):
                 vg = makeVG(*fields)
                 if int(vg.pv_count) != len(vg.pv_name):
                     log.error("vg %s has pv_count %s but pv_names %s",
@@ -403,11 +682,11 @@ class LVMCache(object):
                 self._vgs[vg.name] = vg
                 updatedVGs[vg.name] = vg
             # If we updated all the VGs drop stale flag
-            if not vgName:
+            if not vgNames:
                 self._stalevg = False
                 # Remove stale VGs
                 staleVGs = [staleName for staleName in self._vgs.keys()
-                            if staleName not in updatedVGs.iterkeys()]
+                            if staleName not in updatedVGs]
                 for staleName in staleVGs:
                     removeVgMapping(staleName)
                     log.warning("Removing stale VG: %s", staleName)
@@ -417,50 +696,99 @@ class LVMCache(object):
 
     def _reloadlvs(self, vgName, lvNames=None):
         lvNames = _normalizeargs(lvNames)
+        if lvNames:
+            return self._loadlvs([vgName], lvNames)[vgName]
+        return self._lvsReloader(vgName)
+
+    def _reloadlvsBatch(self, vgNames):
+        return self._loadlvs(vgNames)
+
+    def _loadlvs(self, vgNames, lvNames=()):
+        """
+        Load lvNames in a single VG, or all the LVs of vgNames.
+
+        Returns a dict mapping VG name to the updated LVs of the VG.
+        """
         cmd = list(LVS_CMD)
         if lvNames:
+            vgName, = vgNames
             cmd.extend(["%s/%s" % (vgName, lvName) for lvName in lvNames])
         else:
-            cmd.append(vgName)
+            cmd.extend(vgNames)
 
-        rc, out, err = self.cmd(cmd, self._getVGDevs((vgName,)))
+        rc, out, err = self.cmd(cmd, self._getVGDevs(vgNames))
+
+        if rc != 0 and len(vgNames) > 1:
+            # Single bad VG fails the entire command. Reload every VG
+            # separately so we can use the good ones.
+            log.warning("lvm lvs failed for vgs %s, reloading each vg: "
+                        "%s %s %s", vgNames, rc, out, err)
+            updated = {}
+            for vgName in vgNames:
+                updated.update(self._loadlvs([vgName]))
+            return updated
 
         with self._lock:
             if rc != 0:
                 log.warning("lvm lvs failed: %s %s %s", str(rc), str(out),
                             str(err))
-                lvNames = lvNames if lvNames else self._lvs.keys()
+                vgName = vgNames[0]
+                vglvs = self._lvs.get(vgName)
+                if vglvs is None:
+                    return {vgName: {}}
+                lvNames = lvNames if lvNames else vglvs.names()
                 for l in lvNames:
-                    if isinstance(self._lvs.get(l), Stub):
-                        self._lvs[l] = Unreadable(self._lvs[l].name, True)
-                return dict(self._lvs)
-
-            updatedLVs = {}
+                    lv = vglvs.get(l)
+                    if isinstance(lv, Stub):
+                        vglvs.add(Unreadable(lv.name, True))
+                return {vgName: dict(((vgName, lv.name), lv)
+                                     for lv in vglvs.values())}
+
+            updated = dict((vgName, {}) for vgName in vgNames)
+            vgsMetadata = {}
             for line in out:
-                fields = [field.strip() for field in line.split(SEPARATOR)]
-                lv = makeLV(*fields)
+                lv, vg_uuid, vg_seqno = _parseLvsLine(line)
+                vgsMetadata[lv.vg_name] = (vg_uuid, vg_seqno)
                 # For LV we are only interested in its first extent
                 if lv.seg_start_pe == "0":
-                    self._lvs[(lv.vg_name, lv.name)] = lv
+                    self._vglvs(lv.vg_name).add(lv)
+                    updatedLVs = updated.setdefault(lv.vg_name, {})
                     updatedLVs[(lv.vg_name, lv.name)] = lv
 
-            # Determine if there are stale LVs
-            if lvNames:
-                staleLVs = (lvName for lvName in lvNames
-                            if (vgName, lvName) not in updatedLVs.iterkeys())
-            else:
-                # All the LVs in the VG
-                staleLVs = (lvName for v, lvName in self._lvs.keys()
-                            if (v == vgName) and
-                            ((vgName, lvName) not in updatedLVs.iterkeys()))
+            for vgName in vgNames:
+                vglvs = self._vglvs(vgName)
+                updatedLVs = updated[vgName]
 
-            for lvName in staleLVs:
-                log.warning("Removing stale lv: %s/%s", vgName, lvName)
-                self._lvs.pop((vgName, lvName), None)
+                # Determine if there are stale LVs
+                if lvNames:
+                    staleLVs = [lvName for lvName in lvNames
+                                if (vgName, lvName) not in updatedLVs]
+                else:
+                    # All the LVs in the VG
+                    staleLVs = [lvName for lvName in vglvs.names()
+                                if (vgName, lvName) not in updatedLVs]
+                    vglvs.complete = True
+                    vglvs.vg_uuid, vglvs.vg_seqno = vgsMetadata.get(
+                        vgName, (None, None))
+                    vglvs.suspect = False
+
+                for lvName in staleLVs:
+                    log.warning("Removing stale lv: %s/%s", vgName, lvName)
+                    vglvs.remove(lvName)
 
             log.debug("lvs reloaded")
 
-        return updatedLVs
+        return updated
+
+    def _vglvs(self, vgName):
+        """
+        Return the cached LVs of vgName, adding an empty partition for an
+        unknown VG. Must be called when holding self._lock.
+        """
+        vglvs = self._lvs.get(vgName)
+        if vglvs is None:
+            vglvs = self._lvs[vgName] = VGLVs()
+        return vglvs
 
     def _reloadAllLvs(self):
         """
@@ -468,23 +796,37 @@ class LVMCache(object):
         """
         cmd = list(LVS_CMD)
         rc, out, err = self.cmd(cmd)
-        if rc == 0:
-            updatedLVs = set()
-            for line in out:
-                fields = [field.strip() for field in line.split(SEPARATOR)]
-                lv = makeLV(*fields)
-                # For LV we are only interested in its first extent
-                if lv.seg_start_pe == "0":
-                    self._lvs[(lv.vg_name, lv.name)] = lv
-                    updatedLVs.add((lv.vg_name, lv.name))
-
-            # Remove stales
-            for vgName, lvName in self._lvs.keys():
-                if (vgName, lvName) not in updatedLVs:
-                    self._lvs.pop((vgName, lvName), None)
-                    log.error("Removing stale lv: %s/%s", vgName, lvName)
-            self._stalelv = False
-        return dict(self._lvs)
+        with self._lock:
+            if rc == 0:
+                updated = {}
+                for line in out:
+                    lv, vg_uuid, vg_seqno = _parseLvsLine(line)
+                    # For LV we are only interested in its first extent
+                    if lv.seg_start_pe == "0":
+                        vglvs = updated.get(lv.vg_name)
+                        if vglvs is None:
+                            vglvs = updated[lv.vg_name] = VGLVs()
+                            vglvs.complete = True
+                            vglvs.vg_uuid = vg_uuid
+                            vglvs.vg_seqno = vg_seqno
+                        vglvs.add(lv)
+
+                # Report stales
+                for vgName, vglvs in self._lvs.items():
+                    vgUpdated = updated.get(vgName)
+                    for lvName in vglvs.names():
+                        if vgUpdated is None or vgUpdated.get(lvName) is None:
+                            log.error("Removing stale lv: %s/%s", vgName,
+                                      lvName)
+
+                self._lvs = updated
+                self._stalelv = False
+            return self._allLvs()
+
+    def _allLvs(self):
+        return dict(((vgName, lv.name), lv)
+                    for vgName, vglvs in self._lvs.items()
+                    for lv in vglvs.values())
 
     def _invalidatepvs(self, pvNames):
         pvNames = _normalizeargs(pvNames)
@@ -511,28 +853,128 @@ class LVMCache(object):
     def _invalidatelvs(self, vgName, lvNames=None):
         lvNames = _normalizeargs(lvNames)
         with self._lock:
+            vglvs = self._vglvs(vgName)
             # Invalidate LVs in a specific VG
             if lvNames:
                 # Invalidate a specific LVs
                 for lvName in lvNames:
-                    self._lvs[(vgName, lvName)] = Stub(lvName, True)
+                    vglvs.add(Stub(lvName, True))
             else:
                 # Invalidate all the LVs in a given VG
-                for lv in self._lvs.values():
-                    if not isinstance(lv, Stub):
-                        if lv.vg_name == vgName:
-                            self._lvs[(vgName, lv.name)] = Stub(lv.name, True)
+                for lv in vglvs.lvs():
+                    vglvs.add(Stub(lv.name, True))
+                vglvs.complete = False
 
     def _invalidateAllLvs(self):
         with self._lock:
             self._stalelv = True
             self._lvs.clear()
 
+    def _invalidatevglvs(self, vgName):
+        """
+        Invalidate the LVs of vgName when the VG metadata may have been
+        modified. When following events, the LVs are reloaded only if the VG
+        metadata sequence number was changed.
+        """
+        if self._events:
+            self._suspectlvs(vgName)
+        else:
+            self._invalidatelvs(vgName)
+
+    def _suspectlvs(self, vgName=None):
+        with self._lock:
+            if vgName is None:
+                partitions = self._lvs.values()
+            else:
+                partitions = [self._lvs.get(vgName)]
+            for vglvs in partitions:
+                if vglvs is not None:
+                    vglvs.suspect = True
+
+    def _verifylvs(self, vgName):
+        """
+        Verify that the VG metadata was not modified since the LVs of vgName
+        were loaded, and reload the LVs if it was.
+        """
+        vg = self.getVg(vgName)
+        with self._lock:
+            vglvs = self._lvs.get(vgName)
+            if vglvs is None or not vglvs.suspect:
+                return
+            if (vg is not None and not isinstance(vg, Stub) and
+                    vglvs.vg_uuid == vg.uuid and
+                    vglvs.vg_seqno == vg.vg_seqno):
+                log.debug("VG %s metadata not modified (seqno=%s)",
+                          vgName, vg.vg_seqno)
+                vglvs.suspect = False
+                return
+        self._reloadlvs(vgName)
+
+    def _removelvs(self, vgName, lvNames):
+        lvNames = _normalizeargs(lvNames)
+        with self._lock:
+            vglvs = self._lvs.get(vgName)
+            if vglvs is not None:
+                for lvName in lvNames:
+                    vglvs.remove(lvName)
+
     def flush(self):
         self._invalidateAllPvs()
         self._invalidateAllVgs()
+        if self._events:
+            self._suspectlvs()
+        else:
+            self._invalidateAllLvs()
+
+    def enableEvents(self):
+        """
+        Called when starting to receive LV events. Since LV activation
+        changes are reported by events, and VG metadata changes are detected
+        using the VG metadata sequence number, LVs are reloaded only when
+        they were modified.
+        """
+        log.info("Enabling LVM cache events")
+        self._events = True
+
+    def disableEvents(self):
+        """
+        Called when LV events are not received any more. Since we may have
+        missed events, invalidate all the LVs.
+        """
+        log.info("Disabling LVM cache events")
+        self._events = False
         self._invalidateAllLvs()
 
+    def handleEvent(self, event):
+        """
+        Update the cached LVs with an udev.LVEvent.
+
+        Only the activation state is updated by events. Opening or closing
+        an LV does not emit an event, so the opened state and the devopen
+        attribute of cached LVs may be stale; callers checking them must
+        reload the LV first.
+        """
+        with self._lock:
+            vglvs = self._lvs.get(event.vg_name)
+            if vglvs is None:
+                return
+
+            if event.type == udev.LV_CHANGED:
+                # The device was reloaded or resized; the VG metadata may
+                # have changed.
+                vglvs.suspect = True
+                return
+
+            lv = vglvs.get(event.lv_name)
+            if lv is None or isinstance(lv, Stub):
+                return
+
+            active = event.type == udev.LV_ADDED
+            if lv.active != active:
+                log.debug("Updating lv %s/%s active=%s",
+                          event.vg_name, event.lv_name, active)
+                vglvs.add(_setLVActive(lv, active))
+
     def getPv(self, pvName):
         # Get specific PV
         pv = self._pvs.get(pvName)
@@ -547,7 +989,7 @@ class LVMCache(object):
             pvs = self._reloadpvs()
         else:
             pvs = dict(self._pvs)
-            stalepvs = [pv.name for pv in pvs.itervalues()
+            stalepvs = [pv.name for pv in six.itervalues(pvs)
                         if isinstance(pv, Stub)]
             if stalepvs:
                 reloaded = self._reloadpvs(stalepvs)
@@ -589,7 +1031,7 @@ class LVMCache(object):
         Fills the cache but not uses it.
         Only returns found VGs.
         """
-        return [vg for vgName, vg in self._reloadvgs(vgNames).iteritems()
+        return [vg for vgName, vg in six.iteritems(self._reloadvgs(vgNames))
                 if vgName in vgNames]
 
     def getAllVgs(self):
@@ -598,7 +1040,7 @@ class LVMCache(object):
             vgs = self._reloadvgs()
         else:
             vgs = dict(self._vgs)
-            stalevgs = [vg.name for vg in vgs.itervalues()
+            stalevgs = [vg.name for vg in six.itervalues(vgs)
                         if isinstance(vg, Stub)]
             if stalevgs:
                 reloaded = self._reloadvgs(stalevgs)
@@ -606,18 +1048,19 @@ class LVMCache(object):
         return vgs.values()
 
     def getLv(self, vgName, lvName=None):
-        # Checking self._stalelv here is suboptimal, because
-        # unnecessary reloads
-        # are done.
-
         # Return vgName/lvName info
         # If both 'vgName' and 'lvName' are None then return everything
         # If only 'lvName' is None then return all the LVs in the given VG
         # If only 'vgName' is None it is weird, so return nothing
         # (we can consider returning all the LVs with a given name)
+        vglvs = self._lvs.get(vgName)
+        if vglvs is not None and vglvs.suspect:
+            self._verifylvs(vgName)
+
         if lvName:
             # vgName, lvName
-            lv = self._lvs.get((vgName, lvName))
+            vglvs = self._lvs.get(vgName)
+            lv = vglvs.get(lvName) if vglvs is not None else None
             if not lv or isinstance(lv, Stub):
                 # while we here reload all the LVs in the VG
                 lvs = self._reloadlvs(vgName)
@@ -631,39 +1074,76 @@ class LVMCache(object):
             # If there any stale LVs reload the whole VG, since it would
             # cost us around same efforts anyhow and these stale LVs can
             # be in the vg.
-            # Will be better when the pvs dict will be part of the vg.
-            # Fix me: should not be more stubs
-            if self._stalelv or any(isinstance(lv, Stub)
-                                    for lv in self._lvs.values()):
-                lvs = self._reloadlvs(vgName)
-            else:
-                lvs = dict(self._lvs)
-            # lvs = self._reloadlvs()
-            lvs = [lv for lv in lvs.values()
-                   if not isinstance(lv, Stub) and (lv.vg_name == vgName)]
-            res = lvs
+            with self._lock:
+                vglvs = self._lvs.get(vgName)
+                if vglvs is not None and not vglvs.stale:
+                    return vglvs.lvs()
+            self._reloadlvs(vgName)
+            with self._lock:
+                vglvs = self._lvs.get(vgName)
+                res = vglvs.lvs() if vglvs is not None else []
         return res
 
+    def getLvsByTag(self, vgName, tag):
+        """
+        Return the LVs in vgName having tag.
+        """
+        vglvs = self._lvs.get(vgName)
+        if vglvs is not None and vglvs.suspect:
+            self._verifylvs(vgName)
+
+        with self._lock:
+            vglvs = self._lvs.get(vgName)
+            if vglvs is not None and not vglvs.stale:
+                return vglvs.by_tag(tag)
+        self._reloadlvs(vgName)
+        with self._lock:
+            vglvs = self._lvs.get(vgName)
+            return vglvs.by_tag(tag) if vglvs is not None else []
+
     def getAllLvs(self):
         # None, None
-        if self._stalelv or any(isinstance(lv, Stub)
-                                for lv in self._lvs.values()):
+        if self._stalelv or any(vglvs.stale or vglvs.suspect
+                                for vglvs in self._lvs.values()):
             lvs = self._reloadAllLvs()
         else:
-            lvs = dict(self._lvs)
+            with self._lock:
+                lvs = self._allLvs()
         return lvs.values()
 
 _lvminfo = LVMCache()
 
 
-def bootstrap(skiplvs=()):
+class CacheMonitor(object):
+    """
+    Keep the LVM cache up to date using LV events.
+
+    Implements the monitor interface of udev.LVMListener.
+    """
+
+    def __init__(self, cache=None):
+        self._cache = cache or _lvminfo
+
+    def start(self):
+        self._cache.enableEvents()
+
+    def handle(self, event):
+        self._cache.handleEvent(event)
+
+    def stop(self):
+        self._cache.disableEvents()
+
+
+def bootstrap(skiplvs=(), useSnapshot=False):
     """
     Bootstrap lvm module
 
     This function builds the lvm cache and ensure that all unused lvs are
-    deactivated, expect lvs matching skiplvs.
+    deactivated, expect lvs matching skiplvs. If useSnapshot is True, restore
+    the cache from the snapshot saved by saveSnapshot().
     """
-    _lvminfo.bootstrap()
+    snapshot = _loadSnapshot() if useSnapshot else None
+    _lvminfo.bootstrap(snapshot=snapshot, skiplvs=skiplvs)
 
     skiplvs = set(skiplvs)
 
@@ -674,6 +1154,7 @@ def bootstrap(skiplvs=()):
         pattern = "/run/vdsm/storage/{}/*/*".format(vg.name)
         prepared = frozenset(os.path.basename(n) for n in glob.iglob(pattern))
 
+        candidates = []
         for lv in _lvminfo.getLv(vg.name):
             if lv.active:
                 if lv.name in skiplvs:
@@ -682,11 +1163,25 @@ def bootstrap(skiplvs=()):
                 elif lv.name in prepared:
                     log.debug("Skipping prepared volume lv: vg=%s lv=%s",
                               vg.name, lv.name)
+                else:
+                    candidates.append(lv.name)
+
+        if candidates:
+            # The cached open state is not updated when another process
+            # opens or closes the LV, so reload the LVs before checking it.
+            lvs = _lvminfo._reloadlvs(vg.name, candidates)
+            for lvName in candidates:
+                lv = lvs.get((vg.name, lvName))
+                if lv is None or isinstance(lv, Stub):
+                    log.debug("Skipping unreadable lv: vg=%s lv=%s",
+                              vg.name, lvName)
+                elif not lv.active:
+                    continue
                 elif lv.opened:
                     log.debug("Skipping open lv: vg=%s lv=%s", vg.name,
-                              lv.name)
+                              lvName)
                 else:
-                    deactivate.append(lv.name)
+                    deactivate.append(lvName)
 
         if deactivate:
             log.info("Deactivating lvs: vg=%s lvs=%s", vg.name, deactivate)
@@ -703,6 +1198,34 @@ def invalidateCache():
     _lvminfo.invalidateCache()
 
 
+def saveSnapshot(path=SNAPSHOT_PATH):
+    """
+    Save a snapshot of the lvm cache, used to restore the cache in the next
+    bootstrap.
+    """
+    snapshot = _lvminfo.snapshot()
+    try:
+        with fileutils.atomic_file_write(path, "w") as f:
+            json.dump(snapshot, f)
+    except EnvironmentError as e:
+        log.warning("Cannot save lvm cache snapshot %s: %s", path, e)
+        return
+    log.info("Saved lvm cache snapshot %s: vgs=%s", path,
+             sorted(snapshot["vgs"]))
+
+
+def _loadSnapshot(path=SNAPSHOT_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except EnvironmentError as e:
+        if e.errno != errno.ENOENT:
+            log.warning("Cannot read lvm cache snapshot %s: %s", path, e)
+    except ValueError as e:
+        log.warning("Ignoring invalid lvm cache snapshot %s: %s", path, e)
+    return None
+
+
 def _fqpvname(pv):
     if pv and not pv.startswith(PV_PREFIX):
         pv = os.path.join(PV_PREFIX, pv)
@@ -1004,7 +1527,7 @@ def createVG(vgName, devices, initialTag, metadataSize, force=False):
 def removeVG(vgName):
     cmd = ["vgremove", "-f", vgName]
     rc, out, err = _lvminfo.cmd(cmd, _lvminfo._getVGDevs((vgName, )))
-    pvs = tuple(pvName for pvName, pv in _lvminfo._pvs.iteritems()
+    pvs = tuple(pvName for pvName, pv in six.iteritems(_lvminfo._pvs)
                 if not isinstance(pv, Stub) and pv.vg_name == vgName)
     # PVS needs to be reloaded anyhow: if vg is removed they are staled,
     # if vg remove failed, something must be wrong with devices and we want
@@ -1079,7 +1602,7 @@ def deactivateVG(vgName):
 def invalidateVG(vgName, invalidateLVs=True, invalidatePVs=False):
     _lvminfo._invalidatevgs(vgName)
     if invalidateLVs:
-        _lvminfo._invalidatelvs(vgName)
+        _lvminfo._invalidatevglvs(vgName)
     if invalidatePVs:
         vgPvs = listPVNames(vgName)
         _lvminfo._invalidatepvs(pvNames=vgPvs)
@@ -1198,11 +1721,10 @@ def removeLVs(vgName, lvNames):
         cmd.append("%s/%s" % (vgName, lvName))
     rc, out, err = _lvminfo.cmd(cmd, _lvminfo._getVGDevs((vgName, )))
     if rc == 0:
-        for lvName in lvNames:
-            # Remove the LV from the cache
-            _lvminfo._lvs.pop((vgName, lvName), None)
-            # If lvremove succeeded it affected VG as well
-            _lvminfo._invalidatevgs(vgName)
+        # Remove the LVs from the cache
+        _lvminfo._removelvs(vgName, lvNames)
+        # If lvremove succeeded it affected VG as well
+        _lvminfo._invalidatevgs(vgName)
     else:
         # Otherwise LV info needs to be refreshed
         _lvminfo._invalidatelvs(vgName, lvNames)
@@ -1318,7 +1840,7 @@ def renameLV(vg, oldlv, newlv):
     if rc != 0:
         raise se.LogicalVolumeRenameError("%s %s %s" % (vg, oldlv, newlv))
 
-    _lvminfo._lvs.pop((vg, oldlv), None)
+    _lvminfo._removelvs(vg, oldlv)
     _lvminfo._reloadlvs(vg, newlv)
 
 
@@ -1491,7 +2013,7 @@ def setrwLV(vg_name, lv_name, rw=True):
 
 
 def lvsByTag(vgName, tag):
-    return [lv for lv in getLV(vgName) if tag in lv.tags]
+    return _lvminfo.getLvsByTag(vgName, tag)
 
 
 def invalidateFilter():
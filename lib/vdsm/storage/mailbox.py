@@ -20,6 +20,8 @@
 
 from __future__ import absolute_import
 import array
+import io
+import mmap
 import os
 import errno
 import time
@@ -29,8 +31,10 @@ import logging
 
 import uuid
 
+import six
 from six.moves import queue
 
+from vdsm import metrics
 from vdsm.config import config
 from vdsm.storage import misc
 from vdsm.storage import task
@@ -39,6 +43,8 @@ from vdsm.storage.threadPool import ThreadPool
 
 from vdsm import constants
 from vdsm.common import concurrent
+from vdsm.common.osutils import uninterruptible
+from vdsm.common.time import monotonic_time
 
 __author__ = "ayalb"
 __date__ = "$Mar 9, 2009 5:25:07 PM$"
@@ -90,6 +96,61 @@ def _mboxExecCmd(*args, **kwargs):
     return misc.execCmd(*args, **kwargs)
 
 
+def _direct_read(path, buf, offset=0):
+    """
+    Read len(buf) bytes from path at offset into mmap buf, using direct I/O.
+    offset must be aligned to the storage block size.
+
+    Returns:
+        The number of bytes read (int), always len(buf).
+
+    Raises:
+        IOError if the file ended before len(buf) bytes were read.
+    """
+    size = len(buf)
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+    with io.FileIO(fd, "r") as f:
+        f.seek(offset)
+        pos = uninterruptible(f.readinto, buf)
+        while 0 < pos < size:
+            # Short read. A writable mmap cannot be sliced in python 2, so
+            # we read the rest into a new aligned buffer.
+            tmp = mmap.mmap(-1, size - pos)
+            try:
+                n = uninterruptible(f.readinto, tmp)
+                if n == 0:
+                    break
+                buf[pos:pos + n] = tmp[:n]
+                pos += n
+            finally:
+                tmp.close()
+    if pos < size:
+        raise IOError(errno.EIO, "Short read from %s at offset %d: read %d "
+                      "of %d bytes" % (path, offset, pos, size))
+    return pos
+
+
+def _direct_write(path, buf, offset, size):
+    """
+    Write size bytes from mmap buf at offset to path at the same offset,
+    using direct I/O. offset and size must be aligned to the storage block
+    size.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_DIRECT)
+    with io.FileIO(fd, "w") as f:
+        f.seek(offset)
+        end = offset + size
+        pos = offset
+        while pos < end:
+            # Slicing a python 2 buffer copies the data to unaligned memory,
+            # so we must create a new buffer for every write.
+            if six.PY2:
+                wbuf = buffer(buf, pos, end - pos)  # NOQA: F821 (python 2)
+            else:
+                wbuf = memoryview(buf)[pos:end]
+            pos += uninterruptible(f.write, wbuf)
+
+
 class SPM_Extend_Message:
 
     log = logging.getLogger('storage.SPM.Messages.Extend')
@@ -185,7 +246,8 @@ class HSM_Mailbox:
 
     log = logging.getLogger('storage.Mailbox.HSM')
 
-    def __init__(self, hostID, poolID, inbox, outbox, monitorInterval=2):
+    def __init__(self, hostID, poolID, inbox, outbox, monitorInterval=2,
+                 minPollInterval=None, requestTimeout=None):
         self._hostID = str(hostID)
         self._poolID = str(poolID)
         self._monitorInterval = monitorInterval
@@ -203,7 +265,8 @@ class HSM_Mailbox:
             raise RuntimeError("HSM_Mailbox create failed - outbox %s does "
                                "not exist" % repr(self._outbox))
         self._mailman = HSM_MailMonitor(self._inbox, self._outbox, hostID,
-                                        self._queue, monitorInterval)
+                                        self._queue, monitorInterval,
+                                        minPollInterval, requestTimeout)
         self.log.debug('HSM_MailboxMonitor created for pool %s' % self._poolID)
 
     def sendExtendMsg(self, volumeData, newSize, callbackFunction=None):
@@ -223,11 +286,15 @@ class HSM_Mailbox:
     def wait(self, timeout=None):
         return self._mailman.wait(timeout)
 
+    def stats(self):
+        return self._mailman.stats()
+
 
 class HSM_MailMonitor(object):
     log = logging.getLogger('storage.MailBox.HsmMailMonitor')
 
-    def __init__(self, inbox, outbox, hostID, queue, monitorInterval):
+    def __init__(self, inbox, outbox, hostID, queue, monitorInterval,
+                 minPollInterval=None, requestTimeout=None):
         # Save arguments
         tpSize = config.getint('irs', 'thread_pool_size') // 2
         waitTimeout = wait_timeout(monitorInterval)
@@ -237,18 +304,32 @@ class HSM_MailMonitor(object):
         self._queue = queue
         self._activeMessages = {}
         self._monitorInterval = monitorInterval
+        if minPollInterval is None:
+            minPollInterval = config.getfloat(
+                'irs', 'hsm_mailbox_min_poll_interval')
+        # While requests are pending, poll for replies every minPollInterval,
+        # backing off up to monitorInterval.
+        self._minPollInterval = min(minPollInterval, monitorInterval)
+        self._pollInterval = self._minPollInterval
+        if requestTimeout is None:
+            requestTimeout = config.getfloat(
+                'irs', 'hsm_mailbox_request_timeout')
+        self._requestTimeout = requestTimeout
+        # Maps active message slot to the time the message was sent.
+        self._sendTimes = {}
+        self._timedOut = set()
+        self._statsLock = threading.Lock()
+        self._stats = {"requests": 0, "replies": 0, "timeouts": 0,
+                       "rtt_last": 0.0, "rtt_max": 0.0, "rtt_total": 0.0}
         self._hostID = int(hostID)
         self._used_slots_array = [0] * MESSAGES_PER_MAILBOX
         self._outgoingMail = EMPTYMAILBOX
         self._incomingMail = EMPTYMAILBOX
         # TODO: add support for multiple paths (multiple mailboxes)
-        self._inCmd = [constants.EXT_DD,
-                       'if=' + str(inbox),
-                       'iflag=direct,fullblock',
-                       'bs=' + str(MAILBOX_SIZE),
-                       'count=1',
-                       'skip=' + str(self._hostID)
-                       ]
+        # The inbox is polled frequently while requests are pending, so it is
+        # read in process using direct I/O into a page aligned buffer.
+        self._inbox = inbox
+        self._inBuf = mmap.mmap(-1, MAILBOX_SIZE)
         self._outCmd = [constants.EXT_DD,
                         'of=' + str(outbox),
                         'iflag=fullblock',
@@ -268,14 +349,105 @@ class HSM_MailMonitor(object):
 
     def _initMailbox(self):
         # Sync initial incoming mail state with storage view
-        (rc, out, err) = _mboxExecCmd(self._inCmd, raw=True)
-        if rc == 0:
-            self._incomingMail = out
-            self._init = True
-        else:
+        try:
+            self._incomingMail = self._readMailbox()
+        except (EnvironmentError, RuntimeError) as e:
             self.log.warning("HSM_MailboxMonitor - Could not initialize "
                              "mailbox, will not accept requests until init "
-                             "succeeds")
+                             "succeeds: %s", e)
+        else:
+            self._init = True
+
+    def _readMailbox(self):
+        _direct_read(self._inbox, self._inBuf, self._hostID * MAILBOX_SIZE)
+        return self._inBuf[:]
+
+    def stats(self):
+        """
+        Return extend requests statistics:
+
+            requests    number of requests sent to the SPM
+            replies     number of replies received from the SPM
+            timeouts    number of requests not answered within the request
+                        timeout
+            pending     number of requests waiting for a reply
+            rtt_last    round trip time of the last reply in seconds
+            rtt_max     maximum round trip time in seconds
+            rtt_avg     average round trip time in seconds
+        """
+        with self._statsLock:
+            stats = dict(self._stats)
+        rtt_total = stats.pop("rtt_total")
+        stats["rtt_avg"] = rtt_total / stats["replies"] if stats["replies"] \
+            else 0.0
+        stats["pending"] = len(self._sendTimes)
+        return stats
+
+    def _requestSent(self, slot):
+        self._sendTimes[slot] = monotonic_time()
+        with self._statsLock:
+            self._stats["requests"] += 1
+
+    def _replyReceived(self, slot):
+        sent = self._sendTimes.pop(slot, None)
+        if sent is None:
+            return
+        self._timedOut.discard(slot)
+        rtt = monotonic_time() - sent
+        with self._statsLock:
+            self._stats["replies"] += 1
+            self._stats["rtt_last"] = rtt
+            self._stats["rtt_max"] = max(self._stats["rtt_max"], rtt)
+            self._stats["rtt_total"] += rtt
+        self.log.debug("HSM_MailMonitor - reply for message %s received in "
+                       "%.3f seconds", slot, rtt)
+        metrics.send({"hosts.storage.mailbox.rtt": rtt})
+
+    def _checkTimeouts(self):
+        now = monotonic_time()
+        for slot, sent in six.iteritems(self._sendTimes):
+            if slot in self._timedOut:
+                continue
+            if now - sent >= self._requestTimeout:
+                self._timedOut.add(slot)
+                with self._statsLock:
+                    self._stats["timeouts"] += 1
+                    timeouts = self._stats["timeouts"]
+                self.log.warning("HSM_MailMonitor - no reply from SPM for "
+                                 "message %s in %.3f seconds: %r",
+                                 slot, now - sent,
+                                 self._activeMessages[slot].payload)
+                metrics.send({"hosts.storage.mailbox.timeouts": timeouts})
+
+    def _waitForMessage(self, timeout):
+        """
+        Wait until timeout expires or a new message is queued, so new
+        requests are sent without waiting for the next poll.
+
+        Returns True if a new message was handled.
+        """
+        if len(self._activeMessages) >= MESSAGES_PER_MAILBOX:
+            time.sleep(timeout)
+            return False
+        try:
+            message = self._queue.get(block=True, timeout=timeout)
+        except queue.Empty:
+            return False
+        self._handleMessage(message)
+        return True
+
+    def _nextPollInterval(self, sentMail):
+        """
+        Return the interval before checking for replies again. Poll quickly
+        after sending mail, since replies are expected soon, and back off
+        while waiting.
+        """
+        if sentMail:
+            self._pollInterval = self._minPollInterval
+        else:
+            self._pollInterval = min(self._pollInterval * 2,
+                                     self._monitorInterval)
+        return self._pollInterval
 
     def immStop(self):
         self._stop = True
@@ -329,6 +501,7 @@ class HSM_MailMonitor(object):
 
             msg = self._activeMessages[i]
             self._activeMessages[i] = CLEAN_MESSAGE
+            self._replyReceived(i)
             self._outgoingMail = self._outgoingMail[0:start] + \
                 CLEAN_MESSAGE + self._outgoingMail[start + MESSAGE_SIZE:]
 
@@ -365,14 +538,7 @@ class HSM_MailMonitor(object):
 
     def _checkForMail(self):
         # self.log.debug("HSM_MailMonitor - checking for mail")
-        # self.log.debug("Running command: " + str(self._inCmd))
-        (rc, in_mail, err) = misc.execCmd(self._inCmd, raw=True)
-        if rc:
-            raise RuntimeError("_handleResponses.Could not read mailbox - rc "
-                               "%s" % rc)
-        if (len(in_mail) != MAILBOX_SIZE):
-            raise RuntimeError("_handleResponses.Could not read mailbox - len "
-                               "%s != %s" % (len(in_mail), MAILBOX_SIZE))
+        in_mail = self._readMailbox()
         # self.log.debug("Parsing inbox content: %s", in_mail)
         return self._handleResponses(in_mail)
 
@@ -411,6 +577,7 @@ class HSM_MailMonitor(object):
         self._msgCounter += 1
         self._used_slots_array[freeSlot] = 1
         self._activeMessages[freeSlot] = message
+        self._requestSent(freeSlot)
         start = freeSlot * MESSAGE_SIZE
         end = start + MESSAGE_SIZE
         self._outgoingMail = self._outgoingMail[0:start] + message.payload + \
@@ -434,10 +601,12 @@ class HSM_MailMonitor(object):
                 except:
                     pass
 
+            newMessage = False
             while not self._stop:
                 try:
                     message = None
-                    sendMail = False
+                    sendMail = newMessage
+                    newMessage = False
                     # If no message is pending, block_wait until a new message
                     # or stop command arrives
                     while not self._stop and not message and \
@@ -483,15 +652,18 @@ class HSM_MailMonitor(object):
                     if sendMail:
                         self._sendMail()
 
+                    self._checkTimeouts()
+
                     # If there are active messages waiting for SPM reply, wait
-                    # a few seconds before performing another IO op
+                    # before performing another IO op
                     if self._activeMessages and not self._stop:
                         # If recurring failures then sleep for one minute
                         # before retrying
                         if (failures > 9):
                             time.sleep(60)
                         else:
-                            time.sleep(self._monitorInterval)
+                            newMessage = self._waitForMessage(
+                                self._nextPollInterval(sendMail))
 
                 except:
                     self.log.error("HSM_MailboxMonitor - Incoming mail"
@@ -544,30 +716,26 @@ class SPM_MailMonitor:
         self._outMailLen = MAILBOX_SIZE * self._numHosts
         self._monitorInterval = monitorInterval
         # TODO: add support for multiple paths (multiple mailboxes)
-        self._outgoingMail = self._outMailLen * b"\0"
-        self._incomingMail = self._outgoingMail
-        self._inCmd = ['dd',
-                       'if=' + str(self._inbox),
-                       'iflag=direct,fullblock',
-                       'count=1'
-                       ]
-        self._outCmd = ['dd',
-                        'of=' + str(self._outbox),
-                        'oflag=direct',
-                        'iflag=fullblock',
-                        'conv=notrunc',
-                        'count=1'
-                        ]
+        # The mailboxes are read and written in process using direct I/O, so
+        # the buffers must be aligned; mmap memory is page aligned, and
+        # initialized with zeros.
+        self._outgoingMail = mmap.mmap(-1, self._outMailLen)
+        self._incomingMail = mmap.mmap(-1, self._outMailLen)
+        self._inBuf = mmap.mmap(-1, self._outMailLen)
+        # Set when the outgoing mail was modified and must be written to
+        # storage. Kept until the write succeeds.
+        self._outgoingDirty = False
         self._outLock = threading.Lock()
         self._inLock = threading.Lock()
         # Clear outgoing mail
-        self.log.debug("SPM_MailMonitor - clearing outgoing mail, command is: "
-                       "%s", self._outCmd)
-        cmd = self._outCmd + ['bs=' + str(self._outMailLen)]
-        (rc, out, err) = _mboxExecCmd(cmd, data=self._outgoingMail)
-        if rc:
-            self.log.warning("SPM_MailMonitor couldn't clear outgoing mail, "
-                             "dd failed")
+        self.log.debug("SPM_MailMonitor - clearing outgoing mail %s",
+                       self._outbox)
+        try:
+            _direct_write(self._outbox, self._outgoingMail, 0,
+                          self._outMailLen)
+        except EnvironmentError as e:
+            self.log.warning("SPM_MailMonitor couldn't clear outgoing mail: "
+                             "%s", e)
 
         self._thread = concurrent.thread(
             self._run, name="mailbox-spm", log=self.log)
@@ -608,150 +776,153 @@ class SPM_MailMonitor:
         return True
 
     def _handleRequests(self, newMail):
+        """
+        Handle new requests in newMail, a buffer holding the current content
+        of all the host mailboxes.
 
+        Only mailboxes changed since the last read are examined, and only
+        changed messages are handled as new requests.
+
+        Returns True if the outgoing mail was modified.
+        """
         send = False
 
-        # run through all messages and check if new messages have arrived
-        # (since last read)
+        # Most of the time no host sends any mail, and this single comparison
+        # is all the work needed.
+        if newMail[:] == self._incomingMail[:]:
+            return send
+
         for host in range(0, self._numHosts):
-            # Check mailbox checksum
             mailboxStart = host * MAILBOX_SIZE
+            mailboxEnd = mailboxStart + MAILBOX_SIZE
+            mailbox = newMail[mailboxStart:mailboxEnd]
+            oldMailbox = self._incomingMail[mailboxStart:mailboxEnd]
 
-            isMailboxValidated = False
-
-            for i in range(0, MESSAGES_PER_MAILBOX):
-
-                msgId = host * SLOTS_PER_MAILBOX + i
-                msgStart = msgId * MESSAGE_SIZE
-
-                # First byte of message is message version.  Check message
-                # version, if 0 then message is empty and can be skipped
-                if newMail[msgStart] in ['\0', '0']:
-                    continue
-
-                # Most mailboxes are probably empty so it costs less to check
-                # that all messages start with 0 than to validate the mailbox,
-                # therefor this is done after we find a non empty message in
-                # mailbox
-                if not isMailboxValidated:
-                    if not self.validateMailbox(
-                            newMail[mailboxStart:mailboxStart + MAILBOX_SIZE],
-                            host):
-                        # Cleaning invalid mbx in newMail
-                        newMail = newMail[:mailboxStart] + EMPTYMAILBOX + \
-                            newMail[mailboxStart + MAILBOX_SIZE:]
-                        break
-                    self.log.debug("SPM_MailMonitor: Mailbox %s validated, "
-                                   "checking mail", host)
-                    isMailboxValidated = True
+            # If the mailbox did not change, all messages were already
+            # handled and can be skipped.
+            if mailbox == oldMailbox:
+                continue
+
+            if self._handleMailbox(host, mailbox, oldMailbox):
+                send = True
+
+        return send
+
+    def _handleMailbox(self, host, mailbox, oldMailbox):
+        """
+        Handle a mailbox changed since the last read, and update the incoming
+        mail.
+
+        Returns True if the outgoing mail was modified.
+        """
+        send = False
+        mailboxStart = host * MAILBOX_SIZE
+        isMailboxValidated = False
+
+        for i in range(0, MESSAGES_PER_MAILBOX):
+            msgStart = i * MESSAGE_SIZE
+            newMsg = mailbox[msgStart:msgStart + MESSAGE_SIZE]
+
+            # First byte of message is message version.  Check message
+            # version, if 0 then message is empty and can be skipped
+            if newMsg[0:1] in (b"\0", b"0"):
+                continue
+
+            # Most mailboxes are probably empty so it costs less to check
+            # that all messages start with 0 than to validate the mailbox,
+            # therefor this is done after we find a non empty message in
+            # mailbox
+            if not isMailboxValidated:
+                if not self.validateMailbox(mailbox, host):
+                    # Forget the invalid mailbox, so all its messages are
+                    # considered new when it becomes valid.
+                    mailbox = EMPTYMAILBOX
+                    break
+                self.log.debug("SPM_MailMonitor: Mailbox %s validated, "
+                               "checking mail", host)
+                isMailboxValidated = True
 
-                newMsg = newMail[msgStart:msgStart + MESSAGE_SIZE]
+            msgId = host * SLOTS_PER_MAILBOX + i
+            if newMsg == CLEAN_MESSAGE:
                 msgOffset = msgId * MESSAGE_SIZE
-                if newMsg == CLEAN_MESSAGE:
-                    # Should probably put a setter on outgoingMail which would
-                    # take the lock
-                    with self._outLock:
-                        self._outgoingMail = \
-                            self._outgoingMail[0:msgOffset] + CLEAN_MESSAGE + \
-                            self._outgoingMail[msgOffset + MESSAGE_SIZE:
-                                               self._outMailLen]
-                    send = True
-                    continue
-
-                # Message isn't empty, check if its new
-                isMessageNew = False
-                for j in range(msgStart, msgStart + MESSAGE_SIZE):
-                    if newMail[j] != self._incomingMail[j]:
-                        isMessageNew = True
-                        break
+                with self._outLock:
+                    self._outgoingMail[msgOffset:msgOffset + MESSAGE_SIZE] = \
+                        CLEAN_MESSAGE
+                send = True
+                continue
 
-                # If search exhausted, i.e. message hasn't changed since last
-                # read, it can be skipped
-                if not isMessageNew:
-                    continue
+            # If the message hasn't changed since last read, it can be
+            # skipped
+            if newMsg == oldMailbox[msgStart:msgStart + MESSAGE_SIZE]:
+                continue
 
-                # We only get here if there is a novel request
-                try:
-                    msgType = newMail[msgStart + 1:msgStart + 5]
-                    if msgType in self._messageTypes:
-                        # Use message class to process request according to
-                        # message specific logic
-                        id = str(uuid.uuid4())
-                        self.log.debug("SPM_MailMonitor: processing request: "
-                                       "%s" % repr(newMail[
-                                           msgStart:msgStart + MESSAGE_SIZE]))
-                        res = self.tp.queueTask(
-                            id, runTask, (self._messageTypes[msgType], msgId,
-                                          newMail[msgStart:
-                                                  msgStart + MESSAGE_SIZE])
-                        )
-                        if not res:
-                            raise Exception()
-                    else:
-                        self.log.error("SPM_MailMonitor: unknown message type "
-                                       "encountered: %s", msgType)
-                except RuntimeError as e:
-                    self.log.error("SPM_MailMonitor: exception: %s caught "
-                                   "while handling message: %s", str(e),
-                                   newMail[msgStart:msgStart + MESSAGE_SIZE])
-                except:
-                    self.log.error("SPM_MailMonitor: exception caught while "
-                                   "handling message: %s",
-                                   newMail[msgStart:msgStart + MESSAGE_SIZE],
-                                   exc_info=True)
+            # We only get here if there is a novel request
+            self._queueRequest(msgId, newMsg)
 
-        self._incomingMail = newMail
+        self._incomingMail[mailboxStart:mailboxStart + MAILBOX_SIZE] = mailbox
         return send
 
+    def _queueRequest(self, msgId, newMsg):
+        try:
+            msgType = newMsg[1:5]
+            if msgType in self._messageTypes:
+                # Use message class to process request according to
+                # message specific logic
+                id = str(uuid.uuid4())
+                self.log.debug("SPM_MailMonitor: processing request: "
+                               "%s" % repr(newMsg))
+                res = self.tp.queueTask(
+                    id, runTask, (self._messageTypes[msgType], msgId, newMsg))
+                if not res:
+                    raise Exception()
+            else:
+                self.log.error("SPM_MailMonitor: unknown message type "
+                               "encountered: %s", msgType)
+        except RuntimeError as e:
+            self.log.error("SPM_MailMonitor: exception: %s caught "
+                           "while handling message: %s", str(e), newMsg)
+        except:
+            self.log.error("SPM_MailMonitor: exception caught while "
+                           "handling message: %s", newMsg, exc_info=True)
+
     def _checkForMail(self):
         # Lock is acquired in order to make sure that
         # incomingMail is not changed during checkForMail
         with self._inLock:
-            # self.log.debug("SPM_MailMonitor -_checking for mail")
-            cmd = self._inCmd + ['bs=' + str(self._outMailLen)]
-            # self.log.debug("SPM_MailMonitor - reading incoming mail, "
-            #               "command: " + str(cmd))
-            (rc, in_mail, err) = misc.execCmd(cmd, raw=True)
-            if rc:
+            try:
+                _direct_read(self._inbox, self._inBuf)
+            except EnvironmentError as e:
                 raise IOError(errno.EIO, "_handleRequests._checkForMail - "
-                              "Could not read mailbox: %s" % self._inbox)
-
-            if (len(in_mail) != (self._outMailLen)):
-                self.log.error('SPM_MailMonitor: _checkForMail - dd succeeded '
-                               'but read %d bytes instead of %d, cannot check '
-                               'mail.  Read mail contains: %s', len(in_mail),
-                               self._outMailLen, repr(in_mail[:80]))
-                raise RuntimeError("_handleRequests._checkForMail - Could not "
-                                   "read mailbox")
-            # self.log.debug("Parsing inbox content: %s", in_mail)
-            if self._handleRequests(in_mail):
+                              "Could not read mailbox: %s: %s"
+                              % (self._inbox, e))
+            if self._handleRequests(self._inBuf):
+                self._outgoingDirty = True
+            if self._outgoingDirty:
                 with self._outLock:
-                    cmd = self._outCmd + ['bs=' + str(self._outMailLen)]
-                    (rc, out, err) = _mboxExecCmd(cmd,
-                                                  data=self._outgoingMail)
-                    if rc:
+                    try:
+                        _direct_write(self._outbox, self._outgoingMail, 0,
+                                      self._outMailLen)
+                    except EnvironmentError as e:
                         self.log.warning("SPM_MailMonitor couldn't write "
-                                         "outgoing mail, dd failed")
+                                         "outgoing mail: %s", e)
+                    else:
+                        self._outgoingDirty = False
 
     def sendReply(self, msgID, msg):
         # Lock is acquired in order to make sure that
         # outgoingMail is not changed while used
         with self._outLock:
             msgOffset = msgID * MESSAGE_SIZE
-            self._outgoingMail = \
-                self._outgoingMail[0:msgOffset] + msg.payload + \
-                self._outgoingMail[msgOffset + MESSAGE_SIZE:self._outMailLen]
+            self._outgoingMail[msgOffset:msgOffset + MESSAGE_SIZE] = \
+                msg.payload
             mailboxOffset = (msgID // SLOTS_PER_MAILBOX) * MAILBOX_SIZE
-            mailbox = self._outgoingMail[mailboxOffset:
-                                         mailboxOffset + MAILBOX_SIZE]
-            cmd = self._outCmd + ['bs=' + str(MAILBOX_SIZE),
-                                  'seek=' + str(mailboxOffset // MAILBOX_SIZE)]
-            # self.log.debug("Running command: %s, for message id: %s",
-            #               str(cmd), str(msgID))
-            (rc, out, err) = _mboxExecCmd(cmd, data=mailbox)
-            if rc:
+            try:
+                _direct_write(self._outbox, self._outgoingMail, mailboxOffset,
+                              MAILBOX_SIZE)
+            except EnvironmentError as e:
                 self.log.error("SPM_MailMonitor: sendReply - couldn't send "
-                               "reply, dd failed")
+                               "reply, will retry: %s", e)
+                self._outgoingDirty = True
 
     def _run(self):
         try:
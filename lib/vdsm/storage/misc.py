@@ -37,12 +37,15 @@ import random
 import re
 import string
 import struct
+import sys
 import threading
+import time
 import uuid
 import weakref
 
 from functools import wraps, partial
 
+import six
 from six.moves import map
 from six.moves import queue
 
@@ -396,6 +399,86 @@ def samplingmethod(func):
     return helper
 
 
+class CoalescingMethod(object):
+    """
+    Merge concurrent calls with different keys into a single call.
+
+    The wrapped function is called with a list of keys, and must return a
+    dict mapping keys to results. Every caller gets the result for its key,
+    or None if the function did not return a result for this key.
+
+    When the function is not running, the first caller calls it
+    immediately. Calls made while the function is running are collected
+    into the next call, so a caller never gets a result computed before it
+    was called: the first of these callers waits window seconds for other
+    callers to join, and then calls the function with all the keys, while
+    the other callers wait.
+
+    If the function raises, all the callers get the exception.
+    """
+    _log = logging.getLogger("storage.CoalescingMethod")
+
+    def __init__(self, func, window):
+        self._func = func
+        self._window = window
+        self._lock = threading.Lock()
+        # The batch accepting new keys, if any.
+        self._batch = None
+        # Number of batches running now.
+        self._running = 0
+
+    def __call__(self, key):
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+                contended = self._running > 0
+            batch.add(key)
+
+        if leader:
+            self._run(batch, contended)
+        else:
+            batch.done.wait()
+
+        if batch.error:
+            six.reraise(*batch.error)
+
+        return batch.result.get(key)
+
+    def _run(self, batch, contended):
+        if contended and self._window:
+            time.sleep(self._window)
+
+        with self._lock:
+            self._batch = None
+            self._running += 1
+
+        self._log.debug("Calling %s with %d keys", self._func.__name__,
+                        len(batch.keys))
+        try:
+            batch.result = self._func(batch.keys)
+        except:
+            batch.error = sys.exc_info()
+        finally:
+            with self._lock:
+                self._running -= 1
+            batch.done.set()
+
+
+class _Batch(object):
+
+    def __init__(self):
+        self.keys = []
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def add(self, key):
+        if key not in self.keys:
+            self.keys.append(key)
+
+
 def getfds():
     return [int(fd) for fd in os.listdir("/proc/self/fd")]
 
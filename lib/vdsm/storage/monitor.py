@@ -21,11 +21,15 @@
 from __future__ import absolute_import
 
 import logging
+import random
 import threading
 import time
 
+from vdsm import executor
+from vdsm import schedule
 from vdsm import utils
 from vdsm.common import concurrent
+from vdsm.common.time import monotonic_time
 from vdsm.config import config
 from vdsm.storage import check
 from vdsm.storage import clusterlock
@@ -139,7 +143,11 @@ class DomainStatus(object):
 
 class DomainMonitor(object):
 
-    def __init__(self, interval):
+    # Every domain has at most one monitor cycle waiting in the executor
+    # queue, so this limits the number of monitored domains.
+    MAX_TASKS = 10000
+
+    def __init__(self, interval, workers=None):
         self._monitors = {}
         self._interval = interval
         # NOTE: This must be used in asynchronous mode to prevent blocking of
@@ -148,6 +156,21 @@ class DomainMonitor(object):
             "storage.DomainMonitor.onDomainStateChange", sync=False)
         self._checker = check.CheckService()
         self._checker.start()
+        if workers is None:
+            workers = config.getint("irs", "domain_monitor_workers")
+        self._scheduler = None
+        self._executor = None
+        if workers:
+            # Monitors run in a shared pool of workers instead of a thread per
+            # domain. A blocked worker is replaced by a new worker, so the
+            # number of workers is not limited.
+            self._scheduler = schedule.Scheduler(name="monitor/sched",
+                                                 clock=monotonic_time)
+            self._scheduler.start()
+            self._executor = executor.Executor(
+                name="monitor", workers_count=workers,
+                max_tasks=self.MAX_TASKS, scheduler=self._scheduler)
+            self._executor.start()
 
     @property
     def domains(self):
@@ -181,8 +204,14 @@ class DomainMonitor(object):
             return
 
         log.info("Start monitoring %s", sdUUID)
-        monitor = MonitorThread(sdUUID, hostId, self._interval,
-                                self.onDomainStateChange, self._checker)
+        if self._executor:
+            monitor = ScheduledMonitor(sdUUID, hostId, self._interval,
+                                       self.onDomainStateChange,
+                                       self._checker, self._scheduler,
+                                       self._executor)
+        else:
+            monitor = MonitorThread(sdUUID, hostId, self._interval,
+                                    self.onDomainStateChange, self._checker)
         monitor.poolDomain = poolDomain
         monitor.start()
         # The domain should be added only after it succesfully started
@@ -223,6 +252,9 @@ class DomainMonitor(object):
         log.info("Shutting down domain monitors")
         self._stopMonitors(self._monitors.values(), shutdown=True)
         self._checker.stop()
+        if self._executor:
+            self._executor.stop(wait=False)
+            self._scheduler.stop()
 
     def _stopMonitors(self, monitors, shutdown=False):
         # The domain monitor issues events that might become raceful if
@@ -309,11 +341,14 @@ class MonitorThread(object):
         except utils.Canceled:
             log.debug("Domain monitor for %s canceled", self.sdUUID)
         finally:
-            log.debug("Domain monitor for %s stopped (shutdown=%s)",
-                      self.sdUUID, self.wasShutdown)
-            self._stopCheckingPath()
-            if self._shouldReleaseHostId():
-                self._releaseHostId()
+            self._monitorStopped()
+
+    def _monitorStopped(self):
+        log.debug("Domain monitor for %s stopped (shutdown=%s)",
+                  self.sdUUID, self.wasShutdown)
+        self._stopCheckingPath()
+        if self._shouldReleaseHostId():
+            self._releaseHostId()
 
     # Setting up
 
@@ -322,18 +357,24 @@ class MonitorThread(object):
         Set up the monitor, retrying on failures. Returns when the monitor is
         ready.
         """
-        while True:
-            try:
-                self._setupMonitor()
-                return
-            except Exception as e:
-                log.exception("Setting up monitor for %s failed", self.sdUUID)
-                domain_status = DomainStatus(error=e)
-                status = Status(self.status._path_status, domain_status)
-                self._updateStatus(status)
-                self.cycleCallback()
-                if self.stopEvent.wait(self.interval):
-                    raise utils.Canceled
+        while not self._trySetup():
+            if self.stopEvent.wait(self.interval):
+                raise utils.Canceled
+
+    def _trySetup(self):
+        """
+        Try to set up the monitor. Returns True if the monitor is ready.
+        """
+        try:
+            self._setupMonitor()
+            return True
+        except Exception as e:
+            log.exception("Setting up monitor for %s failed", self.sdUUID)
+            domain_status = DomainStatus(error=e)
+            status = Status(self.status._path_status, domain_status)
+            self._updateStatus(status)
+            self.cycleCallback()
+            return False
 
     def _setupMonitor(self):
         # Pick up changes in the domain, for example, domain upgrade.
@@ -381,15 +422,18 @@ class MonitorThread(object):
         Monitor the domain peroidically until the monitor is stopped.
         """
         while True:
-            try:
-                self._monitorDomain()
-            except Exception:
-                log.exception("Domain monitor for %s failed", self.sdUUID)
-            finally:
-                self.cycleCallback()
+            self._monitorCycle()
             if self.stopEvent.wait(self.interval):
                 raise utils.Canceled
 
+    def _monitorCycle(self):
+        try:
+            self._monitorDomain()
+        except Exception:
+            log.exception("Domain monitor for %s failed", self.sdUUID)
+        finally:
+            self.cycleCallback()
+
     def _monitorDomain(self):
         # Pick up changes in the domain, for example, domain upgrade.
         if self._shouldRefreshDomain():
@@ -579,5 +623,125 @@ class MonitorThread(object):
                           self.hostId, self.sdUUID)
 
 
+# ScheduledMonitor states
+SCHEDULED = "scheduled"
+RUNNING = "running"
+STOPPED = "stopped"
+
+
+class ScheduledMonitor(MonitorThread):
+    """
+    Monitor a domain like MonitorThread, running the monitor cycles in a
+    shared executor instead of a dedicated thread.
+
+    The next cycle is scheduled interval seconds after the previous cycle has
+    completed, with a random jitter, so monitors started at the same time
+    spread over time. A cycle blocked on storage blocks only the executor
+    worker running it, and the executor replaces the worker if the cycle
+    takes more than interval seconds. The next cycle of the domain is not
+    scheduled before the blocked cycle returns.
+    """
+
+    JITTER = 0.1
+
+    def __init__(self, sdUUID, hostId, interval, changeEvent, checker,
+                 scheduler, executor):
+        super(ScheduledMonitor, self).__init__(
+            sdUUID, hostId, interval, changeEvent, checker)
+        self.thread = None
+        self._scheduler = scheduler
+        self._executor = executor
+        self._stateLock = threading.Lock()
+        self._state = None
+        self._call = None
+        self._ready = False
+        self._stopped = threading.Event()
+
+    def start(self):
+        with self._stateLock:
+            self._state = RUNNING
+            self._executor.dispatch(self._cycle, timeout=self.interval)
+
+    def stop(self, shutdown=False):
+        self.wasShutdown = shutdown
+        self.stopEvent.set()
+        with self._stateLock:
+            if self._state is None:
+                # Never started.
+                self._state = STOPPED
+                self._stopped.set()
+            # If waiting for the next cycle, run it now to stop the monitor.
+            elif self._state is SCHEDULED:
+                self._call.cancel()
+                self._dispatch()
+
+    def join(self):
+        self._stopped.wait()
+
+    def _schedule(self):
+        """
+        Must be called when holding self._stateLock.
+        """
+        delay = self.interval * random.uniform(1 - self.JITTER,
+                                               1 + self.JITTER)
+        self._state = SCHEDULED
+        self._call = self._scheduler.schedule(delay, self._scheduled)
+
+    def _scheduled(self):
+        """
+        Called in the scheduler thread when the next cycle is due.
+        """
+        with self._stateLock:
+            if self._state is SCHEDULED:
+                self._dispatch()
+
+    def _dispatch(self):
+        """
+        Must be called when holding self._stateLock.
+        """
+        self._state = RUNNING
+        self._call = None
+        try:
+            self._executor.dispatch(self._cycle, timeout=self.interval)
+        except Exception:
+            # The executor was stopped or overloaded.
+            log.exception("Cannot run domain monitor for %s", self.sdUUID)
+            if self.stopEvent.is_set():
+                # Stopping must not depend on the executor.
+                concurrent.thread(self._cycle, log=log,
+                                  name="monitor/" + self.sdUUID[:7]).start()
+            else:
+                self._schedule()
+
+    def _cycle(self):
+        """
+        Called in an executor worker to run one monitor cycle.
+        """
+        try:
+            if self.stopEvent.is_set():
+                raise utils.Canceled
+            if not self._ready:
+                self._ready = self._trySetup()
+            if self._ready:
+                self._monitorCycle()
+        except utils.Canceled:
+            log.debug("Domain monitor for %s canceled", self.sdUUID)
+
+        with self._stateLock:
+            if not self.stopEvent.is_set():
+                self._schedule()
+                return
+            self._state = STOPPED
+
+        try:
+            self._monitorStopped()
+        finally:
+            self._stopped.set()
+
+    def __repr__(self):
+        return "<%s %s %s at 0x%x>" % (
+            self.__class__.__name__, self.sdUUID, self._state, id(self))
+
+
 def _NULL_CALLBACK():
     pass
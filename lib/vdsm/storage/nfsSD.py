@@ -110,13 +110,10 @@ class NfsStorageDomain(fileSD.FileStorageDomain):
 
     @staticmethod
     def findDomainPath(sdUUID):
-        for tmpSdUUID, domainPath in fileSD.scanDomains("*"):
-            if tmpSdUUID == sdUUID:
-                mountpoint = os.path.dirname(domainPath)
-                if mount.isMounted(mountpoint):
-                    return domainPath
-
-        raise se.StorageDomainDoesNotExist(sdUUID)
+        try:
+            return findDomainPaths([sdUUID])[sdUUID]
+        except KeyError:
+            raise se.StorageDomainDoesNotExist(sdUUID)
 
     def getRealPath(self):
         try:
@@ -127,3 +124,22 @@ class NfsStorageDomain(fileSD.FileStorageDomain):
 
 def findDomain(sdUUID):
     return NfsStorageDomain(NfsStorageDomain.findDomainPath(sdUUID))
+
+
+def findDomainPaths(sdUUIDs):
+    """
+    Return dict {sdUUID: domainPath} of the domains in sdUUIDs found on
+    mounted file systems, scanning the mounts once.
+    """
+    sdUUIDs = frozenset(sdUUIDs)
+    paths = {}
+    for sdUUID, domainPath in fileSD.scanDomains("*"):
+        if sdUUID in sdUUIDs and sdUUID not in paths:
+            mountpoint = os.path.dirname(domainPath)
+            if mount.isMounted(mountpoint):
+                paths[sdUUID] = domainPath
+    return paths
+
+
+def openDomain(domainPath):
+    return NfsStorageDomain(domainPath)
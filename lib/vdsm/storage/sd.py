@@ -33,6 +33,7 @@ from vdsm import utils
 from vdsm.common import exception
 from vdsm.common.threadlocal import vars
 from vdsm.config import config
+from vdsm.storage import chainindex
 from vdsm.storage import clusterlock
 from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
@@ -322,6 +323,7 @@ class StorageDomainManifest(object):
         self.replaceMetadata(metadata)
         self._domainLock = self._makeDomainLock()
         self._external_leases_lock = rwlock.RWLock()
+        self._chains = chainindex.ChainIndex(self)
 
     @classmethod
     def special_volumes(cls, version):
@@ -451,6 +453,56 @@ class StorageDomainManifest(object):
         return self.getVolumeClass()(self.mountpoint, self.sdUUID, imgUUID,
                                      volUUID)
 
+    # Volume chains
+
+    def getVolumesTree(self, imgUUID):
+        """
+        Return dict {volUUID: chainindex.VolumeNode(imgUUID, parentUUID)} of
+        the volumes in image imgUUID. File domains include also the template
+        volume, belonging to the template image.
+        """
+        raise NotImplementedError
+
+    def getImageVolumesStamps(self, imgUUID):
+        """
+        Return dict {volUUID: stamp} of the volumes in image imgUUID, without
+        reading the volumes metadata. The stamp of a volume must change when
+        the volume parent is changed. File domains include also the template
+        volume.
+        """
+        raise NotImplementedError
+
+    def getImageChain(self, imgUUID, volUUID=None):
+        """
+        Return list of volumes UUIDs in image chain, sorted from base to top,
+        not including the template. See chainindex.ChainIndex.chain().
+        """
+        return self._chains.chain(imgUUID, volUUID)
+
+    def invalidateImage(self, imgUUID):
+        """
+        Must be called after adding or removing volumes in imgUUID, or
+        changing the parent of a volume in imgUUID.
+        """
+        self._chains.invalidate(imgUUID)
+
+    def getVolsOfImage(self, imgUUID):
+        """
+        Return getVolsOfImage(self.getAllVolumes(), imgUUID). Domains keeping
+        an index of the volumes may override this.
+        """
+        return getVolsOfImage(self.getAllVolumes(), imgUUID)
+
+    def getVolumesMetadata(self, imgUUID, volUUIDs):
+        """
+        Return dict {volUUID: metadata} of volumes volUUIDs in image imgUUID,
+        where metadata is the dict returned by VolumeManifest.getMetadata().
+        Domains that can read the metadata of many volumes at once may
+        override this.
+        """
+        return {volUUID: self.produceVolume(imgUUID, volUUID).getMetadata()
+                for volUUID in volUUIDs}
+
     def isISO(self):
         return self.getMetaParam(DMDK_CLASS) == ISO_DOMAIN
 
@@ -728,6 +780,18 @@ class StorageDomain(object):
     def getAllVolumes(self):
         return self._manifest.getAllVolumes()
 
+    def getImageChain(self, imgUUID, volUUID=None):
+        return self._manifest.getImageChain(imgUUID, volUUID)
+
+    def invalidateImage(self, imgUUID):
+        self._manifest.invalidateImage(imgUUID)
+
+    def getVolsOfImage(self, imgUUID):
+        return self._manifest.getVolsOfImage(imgUUID)
+
+    def getVolumesMetadata(self, imgUUID, volUUIDs):
+        return self._manifest.getVolumesMetadata(imgUUID, volUUIDs)
+
     def prepareMailbox(self):
         """
         This method has been introduced in order to prepare the mailbox
@@ -1183,6 +1247,13 @@ class StorageDomain(object):
         """
         pass
 
+    def refreshVolumes(self, volUUIDs):
+        """
+        Refresh volumes after they were changed by another host. Only block
+        storage domains need to refresh volumes.
+        """
+        pass
+
     def getVolumeClass(self):
         """
         Return a type specific volume generator object
@@ -24,15 +24,31 @@ for keeping storage related data that is expensive to harvest, but needed often
 """
 from __future__ import absolute_import
 
+import errno
+import json
 import logging
+import os
 import threading
+import time
 
+from six.moves import queue
+
+from vdsm import constants
+from vdsm.common import concurrent
+from vdsm.common import fileutils
+from vdsm.config import config
 from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
 from vdsm.storage import lvm
 from vdsm.storage import misc
 from vdsm.storage import multipath
 
+# Keeps the module where each domain was found, so the next vdsm process can
+# look for the domain in the right place first.
+DOMAIN_TYPES_PATH = os.path.join(constants.P_VDSM_RUN, "domain-types.json")
+
+DISCOVERY_WINDOW = config.getfloat("irs", "domain_discovery_window")
+
 
 class DomainProxy(object):
     """
@@ -63,13 +79,24 @@ class StorageDomainCache:
     STORAGE_STALE = 1
     STORAGE_REFRESHING = 2
 
-    def __init__(self, storage_repo):
+    def __init__(self, storage_repo, domain_types_path=DOMAIN_TYPES_PATH,
+                 discovery_window=DISCOVERY_WINDOW):
         self._syncroot = threading.Condition()
         self.__domainCache = {}
         self.__inProgress = set()
         self.__staleStatus = self.STORAGE_STALE
         self.storage_repo = storage_repo
         self.knownSDs = {}  # {sdUUID: mod.findDomain}
+        self._domainTypesPath = domain_types_path
+        self._domainTypesLock = threading.Lock()
+        self._domainTypes = None  # {sdUUID: module name}, loaded lazily
+        # Looking up unknown domains concurrently is done using one scan of
+        # every storage backend.
+        self._domainFinder = misc.CoalescingMethod(
+            self._findUnfetchedDomains, discovery_window)
+        # Every storage backend is scanned by one thread at a time.
+        self._probersLock = threading.Lock()
+        self._probers = {}  # {module: _Prober}
 
     def invalidateStorage(self):
         with self._syncroot:
@@ -151,37 +178,175 @@ class StorageDomainCache:
         return findMethod(sdUUID)
 
     def _findUnfetchedDomain(self, sdUUID):
+        domain = self._domainFinder(sdUUID)
+        if domain is None:
+            raise se.StorageDomainDoesNotExist(sdUUID)
+        return domain
+
+    def _findUnfetchedDomains(self, sdUUIDs):
+        """
+        Look up sdUUIDs in all the storage backends, scanning every backend
+        once. Returns dict {sdUUID: domain} of the domains found.
+        """
         from vdsm.storage import blockSD
         from vdsm.storage import glusterSD
         from vdsm.storage import localFsSD
         from vdsm.storage import nfsSD
 
-        self.log.debug("looking for domain %s", sdUUID)
+        self.log.debug("looking for domains %s", sdUUIDs)
+
+        # The backends are scanned concurrently, but if a domain is found in
+        # several backends, the domain found in the first backend is used.
+        # The order is by how quickly we can find the domain, so we do not
+        # wait for unavailable nfs mounts when a domain was found in a faster
+        # backend.
+        modules = [blockSD, glusterSD, localFsSD, nfsSD]
+        domains = {}
+
+        # If a domain was found before, look there first.
+        known = {}
+        for sdUUID in sdUUIDs:
+            domainType = self._getDomainType(sdUUID)
+            for mod in modules:
+                if mod.__name__ == domainType:
+                    known.setdefault(mod, []).append(sdUUID)
+                    break
+        if known:
+            self._discoverDomains(
+                [(mod, known[mod]) for mod in modules if mod in known],
+                domains)
+
+        missing = [sdUUID for sdUUID in sdUUIDs if sdUUID not in domains]
+        if missing:
+            probes = []
+            for mod in modules:
+                probed = known.get(mod, ())
+                uuids = [sdUUID for sdUUID in missing if sdUUID not in probed]
+                if uuids:
+                    probes.append((mod, uuids))
+            self._discoverDomains(probes, domains)
+
+        return domains
+
+    def _discoverDomains(self, probes, domains):
+        """
+        Run probes concurrently, adding found domains to domains. probes is a
+        list of (module, sdUUIDs) tuples, ordered by module preference.
+
+        Every domain is opened using the first module finding it. If opening
+        the domain fails, the next module finding it is used.
 
-        # The order is somewhat important, it's ordered
-        # by how quickly get can find the domain. For instance
-        # if an nfs mount is unavailable we will get stuck
-        # until it times out, this should affect fetching
-        # of block\local domains. If for any case in the future
-        # this changes, please update the order.
-        for mod in (blockSD, glusterSD, localFsSD, nfsSD):
+        Returns when every domain was opened or all the modules were
+        scanned. Slow modules that cannot change the result are not waited
+        for; they keep scanning in the background, and later lookups in the
+        same module are merged into the next scan.
+        """
+        results = queue.Queue()
+        for mod, sdUUIDs in probes:
+            self._prober(mod).probe(sdUUIDs, results)
+
+        found = {}  # {mod: {sdUUID: domainPath}}
+        failed = set()  # {(mod, sdUUID)}
+        while len(found) < len(probes):
+            mod, paths = results.get()
+            found[mod] = paths
+            if all(self._openDomain(sdUUID, probes, found, failed, domains)
+                   for _, sdUUIDs in probes for sdUUID in sdUUIDs):
+                break
+
+    def _openDomain(self, sdUUID, probes, found, failed, domains):
+        """
+        Try to open sdUUID using the first module that found it. Returns
+        True if sdUUID was resolved: opened, or not found by any module
+        probing it.
+        """
+        if sdUUID in domains:
+            return True
+        for mod, sdUUIDs in probes:
+            if sdUUID not in sdUUIDs or (mod, sdUUID) in failed:
+                continue
+            if mod not in found:
+                # A preferred module is still scanning.
+                return False
+            if sdUUID not in found[mod]:
+                continue
             try:
-                return mod.findDomain(sdUUID)
-            except se.StorageDomainDoesNotExist:
-                pass
+                domains[sdUUID] = mod.openDomain(found[mod][sdUUID])
             except Exception:
-                self.log.error("Error while looking for domain `%s`", sdUUID,
-                               exc_info=True)
-
-        raise se.StorageDomainDoesNotExist(sdUUID)
+                self.log.error("Error while looking for domain `%s` in %s",
+                               sdUUID, mod.__name__, exc_info=True)
+                failed.add((mod, sdUUID))
+            else:
+                self._setDomainType(sdUUID, mod.__name__)
+                return True
+        return True
+
+    def _prober(self, mod):
+        with self._probersLock:
+            prober = self._probers.get(mod)
+            if prober is None:
+                prober = self._probers[mod] = _Prober(mod)
+            return prober
+
+    def _getDomainType(self, sdUUID):
+        with self._domainTypesLock:
+            return self._domainTypesDict().get(sdUUID)
+
+    def _setDomainType(self, sdUUID, domainType):
+        with self._domainTypesLock:
+            domainTypes = self._domainTypesDict()
+            if domainTypes.get(sdUUID) == domainType:
+                return
+            domainTypes[sdUUID] = domainType
+            try:
+                with fileutils.atomic_file_write(
+                        self._domainTypesPath, "w") as f:
+                    json.dump(domainTypes, f)
+            except EnvironmentError as e:
+                self.log.warning("Cannot save domain types %s: %s",
+                                 self._domainTypesPath, e)
+
+    def _domainTypesDict(self):
+        """
+        Return the domain types, loading them on the first call. Must be
+        called when holding self._domainTypesLock.
+        """
+        if self._domainTypes is None:
+            self._domainTypes = {}
+            try:
+                with open(self._domainTypesPath) as f:
+                    domainTypes = json.load(f)
+            except EnvironmentError as e:
+                if e.errno != errno.ENOENT:
+                    self.log.warning("Cannot read domain types %s: %s",
+                                     self._domainTypesPath, e)
+            except ValueError as e:
+                self.log.warning("Ignoring invalid domain types %s: %s",
+                                 self._domainTypesPath, e)
+            else:
+                if isinstance(domainTypes, dict):
+                    self._domainTypes = domainTypes
+                else:
+                    self.log.warning("Ignoring invalid domain types %s",
+                                     self._domainTypesPath)
+        return self._domainTypes
 
     def getUUIDs(self):
         from vdsm.storage import blockSD
         from vdsm.storage import fileSD
 
+        def listDomains(mod):
+            start = time.time()
+            uuids = mod.getStorageDomainsList()
+            self.log.info("Listed %d domains in %s in %.2f seconds",
+                          len(uuids), mod.__name__, time.time() - start)
+            return uuids
+
         uuids = []
-        for mod in (blockSD, fileSD):
-            uuids.extend(mod.getStorageDomainsList())
+        for res in concurrent.tmap(listDomains, (blockSD, fileSD)):
+            if not res.succeeded:
+                raise res.value
+            uuids.extend(res.value)
 
         return uuids
 
@@ -202,4 +367,72 @@ class StorageDomainCache:
                 pass
 
 
+class _Prober(object):
+    """
+    Look up domains in a storage backend, using at most one thread.
+
+    Lookups requested while the backend is being scanned are merged into
+    the next scan, so a slow or hung backend does not accumulate threads.
+    """
+
+    log = logging.getLogger("storage.StorageDomainCache")
+
+    def __init__(self, mod):
+        self._mod = mod
+        self._lock = threading.Lock()
+        self._requests = []  # [(sdUUIDs, results)]
+        self._running = False
+
+    def probe(self, sdUUIDs, results):
+        """
+        Look up sdUUIDs, putting (module, {sdUUID: domainPath}) in the
+        results queue when the scan is done.
+        """
+        with self._lock:
+            self._requests.append((sdUUIDs, results))
+            if self._running:
+                return
+            self._running = True
+        try:
+            t = concurrent.thread(
+                self._run, name="sdc/" + self._mod.__name__.rsplit(".", 1)[-1],
+                log=self.log)
+            t.start()
+        except:
+            with self._lock:
+                self._running = False
+            raise
+
+    def _run(self):
+        while True:
+            with self._lock:
+                requests, self._requests = self._requests, []
+                if not requests:
+                    self._running = False
+                    return
+
+            sdUUIDs = set()
+            for uuids, _ in requests:
+                sdUUIDs.update(uuids)
+            paths = self._find(sorted(sdUUIDs))
+
+            for uuids, results in requests:
+                results.put((self._mod, {sdUUID: paths[sdUUID]
+                                         for sdUUID in uuids
+                                         if sdUUID in paths}))
+
+    def _find(self, sdUUIDs):
+        start = time.time()
+        try:
+            paths = self._mod.findDomainPaths(sdUUIDs)
+        except Exception:
+            self.log.error("Error while looking for domains %s in %s",
+                           sdUUIDs, self._mod.__name__, exc_info=True)
+            paths = {}
+        self.log.info("Found %d of %d domains in %s in %.2f seconds",
+                      len(paths), len(sdUUIDs), self._mod.__name__,
+                      time.time() - start)
+        return paths
+
+
 sdCache = StorageDomainCache(sc.REPO_DATA_CENTER)
@@ -32,7 +32,6 @@ import sys
 from vdsm.config import config
 from vdsm import utils
 from vdsm.common import supervdsm
-from vdsm.common import udevadm
 from vdsm.gluster import cli as gluster_cli
 from vdsm.gluster import exception as ge
 from vdsm.storage import exception as se
@@ -485,9 +484,12 @@ class IscsiConnection(object):
         self._cred = credentials
 
     def connect(self):
+        """
+        Log in to the target. The caller must rescan multipath devices and
+        wait for udev events after connecting, usually once for all the
+        connections, using sdCache.refreshStorage().
+        """
         iscsi.addIscsiNode(self._iface, self._target, self._cred)
-        timeout = config.getint("irs", "udev_settle_timeout")
-        udevadm.settle(timeout)
 
     def _match(self, session):
         target = session.target
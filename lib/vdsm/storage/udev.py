@@ -37,6 +37,18 @@ MPATH_REMOVED = "removed"
 PATH_FAILED = "failed"
 PATH_REINSTATED = "reinstated"
 
+LVEvent = namedtuple("LVEvent", "type, vg_name, lv_name")
+
+LV_ADDED = "added"
+LV_CHANGED = "changed"
+LV_REMOVED = "removed"
+
+_LV_EVENT_TYPES = {
+    "add": LV_ADDED,
+    "change": LV_CHANGED,
+    "remove": LV_REMOVED,
+}
+
 
 def create_observer(monitor, callback, name):
     """
@@ -92,9 +104,19 @@ class MultipathMonitor(object):
         """
 
 
-class MultipathListener(object):
+class Listener(object):
+    """
+    Listen to udev events of block devices, and forward the events detected
+    by the listener to registered monitors.
+
+    Subclasses must implement _detect_event().
+    """
     log = logging.getLogger("storage.udev")
 
+    # Used for logging and for naming the observer thread.
+    kind = None
+    thread_name = None
+
     def __init__(self):
         self._lock = threading.Lock()
         self._monitors = set()
@@ -113,7 +135,7 @@ class MultipathListener(object):
         Raise:
             Exception if a registered monitor failed to start.
         """
-        self.log.info("Starting multipath event listener")
+        self.log.info("Starting %s event listener", self.kind)
         with self._lock:
             if self._observer is not None:
                 raise AssertionError("Listener already started")
@@ -126,7 +148,7 @@ class MultipathListener(object):
             monitor.filter_by("block", device_type="disk")
             self._observer = create_observer(monitor,
                                              self._callback,
-                                             name="mpathlistener")
+                                             name=self.thread_name)
 
             # NOTE: order is important!
 
@@ -146,7 +168,7 @@ class MultipathListener(object):
         """
         Stop listening for events and stop registerd monitors.
         """
-        self.log.info("Stopping multipath event listener")
+        self.log.info("Stopping %s event listener", self.kind)
         with self._lock:
             if self._observer is None:
                 return
@@ -157,11 +179,11 @@ class MultipathListener(object):
     def register(self, monitor):
         """
         Register a monitor with the listener. The monitor.handle() method will
-        be invoked with a MultipathEvent instance when receiving an event from
-        udev.
+        be invoked with the detected event (e.g. a MultipathEvent instance)
+        when receiving an event from udev.
 
         The monitor.handle() method must never block, blocking will delay
-        receiving multipath events for the entire system.  If the monitor need
+        receiving events for the entire system.  If the monitor need
         to block, it should add the events to a queue and do the blocking
         operation in another thread.
 
@@ -179,7 +201,7 @@ class MultipathListener(object):
             Exception if the listener has already started, and the monitor
                 failed to start.
         """
-        self.log.info("Registering multipath event monitor %s", monitor)
+        self.log.info("Registering %s event monitor %s", self.kind, monitor)
 
         # NOTE: order is important!
 
@@ -206,7 +228,8 @@ class MultipathListener(object):
             raise
 
     def unregister(self, monitor):
-        self.log.info("Unregistering multipath event monitor %s", monitor)
+        self.log.info("Unregistering %s event monitor %s", self.kind,
+                      monitor)
         with self._lock:
             if monitor not in self._monitors:
                 raise AssertionError("Monitor %s not registered" % monitor)
@@ -226,6 +249,51 @@ class MultipathListener(object):
             self.log.debug("Forwarding %s", event)
             self._forward_event(event)
 
+    def _detect_event(self, device):
+        """
+        Return an event for device, or None if the event is not interesting.
+        """
+        raise NotImplementedError
+
+    def _forward_event(self, event):
+        with self._lock:
+            monitors = list(self._monitors)
+
+        for m in monitors:
+            try:
+                m.handle(event)
+            except Exception as e:
+                self.log.exception("Unhandled exception in %s: %s", m, e)
+
+    def _start_monitors(self, monitors):
+        started = []
+        try:
+            for m in monitors:
+                self.log.debug("Starting monitor %s", m)
+                m.start()
+                started.append(m)
+        except:
+            self._stop_monitors(started)
+            raise
+
+    def _stop_monitors(self, monitors):
+        for m in monitors:
+            self.log.debug("Stopping monitor %s", m)
+            try:
+                m.stop()
+            except Exception:
+                self.log.exception("Unhandled exception stopping %s", m)
+
+
+class MultipathListener(Listener):
+    """
+    Forward multipath events to monitors implementing the MultipathMonitor
+    interface.
+    """
+
+    kind = "multipath"
+    thread_name = "mpathlistener"
+
     def _detect_event(self, device):
         mpath_uuid = device.get("DM_UUID", "")
         if not mpath_uuid.startswith("mpath-"):
@@ -255,31 +323,37 @@ class MultipathListener(object):
         return MultipathEvent(event_type, mpath_uuid, path, valid_paths,
                               dm_seqnum)
 
-    def _forward_event(self, event):
-        with self._lock:
-            monitors = list(self._monitors)
 
-        for m in monitors:
-            try:
-                m.handle(event)
-            except Exception as e:
-                self.log.exception("Unhandled exception in %s: %s", m, e)
+class LVMListener(Listener):
+    """
+    Forward udev events of logical volumes device mapper devices, sent when
+    logical volumes are activated, refreshed or deactivated.
 
-    def _start_monitors(self, monitors):
-        started = []
-        try:
-            for m in monitors:
-                self.log.debug("Starting monitor %s", m)
-                m.start()
-                started.append(m)
-        except:
-            self._stop_monitors(started)
-            raise
+    Monitors registered with this listener implement the same interface as
+    MultipathMonitor, receiving LVEvent namedtuples. The event type is one
+    of LV_ADDED, LV_CHANGED and LV_REMOVED.
+    """
 
-    def _stop_monitors(self, monitors):
-        for m in monitors:
-            self.log.debug("Stopping monitor %s", m)
-            try:
-                m.stop()
-            except Exception:
-                self.log.exception("Unhandled exception stopping %s", m)
+    kind = "lvm"
+    thread_name = "lvmlistener"
+
+    def _detect_event(self, device):
+        if not device.get("DM_UUID", "").startswith("LVM-"):
+            return None
+
+        # Internal devices, like snapshot or thin pool layers.
+        if device.get("DM_LV_LAYER"):
+            return None
+
+        event_type = _LV_EVENT_TYPES.get(device["ACTION"])
+        if event_type is None:
+            return None
+
+        vg_name = device.get("DM_VG_NAME")
+        lv_name = device.get("DM_LV_NAME")
+        if not vg_name or not lv_name:
+            self.log.debug("Ignoring event for unknown lv (DM_NAME=%s)",
+                           device.get("DM_NAME"))
+            return None
+
+        return LVEvent(event_type, vg_name, lv_name)
@@ -1248,6 +1248,8 @@ class Volume(object):
             raise se.VolumeCreationError("Volume creation %s failed: %s" %
                                          (volUUID, e))
 
+        dom.invalidateImage(imgUUID)
+
         # Remove the rollback for the halfbaked volume
         vars.task.replaceRecoveries(
             task.Recovery("Create volume rollback", clsModule, clsName,
@@ -102,6 +102,20 @@ class VolumeMetadata(object):
             raise exception.MetaDataKeyNotFoundError(
                 "Missing metadata key: %s: found: %s" % (e, md))
 
+    @classmethod
+    def from_block(cls, data):
+        """
+        Parse volume metadata from the bytes of a metadata slot, terminated
+        by an "EOF" line and padded with zeros.
+        """
+        # Skip the padding instead of splitting it into lines.
+        end = data.find(b"\nEOF")
+        if end != -1:
+            data = data[:end]
+        if not isinstance(data, str):
+            data = data.decode("utf-8")
+        return cls.from_lines(data.splitlines())
+
     @property
     def description(self):
         return self._description
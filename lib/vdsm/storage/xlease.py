@@ -549,14 +549,7 @@ class LeasesVolume(object):
         """
         log.info("Adding lease %r in lockspace %r",
                  lease_id, self.lockspace)
-        recnum = self._index.find_record(lease_id)
-        if recnum != -1:
-            record = self._index.read_record(recnum)
-            if record.updating:
-                # TODO: rebuild this record instead of failing
-                raise LeaseUpdating(lease_id)
-            else:
-                raise LeaseExists(lease_id)
+        self._check_missing(lease_id)
 
         recnum = self._index.find_free_record()
         if recnum == -1:
@@ -600,6 +593,96 @@ class LeasesVolume(object):
 
         self._write_record(recnum, EMPTY_RECORD)
 
+    def add_many(self, lease_ids):
+        """
+        Add leases to index, returning list of LeaseInfo, ordered like
+        lease_ids.
+
+        Changed records are written to storage using one write before
+        creating the sanlock resources, and one write after. The index is
+        marked as updating during the operation; if the operation fails, the
+        index must be formatted or rebuilt from storage.
+
+        Raises:
+        - LeaseExists if lease already stored for one of lease_ids, or
+          lease_ids contains duplicates
+        - LeaseUpdating if one of lease_ids is updating
+        - InvalidRecord if corrupted lease record is found
+        - NoSpace if there are not enough free slots
+        - OSError if I/O operation failed
+        - sanlock.SanlockException if sanlock operation failed.
+        """
+        log.info("Adding leases %s in lockspace %r",
+                 lease_ids, self.lockspace)
+        seen = set()
+        for lease_id in lease_ids:
+            if lease_id in seen:
+                raise LeaseExists(lease_id)
+            seen.add(lease_id)
+            self._check_missing(lease_id)
+
+        recnums = self._index.find_free_records(len(lease_ids))
+        if len(recnums) < len(lease_ids):
+            raise NoSpace(lease_ids[len(recnums)])
+
+        if not lease_ids:
+            return []
+
+        leases = list(zip(recnums, lease_ids))
+        with self._updating():
+            self._write_records(
+                {recnum: Record(lease_id, lease_offset(recnum), updating=True)
+                 for recnum, lease_id in leases})
+
+            for recnum, lease_id in leases:
+                sanlock.write_resource(
+                    self.lockspace, lease_id,
+                    [(self._file.name, lease_offset(recnum))])
+
+            self._write_records(
+                {recnum: Record(lease_id, lease_offset(recnum))
+                 for recnum, lease_id in leases})
+
+        return [LeaseInfo(self.lockspace, lease_id, self._file.name,
+                          lease_offset(recnum))
+                for recnum, lease_id in leases]
+
+    def remove_many(self, lease_ids):
+        """
+        Remove leases from index.
+
+        Changed records are written to storage like add_many(), and the
+        index is marked as updating during the operation.
+
+        Raises:
+        - NoSuchLease if one of lease_ids was not found, or lease_ids
+          contains duplicates
+        - OSError if I/O operation failed
+        - sanlock.SanlockException if sanlock operation failed.
+        """
+        log.info("Removing leases %s in lockspace %r",
+                 lease_ids, self.lockspace)
+        leases = {}
+        for lease_id in lease_ids:
+            recnum = self._index.find_record(lease_id)
+            if recnum == -1 or recnum in leases:
+                raise NoSuchLease(lease_id)
+            leases[recnum] = lease_id
+
+        if not leases:
+            return
+
+        with self._updating():
+            self._write_records(
+                {recnum: Record(lease_id, lease_offset(recnum), updating=True)
+                 for recnum, lease_id in six.iteritems(leases)})
+
+            for recnum in leases:
+                sanlock.write_resource(
+                    "", "", [(self._file.name, lease_offset(recnum))])
+
+            self._write_records({recnum: EMPTY_RECORD for recnum in leases})
+
     def leases(self):
         """
         Return all leases in the index
@@ -624,6 +707,16 @@ class LeasesVolume(object):
         log.debug("Closing index for lockspace %r", self.lockspace)
         self._index.close()
 
+    def _check_missing(self, lease_id):
+        recnum = self._index.find_record(lease_id)
+        if recnum != -1:
+            record = self._index.read_record(recnum)
+            if record.updating:
+                # TODO: rebuild this record instead of failing
+                raise LeaseUpdating(lease_id)
+            else:
+                raise LeaseExists(lease_id)
+
     def _write_record(self, recnum, record):
         """
         Write record recnum to storage atomically.
@@ -637,6 +730,30 @@ class LeasesVolume(object):
             block.dump(self._file)
         self._index.write_record(recnum, record)
 
+    def _write_records(self, records):
+        """
+        Write records dict {recnum: record} to storage using one write.
+
+        Copy the blocks from the first to the last changed record, modify
+        them and write the blocks to storage. Every block is written
+        atomically, but the write is not. If this succeeds, write the
+        records to the index.
+        """
+        recnums = sorted(records)
+        block = self._index.copy_record_blocks(recnums[0], recnums[-1])
+        with utils.closing(block):
+            for recnum in recnums:
+                block.write_record(recnum, records[recnum])
+            block.dump(self._file)
+        for recnum in recnums:
+            self._index.write_record(recnum, records[recnum])
+
+    @contextmanager
+    def _updating(self):
+        with self._index.updating(self.lockspace, self._file):
+            yield
+        self._md = self._index.read_metadata()
+
 
 def format_index(lockspace, file):
     """
@@ -669,36 +786,49 @@ class VolumeIndex(object):
     """
     Index maintaining volume metadata and the mapping from lease id to lease
     offset.
+
+    The records are kept in a buffer using the storage format. To avoid
+    searching the buffer, the index keeps also a dict mapping the lookup key
+    of every used record to the record number, and a map of free records,
+    built when loading the index, and updated when writing records.
     """
 
+    _EMPTY_RECORD = EMPTY_RECORD.bytes()
+    _EMPTY_KEY = _EMPTY_RECORD[:LOOKUP_STRUCT.size]
+
     def __init__(self):
         self._buf = mmap.mmap(-1, INDEX_SIZE, mmap.MAP_SHARED)
+        # {lookup key: recnum}
+        self._records = {}
+        # One byte per record, 1 for free records.
+        self._free = bytearray(MAX_RECORDS)
 
     def find_record(self, lease_id):
         """
         Search for lease_id record. Returns record number if found, -1
         otherwise.
         """
-        prefix = LOOKUP_STRUCT.pack(lease_id.encode("ascii"))
-
-        # TODO: continue search if offset is not aligned to record size.
-        offset = self._buf.find(prefix, RECORD_BASE)
-        if offset == -1:
-            return -1
-
-        return self._record_number(offset)
+        key = LOOKUP_STRUCT.pack(lease_id.encode("ascii"))
+        return self._records.get(key, -1)
 
     def find_free_record(self):
         """
         Find the first free record. Returns record number if found, -1
         otherwise.
         """
-        # TODO: continue search if offset is not aligned to record size.
-        offset = self._buf.find(EMPTY_RECORD.bytes(), RECORD_BASE)
-        if offset == -1:
-            return -1
+        return self._free.find(b"\x01")
 
-        return self._record_number(offset)
+    def find_free_records(self, count):
+        """
+        Find the first count free records. Returns list of record numbers,
+        shorter than count if there are not enough free records.
+        """
+        recnums = []
+        recnum = self._free.find(b"\x01")
+        while recnum != -1 and len(recnums) < count:
+            recnums.append(recnum)
+            recnum = self._free.find(b"\x01", recnum + 1)
+        return recnums
 
     def read_record(self, recnum):
         """
@@ -718,8 +848,13 @@ class VolumeIndex(object):
         storage.
         """
         offset = self._record_offset(recnum)
+        key = self._buf[offset:offset + LOOKUP_STRUCT.size]
+        if self._records.get(key) == recnum:
+            del self._records[key]
+        data = record.bytes()
         self._buf.seek(offset)
-        self._buf.write(record.bytes())
+        self._buf.write(data)
+        self._index_record(recnum, data)
 
     def read_metadata(self):
         """
@@ -752,6 +887,19 @@ class VolumeIndex(object):
         if nread < len(self._buf):
             raise TruncatedIndex(len(self._buf), nread)
 
+        # Copying the records once and comparing to the empty record inline
+        # is much faster than indexing every record separately.
+        data = self._buf[RECORD_BASE:]
+        self._records = {}
+        self._free = bytearray(MAX_RECORDS)
+        for recnum in range(MAX_RECORDS):
+            offset = recnum * RECORD_SIZE
+            record = data[offset:offset + RECORD_SIZE]
+            if record == self._EMPTY_RECORD:
+                self._free[recnum] = 1
+            else:
+                self._index_key(recnum, record[:LOOKUP_STRUCT.size])
+
     def dump(self, file):
         """
         Write the entire buffer to storage and wait until the data reach
@@ -761,22 +909,30 @@ class VolumeIndex(object):
         file.pwrite(INDEX_BASE, self._buf)
 
     def copy_record_block(self, recnum):
-        offset = self._record_offset(recnum)
-        block_start = offset - (offset % BLOCK_SIZE)
-        return ChangeBlock(self._buf, block_start)
+        return self.copy_record_blocks(recnum, recnum)
+
+    def copy_record_blocks(self, first, last):
+        """
+        Return a ChangeBlock with the blocks holding records first to last.
+        """
+        start = self._record_offset(first)
+        start -= start % BLOCK_SIZE
+        end = self._record_offset(last)
+        end += BLOCK_SIZE - end % BLOCK_SIZE
+        return ChangeBlock(self._buf, start, size=end - start)
 
     @contextmanager
     def updating(self, lockspace, file):
         """
         Context manager for index updates.
 
-        Before entering the context, mark the index as updating. When exiting
-        cleanly from the context, clear the updating flag. If the user code
-        fails, the index will be left in updating state.
+        Before entering the context, mark the index as updating on storage.
+        When exiting cleanly from the context, clear the updating flag. If the
+        user code fails, the index will be left in updating state.
         """
         # Mark as updating
         metadata = IndexMetadata(INDEX_VERSION, lockspace, updating=True)
-        self.write_metadata(metadata)
+        self._dump_metadata(metadata, file)
 
         # Call withotu try-finally intentionally, so failure in the caller code
         # will leave the index mark as "updating".
@@ -784,19 +940,34 @@ class VolumeIndex(object):
 
         # Clear updating flag
         metadata = IndexMetadata(INDEX_VERSION, lockspace)
+        self._dump_metadata(metadata, file)
+
+    def close(self):
+        self._buf.close()
+
+    def _dump_metadata(self, metadata, file):
         block = ChangeBlock(metadata.bytes(), 0)
         with utils.closing(block):
             block.dump(file)
+        self.write_metadata(metadata)
 
-    def close(self):
-        self._buf.close()
+    def _index_record(self, recnum, data):
+        if data == self._EMPTY_RECORD:
+            self._free[recnum] = 1
+            return
+        self._free[recnum] = 0
+        self._index_key(recnum, data[:LOOKUP_STRUCT.size])
+
+    def _index_key(self, recnum, key):
+        # Empty resource in a record that is not free is invalid record, not
+        # a lease.
+        if key != self._EMPTY_KEY:
+            # Like searching the index, the first record wins.
+            self._records.setdefault(key, recnum)
 
     def _record_offset(self, recnum):
         return RECORD_BASE + recnum * RECORD_SIZE
 
-    def _record_number(self, offset):
-        return (offset - RECORD_BASE) // RECORD_SIZE
-
 
 class ChangeBlock(object):
     """
@@ -807,7 +978,7 @@ class ChangeBlock(object):
     successful, modify the original buffer.
     """
 
-    def __init__(self, buf, offset):
+    def __init__(self, buf, offset, size=BLOCK_SIZE):
         """
         Initialize a ChangeBlock from a buffer, copying the block starting at
         offset.
@@ -815,10 +986,12 @@ class ChangeBlock(object):
         Arguments:
             buf (buffer): the buffer holding the block contents
             offset (int): offset in of this block in index_buf
+            size (int): size of the change, a multiple of BLOCK_SIZE
         """
         self._offset = offset
-        self._buf = mmap.mmap(-1, BLOCK_SIZE, mmap.MAP_SHARED)
-        self._buf[:] = buf[offset:offset + BLOCK_SIZE]
+        self._size = size
+        self._buf = mmap.mmap(-1, size, mmap.MAP_SHARED)
+        self._buf[:] = buf[offset:offset + size]
 
     def write_record(self, recnum, record):
         """
@@ -835,7 +1008,8 @@ class ChangeBlock(object):
         Write the block to storage and wait until the data reach storage.
 
         This is atomic operation, the block is either fully written to storage
-        or not.
+        or not. If the change includes multiple blocks, every block is written
+        atomically.
         """
         file.pwrite(INDEX_BASE + self._offset, self._buf)
 
@@ -844,7 +1018,7 @@ class ChangeBlock(object):
 
     def _record_offset(self, recnum):
         offset = RECORD_BASE + recnum * RECORD_SIZE - self._offset
-        last_offset = BLOCK_SIZE - RECORD_SIZE
+        last_offset = self._size - RECORD_SIZE
         if not 0 <= offset <= last_offset:
             raise ValueError("recnum %s out of range for this block" % recnum)
         return offset
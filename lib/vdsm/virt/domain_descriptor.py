@@ -22,12 +22,18 @@ from __future__ import absolute_import
 from __future__ import division
 
 from contextlib import contextmanager
+import collections
 import xml.etree.ElementTree as etree
 
 from vdsm.common import xmlutils
 from vdsm.virt import metadata
 from vdsm.virt import vmxml
 
+# Index of device elements, built once for immutable descriptors.
+# by_tag: {tag: [element, ...]}, including nested elements, in document order
+# by_alias: {alias: element}, including only devices
+_DeviceIndex = collections.namedtuple("_DeviceIndex", "by_tag, by_alias")
+
 
 class MutableDomainDescriptor(object):
 
@@ -70,11 +76,21 @@ class MutableDomainDescriptor(object):
         return vmxml.find_all(self.devices, tagName)
 
     def get_device_elements_with_attrs(self, tag_name, **kwargs):
-        for element in vmxml.find_all(self.devices, tag_name):
+        for element in self.get_device_elements(tag_name):
             if all(vmxml.attr(element, key) == value
                     for key, value in kwargs.items()):
                 yield element
 
+    def get_device_element_by_alias(self, alias):
+        """
+        Return the device element with alias, or None if not found.
+        """
+        if self.devices is not None:
+            for element in vmxml.children(self.devices):
+                if vmxml.find_attr(element, 'alias', 'name') == alias:
+                    return element
+        return None
+
     @contextmanager
     def metadata_descriptor(self):
         md_desc = metadata.Descriptor.from_tree(self._dom)
@@ -126,12 +142,19 @@ class MutableDomainDescriptor(object):
 
 
 class DomainDescriptor(MutableDomainDescriptor):
+    """
+    Immutable domain descriptor.
+
+    Since the XML cannot change, the devices hash and the index of the
+    device elements are computed once, on first use.
+    """
 
     def __init__(self, xmlStr):
         super(DomainDescriptor, self).__init__(xmlStr)
         self._xml = xmlStr
         self._devices = super(DomainDescriptor, self).devices
-        self._devices_hash = super(DomainDescriptor, self).devices_hash
+        self._devices_hash = None
+        self._device_index = None
 
     @property
     def xml(self):
@@ -143,8 +166,31 @@ class DomainDescriptor(MutableDomainDescriptor):
 
     @property
     def devices_hash(self):
+        if self._devices_hash is None:
+            self._devices_hash = super(DomainDescriptor, self).devices_hash
         return self._devices_hash
 
+    def get_device_elements(self, tagName):
+        return iter(self._index().by_tag.get(tagName, ()))
+
+    def get_device_element_by_alias(self, alias):
+        return self._index().by_alias.get(alias)
+
+    def _index(self):
+        # Building the index twice in concurrent calls is harmless.
+        if self._device_index is None:
+            by_tag = collections.defaultdict(list)
+            by_alias = {}
+            if self._devices is not None:
+                for element in self._devices.iter():
+                    by_tag[vmxml.tag(element)].append(element)
+                for element in vmxml.children(self._devices):
+                    alias = vmxml.find_attr(element, 'alias', 'name')
+                    if alias:
+                        by_alias[alias] = element
+            self._device_index = _DeviceIndex(dict(by_tag), by_alias)
+        return self._device_index
+
     @contextmanager
     def metadata_descriptor(self):
         yield metadata.Descriptor.from_tree(self._dom)
@@ -32,6 +32,25 @@ class ImprobableResizeRequestError(RuntimeError):
     pass
 
 
+def block_info(stats):
+    """
+    Return dict mapping drive names to BlockInfo, using the block stats in
+    the bulk stats of a VM. Drives with partial block stats are not
+    included.
+    """
+    infos = {}
+    for index in range(stats.get('block.count', 0)):
+        try:
+            name = stats['block.%d.name' % index]
+            infos[name] = storage.BlockInfo(
+                stats['block.%d.capacity' % index],
+                stats['block.%d.allocation' % index],
+                stats['block.%d.physical' % index])
+        except KeyError:
+            continue
+    return infos
+
+
 class DriveMonitor(object):
     """
     Track the highest allocation of thin-provisioned drives
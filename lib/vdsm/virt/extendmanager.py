@@ -0,0 +1,246 @@
+#
+# Copyright 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+"""
+Host level manager for thin provisioned volumes extension.
+
+VMs request an extension when a drive is about to run out of space. The
+requests of all the VMs are sent to the SPM using the storage mailbox, which
+writes all the queued requests to the SPM in one mailbox write.
+
+The manager keeps the requests in flight per volume, so a volume checked
+again before the SPM replied is not extended twice.
+
+When the SPM replies, the volume must be refreshed on this host before the
+VM can use the new space. Replies received while a refresh is running are
+refreshed together in the next refresh, using one operation per storage
+domain.
+
+The manager keeps extension latency and queue depth statistics, reported in
+host stats.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import collections
+import functools
+import logging
+import threading
+
+import six
+
+from vdsm.common import response
+from vdsm.common.time import monotonic_time
+from vdsm.config import config
+
+# Number of completed extensions used to compute latency percentiles.
+LATENCY_SAMPLES = 1000
+
+
+class _Request(object):
+
+    def __init__(self, poolID, volInfo, newSize, callback, start):
+        self.poolID = poolID
+        self.volInfo = volInfo
+        self.newSize = newSize
+        self.callback = callback
+        self.start = start
+
+    @property
+    def key(self):
+        return (self.volInfo['domainID'], self.volInfo['volumeID'])
+
+
+class ExtendManager(object):
+
+    log = logging.getLogger("virt.extendmanager")
+
+    def __init__(self, irs, timeout=None, clock=monotonic_time):
+        """
+        irs: storage dispatcher, providing sendExtendMsg and refreshVolumes
+        timeout: number of seconds to wait for an SPM reply before sending
+                 another request for the same volume.
+        clock: callable returning monotonic time in seconds
+        """
+        if timeout is None:
+            timeout = config.getfloat('irs', 'hsm_mailbox_request_timeout')
+        self._irs = irs
+        self._timeout = timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._inflight = {}  # (domainID, volumeID) -> _Request
+        self._replied = []  # requests waiting for refresh
+        self._refreshing = False
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._requests = 0
+        self._duplicates = 0
+        self._completed = 0
+        self._refreshes = 0
+
+    def extend(self, poolID, volInfo, newSize, callback):
+        """
+        Request extension of the volume described by volInfo to newSize
+        bytes. callback(volInfo) is called after the SPM extended the volume
+        and the volume was refreshed on this host.
+
+        Return False if an extension request for the volume is in flight,
+        or sending the request failed.
+        """
+        now = self._clock()
+        req = _Request(poolID, volInfo, newSize, callback, now)
+        with self._lock:
+            inflight = self._inflight.get(req.key)
+            if inflight is not None and now - inflight.start < self._timeout:
+                self._duplicates += 1
+                self.log.debug("Extension of volume %s already in flight "
+                               "(requested %s, in flight %s)",
+                               volInfo['volumeID'], newSize, inflight.newSize)
+                return False
+            self._inflight[req.key] = req
+
+        self.log.debug("Requesting extension of volume %s to %s",
+                       volInfo['volumeID'], newSize)
+        try:
+            res = self._irs.sendExtendMsg(
+                poolID, volInfo, newSize,
+                functools.partial(self._extended, req))
+        except Exception:
+            self.log.exception("Error requesting extension of volume %s",
+                               volInfo['volumeID'])
+            self._abort(req)
+            return False
+
+        if response.is_error(res):
+            # The callback will never be called, so the volume can be
+            # extended again.
+            self.log.error("Error requesting extension of volume %s: %s",
+                           volInfo['volumeID'], res["status"]["message"])
+            self._abort(req)
+            return False
+
+        with self._lock:
+            self._requests += 1
+        return True
+
+    def stats(self):
+        """
+        Return extension statistics:
+
+            requests        number of extension requests sent
+            duplicates      number of requests dropped since an extension
+                            of the volume was in flight
+            completed       number of completed extensions
+            refreshes       number of volume refresh batches
+            inflight        number of requests waiting for SPM reply or
+                            refresh
+            refresh_queue   number of replied requests waiting for refresh
+            latency_p50     median extension latency in seconds
+            latency_p90     90th percentile of extension latency in seconds
+            latency_p99     99th percentile of extension latency in seconds
+            latency_max     maximum extension latency in seconds
+
+        Latencies are computed using the last LATENCY_SAMPLES completed
+        extensions, from the request until the volume was refreshed.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "requests": self._requests,
+                "duplicates": self._duplicates,
+                "completed": self._completed,
+                "refreshes": self._refreshes,
+                "inflight": len(self._inflight),
+                "refresh_queue": len(self._replied),
+            }
+        stats["latency_p50"] = _percentile(latencies, 50)
+        stats["latency_p90"] = _percentile(latencies, 90)
+        stats["latency_p99"] = _percentile(latencies, 99)
+        stats["latency_max"] = latencies[-1] if latencies else 0.0
+        return stats
+
+    def _extended(self, req, volInfo):
+        """
+        Called by the storage mailbox when the SPM replied.
+        """
+        with self._lock:
+            self._replied.append(req)
+            if self._refreshing:
+                # The running refresh will handle this request.
+                return
+            self._refreshing = True
+
+        while True:
+            with self._lock:
+                batch, self._replied = self._replied, []
+                if not batch:
+                    self._refreshing = False
+                    return
+                self._refreshes += 1
+            self._refresh(batch)
+            for req in batch:
+                self._complete(req)
+
+    def _refresh(self, batch):
+        volumes = collections.defaultdict(list)
+        for req in batch:
+            volumes[(req.volInfo['domainID'], req.poolID)].append(
+                req.volInfo['volumeID'])
+
+        for (sdUUID, spUUID), volUUIDs in six.iteritems(volumes):
+            self.log.debug("Refreshing volumes %s in domain %s",
+                           volUUIDs, sdUUID)
+            res = self._irs.refreshVolumes(sdUUID, spUUID, volUUIDs)
+            if response.is_error(res):
+                # The callbacks will find that the volumes were not extended.
+                self.log.error("Error refreshing volumes %s in domain %s: %s",
+                               volUUIDs, sdUUID, res["status"]["message"])
+
+    def _abort(self, req):
+        with self._lock:
+            if self._inflight.get(req.key) is req:
+                del self._inflight[req.key]
+
+    def _complete(self, req):
+        try:
+            req.callback(req.volInfo)
+        except Exception:
+            self.log.exception("Error completing extension of volume %s",
+                               req.volInfo['volumeID'])
+
+        latency = self._clock() - req.start
+        with self._lock:
+            if self._inflight.get(req.key) is req:
+                del self._inflight[req.key]
+            self._completed += 1
+            self._latencies.append(latency)
+
+        self.log.debug("Extension of volume %s completed in %.2f seconds",
+                       req.volInfo['volumeID'], latency)
+
+
+def _percentile(values, percent):
+    """
+    Return the percentile of sorted values, or 0.0 if values is empty.
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, len(values) * percent // 100)
+    return values[index]
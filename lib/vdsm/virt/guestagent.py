@@ -36,6 +36,7 @@ import six
 from vdsm import utils
 from vdsm.common import filecontrol
 from vdsm.common import supervdsm
+from vdsm.common.time import monotonic_time
 from vdsm.config import config
 from vdsm.virt import vmstatus
 
@@ -80,6 +81,14 @@ _FILTERED_CHARS = (
 )
 
 _filter_chars_re = re.compile(u'[%s]' % _FILTERED_CHARS)
+
+# Match a JSON text that may include filtered characters after decoding,
+# either literally or as JSON escapes. The match is conservative; a text that
+# does not match cannot contain filtered characters after decoding, so
+# filtering the decoded object can be skipped.
+_may_need_filtering_re = re.compile(
+    u'[%s]|\\\\([bf]|u(00[01]|007[fF]|00[89]|[dD][89a-fA-F]|[fF]{3}[eEfF]))'
+    % _FILTERED_CHARS)
 _qga_re = re.compile(r'\bqemu[ -](guest[ -]agent|ga)\b', re.IGNORECASE)
 
 
@@ -155,6 +164,12 @@ class GuestAgentEvents(object):
 
 class GuestAgent(object):
     MAX_MESSAGE_SIZE = 2 ** 20  # 1 MiB for now
+    # Maximum number of bytes read on every channel event. Data left in the
+    # channel is read on the next event, after handling the other channels.
+    MAX_READ_SIZE = 2 ** 18
+    # Maximum number of bytes processed per second. Messages received above
+    # this rate are dropped without parsing.
+    MAX_RATE = config.getint('guest_agent', 'channel_max_rate')
     SEEN_SHUTDOWN_TIMEOUT = config.getint('vars', 'sys_shutdown_timeout') * 2
 
     def __init__(self, socketName, channelListener, log, onStatusChange,
@@ -191,6 +206,10 @@ class GuestAgent(object):
         self._seen_shutdown = None
         self._qgaCaps = qgaCaps
         self._qgaGuestInfo = qgaGuestInfo
+        self._buffer = bytearray()
+        self._rateStart = 0
+        self._rateSize = 0
+        self._rateDropped = 0
 
     def has_seen_shutdown(self):
         if self._seen_shutdown is None:
@@ -570,8 +589,7 @@ class GuestAgent(object):
             self.guestStatus = None
 
     def _clearReadBuffer(self):
-        self._buffer = []
-        self._bufferSize = 0
+        self._buffer = bytearray()
 
     def _processMessage(self, line):
         try:
@@ -581,33 +599,56 @@ class GuestAgent(object):
         except ValueError as err:
             self.log.error("%s: %s" % (err, repr(line)))
 
+    def _withinRate(self, size):
+        """
+        Account size bytes in the current rate window, returning True if the
+        rate was not exceeded.
+        """
+        now = monotonic_time()
+        if now - self._rateStart >= 1:
+            if self._rateDropped:
+                self.log.warning("Dropped %d messages exceeding maximum rate "
+                                 "of %d bytes per second",
+                                 self._rateDropped, self.MAX_RATE)
+            self._rateStart = now
+            self._rateSize = 0
+            self._rateDropped = 0
+        self._rateSize += size
+        if self._rateSize > self.MAX_RATE:
+            self._rateDropped += 1
+            return False
+        return True
+
     def _handleData(self, data):
-        while (not self._stopped) and b'\n' in data:
-            line, data = data.split(b'\n', 1)
-            line = b''.join(self._buffer) + line
-            self._clearReadBuffer()
+        self._buffer += data
+        start = 0
+        while not self._stopped:
+            end = self._buffer.find(b'\n', start)
+            if end == -1:
+                break
+            line = bytes(self._buffer[start:end])
+            start = end + 1
             if self._messageState is MessageState.TOO_BIG:
                 self._messageState = MessageState.NORMAL
                 self.log.warning("Not processing current message because it "
                                  "was too big")
-            else:
+            elif self._withinRate(len(line)):
                 self._processMessage(line)
+        del self._buffer[:start]
 
-        self._buffer.append(data)
-        self._bufferSize += len(data)
-
-        if self._bufferSize >= self.MAX_MESSAGE_SIZE:
+        if len(self._buffer) >= self.MAX_MESSAGE_SIZE:
             self.log.warning("Discarding buffer with size: %d because the "
                              "message reached maximum size of %d bytes before "
-                             "message end was reached.", self._bufferSize,
+                             "message end was reached.", len(self._buffer),
                              self.MAX_MESSAGE_SIZE)
             self._messageState = MessageState.TOO_BIG
             self._clearReadBuffer()
 
     def _onChannelRead(self):
         result = True
+        budget = self.MAX_READ_SIZE
         try:
-            while not self._stopped:
+            while not self._stopped and budget > 0:
                 data = self._sock.recv(2 ** 16)
                 # The connection is broken when recv returns no data
                 # therefore we're going to set ourself to stopped state
@@ -616,6 +657,7 @@ class GuestAgent(object):
                     self.log.debug("Disconnected from %s", self._socketName)
                     result = False
                 else:
+                    budget -= len(data)
                     self._handleData(data)
         except socket.error as err:
             if err.errno not in (errno.EWOULDBLOCK, errno.EAGAIN):
@@ -632,7 +674,8 @@ class GuestAgent(object):
         # that aren't permitted in XML.  This must be done _after_ the
         # JSON decoding, since otherwise JSON's \u escape decoding
         # could be used to generate the bad characters
-        args = _filterObject(args)
+        if _may_need_filtering_re.search(uniline):
+            args = _filterObject(args)
         name = args['__name__']
         del args['__name__']
         return (name, args)
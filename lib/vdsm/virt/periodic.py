@@ -38,11 +38,13 @@ from vdsm.common import errors
 from vdsm.common import exception
 from vdsm.common import libvirtconnection
 from vdsm.config import config
+from vdsm.virt import drivemonitor
 from vdsm.virt import migration
 from vdsm.virt import recovery
 from vdsm.virt import sampling
 from vdsm.virt import virdomain
 from vdsm.virt import vmstatus
+from vdsm.virt.utils import ExpiringCache
 
 
 # Just a made up number. Maybe should be equal to number of cores?
@@ -374,13 +376,150 @@ class BlockjobMonitor(_RunnableOnVm):
 
 class DriveWatermarkMonitor(_RunnableOnVm):
 
+    def __init__(self, vm, block_info=None):
+        super(DriveWatermarkMonitor, self).__init__(vm)
+        self._block_info = block_info
+
     @property
     def required(self):
         return (super(DriveWatermarkMonitor, self).required and
                 self._vm.drive_monitor.monitoring_needed())
 
     def _execute(self):
-        self._vm.monitor_drives()
+        self._vm.monitor_drives(self._block_info)
+
+
+# Like sampling._TTL, longer than the libvirt QEMU monitor timeout (30s), so
+# a hung VM is not sampled again before its monitor call times out.
+_SKIP_TTL = 40.0
+
+
+class DriveWatermarkDispatcher(object):
+    """
+    Dispatch DriveWatermarkMonitor to all VMs, providing the block info of
+    the drives of all the VMs, collected in one pass.
+
+    Getting the block info using blockInfo() needs one libvirt call and one
+    QEMU monitor command per drive in every cycle. Instead we use the block
+    stats of the last bulk stats sample collected by VMBulkstatsMonitor, if
+    it is recent enough, and get the block stats of the other VMs using one
+    bulk stats call. VMs without block stats, for example if the bulk stats
+    call failed, fall back to blockInfo().
+
+    Like VMBulkstatsMonitor, VMs which are not ready for commands are not
+    sampled for a while, so a hung VM does not block the sampling of the
+    other VMs. If a previous bulk stats call is blocked, the VMs sampled by
+    that call are skipped in the same way, and the other VMs are sampled.
+    """
+
+    _log = logging.getLogger("virt.periodic.DriveWatermarkDispatcher")
+
+    def __init__(self, conn, get_vms, stats_cache, executor, timeout,
+                 max_age, ttl=_SKIP_TTL):
+        """
+        conn: libvirt connection
+        get_vms: callable which will return a dict which maps
+                 vm_ids to vm_instances
+        stats_cache: sampling.StatsCache instance
+        executor: executor.Executor instance
+        timeout: per-vm operation timeout, in seconds
+                 (fractions allowed).
+        max_age: maximum age of bulk stats samples to use, in seconds.
+        ttl: number of seconds to skip sampling unresponsive VMs.
+        """
+        self._conn = conn
+        self._get_vms = get_vms
+        self._stats_cache = stats_cache
+        self._executor = executor
+        self._timeout = timeout
+        self._max_age = max_age
+        self._skip_doms = ExpiringCache(ttl)
+        self._sampling = threading.Semaphore()  # used as glorified counter
+        # Ids of the VMs sampled by the call holding self._sampling.
+        self._sampling_vms = frozenset()
+
+    def __call__(self):
+        vms = self._get_vms()
+        block_info = self._collect(vms)
+
+        def create(vm):
+            return DriveWatermarkMonitor(vm, block_info.get(vm.id))
+
+        dispatcher = VmDispatcher(
+            lambda: vms, self._executor, create, self._timeout)
+        return dispatcher()
+
+    def _collect(self, vms):
+        """
+        Return dict mapping the ids of the VMs needing drive monitoring to
+        the block info of their drives.
+        """
+        block_info = {}
+        doms = []  # [(vm_id, libvirt domain)]
+        cached = 0
+        skipped = 0
+
+        for vm_id, vm_obj in six.iteritems(vms):
+            try:
+                if not DriveWatermarkMonitor(vm_obj).required:
+                    continue
+                stats, age = self._stats_cache.get_last(vm_id)
+                if stats is not None and age <= self._max_age:
+                    block_info[vm_id] = drivemonitor.block_info(stats)
+                    cached += 1
+                elif self._skip_doms.get(vm_id, False):
+                    skipped += 1
+                elif not vm_obj.isDomainReadyForCommands():
+                    self._skip_doms[vm_id] = True
+                    skipped += 1
+                else:
+                    doms.append((vm_id, vm_obj._dom._dom))
+            except Exception:
+                # The VM will be handled, or skipped, by VmDispatcher.
+                self._log.exception("while collecting block info for %s",
+                                    vm_id)
+
+        if doms:
+            block_info.update(self._sample(doms))
+
+        # Skipped VMs fall back to blockInfo().
+        self._log.debug("Collected block info for %d VMs (cached %d, "
+                        "sampled %d, skipped %d)", len(block_info), cached,
+                        len(doms), skipped)
+        return block_info
+
+    def _sample(self, doms):
+        """
+        Sample the block stats of doms, list of (vm_id, libvirt domain),
+        using one bulk stats call. Return dict mapping vm ids to block info.
+        """
+        acquired = self._sampling.acquire(False)
+        if acquired:
+            self._sampling_vms = frozenset(vm_id for vm_id, _ in doms)
+        else:
+            # A previous call is blocked, likely by one of the VMs it
+            # samples. Skip these VMs instead of blocking again.
+            blocked = self._sampling_vms
+            self._log.warning("Previous block stats sampling is blocked, "
+                              "skipping VMs %s", sorted(blocked))
+            for vm_id in blocked:
+                self._skip_doms[vm_id] = True
+            doms = [(vm_id, dom) for vm_id, dom in doms
+                    if vm_id not in blocked]
+            if not doms:
+                return {}
+        try:
+            bulk_stats = self._conn.domainListGetStats(
+                [dom for _, dom in doms],
+                stats=libvirt.VIR_DOMAIN_STATS_BLOCK)
+        except Exception:
+            self._log.exception("block stats sampling failed")
+            return {}
+        finally:
+            if acquired:
+                self._sampling.release()
+        return {dom.UUIDString(): drivemonitor.block_info(stats)
+                for dom, stats in bulk_stats}
 
 
 def _kill_long_paused_vms(cif):
@@ -398,6 +537,8 @@ def _create(cif, scheduler):
             cif.getVMs, _executor, func, _timeout_from(period))
         return Operation(disp, period, scheduler)
 
+    watermark_interval = config.getint('vars', 'vm_watermark_interval')
+
     ops = [
         # Needs dispatching because updating the volume stats needs
         # access to the storage, thus can block.
@@ -412,10 +553,18 @@ def _create(cif, scheduler):
 
         # We do this only until we get high water mark notifications
         # from QEMU. It accesses storage and/or QEMU monitor, so can block,
-        # thus we need dispatching.
-        per_vm_operation(
-            DriveWatermarkMonitor,
-            config.getint('vars', 'vm_watermark_interval')),
+        # thus we need dispatching. The block info of all VMs is collected
+        # in one pass, so most VMs do not need to access QEMU monitor.
+        Operation(
+            DriveWatermarkDispatcher(
+                libvirtconnection.get(cif),
+                cif.getVMs,
+                sampling.stats_cache,
+                _executor,
+                _timeout_from(watermark_interval),
+                watermark_interval),
+            watermark_interval,
+            scheduler),
 
         Operation(
             lambda: recovery.lookup_external_vms(cif),
@@ -21,12 +21,19 @@
 from __future__ import absolute_import
 from __future__ import division
 
+from contextlib import contextmanager
+import collections
+import functools
 import logging
+import threading
 
 import libvirt
 
+from vdsm.common import concurrent
 from vdsm.common import libvirtconnection
 from vdsm.common import response
+from vdsm.common.time import monotonic_time
+from vdsm.config import config
 from vdsm.virt import vmchannels
 from vdsm.virt import vmstatus
 from vdsm.virt import vmxml
@@ -60,11 +67,48 @@ def _is_ignored_vm(dom_uuid, dom_obj, dom_xml):
     return False
 
 
-def _list_domains():
-    conn = libvirtconnection.get()
-    domains = []
-    for dom_obj in conn.listAllDomains():
-        dom_uuid = 'unknown'
+class _Progress(object):
+    """
+    Track the number of recovered domains, and the time spent in every
+    recovery stage by all the recovery workers.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self._lock = threading.Lock()
+        self._done = 0
+        self._stages = collections.defaultdict(float)
+
+    @contextmanager
+    def stage(self, name):
+        start = monotonic_time()
+        try:
+            yield
+        finally:
+            elapsed = monotonic_time() - start
+            with self._lock:
+                self._stages[name] += elapsed
+
+    def done(self):
+        """
+        Mark a domain as done, returning the number of domains done.
+        """
+        with self._lock:
+            self._done += 1
+            return self._done
+
+    def timings(self):
+        with self._lock:
+            return dict(self._stages)
+
+
+def _fetch_domain(progress, dom_obj):
+    """
+    Return (dom_obj, dom_uuid, dom_xml, external) tuple, or None if the
+    domain is dead or ignored.
+    """
+    dom_uuid = 'unknown'
+    with progress.stage("fetch"):
         try:
             dom_uuid = dom_obj.UUIDString()
             logging.debug("Found domain %s", dom_uuid)
@@ -72,21 +116,38 @@ def _list_domains():
         except libvirt.libvirtError as e:
             if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
                 logging.exception("domain %s is dead", dom_uuid)
+                return None
             else:
                 raise
-        else:
-            if _is_ignored_vm(dom_uuid, dom_obj, dom_xml):
-                continue
-            domains.append((dom_obj, dom_xml, _is_external_vm(dom_xml),))
+        if _is_ignored_vm(dom_uuid, dom_obj, dom_xml):
+            return None
+        return dom_obj, dom_uuid, dom_xml, _is_external_vm(dom_xml)
+
+
+def _list_domains(progress, workers):
+    conn = libvirtconnection.get()
+    dom_objs = conn.listAllDomains()
+    results = concurrent.tmap(
+        functools.partial(_fetch_domain, progress), dom_objs, workers=workers)
+    domains = []
+    for res in results:
+        if not res.succeeded:
+            raise res.value
+        if res.value is not None:
+            domains.append(res.value)
     return domains
 
 
-def _recover_domain(cif, vm_id, dom_xml, external):
+def _recover_domain(cif, vm_id, dom_xml, external, progress=None):
     external_str = " (external)" if external else ""
     cif.log.debug("recovery: trying with VM%s %s", external_str, vm_id)
+    if progress is None:
+        progress = _Progress(1)
     try:
-        res = cif.createVm(_recovery_params(vm_id, dom_xml, external),
-                           vmRecover=True)
+        with progress.stage("parse"):
+            params = _recovery_params(vm_id, dom_xml, external)
+        with progress.stage("register"):
+            res = cif.createVm(params, vmRecover=True)
     except Exception:
         cif.log.exception("Error recovering VM%s: %s", external_str, vm_id)
         return False
@@ -112,27 +173,59 @@ def _recovery_params(vm_id, dom_xml, external):
     return params
 
 
+def _recover_one(cif, progress, domain):
+    dom_obj, vm_id, dom_xml, external = domain
+    recovered = _recover_domain(cif, vm_id, dom_xml, external, progress)
+    idx = progress.done()
+    if recovered:
+        cif.log.info(
+            'recovery [1:%d/%d]: recovered domain %s',
+            idx, progress.total, vm_id)
+    elif external:
+        cif.log.info("Failed to recover external domain: %s" % (vm_id,))
+    else:
+        cif.log.info(
+            'recovery [1:%d/%d]: loose domain %s found, killing it.',
+            idx, progress.total, vm_id)
+        try:
+            dom_obj.destroy()
+        except libvirt.libvirtError:
+            cif.log.exception(
+                'recovery [1:%d/%d]: failed to kill loose domain %s',
+                idx, progress.total, vm_id)
+
+
 def all_domains(cif):
-    doms = _list_domains()
-    num_doms = len(doms)
-    for idx, (dom_obj, dom_xml, external) in enumerate(doms):
-        vm_id = dom_obj.UUIDString()
-        if _recover_domain(cif, vm_id, dom_xml, external):
-            cif.log.info(
-                'recovery [1:%d/%d]: recovered domain %s',
-                idx + 1, num_doms, vm_id)
-        elif external:
-            cif.log.info("Failed to recover external domain: %s" % (vm_id,))
-        else:
-            cif.log.info(
-                'recovery [1:%d/%d]: loose domain %s found, killing it.',
-                idx + 1, num_doms, vm_id)
-            try:
-                dom_obj.destroy()
-            except libvirt.libvirtError:
-                cif.log.exception(
-                    'recovery [1:%d/%d]: failed to kill loose domain %s',
-                    idx + 1, num_doms, vm_id)
+    """
+    Recover all the domains running on this host.
+
+    The domains XML is fetched from libvirt using up to vars:recovery_workers
+    threads. If fetching the XML fails, no domain is recovered, so the
+    recovery can be retried. Then the domains are recovered, parsing the
+    domain XML and registering the Vm objects, using the same number of
+    threads.
+
+    Return a dict with the time spent in every stage by all the workers.
+    """
+    start = monotonic_time()
+    workers = config.getint('vars', 'recovery_workers')
+    progress = _Progress(0)
+
+    doms = _list_domains(progress, workers)
+    progress.total = len(doms)
+    cif.log.info('recovery [1]: found %d domains in %.2f seconds',
+                 progress.total, monotonic_time() - start)
+
+    concurrent.tmap(
+        functools.partial(_recover_one, cif, progress), doms, workers=workers)
+
+    timings = progress.timings()
+    cif.log.info('recovery [1]: recovered %d domains in %.2f seconds '
+                 '(fetch: %.2f, parse: %.2f, register: %.2f)',
+                 progress.total, monotonic_time() - start,
+                 timings.get("fetch", 0.0), timings.get("parse", 0.0),
+                 timings.get("register", 0.0))
+    return timings
 
 
 def lookup_external_vms(cif):
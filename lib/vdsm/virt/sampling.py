@@ -29,8 +29,10 @@ from six.moves import map
 Support for VM and host statistics sampling.
 """
 
+from array import array
 from collections import defaultdict, deque, namedtuple
 import logging
+import operator
 import os
 import re
 import threading
@@ -246,6 +248,229 @@ class StatsSample(_StatsSample):
         )
 
 
+StatsDeltas = namedtuple('StatsDeltas', ['values', 'devices'])
+
+_NO_DELTAS = StatsDeltas({}, {})
+
+
+class StatsTable(object):
+    """
+    Columnar store for the counters of the last two bulk stats samples.
+
+    libvirt reports the bulk stats as one flat dict per VM, and device
+    counters are keyed by the position of the device in that very sample
+    (e.g. 'block.1.rd.bytes'), which may change from a sample to the next.
+    Computing rates straight out of those dicts means remapping and
+    diffing every key of every VM on every getAllVmStats call.
+
+    Here VM ids are interned once into rows and counters into columns.
+    Each device gets a stable per-VM slot, so a column keeps tracking the
+    same device even if libvirt reports it at another index. Counters are
+    kept in preallocated float arrays, with NaN marking the values missing
+    from a sample, and the deltas between the two samples are computed for
+    all the VMs at once, one column at a time, when the sample is added.
+    Serving the deltas of a VM is then just a lookup.
+    """
+
+    _VM_COUNTERS = (
+        'cpu.time',
+        'cpu.user',
+        'cpu.system',
+        'balloon.swap_in',
+        'balloon.swap_out',
+        'balloon.major_fault',
+        'balloon.minor_fault',
+    )
+
+    _DEVICE_COUNTERS = (
+        ('block', ('rd.reqs', 'rd.bytes', 'rd.times',
+                   'wr.reqs', 'wr.bytes', 'wr.times',
+                   'fl.reqs', 'fl.times')),
+        ('net', ('rx.bytes', 'tx.bytes')),
+    )
+
+    _MISSING = float('nan')
+
+    def __init__(self, capacity=64):
+        self._capacity = capacity
+        self._blank = array('d', [self._MISSING]) * capacity
+        self._rows = {}  # vm id -> row
+        self._free_rows = []
+        self._slots = {}  # row -> {(group, device name): slot}
+        self._columns = {}  # counter key -> column
+        self._first = []  # column -> counters of the first sample
+        self._last = []  # column -> counters of the last sample
+        self._layouts = {}  # row -> {group: {device name: index}}
+        self._deltas = {}  # row -> StatsDeltas
+        self._device_keys = {}  # (group, index) -> (name key, counter keys)
+        self._slot_columns = {}  # (group, slot) -> counter columns
+        self._vm_columns = tuple((key, self._column(key))
+                                 for key in self._VM_COUNTERS)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def put(self, bulk_stats):
+        """
+        Add a new bulk sample, which becomes the last one, while the
+        previous last sample becomes the first one.
+        """
+        # Reuse the arrays of the oldest sample for the new one.
+        self._first, self._last = self._last, self._first
+        for counters in self._last:
+            counters[:] = self._blank
+        first_layouts, self._layouts = self._layouts, {}
+        plans = {}
+        devices = {}
+
+        for vmid, stats in six.iteritems(bulk_stats):
+            row = self._row(vmid)
+            for key, column in self._vm_columns:
+                value = stats.get(key)
+                if value is not None:
+                    self._last[column][row] = value
+
+            # The counters to report for this VM, keyed like this sample.
+            plan = list(self._vm_columns)
+            layout = {}
+            vm_devices = {}
+            first_layout = first_layouts.get(row, {})
+            for group, fields in self._DEVICE_COUNTERS:
+                indexes = {}
+                common = {}
+                first_indexes = first_layout.get(group, {})
+                for index in range(stats.get('%s.count' % group, 0)):
+                    name_key, keys = self._keys(group, index)
+                    name = stats.get(name_key)
+                    if name is None:
+                        # Bulk stats may report partial data, see
+                        # vmstats._find_bulk_stats_reverse_map.
+                        continue
+                    indexes[name] = index
+                    slot = self._slot(row, group, name)
+                    columns = self._device_columns(group, slot)
+                    for key, column in zip(keys, columns):
+                        value = stats.get(key)
+                        if value is not None:
+                            self._last[column][row] = value
+                    if name in first_indexes:
+                        common[name] = index
+                        plan.extend(zip(keys, columns))
+                layout[group] = indexes
+                vm_devices[group] = common
+            self._layouts[row] = layout
+            plans[row] = plan
+            devices[row] = vm_devices
+
+        # One pass per column for all the VMs; NaN propagates, so the
+        # counters missing in either sample stay missing.
+        deltas = [array('d', map(operator.sub, last, first))
+                  for first, last in zip(self._first, self._last)]
+
+        self._deltas = {}
+        for row, plan in six.iteritems(plans):
+            values = {}
+            for key, column in plan:
+                value = deltas[column][row]
+                if value == value:  # not NaN
+                    values[key] = value
+            self._deltas[row] = StatsDeltas(values, devices[row])
+
+    def remove(self, vmid):
+        """
+        Forget the given VM, releasing its row.
+        """
+        row = self._rows.pop(vmid, None)
+        if row is None:
+            return
+        for counters in self._first:
+            counters[row] = self._MISSING
+        for counters in self._last:
+            counters[row] = self._MISSING
+        self._slots.pop(row, None)
+        self._layouts.pop(row, None)
+        self._deltas.pop(row, None)
+        self._free_rows.append(row)
+
+    def deltas(self, vmid):
+        """
+        Return the StatsDeltas of the given VM between the two samples, or
+        None if the VM is unknown.
+
+        StatsDeltas.values maps the counter keys, as found in the last
+        sample, to how much they changed since the first sample. Counters
+        missing from either sample are not reported.
+        StatsDeltas.devices maps each device group ('block', 'net') to the
+        {name: index} of the devices found in both samples, where index
+        is the position of the device in the last sample.
+        """
+        row = self._rows.get(vmid)
+        if row is None:
+            return None
+        # A known VM may be missing from the last sample.
+        return self._deltas.get(row, _NO_DELTAS)
+
+    def _row(self, vmid):
+        row = self._rows.get(vmid)
+        if row is None:
+            if not self._free_rows:
+                self._grow()
+            row = self._free_rows.pop()
+            self._rows[vmid] = row
+        return row
+
+    def _grow(self):
+        size = len(self._rows)
+        if size >= self._capacity:
+            self._capacity *= 2
+            self._blank = array('d', [self._MISSING]) * self._capacity
+            padding = array('d', [self._MISSING]) * (self._capacity - size)
+            for counters in self._first:
+                counters.extend(padding)
+            for counters in self._last:
+                counters.extend(padding)
+        used = set(six.itervalues(self._rows))
+        self._free_rows = [row for row in range(self._capacity - 1, -1, -1)
+                           if row not in used]
+
+    def _slot(self, row, group, name):
+        slots = self._slots.setdefault(row, {})
+        slot = slots.get((group, name))
+        if slot is None:
+            slot = sum(1 for g, _ in slots if g == group)
+            slots[(group, name)] = slot
+        return slot
+
+    def _keys(self, group, index):
+        keys = self._device_keys.get((group, index))
+        if keys is None:
+            fields = dict(self._DEVICE_COUNTERS)[group]
+            keys = ('%s.%d.name' % (group, index),
+                    tuple('%s.%d.%s' % (group, index, field)
+                          for field in fields))
+            self._device_keys[(group, index)] = keys
+        return keys
+
+    def _device_columns(self, group, slot):
+        columns = self._slot_columns.get((group, slot))
+        if columns is None:
+            fields = dict(self._DEVICE_COUNTERS)[group]
+            # Slots, not indexes: the column must follow the device.
+            columns = tuple(self._column('%s.slot%d.%s' % (group, slot, f))
+                            for f in fields)
+            self._slot_columns[(group, slot)] = columns
+        return columns
+
+    def _column(self, key):
+        column = self._columns.get(key)
+        if column is None:
+            column = len(self._first)
+            self._columns[key] = column
+            self._first.append(array('d', self._blank))
+            self._last.append(array('d', self._blank))
+        return column
+
+
 class StatsCache(object):
     """
     Cache for bulk stats samples.
@@ -275,10 +500,15 @@ class StatsCache(object):
 
     _log = logging.getLogger("virt.sampling.StatsCache")
 
-    def __init__(self, clock=vdsm.common.time.monotonic_time):
+    def __init__(self, clock=vdsm.common.time.monotonic_time, table=None):
+        """
+        `table' is an optional StatsTable, fed with the same samples, used
+        to provide the per-VM counter deltas through get_with_deltas().
+        """
         self._clock = clock
         self._lock = threading.Lock()
         self._samples = SampleWindow(size=2, timefn=self._clock)
+        self._table = table
         self._last_sample_time = 0
         self._vm_last_timestamp = defaultdict(int)
 
@@ -297,26 +527,55 @@ class StatsCache(object):
         """
         with self._lock:
             del self._vm_last_timestamp[vmid]
+            if self._table is not None:
+                self._table.remove(vmid)
 
     def get(self, vmid):
         """
         Return the available StatSample for the given VM.
         """
         with self._lock:
-            first_batch, last_batch, interval = self._samples.stats()
-            stats_age = self._clock() - self._vm_last_timestamp[vmid]
+            return self._get(vmid)
 
-            if first_batch is None:
-                return StatsSample(None, None, None, stats_age)
+    def get_with_deltas(self, vmid):
+        """
+        Return the available StatSample for the given VM, and the
+        StatsDeltas computed out of the same samples, or None if there
+        is no StatsTable or no data for the VM.
+        """
+        with self._lock:
+            sample = self._get(vmid)
+            if self._table is None or sample.is_empty():
+                return sample, None
+            return sample, self._table.deltas(vmid)
 
-            first_sample = first_batch.get(vmid)
-            last_sample = last_batch.get(vmid)
+    def _get(self, vmid):
+        first_batch, last_batch, interval = self._samples.stats()
+        stats_age = self._clock() - self._vm_last_timestamp[vmid]
 
-            if first_sample is None or last_sample is None:
-                return StatsSample(None, None, None, stats_age)
+        if first_batch is None:
+            return StatsSample(None, None, None, stats_age)
 
-            return StatsSample(first_sample, last_sample,
-                               interval, stats_age)
+        first_sample = first_batch.get(vmid)
+        last_sample = last_batch.get(vmid)
+
+        if first_sample is None or last_sample is None:
+            return StatsSample(None, None, None, stats_age)
+
+        return StatsSample(first_sample, last_sample,
+                           interval, stats_age)
+
+    def get_last(self, vmid):
+        """
+        Return the last bulk stats sampled for the given VM, and their age,
+        or (None, None) if the VM is missing from the last sample.
+        """
+        with self._lock:
+            _, last_batch = self._samples.last()
+            if last_batch is None or vmid not in last_batch:
+                return None, None
+            stats_age = self._clock() - self._vm_last_timestamp[vmid]
+            return last_batch[vmid], stats_age
 
     def get_batch(self):
         """
@@ -357,6 +616,8 @@ class StatsCache(object):
             last_sample_time = self._last_sample_time
             if monotonic_ts >= last_sample_time:
                 self._samples.append(bulk_stats)
+                if self._table is not None:
+                    self._table.put(bulk_stats)
                 self._last_sample_time = monotonic_ts
 
                 self._update_ts(bulk_stats, monotonic_ts)
@@ -366,12 +627,10 @@ class StatsCache(object):
                     monotonic_ts, last_sample_time)
 
     def _update_ts(self, bulk_stats, monotonic_ts):
-        # FIXME: this is expected to be costly performance-wise.
-        for vmid in bulk_stats:
-            self._vm_last_timestamp[vmid] = monotonic_ts
+        self._vm_last_timestamp.update(dict.fromkeys(bulk_stats, monotonic_ts))
 
 
-stats_cache = StatsCache()
+stats_cache = StatsCache(table=StatsTable())
 
 
 # this value can be tricky to tune.
@@ -1162,12 +1162,26 @@ class Vm(object):
                 if (drive.chunked or drive.replicaChunked) and not
                 drive.readonly]
 
-    def _getExtendInfo(self, drive):
+    def _getExtendInfo(self, drive, block_info=None):
         """
         Return extension info for a chunked drive or drive replicating to
         chunked replica volume.
+
+        block_info is an optional dict mapping drive names to BlockInfo,
+        taken from bulk stats. If it includes the drive, it is used instead
+        of querying libvirt.
         """
-        capacity, alloc, physical = self._dom.blockInfo(drive.path, 0)
+        info = None
+        if block_info is not None and drive.chunked:
+            info = block_info.get(drive.name)
+            if info is not None and info.physical < drive.apparentsize:
+                # Sampled before the drive was extended.
+                info = None
+
+        if info is not None:
+            capacity, alloc, physical = info
+        else:
+            capacity, alloc, physical = self._dom.blockInfo(drive.path, 0)
 
         # Libvirt reports watermarks only for the source drive, but for
         # file-based drives it reports the same alloc and physical, which
@@ -1191,22 +1205,25 @@ class Vm(object):
 
         return blockinfo
 
-    def monitor_drives(self):
+    def monitor_drives(self, block_info=None):
         """
         Return True if at least one drive is being extended, False otherwise.
+
+        block_info is an optional dict mapping drive names to BlockInfo,
+        see _getExtendInfo.
         """
         extended = False
 
         try:
             for drive in self.drive_monitor.monitored_drives():
-                if self.extend_drive_if_needed(drive):
+                if self.extend_drive_if_needed(drive, block_info):
                     extended = True
         except drivemonitor.ImprobableResizeRequestError:
             return False
 
         return extended
 
-    def extend_drive_if_needed(self, drive):
+    def extend_drive_if_needed(self, drive, block_info=None):
         """
         Check if a drive should be extended, and start extension flow if
         needed.
@@ -1223,6 +1240,9 @@ class Vm(object):
         - SET: this method should never receive a drive in this state,
                emit warning and exit.
 
+        block_info is an optional dict mapping drive names to BlockInfo,
+        see _getExtendInfo.
+
         Return True if started an extension flow, False otherwise.
         """
 
@@ -1233,7 +1253,8 @@ class Vm(object):
             return
 
         try:
-            capacity, alloc, physical = self._getExtendInfo(drive)
+            capacity, alloc, physical = self._getExtendInfo(
+                drive, block_info)
         except libvirt.libvirtError as e:
             self.log.error("Unable to get watermarks for drive %s: %s",
                            drive.name, e)
@@ -1286,13 +1307,6 @@ class Vm(object):
         else:
             self.__extendDriveVolume(vmDrive, volumeID, newSize, clock)
 
-    def __refreshDriveVolume(self, volInfo):
-        self.log.debug("Refreshing drive volume for %s (domainID: %s, "
-                       "volumeID: %s)", volInfo['name'], volInfo['domainID'],
-                       volInfo['volumeID'])
-        self.cif.irs.refreshVolume(volInfo['domainID'], volInfo['poolID'],
-                                   volInfo['imageID'], volInfo['volumeID'])
-
     def __verifyVolumeExtension(self, volInfo):
         volSize = self._getVolumeSize(volInfo['domainID'], volInfo['poolID'],
                                       volInfo['imageID'], volInfo['volumeID'])
@@ -1309,12 +1323,10 @@ class Vm(object):
         return volSize
 
     def __afterReplicaExtension(self, volInfo):
+        # The replica was extended and refreshed by the extend manager.
         clock = volInfo["clock"]
         clock.stop("extend-replica")
 
-        with clock.run("refresh-replica"):
-            self.__refreshDriveVolume(volInfo)
-
         self.__verifyVolumeExtension(volInfo)
         vmDrive = lookup.drive_by_name(
             self.getDiskDevices()[:], volInfo['name'])
@@ -1344,7 +1356,7 @@ class Vm(object):
             'clock': clock,
         }
         self.log.debug("Requesting an extension for the volume: %s", volInfo)
-        self.cif.irs.sendExtendMsg(
+        self.cif.extend_manager.extend(
             vmDrive.poolID,
             volInfo,
             newSize,
@@ -1363,18 +1375,16 @@ class Vm(object):
         }
         self.log.debug("Requesting an extension for the volume "
                        "replication: %s", volInfo)
-        self.cif.irs.sendExtendMsg(drive.poolID,
-                                   volInfo,
-                                   newSize,
-                                   self.__afterReplicaExtension)
+        self.cif.extend_manager.extend(drive.poolID,
+                                       volInfo,
+                                       newSize,
+                                       self.__afterReplicaExtension)
 
     def __afterVolumeExtension(self, volInfo):
+        # The volume was extended and refreshed by the extend manager.
         clock = volInfo["clock"]
         clock.stop("extend-volume")
 
-        with clock.run("refresh-volume"):
-            self.__refreshDriveVolume(volInfo)
-
         # Check if the extension succeeded.  On failure an exception is raised
         # TODO: Report failure to the engine.
         volSize = self.__verifyVolumeExtension(volInfo)
@@ -1821,11 +1831,13 @@ class Vm(object):
             # Here we need to do the reverse: check first if a VM is
             # monitorable, and only if it is, consider the stats_age.
             monitorable = self._monitorable
-            vm_sample = sampling.stats_cache.get(self.id)
+            vm_sample, vm_deltas = sampling.stats_cache.get_with_deltas(
+                self.id)
             decStats = vmstats.produce(self,
                                        vm_sample.first_value,
                                        vm_sample.last_value,
-                                       vm_sample.interval)
+                                       vm_sample.interval,
+                                       vm_deltas)
             if monitorable:
                 self._setUnresponsiveIfTimeout(stats, vm_sample.stats_age)
         except Exception:
@@ -5046,7 +5058,10 @@ class Vm(object):
 
     def _updateDomainDescriptor(self, xml=None):
         domxml = self._dom.XMLDesc(0) if xml is None else xml
-        self._domain = DomainDescriptor(domxml)
+        # Keep the parsed descriptor, including the cached devices hash and
+        # device index, if libvirt XML did not change.
+        if domxml != self._domain.xml:
+            self._domain = DomainDescriptor(domxml)
 
     def _updateMetadataDescriptor(self):
         # load will overwrite any existing content, as per doc.
@@ -5879,19 +5894,14 @@ class Vm(object):
         return True
 
     def _driveGetActualVolumeChain(self, drives):
-        def lookupDeviceXMLByAlias(domXML, targetAlias):
-            for deviceXML in vmxml.children(DomainDescriptor(domXML).devices):
-                alias = vmdevices.core.find_device_alias(deviceXML)
-                if alias and alias == targetAlias:
-                    return deviceXML
-            raise LookupError("Unable to find matching XML for device %r" %
-                              targetAlias)
-
         ret = {}
         self._updateDomainDescriptor()
         for drive in drives:
             alias = drive['alias']
-            diskXML = lookupDeviceXMLByAlias(self._domain.xml, alias)
+            diskXML = self._domain.get_device_element_by_alias(alias)
+            if diskXML is None:
+                raise LookupError("Unable to find matching XML for device %r" %
+                                  alias)
             volChain = drive.parse_volume_chain(diskXML)
             if volChain:
                 ret[alias] = volChain
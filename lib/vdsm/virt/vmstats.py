@@ -21,8 +21,13 @@
 from __future__ import absolute_import
 from __future__ import division
 
+import collections
 import contextlib
+import hashlib
+import json
 import logging
+import threading
+import uuid
 
 import six
 
@@ -35,20 +40,24 @@ from vdsm.virt.utils import isVdsmImage
 _log = logging.getLogger('virt.vmstats')
 
 
-def produce(vm, first_sample, last_sample, interval):
+def produce(vm, first_sample, last_sample, interval, deltas=None):
     """
     Translates vm samples into stats.
+
+    `deltas' is the optional sampling.StatsDeltas of the vm, computed
+    out of the same samples; if given, the counter deltas are taken
+    from it instead of diffing the samples.
     """
 
     stats = {}
 
-    cpu(stats, first_sample, last_sample, interval)
-    networks(vm, stats, first_sample, last_sample, interval)
-    disks(vm, stats, first_sample, last_sample, interval)
+    cpu(stats, first_sample, last_sample, interval, deltas)
+    networks(vm, stats, first_sample, last_sample, interval, deltas)
+    disks(vm, stats, first_sample, last_sample, interval, deltas)
     balloon(vm, stats, last_sample)
     cpu_count(stats, last_sample)
     tune_io(vm, stats)
-    memory(stats, first_sample, last_sample, interval)
+    memory(stats, first_sample, last_sample, interval, deltas)
 
     return stats
 
@@ -102,7 +111,7 @@ def tune_io(vm, stats):
     stats['ioTune'] = io_tune_info
 
 
-def cpu(stats, first_sample, last_sample, interval):
+def cpu(stats, first_sample, last_sample, interval, deltas=None):
     """
     Add cpu statistics to the `stats' dict:
     - cpuUser
@@ -127,28 +136,28 @@ def cpu(stats, first_sample, last_sample, interval):
             interval)
         return None
 
-    keys = ('cpu.system', 'cpu.user')
-    samples = (last_sample, first_sample)
-
-    if all(k in s for k in keys for s in samples):
-        # TODO: cpuUsage should have the same type as cpuUser and cpuSys.
-        # we may block the str() when xmlrpc is deserted.
-        stats['cpuUsage'] = str(last_sample['cpu.system'] +
-                                last_sample['cpu.user'])
+    try:
+        cpu_sys = (
+            _counter_delta(first_sample, last_sample, 'cpu.user', deltas) +
+            _counter_delta(first_sample, last_sample, 'cpu.system', deltas))
+    except KeyError:
+        return None
 
-        cpu_sys = ((last_sample['cpu.user'] - first_sample['cpu.user']) +
-                   (last_sample['cpu.system'] - first_sample['cpu.system']))
-        stats['cpuSys'] = _usage_percentage(cpu_sys, interval)
+    # TODO: cpuUsage should have the same type as cpuUser and cpuSys.
+    # we may block the str() when xmlrpc is deserted.
+    stats['cpuUsage'] = str(last_sample['cpu.system'] +
+                            last_sample['cpu.user'])
+    stats['cpuSys'] = _usage_percentage(cpu_sys, interval)
 
-        if all('cpu.time' in s for s in samples):
-            stats['cpuUser'] = _usage_percentage(
-                ((last_sample['cpu.time'] - first_sample['cpu.time']) -
-                 cpu_sys),
-                interval)
+    try:
+        cpu_time = _counter_delta(first_sample, last_sample, 'cpu.time',
+                                  deltas)
+    except KeyError:
+        return None
 
-            return stats
+    stats['cpuUser'] = _usage_percentage(cpu_time - cpu_sys, interval)
 
-    return None
+    return stats
 
 
 def balloon(vm, stats, sample):
@@ -232,7 +241,7 @@ def _nic_traffic(vm_obj, nic,
     return if_stats
 
 
-def networks(vm, stats, first_sample, last_sample, interval):
+def networks(vm, stats, first_sample, last_sample, interval, deltas=None):
     stats['network'] = {}
 
     if first_sample is None or last_sample is None:
@@ -243,8 +252,8 @@ def networks(vm, stats, first_sample, last_sample, interval):
             interval, vm.id)
         return None
 
-    first_indexes = _find_bulk_stats_reverse_map(first_sample, 'net')
-    last_indexes = _find_bulk_stats_reverse_map(last_sample, 'net')
+    first_indexes, last_indexes = _find_device_indexes(
+        first_sample, last_sample, deltas, 'net')
 
     for nic in vm.getNicDevices():
         if nic.is_hostdevice:
@@ -279,7 +288,7 @@ def nic_info(nic):
     return info
 
 
-def disks(vm, stats, first_sample, last_sample, interval):
+def disks(vm, stats, first_sample, last_sample, interval, deltas=None):
     if first_sample is None or last_sample is None:
         return None
 
@@ -287,8 +296,8 @@ def disks(vm, stats, first_sample, last_sample, interval):
     # order across calls. It is usually like this, but not always,
     # for example if hotplug/hotunplug comes into play.
     # To be safe, we need to find the mapping after each call.
-    first_indexes = _find_bulk_stats_reverse_map(first_sample, 'block')
-    last_indexes = _find_bulk_stats_reverse_map(last_sample, 'block')
+    first_indexes, last_indexes = _find_device_indexes(
+        first_sample, last_sample, deltas, 'block')
     disk_stats = {}
 
     for vm_drive in vm.getDiskDevices():
@@ -309,11 +318,12 @@ def disks(vm, stats, first_sample, last_sample, interval):
                         _disk_rate(
                             first_sample, first_indexes[vm_drive.name],
                             last_sample, last_indexes[vm_drive.name],
-                            interval))
+                            interval, deltas))
                 drive_stats.update(
                     _disk_latency(
                         first_sample, first_indexes[vm_drive.name],
-                        last_sample, last_indexes[vm_drive.name]))
+                        last_sample, last_indexes[vm_drive.name],
+                        deltas))
                 drive_stats.update(
                     _disk_iops_bytes(
                         first_sample, first_indexes[vm_drive.name],
@@ -352,23 +362,25 @@ def disk_info(vm_drive):
     return drive_stats
 
 
-def _disk_rate(first_sample, first_index, last_sample, last_index, interval):
+def _disk_rate(first_sample, first_index, last_sample, last_index, interval,
+               deltas=None):
     stats = {}
 
     for name, mode in (("readRate", "rd"), ("writeRate", "wr")):
         first_key = 'block.%d.%s.bytes' % (first_index, mode)
         last_key = 'block.%d.%s.bytes' % (last_index, mode)
         try:
-            first_value = first_sample[first_key]
-            last_value = last_sample[last_key]
+            value = _counter_delta(first_sample, last_sample, last_key,
+                                   deltas, first_key=first_key)
         except KeyError:
             continue
-        stats[name] = str((last_value - first_value) / interval)
+        stats[name] = str(value / interval)
 
     return stats
 
 
-def _disk_latency(first_sample, first_index, last_sample, last_index):
+def _disk_latency(first_sample, first_index, last_sample, last_index,
+                  deltas=None):
     stats = {}
 
     for name, mode in (('readLatency', 'rd'),
@@ -377,10 +389,12 @@ def _disk_latency(first_sample, first_index, last_sample, last_index):
         try:
             last_key = "block.%d.%s" % (last_index, mode)
             first_key = "block.%d.%s" % (first_index, mode)
-            operations = (last_sample[last_key + ".reqs"] -
-                          first_sample[first_key + ".reqs"])
-            elapsed_time = (last_sample[last_key + ".times"] -
-                            first_sample[first_key + ".times"])
+            operations = _counter_delta(
+                first_sample, last_sample, last_key + ".reqs", deltas,
+                first_key=first_key + ".reqs")
+            elapsed_time = _counter_delta(
+                first_sample, last_sample, last_key + ".times", deltas,
+                first_key=first_key + ".times")
         except KeyError:
             continue
         if operations:
@@ -412,6 +426,35 @@ def _usage_percentage(val, interval):
     return 100 * val / interval / 1000 ** 3
 
 
+def _counter_delta(first_sample, last_sample, key, deltas, first_key=None):
+    """
+    Return how much the counter `key' of the last sample changed since
+    the first sample, where it is found as `first_key' if given.
+    Use the precomputed `deltas' if available, which are keyed like the
+    last sample. Raise KeyError if the counter is missing in any sample.
+    """
+    if deltas is not None:
+        return deltas.values[key]
+    if first_key is None:
+        first_key = key
+    return last_sample[key] - first_sample[first_key]
+
+
+def _find_device_indexes(first_sample, last_sample, deltas, group):
+    """
+    Return the maps of device name to index in `group' for the first and
+    the last sample.
+    The precomputed `deltas' already know the devices found in both
+    samples, and are keyed by their index in the last sample, so the same
+    map is returned twice.
+    """
+    if deltas is not None:
+        indexes = deltas.devices.get(group, {})
+        return indexes, indexes
+    return (_find_bulk_stats_reverse_map(first_sample, group),
+            _find_bulk_stats_reverse_map(last_sample, group))
+
+
 def _find_bulk_stats_reverse_map(stats, group):
     name_to_idx = {}
     for idx in six.moves.xrange(stats.get('%s.count' % group, 0)):
@@ -428,7 +471,7 @@ def _find_bulk_stats_reverse_map(stats, group):
     return name_to_idx
 
 
-def memory(stats, first_sample, last_sample, interval):
+def memory(stats, first_sample, last_sample, interval, deltas=None):
     mem_stats = {}
 
     if last_sample is not None:
@@ -458,10 +501,12 @@ def memory(stats, first_sample, last_sample, interval):
             'minflt': 'balloon.minor_fault',
         }
         for (k, v) in six.iteritems(stats_map):
+            if deltas is not None:
+                delta = deltas.values.get(v, 0)
+            else:
+                delta = last_sample.get(v, 0) - first_sample.get(v, 0)
             # pylint: disable=round-builtin
-            mem_stats[k] = int(round((
-                last_sample.get(v, 0) - first_sample.get(v, 0)
-            ) / interval))
+            mem_stats[k] = int(round(delta / interval))
 
         # This stat is deprecated
         mem_stats['pageflt'] = mem_stats['majflt'] + mem_stats['minflt']
@@ -486,3 +531,115 @@ def _skip_if_missing_stats(vm_obj):
             pass
         else:
             _log.warning('Missing stat: %s for vm %s', str(exc), vm_obj.id)
+
+
+class StatsTracker(object):
+    """
+    Remember the stats reported to the clients, to report to each of them
+    only what changed since its previous report.
+
+    Every report is identified by an opaque token, which the client sends
+    back with its next request. Only the last `history' reports are kept,
+    so that a few clients can poll independently; a client sending an
+    unknown or expired token, like any token issued before vdsm was
+    restarted, just gets the full stats again.
+
+    Reports are not copied; for every VM we keep only a fingerprint of
+    each field: the type and value for scalars, and a digest of the
+    canonical JSON serialization for nested values.
+    """
+
+    def __init__(self, history=4):
+        self._history = history
+        self._prefix = str(uuid.uuid4())
+        self._generation = 0
+        self._lock = threading.Lock()
+        # token -> {vmId: {field: fingerprint}}
+        self._reports = collections.OrderedDict()
+
+    def delta(self, stats_list, since=None):
+        """
+        Record `stats_list', the stats of all the VMs as returned by
+        getAllVmStats, and return a dict with:
+        - token: identifies this report, to be sent back in the next call
+        - full: True if `since' is unknown, and all the stats are reported
+        - changed: for each new or changed VM, its vmId and the new or
+          changed fields, or all of them for a new VM
+        - removedFields: for each VM in changed, the fields gone since the
+          previous report, if any
+        - removed: the ids of the VMs gone since the previous report
+        """
+        # The stats may share objects with the VMs, that can change under
+        # our feet, so we fingerprint them now, to compare with later.
+        current = dict((stats['vmId'], _fingerprint_fields(stats))
+                       for stats in stats_list)
+
+        with self._lock:
+            previous = self._reports.get(since) if since else None
+            self._generation += 1
+            token = '%s:%d' % (self._prefix, self._generation)
+            self._reports[token] = current
+            while len(self._reports) > self._history:
+                self._reports.popitem(last=False)
+
+        if previous is None:
+            return {
+                'token': token,
+                'full': True,
+                'changed': list(stats_list),
+                'removedFields': {},
+                'removed': [],
+            }
+
+        changed = []
+        removed_fields = {}
+        for stats in stats_list:
+            vm_id = stats['vmId']
+            old_prints = previous.get(vm_id)
+            if old_prints is None:
+                changed.append(stats)
+                continue
+            prints = current[vm_id]
+            fields = dict((key, stats[key]) for key in prints
+                          if old_prints.get(key, _MISSING) != prints[key])
+            gone = sorted(key for key in old_prints if key not in prints)
+            if gone:
+                removed_fields[vm_id] = gone
+            if fields or gone:
+                fields['vmId'] = vm_id
+                changed.append(fields)
+
+        removed = [key for key in previous if key not in current]
+
+        return {
+            'token': token,
+            'full': False,
+            'changed': changed,
+            'removedFields': removed_fields,
+            'removed': removed,
+        }
+
+
+_MISSING = object()
+
+_SCALARS = frozenset(six.string_types + six.integer_types + (
+    six.binary_type, float, bool, type(None)))
+
+
+def _fingerprint_fields(stats):
+    """
+    Return a dict mapping the fields of `stats' to their fingerprint.
+
+    Scalars are kept with their type, so 1 and True, or 1 and 1.0, are
+    different. Nested values are serialized to JSON with sorted keys, as
+    the client receives them, and fingerprinted by the SHA-256 digest of the
+    serialization.
+    """
+    return {key: ((type(value), value) if type(value) in _SCALARS else
+                  _digest(value))
+            for key, value in six.iteritems(stats)}
+
+
+def _digest(value):
+    data = json.dumps(value, sort_keys=True, default=repr)
+    return hashlib.sha256(data.encode('utf-8')).digest()
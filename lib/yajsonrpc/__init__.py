@@ -15,7 +15,9 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA
 from __future__ import absolute_import
 from __future__ import division
+import bisect
 import logging
+import threading
 from six.moves import queue
 
 from vdsm.common import exception as vdsmexception
@@ -267,38 +269,126 @@ class JsonRpcTask(object):
         )
 
 
+class LatencyHistogram(object):
+    """
+    Count calls per method, by latency.
+    """
+
+    # Upper bounds of the buckets in seconds. The last bucket counts the
+    # calls slower than the last bound.
+    BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods = {}
+
+    def add(self, method, seconds):
+        index = bisect.bisect_left(self.BUCKETS, seconds)
+        with self._lock:
+            counts = self._methods.get(method)
+            if counts is None:
+                counts = self._methods[method] = [0] * (len(self.BUCKETS) + 1)
+            counts[index] += 1
+
+    def collect(self):
+        """
+        Return the counts of every method since the last call, as a dict
+        mapping method name to list of counts per bucket.
+        """
+        with self._lock:
+            methods = self._methods
+            self._methods = {}
+        return methods
+
+    @classmethod
+    def format(cls, counts):
+        bounds = ["<=%ss" % b for b in cls.BUCKETS]
+        bounds.append(">%ss" % cls.BUCKETS[-1])
+        return ", ".join("%s: %d" % (bound, count)
+                         for bound, count in zip(bounds, counts)
+                         if count)
+
+
 class JsonRpcServer(object):
     log = logging.getLogger("jsonrpc.JsonRpcServer")
 
     """
     Creates new JsonrRpcServer by providing a bridge, timeout in seconds
-    which defining how often we should log connections stats and thread
-    factory.
+    which defining how often we should log connections stats, thread
+    factory and the number of workers parsing the requests.
+
+    Each worker must run serve_requests() with its index in its own
+    thread. Messages from the same connection are always handled by the
+    same worker, so requests are dispatched in the order they were
+    received.
     """
-    def __init__(self, bridge, timeout, cif, threadFactory=None):
+    def __init__(self, bridge, timeout, cif, threadFactory=None, workers=1):
         self._bridge = bridge
         self._cif = cif
-        self._workQueue = queue.Queue()
+        self._queues = [queue.Queue() for _ in range(workers)]
         self._threadFactory = threadFactory
         self._timeout = timeout
+        self._latency = LatencyHistogram()
+        self._stats_lock = threading.Lock()
         self._next_report = monotonic_time() + self._timeout
-        self._counter = 0
+        self._reset_parse_stats()
+
+    @property
+    def workers(self):
+        return len(self._queues)
 
     def queueRequest(self, req):
-        self._workQueue.put_nowait(req)
+        self._worker_queue(req).put_nowait(req)
+
+    def _worker_queue(self, req):
+        if len(self._queues) == 1:
+            return self._queues[0]
+        client, server_address, context, msg = req
+        connection = (context.client_host, context.client_port)
+        return self._queues[hash(connection) % len(self._queues)]
+
+    def _reset_parse_stats(self):
+        self._messages = 0
+        self._max_queue_depth = 0
+        self._parse_time = 0.0
+        self._max_parse_time = 0.0
+
+    def _message_parsed(self, queue_depth, parse_time):
+        with self._stats_lock:
+            self._messages += 1
+            self._max_queue_depth = max(self._max_queue_depth, queue_depth)
+            self._parse_time += parse_time
+            self._max_parse_time = max(self._max_parse_time, parse_time)
 
     """
-    Aggregates number of requests received by vdsm. Each request from
-    a batch is added separately. After time defined by timeout we log
-    number of requests.
+    Aggregates latency of the requests received by vdsm per method. Each
+    request from a batch is added separately. After time defined by
+    timeout we log the histograms, and the parsing stats.
     """
     def _attempt_log_stats(self):
-        self._counter += 1
-        if monotonic_time() > self._next_report:
-            self.log.info('%s requests processed during %s seconds',
-                          self._counter, self._timeout)
-            self._next_report += self._timeout
-            self._counter = 0
+        now = monotonic_time()
+        with self._stats_lock:
+            if now <= self._next_report:
+                return
+            self._next_report = now + self._timeout
+            messages = self._messages
+            max_queue_depth = self._max_queue_depth
+            parse_time = self._parse_time
+            max_parse_time = self._max_parse_time
+            self._reset_parse_stats()
+
+        latency = self._latency.collect()
+        self.log.info('%s requests processed during %s seconds',
+                      sum(sum(counts) for counts in latency.values()),
+                      self._timeout)
+        for method in sorted(latency):
+            self.log.info('%s latency: %s', method,
+                          LatencyHistogram.format(latency[method]))
+        if messages:
+            self.log.info('%s messages parsed by %s workers, max queue '
+                          'depth %s, parse time avg %.6f max %.6f seconds',
+                          messages, len(self._queues), max_queue_depth,
+                          parse_time / messages, max_parse_time)
 
     def _serveRequest(self, ctx, req):
         start_time = monotonic_time()
@@ -308,13 +398,15 @@ class JsonRpcServer(object):
             response_log = "succeeded"
         else:
             response_log = "failed (error %s)" % (error.code,)
+        elapsed = monotonic_time() - start_time
         self.log.info("RPC call %s %s in %.2f seconds",
-                      req.method, response_log, monotonic_time() - start_time)
+                      req.method, response_log, elapsed)
+        self._latency.add(req.method, elapsed)
+        self._attempt_log_stats()
         if response is not None:
             ctx.requestDone(response)
 
     def _handle_request(self, req, ctx):
-        self._attempt_log_stats()
         logLevel = logging.DEBUG
 
         # VDSM should never respond to any request before all information about
@@ -361,15 +453,27 @@ class JsonRpcServer(object):
             vars.context = None
 
     @traceback(log=log)
-    def serve_requests(self):
+    def serve_requests(self, worker=0):
+        work_queue = self._queues[worker]
         while True:
-            obj = self._workQueue.get()
+            obj = work_queue.get()
             if obj is None:
                 break
 
-            self._parseMessage(obj)
+            queue_depth = work_queue.qsize()
+            start_time = monotonic_time()
+            requests = self._parseMessage(obj)
+            self._message_parsed(queue_depth, monotonic_time() - start_time)
+            if requests:
+                ctx, requests = requests
+                for request in requests:
+                    self._runRequest(ctx, request)
 
     def _parseMessage(self, obj):
+        """
+        Parse a message, returning the requests to run with their context,
+        or None if there is nothing to run.
+        """
         client, server_address, context, msg = obj
         ctx = _JsonRpcServeRequestContext(client, server_address, context)
 
@@ -379,7 +483,7 @@ class JsonRpcServer(object):
             ctx.addResponse(JsonRpcResponse(
                 None, exception.JsonRpcParseError(), None))
             ctx.sendReply()
-            return
+            return None
 
         if isinstance(rawRequests, list):
             # Empty batch request
@@ -390,7 +494,7 @@ class JsonRpcServer(object):
                             "request batch is empty", request=rawRequests),
                         None))
                 ctx.sendReply()
-                return
+                return None
         else:
             # From this point on we know it's always a list
             rawRequests = [rawRequests]
@@ -413,8 +517,7 @@ class JsonRpcServer(object):
         if ctx.counter == 0:
             ctx.sendReply()
 
-        for request in requests:
-            self._runRequest(ctx, request)
+        return ctx, requests
 
     def _runRequest(self, ctx, request):
         if self._threadFactory is None:
@@ -440,4 +543,5 @@ class JsonRpcServer(object):
 
     def stop(self):
         self.log.info("Stopping JsonRPC Server")
-        self._workQueue.put_nowait(None)
+        for work_queue in self._queues:
+            work_queue.put_nowait(None)
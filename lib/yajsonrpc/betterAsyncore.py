@@ -140,8 +140,25 @@ class Dispatcher(asyncore.dispatcher):
             return ''
 
     def send(self, data):
+        return self._send(self.socket.send, data)
+
+    def sendmsg(self, buffers):
+        """
+        Send buffers using a single system call if the socket supports
+        scatter/gather I/O. SSL sockets and python 2 sockets do not, so we
+        send only the first buffer.
+
+        Returns the number of bytes sent.
+        """
+        sock = self.socket
+        if isinstance(sock, sslutils.SSLSocket) or \
+                not hasattr(sock, "sendmsg"):
+            return self._send(sock.send, buffers[0])
+        return self._send(sock.sendmsg, buffers)
+
+    def _send(self, func, data):
         try:
-            result = self.socket.send(data)
+            result = func(data)
             if result == -1:
                 return 0
             return result
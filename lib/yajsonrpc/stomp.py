@@ -16,6 +16,7 @@
 
 from __future__ import absolute_import
 from __future__ import division
+import itertools
 import logging
 import six
 import socket
@@ -109,6 +110,9 @@ class _HeartBeatFrame(object):
     def encode(self):
         return "\n"
 
+    def encode_buffers(self):
+        return ["\n"]
+
 # There is no reason to have multiple instances
 _heartBeatFrame = _HeartBeatFrame()
 
@@ -128,6 +132,13 @@ class Frame(object):
         self.body = body
 
     def encode(self):
+        return ''.join(self.encode_buffers())
+
+    def encode_buffers(self):
+        """
+        Return the encoded frame as a list of buffers, keeping the body in
+        its own buffer so it is not copied.
+        """
         body = self.body
         # We do it here so we are sure header is up to date
         if body is not None:
@@ -141,11 +152,11 @@ class Frame(object):
             data.append("\n")
 
         data.append('\n')
-        if body is not None:
-            data.append(body)
+        if not body:
+            data.append("\0")
+            return [''.join(data)]
 
-        data.append("\0")
-        return ''.join(data)
+        return [''.join(data), body, "\0"]
 
     def __repr__(self):
         return "<StompFrame command=%s>" % (repr(self.command))
@@ -185,6 +196,19 @@ def encodeValue(s):
 
 
 class Parser(object):
+    """
+    Incremental STOMP frame parser.
+
+    Incoming data is appended to a bytearray, and line and frame
+    terminators are looked up in place using a read offset, instead of
+    slicing copies of the remaining data. Consumed data is dropped once
+    per parse() call.
+
+    A body with a content-length header is copied as it arrives into a
+    buffer preallocated for the whole body, so receiving a large frame in
+    small chunks takes time linear in the frame size.
+    """
+
     _STATE_CMD = "Parsing command"
     _STATE_HEADER = "Parsing headers"
     _STATE_BODY = "Receiving body"
@@ -197,6 +221,14 @@ class Parser(object):
         self._frames = deque()
         self._change_state(self._STATE_CMD)
         self._contentLength = -1
+        self._tmpFrame = None
+        # Body of the current frame, when content-length is known, and the
+        # number of bytes received into it.
+        self._body = None
+        self._body_received = 0
+        # Where to resume looking for the terminator of a body without
+        # content-length.
+        self._scan_offset = 0
         self._flush()
 
     def _change_state(self, new_state):
@@ -204,32 +236,35 @@ class Parser(object):
         self._state_cb = self._states[new_state]
 
     def _flush(self):
-        self._buffer = ""
-
-    def _write_buffer(self, buff):
-        self._buffer += buff
-
-    def _get_buffer(self):
-        return self._buffer
-
-    def _handle_terminator(self, term):
-        res, sep, rest = self._buffer.partition(term)
-        if not sep:
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def _compact(self):
+        if self._offset:
+            del self._buffer[:self._offset]
+            self._scan_offset -= self._offset
+            self._offset = 0
+
+    def _handle_terminator(self, term, start=None):
+        if start is None:
+            start = self._offset
+        end = self._buffer.find(term, start)
+        if end == -1:
             return None
 
-        self._buffer = rest
-
+        res = bytes(self._buffer[self._offset:end])
+        self._offset = end + 1
         return res
 
     def _parse_command(self):
-        cmd = self._handle_terminator('\n')
+        cmd = self._handle_terminator(b'\n')
         if cmd is None:
             return False
 
-        if len(cmd) > 0 and cmd[-1] == '\r':
+        if cmd.endswith(b'\r'):
             cmd = cmd[:-1]
 
-        if cmd == "":
+        if not cmd:
             return True
 
         cmd = decodeValue(cmd)
@@ -239,20 +274,22 @@ class Parser(object):
         return True
 
     def _parse_header(self):
-        header = self._handle_terminator('\n')
+        header = self._handle_terminator(b'\n')
         if header is None:
             return False
 
-        if len(header) > 0 and header[-1] == '\r':
+        if header.endswith(b'\r'):
             header = header[:-1]
 
         headers = self._tmpFrame.headers
-        if header == "":
+        if not header:
             self._contentLength = int(headers.get('content-length', -1))
+            if self._contentLength < 0:
+                self._scan_offset = self._offset
             self._change_state(self._STATE_BODY)
             return True
 
-        key, value = header.split(":", 1)
+        key, value = header.split(b":", 1)
         key = decodeValue(key)
         value = decodeValue(value)
 
@@ -269,6 +306,8 @@ class Parser(object):
         self._change_state(self._STATE_CMD)
         self._tmpFrame = None
         self._contentLength = -1
+        self._body = None
+        self._body_received = 0
 
     def _parse_body(self):
         if self._contentLength >= 0:
@@ -277,8 +316,10 @@ class Parser(object):
             return self._parse_body_terminator()
 
     def _parse_body_terminator(self):
-        body = self._handle_terminator('\0')
+        body = self._handle_terminator(b'\0', self._scan_offset)
         if body is None:
+            # Do not scan again the data we already have.
+            self._scan_offset = len(self._buffer)
             return False
 
         self._tmpFrame.body = body
@@ -286,32 +327,67 @@ class Parser(object):
         return True
 
     def _parse_body_length(self):
-        buf = self._get_buffer()
-        cl = self._contentLength
-        ndata = len(buf)
-        if ndata < (cl + 1):
+        buf = self._buffer
+        if self._body is None:
+            end = self._offset + self._contentLength
+            if end < len(buf):
+                # The entire frame is available, typical for small frames.
+                if buf[end] != 0:
+                    raise RuntimeError("Frame end is missing \\0")
+                self._tmpFrame.body = bytes(buf[self._offset:end])
+                self._offset = end + 1
+                self._pushFrame()
+                return True
+            self._body = bytearray(self._contentLength)
+
+        missing = self._contentLength - self._body_received
+        if missing:
+            count = min(missing, len(buf) - self._offset)
+            if count == 0:
+                return False
+            self._receive_body(memoryview(buf)[
+                self._offset:self._offset + count])
+            self._offset += count
+            if count < missing:
+                return False
+
+        if self._offset == len(buf):
             return False
 
-        if buf[cl] != "\0":
+        if buf[self._offset] != 0:
             raise RuntimeError("Frame end is missing \\0")
 
-        self._flush()
-        self._write_buffer(buf[cl + 1:])
-        body = buf[:cl]
-
-        self._tmpFrame.body = body
+        self._offset += 1
+        self._tmpFrame.body = bytes(self._body)
         self._pushFrame()
 
         return True
 
+    def _receive_body(self, data):
+        start = self._body_received
+        self._body[start:start + len(data)] = data
+        self._body_received += len(data)
+
     @property
     def pending(self):
         return len(self._frames)
 
     def parse(self, data):
-        self._write_buffer(data)
-        while self._state_cb():
-            pass
+        if (self._state == self._STATE_BODY and self._body is not None and
+                self._offset == len(self._buffer)):
+            # Receiving a large body; copy the data straight into it, unless
+            # it contains the end of the frame.
+            missing = self._contentLength - self._body_received
+            if len(data) <= missing:
+                self._receive_body(data)
+                return
+
+        self._buffer += data
+        try:
+            while self._state_cb():
+                pass
+        finally:
+            self._compact()
 
     def popFrame(self):
         try:
@@ -336,8 +412,8 @@ class AsyncDispatcher(object):
         Process received frame
         def handle_frame(self, frame)
 
-        Returns response frame to be sent
-        def peek_message(self)
+        Removes and returns the next frame to be sent
+        def pop_message(self)
 
         Returns Ture if there are messages to be sent
         def has_outgoing_messages(self)
@@ -349,13 +425,24 @@ class AsyncDispatcher(object):
     - StompAdapterImpl - responsible for server side
     - AsyncClient - responsible for client side
     """
+
+    # Buffers smaller than this are joined, so several small frames, like
+    # events and heartbeats, are sent using one system call.
+    COALESCE_SIZE = 4096
+
+    # Maximum number of buffers sent in one system call.
+    MAX_SEND_BUFFERS = 64
+
     def __init__(self, connection, frame_handler, bufferSize=4096,
                  clock=time.monotonic_time, count=0):
         self._frame_handler = frame_handler
         self.connection = connection
         self._bufferSize = bufferSize
         self._parser = Parser()
-        self._outbuf = None
+        # Encoded frames being sent, as memoryviews of the frames buffers,
+        # and the frames with the number of bytes left to send.
+        self._outbufs = deque()
+        self._outframes = deque()
         self._incoming_heartbeat_in_milis = 0
         self._outgoing_heartbeat_in_milis = 0
         self._reconnect_interval = 0
@@ -386,7 +473,8 @@ class AsyncDispatcher(object):
 
     def handle_connect(self, dispatcher):
         self.log.debug("managed to connect successfully.")
-        self._outbuf = None
+        self._outbufs.clear()
+        self._outframes.clear()
         self._count = 0
         self._on_timeout = False
         self._update_reconnect_time()
@@ -484,36 +572,84 @@ class AsyncDispatcher(object):
 
     def handle_write(self, dispatcher):
         while True:
-            if self._outbuf is None:
-                try:
-                    frame = self._frame_handler.peek_message()
-                except IndexError:
+            if not self._outbufs:
+                self._take_frames()
+                if not self._outbufs:
                     return
 
-                self._outbuf = frame.encode()
-
-            data = self._outbuf
-            numSent = dispatcher.send(data)
+            buffers = list(itertools.islice(self._outbufs,
+                                            self.MAX_SEND_BUFFERS))
+            numSent = dispatcher.sendmsg(buffers)
             if numSent == 0:
                 # want to resend
-                resend = self._frame_handler.peek_message()
+                resend, _ = self._outframes[0]
                 if resend.command == Command.SEND:
                     self._frame_handler.queue_resend(resend)
                 return
 
             self._update_outgoing_heartbeat()
-            if numSent < len(data):
-                self._outbuf = data[numSent:]
+            self._consume(numSent)
+            if numSent < sum(len(buf) for buf in buffers):
+                # The socket buffer is full.
                 return
 
-            self._outbuf = None
-            self._frame_handler.pop_message()
+    def _take_frames(self):
+        """
+        Take the queued frames from the frame handler, keeping large
+        buffers like frame bodies as is, and joining small buffers.
+        """
+        small = []
+        small_size = 0
+        while (self._frame_handler.has_outgoing_messages and
+               len(self._outbufs) < self.MAX_SEND_BUFFERS):
+            frame = self._frame_handler.pop_message()
+            frame_size = 0
+            for buf in frame.encode_buffers():
+                frame_size += len(buf)
+                if len(buf) < self.COALESCE_SIZE:
+                    small.append(buf)
+                    small_size += len(buf)
+                    if small_size < self.COALESCE_SIZE:
+                        continue
+                    buf = b''.join(small)
+                elif small:
+                    self._outbufs.append(memoryview(b''.join(small)))
+                self._outbufs.append(memoryview(buf))
+                small = []
+                small_size = 0
+            self._outframes.append((frame, frame_size))
+
+        if small:
+            self._outbufs.append(memoryview(b''.join(small)))
+
+    def _consume(self, count):
+        """
+        Drop count bytes from the buffers being sent, and the frames sent
+        completely.
+        """
+        remaining = count
+        while remaining:
+            buf = self._outbufs[0]
+            if remaining < len(buf):
+                self._outbufs[0] = buf[remaining:]
+                break
+            remaining -= len(buf)
+            self._outbufs.popleft()
+
+        remaining = count
+        while remaining:
+            frame, size = self._outframes[0]
+            if remaining < size:
+                self._outframes[0] = (frame, size - remaining)
+                break
+            remaining -= size
+            self._outframes.popleft()
 
     def writable(self, dispatcher):
         if self._frame_handler.has_outgoing_messages:
             return True
 
-        if self._outbuf is not None:
+        if self._outbufs:
             return True
 
         if (self.next_check_interval() == 0):
@@ -190,6 +190,7 @@ class BarrierTests(VdsmTestCase):
                 t.join()
 
 
+@expandPermutations
 class TMapTests(VdsmTestCase):
 
     def test_results(self):
@@ -214,6 +215,41 @@ class TMapTests(VdsmTestCase):
         self.assertGreater(elapsed, 0.5)
         self.assertLess(elapsed, 1.0)
 
+    def test_workers(self):
+        running = [0]
+        max_running = [0]
+        lock = threading.Lock()
+
+        def func(x):
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return x
+
+        values = tuple(range(20))
+        results = concurrent.tmap(func, values, workers=4)
+        expected = [concurrent.Result(True, x) for x in values]
+        self.assertEqual(results, expected)
+        self.assertEqual(max_running[0], 4)
+
+    @permutations([[0], [-1]])
+    def test_workers_unlimited(self, workers):
+        start = time.time()
+        results = concurrent.tmap(time.sleep, [0.2] * 10, workers=workers)
+        elapsed = time.time() - start
+        self.assertEqual(results, [concurrent.Result(True, None)] * 10)
+        self.assertLess(elapsed, 0.4)
+
+    def test_workers_concurrency(self):
+        start = time.time()
+        concurrent.tmap(time.sleep, [0.2] * 10, workers=5)
+        elapsed = time.time() - start
+        self.assertGreater(elapsed, 0.4)
+        self.assertLess(elapsed, 1.0)
+
     def test_error(self):
         error = RuntimeError("No result for you!")
 
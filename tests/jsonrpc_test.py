@@ -20,8 +20,13 @@
 
 from __future__ import absolute_import
 from __future__ import division
-from yajsonrpc import JsonRpcRequest, JsonRpcServer
 
+import threading
+
+from yajsonrpc import JsonRpcRequest, JsonRpcServer, LatencyHistogram
+
+from vdsm.common import api
+from vdsm.common import concurrent
 from vdsm.common import exception
 from vdsm.common.compat import json
 
@@ -63,3 +68,105 @@ class ServerTests(VdsmTestCase):
         self.assertEqual({"reason": "Too many tasks",
                           "resource": "test",
                           "current_tasks": 0}, reason)
+
+
+class FakeBridge(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def dispatch(self, method):
+        def call(**params):
+            with self.lock:
+                self.calls.append((method, params["connection"],
+                                   params["seq"]))
+        return call
+
+    def register_server_address(self, address):
+        pass
+
+    def unregister_server_address(self):
+        pass
+
+
+class FakeCif(object):
+    ready = True
+
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.replies = []
+
+    def send(self, data):
+        self.replies.append(json.loads(data))
+
+
+class ParseWorkersTests(VdsmTestCase):
+
+    def test_order_per_connection(self):
+        bridge = FakeBridge()
+        server = JsonRpcServer(bridge, 60, FakeCif(), workers=3)
+        client = FakeClient()
+        connections = 8
+        messages = 50
+
+        for seq in range(messages):
+            for port in range(connections):
+                msg = json.dumps({
+                    "jsonrpc": "2.0",
+                    "method": "Host.echo",
+                    "params": {"connection": port, "seq": seq},
+                    "id": "%d-%d" % (port, seq),
+                })
+                context = api.Context(None, "127.0.0.1", port)
+                server.queueRequest((client, None, context, msg))
+
+        server.stop()
+        threads = [concurrent.thread(server.serve_requests, args=(worker,))
+                   for worker in range(server.workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(bridge.calls), connections * messages)
+        for port in range(connections):
+            seqs = [seq for _, conn, seq in bridge.calls if conn == port]
+            self.assertEqual(seqs, list(range(messages)))
+        self.assertEqual(len(client.replies), connections * messages)
+
+    def test_parse_error(self):
+        server = JsonRpcServer(FakeBridge(), 60, FakeCif(), workers=2)
+        client = FakeClient()
+        context = api.Context(None, "127.0.0.1", 54321)
+        server.queueRequest((client, None, context, "not json"))
+        server.stop()
+        for worker in range(server.workers):
+            server.serve_requests(worker)
+
+        reply, = client.replies
+        self.assertEqual(reply["error"]["code"], -32700)
+
+
+class LatencyHistogramTests(VdsmTestCase):
+
+    def test_collect(self):
+        histogram = LatencyHistogram()
+        histogram.add("Host.getStats", 0.001)
+        histogram.add("Host.getStats", 0.05)
+        histogram.add("Host.getStats", 0.05)
+        histogram.add("Host.getAllVmStats", 120)
+
+        latency = histogram.collect()
+        self.assertEqual(latency["Host.getStats"][:3], [1, 2, 0])
+        self.assertEqual(latency["Host.getAllVmStats"][-1], 1)
+        self.assertEqual(histogram.collect(), {})
+
+    def test_format(self):
+        counts = [0] * (len(LatencyHistogram.BUCKETS) + 1)
+        counts[1] = 2
+        counts[-1] = 1
+        self.assertEqual(LatencyHistogram.format(counts),
+                         "<=0.1s: 2, >60s: 1")
@@ -33,10 +33,34 @@ from yajsonrpc.stomp import (
     Command,
     Frame,
     Headers,
-    DEFAULT_INTERVAL
+    DEFAULT_INTERVAL,
+    _heartBeatFrame
 )
 
 
+class RecordingAsyncDispatcher(FakeAsyncDispatcher):
+    """
+    Record the buffers sent, sending at most max_size bytes per call.
+    """
+
+    def __init__(self, max_size=None):
+        super(RecordingAsyncDispatcher, self).__init__(None)
+        self.max_size = max_size
+        self.calls = []
+        self.sent = []
+
+    def sendmsg(self, buffers):
+        self.calls.append([buf.tobytes() for buf in buffers])
+        data = b''.join(self.calls[-1])
+        if self.max_size is not None:
+            data = data[:self.max_size]
+        self.sent.append(data)
+        return len(data)
+
+    def data(self):
+        return b''.join(self.sent)
+
+
 class AsyncDispatcherTest(TestCaseBase):
 
     def test_handle_connect(self):
@@ -137,6 +161,54 @@ class AsyncDispatcherTest(TestCaseBase):
         dispatcher.handle_write(FakeAsyncDispatcher(''))
         self.assertFalse(frame_handler.has_outgoing_messages)
 
+    def test_handle_write_coalesce_small_frames(self):
+        frame_handler = FakeFrameHandler()
+        frames = [Frame(Command.MESSAGE, {}, 'event %d' % i)
+                  for i in range(10)]
+        for frame in frames:
+            frame_handler.queue_frame(frame)
+        frame_handler.queue_frame(_heartBeatFrame)
+
+        dispatcher = AsyncDispatcher(FakeConnection(), frame_handler)
+        socket = RecordingAsyncDispatcher()
+        dispatcher.handle_write(socket)
+
+        self.assertEqual(len(socket.calls), 1)
+        expected = ''.join(f.encode() for f in frames) + '\n'
+        self.assertEqual(socket.data(), expected)
+        self.assertFalse(dispatcher.writable(None))
+
+    def test_handle_write_large_body(self):
+        body = 'x' * (1024 * 1024)
+        frame = Frame(Command.MESSAGE, {}, body)
+        frame_handler = FakeFrameHandler()
+        frame_handler.queue_frame(frame)
+
+        dispatcher = AsyncDispatcher(FakeConnection(), frame_handler)
+        socket = RecordingAsyncDispatcher()
+        dispatcher.handle_write(socket)
+
+        # Header, body and terminator sent using one call, without copying
+        # the body.
+        buffers, = socket.calls
+        self.assertEqual(len(buffers), 3)
+        self.assertEqual(len(buffers[1]), len(body))
+        self.assertEqual(socket.data(), frame.encode())
+
+    def test_handle_write_partial(self):
+        frames = [Frame(Command.MESSAGE, {}, 'x' * 10000) for i in range(3)]
+        frame_handler = FakeFrameHandler()
+        for frame in frames:
+            frame_handler.queue_frame(frame)
+
+        dispatcher = AsyncDispatcher(FakeConnection(), frame_handler)
+        socket = RecordingAsyncDispatcher(max_size=4000)
+        while dispatcher.writable(None):
+            dispatcher.handle_write(socket)
+
+        self.assertEqual(socket.data(),
+                         ''.join(f.encode() for f in frames))
+
     def test_handle_close(self):
         connection = FakeConnection()
         dispatcher = AsyncDispatcher(connection, FakeFrameHandler())
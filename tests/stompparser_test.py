@@ -0,0 +1,312 @@
+#
+# Copyright 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+from collections import deque
+
+import pytest
+
+from testlib import VdsmTestCase
+from testlib import expandPermutations, permutations
+
+from yajsonrpc import stomp
+
+KiB = 1024
+MiB = 1024 * KiB
+
+# Size of the chunks read from the socket by stomp.AsyncDispatcher.
+CHUNK_SIZE = 4096
+
+
+def frame_data(body, content_length=True, command=b"SEND",
+               headers=((b"destination", b"/queue/a"),)):
+    lines = [command]
+    for key, value in headers:
+        lines.append(key + b":" + value)
+    if content_length:
+        lines.append(b"content-length:" + str(len(body)).encode("ascii"))
+    return b"\n".join(lines) + b"\n\n" + body + b"\0"
+
+
+def parse_chunks(parser, data, size):
+    for i in range(0, len(data), size):
+        parser.parse(data[i:i + size])
+
+
+def pop_frames(parser):
+    frames = []
+    while parser.pending:
+        frames.append(parser.popFrame())
+    return frames
+
+
+@expandPermutations
+class ParserTests(VdsmTestCase):
+
+    @permutations([
+        # content_length, chunk_size
+        (True, 1),
+        (True, 7),
+        (True, CHUNK_SIZE),
+        (False, 1),
+        (False, 7),
+        (False, CHUNK_SIZE),
+    ])
+    def test_frame(self, content_length, chunk_size):
+        body = b'{"jsonrpc": "2.0", "method": "Host.ping2", "id": "1"}'
+        parser = stomp.Parser()
+        parse_chunks(parser, frame_data(body, content_length), chunk_size)
+        frame, = pop_frames(parser)
+        self.assertEqual(frame.command, u"SEND")
+        self.assertEqual(frame.headers[u"destination"], u"/queue/a")
+        self.assertEqual(frame.body, body)
+        self.assertIsInstance(frame.body, bytes)
+
+    @permutations([[1], [7], [CHUNK_SIZE]])
+    def test_body_with_null(self, chunk_size):
+        body = b"before\0after"
+        parser = stomp.Parser()
+        parse_chunks(parser, frame_data(body), chunk_size)
+        frame, = pop_frames(parser)
+        self.assertEqual(frame.body, body)
+
+    def test_empty_body(self):
+        parser = stomp.Parser()
+        parser.parse(frame_data(b""))
+        frame, = pop_frames(parser)
+        self.assertEqual(frame.body, b"")
+
+    @permutations([[1], [7], [CHUNK_SIZE]])
+    def test_multiple_frames(self, chunk_size):
+        bodies = [b"first", b"second" * 1000, b"third"]
+        data = b"".join([
+            frame_data(bodies[0]),
+            b"\n\r\n",  # heartbeats
+            frame_data(bodies[1], content_length=False),
+            frame_data(bodies[2]),
+        ])
+        parser = stomp.Parser()
+        parse_chunks(parser, data, chunk_size)
+        frames = pop_frames(parser)
+        self.assertEqual([f.body for f in frames], bodies)
+        self.assertIsNone(parser.popFrame())
+
+    def test_partial_frame(self):
+        data = frame_data(b"body")
+        parser = stomp.Parser()
+        parser.parse(data[:-1])
+        self.assertEqual(parser.pending, 0)
+        parser.parse(data[-1:])
+        self.assertEqual(parser.pending, 1)
+
+    def test_crlf(self):
+        data = (b"SEND\r\ndestination:/queue/a\r\ncontent-length:4\r\n\r\n"
+                b"body\0")
+        parser = stomp.Parser()
+        parser.parse(data)
+        frame, = pop_frames(parser)
+        self.assertEqual(frame.command, u"SEND")
+        self.assertEqual(frame.headers, {u"destination": u"/queue/a",
+                                         u"content-length": u"4"})
+        self.assertEqual(frame.body, b"body")
+
+    def test_escaped_header(self):
+        data = frame_data(b"", headers=((b"key\\c", b"a\\nb\\\\"),))
+        parser = stomp.Parser()
+        parser.parse(data)
+        frame, = pop_frames(parser)
+        self.assertEqual(frame.headers[u"key:"], u"a\nb\\")
+
+    def test_repeated_header(self):
+        data = frame_data(b"", headers=((b"key", b"first"),
+                                        (b"key", b"second")))
+        parser = stomp.Parser()
+        parser.parse(data)
+        frame, = pop_frames(parser)
+        self.assertEqual(frame.headers[u"key"], u"first")
+
+    def test_missing_frame_end(self):
+        data = b"SEND\ncontent-length:4\n\nbodyX"
+        parser = stomp.Parser()
+        self.assertRaises(RuntimeError, parser.parse, data)
+
+
+class LegacyParser(object):
+    """
+    The parser used before stomp.Parser kept the data in a bytearray, kept
+    for comparing performance.
+    """
+    _STATE_CMD = "Parsing command"
+    _STATE_HEADER = "Parsing headers"
+    _STATE_BODY = "Receiving body"
+
+    def __init__(self):
+        self._states = {
+            self._STATE_CMD: self._parse_command,
+            self._STATE_HEADER: self._parse_header,
+            self._STATE_BODY: self._parse_body}
+        self._frames = deque()
+        self._change_state(self._STATE_CMD)
+        self._contentLength = -1
+        self._flush()
+
+    def _change_state(self, new_state):
+        self._state = new_state
+        self._state_cb = self._states[new_state]
+
+    def _flush(self):
+        self._buffer = b""
+
+    def _write_buffer(self, buff):
+        self._buffer += buff
+
+    def _get_buffer(self):
+        return self._buffer
+
+    def _handle_terminator(self, term):
+        res, sep, rest = self._buffer.partition(term)
+        if not sep:
+            return None
+
+        self._buffer = rest
+
+        return res
+
+    def _parse_command(self):
+        cmd = self._handle_terminator(b'\n')
+        if cmd is None:
+            return False
+
+        if len(cmd) > 0 and cmd[-1:] == b'\r':
+            cmd = cmd[:-1]
+
+        if cmd == b"":
+            return True
+
+        cmd = stomp.decodeValue(cmd)
+        self._tmpFrame = stomp.Frame(cmd)
+
+        self._change_state(self._STATE_HEADER)
+        return True
+
+    def _parse_header(self):
+        header = self._handle_terminator(b'\n')
+        if header is None:
+            return False
+
+        if len(header) > 0 and header[-1:] == b'\r':
+            header = header[:-1]
+
+        headers = self._tmpFrame.headers
+        if header == b"":
+            self._contentLength = int(headers.get('content-length', -1))
+            self._change_state(self._STATE_BODY)
+            return True
+
+        key, value = header.split(b":", 1)
+        key = stomp.decodeValue(key)
+        value = stomp.decodeValue(value)
+        headers.setdefault(key, value)
+
+        return True
+
+    def _pushFrame(self):
+        self._frames.append(self._tmpFrame)
+        self._change_state(self._STATE_CMD)
+        self._tmpFrame = None
+        self._contentLength = -1
+
+    def _parse_body(self):
+        if self._contentLength >= 0:
+            return self._parse_body_length()
+        else:
+            return self._parse_body_terminator()
+
+    def _parse_body_terminator(self):
+        body = self._handle_terminator(b'\0')
+        if body is None:
+            return False
+
+        self._tmpFrame.body = body
+        self._pushFrame()
+        return True
+
+    def _parse_body_length(self):
+        buf = self._get_buffer()
+        cl = self._contentLength
+        ndata = len(buf)
+        if ndata < (cl + 1):
+            return False
+
+        if buf[cl:cl + 1] != b"\0":
+            raise RuntimeError("Frame end is missing \\0")
+
+        self._flush()
+        self._write_buffer(buf[cl + 1:])
+        body = buf[:cl]
+
+        self._tmpFrame.body = body
+        self._pushFrame()
+
+        return True
+
+    @property
+    def pending(self):
+        return len(self._frames)
+
+    def parse(self, data):
+        self._write_buffer(data)
+        while self._state_cb():
+            pass
+
+
+@expandPermutations
+class ParserBenchmarkTests(VdsmTestCase):
+
+    # Feeding a large frame to the legacy parser takes time quadratic in
+    # the frame size, so we compare only up to this size.
+    LEGACY_MAX_SIZE = 8 * MiB
+
+    @pytest.mark.stress
+    @permutations([[1 * KiB], [64 * KiB], [1 * MiB], [8 * MiB], [50 * MiB]])
+    def test_throughput(self, size):
+        data = frame_data(b"x" * size)
+        # Send enough data to get meaningful timing for small frames.
+        count = max(1, (8 * MiB) // len(data))
+        data *= count
+
+        print()
+        self.benchmark("parser", stomp.Parser(), data, count)
+        if size <= self.LEGACY_MAX_SIZE:
+            self.benchmark("legacy parser", LegacyParser(), data, count)
+
+    def benchmark(self, name, parser, data, count):
+        start = time.time()
+        parse_chunks(parser, data, CHUNK_SIZE)
+        elapsed = time.time() - start
+        self.assertEqual(parser.pending, count)
+        print("%s: %d frames of %d bytes: %.3fs, %.2f MiB/s, "
+              "%.2f frames/s"
+              % (name, count, len(data) // count, elapsed,
+                 len(data) / MiB / elapsed, count / elapsed))
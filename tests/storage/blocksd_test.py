@@ -32,6 +32,7 @@ from storage.storagefakelib import fake_vg
 from testValidation import xfail
 from testlib import VdsmTestCase
 from vdsm.storage import blockSD
+from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
 from vdsm.storage import lvm
 from vdsm import constants
@@ -163,3 +164,94 @@ def test_meta_size_max_val(monkeypatch):
         free=str(1024 * constants.MEGAB)))
     meta_size = blockSD.BlockStorageDomain.metaSize('sd-uuid')
     assert meta_size == 513
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def metadata_volume(tmpdir):
+    path = tmpdir.join("metadata")
+    with open(str(path), "wb") as f:
+        for slot in range(8192):
+            f.write(slot_data(slot))
+    return str(path)
+
+
+def slot_data(slot):
+    return ("slot %d" % slot).encode("ascii").ljust(sc.METADATA_SIZE, b"\0")
+
+
+class TestVolumeMetadataSlots:
+
+    def test_read(self, metadata_volume):
+        slots = blockSD.VolumeMetadataSlots(metadata_volume, 0)
+        res = slots.read([7, 0, 13])
+        assert res == {0: slot_data(0), 7: slot_data(7), 13: slot_data(13)}
+
+    def test_read_groups(self, metadata_volume, monkeypatch):
+        slots = blockSD.VolumeMetadataSlots(metadata_volume, 0)
+        reads = []
+        read_slots = slots._read_slots
+
+        def counting_read_slots(group):
+            reads.append(group)
+            return read_slots(group)
+
+        monkeypatch.setattr(slots, "_read_slots", counting_read_slots)
+        max_slots = slots.MAX_READ // sc.METADATA_SIZE
+        requested = [1, 5, max_slots + 1, max_slots + 2, 8191]
+        res = slots.read(requested)
+        assert res == {slot: slot_data(slot) for slot in requested}
+        assert reads == [[1, 5], [max_slots + 1, max_slots + 2], [8191]]
+
+    def test_no_cache(self, metadata_volume, monkeypatch):
+        slots = blockSD.VolumeMetadataSlots(metadata_volume, 0)
+        slots.read([1])
+        with open(metadata_volume, "r+b") as f:
+            f.seek(sc.METADATA_SIZE)
+            f.write(b"modified")
+        assert slots.read([1])[1].startswith(b"modified")
+
+    def test_cache(self, metadata_volume):
+        clock = FakeClock()
+        slots = blockSD.VolumeMetadataSlots(metadata_volume, 10, clock=clock)
+        slots.read([1, 2])
+        with open(metadata_volume, "r+b") as f:
+            f.seek(sc.METADATA_SIZE)
+            f.write(b"modified")
+
+        # Cached slot.
+        assert slots.read([1])[1] == slot_data(1)
+
+        # Cached slot expired.
+        clock.now += 10
+        assert slots.read([1])[1].startswith(b"modified")
+
+    def test_invalidate(self, metadata_volume):
+        slots = blockSD.VolumeMetadataSlots(
+            metadata_volume, 10, clock=FakeClock())
+        slots.read([1, 2])
+        with open(metadata_volume, "r+b") as f:
+            f.seek(sc.METADATA_SIZE)
+            f.write(b"modified")
+        slots.invalidate(1)
+        res = slots.read([1, 2])
+        assert res[1].startswith(b"modified")
+        assert res[2] == slot_data(2)
+
+    def test_read_error(self, tmpdir):
+        slots = blockSD.VolumeMetadataSlots(str(tmpdir.join("missing")), 0)
+        with pytest.raises(se.MiscBlockReadException):
+            slots.read([1])
+
+    def test_read_incomplete(self, metadata_volume):
+        slots = blockSD.VolumeMetadataSlots(metadata_volume, 0)
+        with pytest.raises(se.MiscBlockReadIncomplete):
+            slots.read([8192])
@@ -29,6 +29,7 @@ from vdsm import constants
 from vdsm.config import config
 from vdsm.constants import GIB
 from vdsm.constants import MEGAB
+from vdsm.storage import blockSD
 from vdsm.storage import blockVolume
 from vdsm.storage import constants as sc
 from vdsm.storage import exception as se
@@ -174,3 +175,77 @@ class TestBlockVolumeManifest(VdsmTestCase):
             with MonkeyPatchScope([(qemuimg, 'check', fake_check)]):
                 env.chain = make_qemu_chain(env, actual_size, sc.COW_FORMAT, 3)
                 self.assertEqual(env.chain[1].optimal_size(), optimal_size)
+
+
+class TestVolumesMetadata(VdsmTestCase):
+
+    @contextmanager
+    def make_env(self, cache_timeout=0):
+        config = make_config([
+            ('irs', 'block_volume_metadata_cache_timeout',
+             str(cache_timeout))])
+        with MonkeyPatchScope([(blockSD, 'config', config)]):
+            with fake_env('block') as env:
+                img_id = env.img_id = make_uuid()
+                env.volumes = []
+                for i in range(3):
+                    vol_id = make_uuid()
+                    env.make_volume(MEGAB, img_id, vol_id,
+                                    desc="volume %d" % i)
+                    env.volumes.append(
+                        env.sd_manifest.produceVolume(img_id, vol_id))
+                slots = env.sd_manifest._volume_metadata
+                env.reads = []
+                read_slots = slots._read_slots
+
+                def counting_read_slots(group):
+                    env.reads.append(group)
+                    return read_slots(group)
+
+                with MonkeyPatchScope([
+                        (slots, "_read_slots", counting_read_slots)]):
+                    yield env
+
+    def test_get_volumes_metadata(self):
+        with self.make_env() as env:
+            vol_ids = [vol.volUUID for vol in env.volumes]
+            res = env.sd_manifest.getVolumesMetadata(env.img_id, vol_ids)
+            self.assertEqual(len(env.reads), 1)
+            for i, vol in enumerate(env.volumes):
+                md = res[vol.volUUID]
+                self.assertEqual(md, vol.getMetadata())
+                self.assertEqual(md[sc.DESCRIPTION], "volume %d" % i)
+
+    def test_get_volumes_legality(self):
+        with self.make_env() as env:
+            env.volumes[1].setLegality(sc.ILLEGAL_VOL)
+            del env.reads[:]
+            vol_ids = [vol.volUUID for vol in env.volumes]
+            res = env.sd_manifest.getVolumesMetadata(env.img_id, vol_ids)
+            self.assertEqual(len(env.reads), 1)
+            self.assertEqual(
+                [res[vol_id][sc.LEGALITY] for vol_id in vol_ids],
+                [sc.LEGAL_VOL, sc.ILLEGAL_VOL, sc.LEGAL_VOL])
+
+    def test_no_cache(self):
+        with self.make_env() as env:
+            vol = env.volumes[0]
+            vol.getMetadata()
+            vol.getMetadata()
+            self.assertEqual(len(env.reads), 2)
+
+    def test_cache(self):
+        with self.make_env(cache_timeout=60) as env:
+            vol_ids = [vol.volUUID for vol in env.volumes]
+            env.sd_manifest.getVolumesMetadata(env.img_id, vol_ids)
+            for vol in env.volumes:
+                vol.getMetadata()
+            self.assertEqual(len(env.reads), 1)
+
+    def test_cache_invalidated_on_write(self):
+        with self.make_env(cache_timeout=60) as env:
+            vol = env.volumes[0]
+            vol.getMetadata()
+            vol.setDescription("new description")
+            self.assertEqual(vol.getDescription(), "new description")
+            self.assertEqual(len(env.reads), 2)
@@ -0,0 +1,297 @@
+#
+# Copyright 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import pytest
+
+from storage.storagetestlib import fake_env
+
+from vdsm.storage import chainindex
+from vdsm.storage import constants as sc
+from vdsm.storage import exception as se
+
+from testlib import make_uuid
+
+MB = 1024**2
+
+
+class FakeManifest(object):
+    """
+    Keep volumes tree in memory. Images include the template volume, like
+    file domains.
+    """
+
+    sdUUID = "sd-uuid"
+
+    def __init__(self, volumes, links=None):
+        self.volumes = volumes
+        self.links = links or {}
+        self.loads = []
+
+    def getVolumesTree(self, imgUUID):
+        self.loads.append(imgUUID)
+        return self.image_volumes(imgUUID)
+
+    def getImageVolumesStamps(self, imgUUID):
+        # Like file domains, the stamp changes when the parent is changed.
+        return self.image_volumes(imgUUID)
+
+    def image_volumes(self, imgUUID):
+        linked = self.links.get(imgUUID, [])
+        return {vol_id: node for vol_id, node in self.volumes.items()
+                if node.image == imgUUID or vol_id in linked}
+
+
+def node(image, parent=sc.BLANK_UUID):
+    return chainindex.VolumeNode(image, parent)
+
+
+@pytest.fixture
+def manifest():
+    # tmpl-img: tmpl
+    # img: tmpl <- base <- mid <- top
+    # other: other-base
+    return FakeManifest(
+        {
+            "tmpl": node("tmpl-img"),
+            "base": node("img", "tmpl"),
+            "mid": node("img", "base"),
+            "top": node("img", "mid"),
+            "other-base": node("other"),
+        },
+        links={"img": ["tmpl"]})
+
+
+def test_chain(manifest):
+    index = chainindex.ChainIndex(manifest)
+    assert index.chain("img") == ["base", "mid", "top"]
+    assert index.chain("other") == ["other-base"]
+    # Only the requested images are loaded.
+    assert manifest.loads == ["img", "other"]
+
+
+def test_chain_cached(manifest):
+    index = chainindex.ChainIndex(manifest)
+    index.chain("img")
+    assert index.chain("img") == ["base", "mid", "top"]
+    assert manifest.loads == ["img"]
+
+
+def test_chain_to_volume(manifest):
+    index = chainindex.ChainIndex(manifest)
+    assert index.chain("img", "mid") == ["base", "mid"]
+
+
+def test_template(manifest):
+    index = chainindex.ChainIndex(manifest)
+    assert index.chain("tmpl-img") == ["tmpl"]
+    assert index.chain("tmpl-img", "tmpl") == ["tmpl"]
+    assert index.chain("img", "tmpl") == ["tmpl"]
+
+
+def test_template_not_linked(manifest):
+    # Block domains do not list the template in the derived image.
+    manifest.links = {}
+    index = chainindex.ChainIndex(manifest)
+    assert index.chain("img") == ["base", "mid", "top"]
+    assert manifest.loads == ["img"]
+
+
+def test_missing_image(manifest):
+    index = chainindex.ChainIndex(manifest)
+    with pytest.raises(se.ImageDoesNotExistInSD):
+        index.chain("missing")
+
+
+def test_missing_volume(manifest):
+    index = chainindex.ChainIndex(manifest)
+    with pytest.raises(se.VolumeDoesNotExist):
+        index.chain("img", "missing")
+
+
+def test_volume_added(manifest):
+    index = chainindex.ChainIndex(manifest)
+    index.chain("img")
+    # Another host created a snapshot.
+    manifest.volumes["new"] = node("img", "top")
+    assert index.chain("img") == ["base", "mid", "top", "new"]
+    assert manifest.loads == ["img", "img"]
+
+
+def test_volume_removed(manifest):
+    index = chainindex.ChainIndex(manifest)
+    index.chain("img")
+    # Another host merged mid into base.
+    manifest.volumes["top"] = node("img", "base")
+    del manifest.volumes["mid"]
+    assert index.chain("img") == ["base", "top"]
+    assert manifest.loads == ["img", "img"]
+
+
+def test_parent_changed(manifest):
+    index = chainindex.ChainIndex(manifest)
+    index.chain("img")
+    # Another host changed the parent before removing the merged volume, so
+    # the image volumes did not change.
+    manifest.volumes["top"] = node("img", "base")
+    assert index.chain("img", "top") == ["base", "top"]
+    assert manifest.loads == ["img", "img"]
+
+
+def test_invalidate(manifest):
+    index = chainindex.ChainIndex(manifest)
+    index.chain("img")
+    index.invalidate("img")
+    index.chain("img")
+    assert manifest.loads == ["img", "img"]
+
+
+def test_clear(manifest):
+    index = chainindex.ChainIndex(manifest)
+    index.chain("img")
+    index.chain("other")
+    index.clear()
+    index.chain("img")
+    assert manifest.loads == ["img", "other", "img"]
+
+
+def test_multiple_leaves(manifest):
+    manifest.volumes["orphan"] = node("img", "base")
+    index = chainindex.ChainIndex(manifest)
+    with pytest.raises(se.ImageIsNotLegalChain):
+        index.chain("img")
+    assert index.chain("img", "orphan") == ["base", "orphan"]
+
+
+def test_loop():
+    manifest = FakeManifest({
+        "leaf": node("img", "a"),
+        "a": node("img", "b"),
+        "b": node("img", "a"),
+    })
+    index = chainindex.ChainIndex(manifest)
+    with pytest.raises(se.ImageIsNotLegalChain):
+        index.chain("img")
+
+
+def make_chain(env, img_id, length, parent_id=sc.BLANK_UUID):
+    vol_ids = []
+    for i in range(length):
+        vol_id = make_uuid()
+        vol_type = sc.LEAF_VOL if i == length - 1 else sc.INTERNAL_VOL
+        env.make_volume(MB, img_id, vol_id, parent_vol_id=parent_id,
+                        vol_type=vol_type)
+        vol_ids.append(vol_id)
+        parent_id = vol_id
+    return vol_ids
+
+
+@pytest.mark.parametrize("storage_type", ["file", "block"])
+def test_domain_chain(storage_type):
+    with fake_env(storage_type) as env:
+        img_id = make_uuid()
+        vol_ids = make_chain(env, img_id, 3)
+        other_img_id = make_uuid()
+        other_vol_ids = make_chain(env, other_img_id, 2)
+        manifest = env.sd_manifest
+        assert manifest.getImageChain(img_id) == vol_ids
+        assert manifest.getImageChain(img_id, vol_ids[1]) == vol_ids[:2]
+        assert manifest.getImageChain(other_img_id) == other_vol_ids
+
+
+@pytest.mark.parametrize("storage_type", ["file", "block"])
+def test_domain_chain_add_volume(storage_type):
+    with fake_env(storage_type) as env:
+        img_id = make_uuid()
+        vol_ids = make_chain(env, img_id, 3)
+        manifest = env.sd_manifest
+        manifest.getImageChain(img_id)
+        vol_ids += make_chain(env, img_id, 1, parent_id=vol_ids[-1])
+        assert manifest.getImageChain(img_id) == vol_ids
+
+
+@pytest.mark.parametrize("storage_type", ["file", "block"])
+def test_domain_chain_set_parent(storage_type):
+    with fake_env(storage_type) as env:
+        img_id = make_uuid()
+        base, mid, top = make_chain(env, img_id, 3)
+        manifest = env.sd_manifest
+        manifest.getImageChain(img_id)
+        # Unlink mid from the chain, like syncVolumeChain after live merge.
+        vol = manifest.produceVolume(img_id, top)
+        vol.setParentTag(base)
+        vol.setParentMeta(base)
+        assert manifest.getImageChain(img_id, top) == [base, top]
+
+
+def legacy_chain(manifest, img_id):
+    """
+    Find the chain like Image.getChain did before using the chain index.
+    """
+    vol_ids = manifest.getVolumeClass().getImageVolumes(
+        manifest.sdUUID, img_id)
+    for vol_id in vol_ids:
+        vol = manifest.produceVolume(img_id, vol_id)
+        if vol.isLeaf():
+            break
+    chain = []
+    while not vol.isShared():
+        chain.insert(0, vol)
+        parent_id = vol.getParent()
+        if parent_id == sc.BLANK_UUID:
+            break
+        vol = manifest.produceVolume(img_id, parent_id)
+    return chain
+
+
+def index_chain(manifest, img_id):
+    return [manifest.produceVolume(img_id, vol_id)
+            for vol_id in manifest.getImageChain(img_id)]
+
+
+@pytest.mark.stress
+@pytest.mark.parametrize("storage_type", ["file", "block"])
+@pytest.mark.parametrize("length", [10, 50, 100])
+def test_chain_benchmark(storage_type, length):
+    with fake_env(storage_type) as env:
+        img_id = make_uuid()
+        vol_ids = make_chain(env, img_id, length)
+        manifest = env.sd_manifest
+
+        print()
+        for name, func in [("legacy", legacy_chain), ("index", index_chain)]:
+            start = time.time()
+            chain = func(manifest, img_id)
+            first = time.time() - start
+            assert [vol.volUUID for vol in chain] == vol_ids
+
+            count = 10
+            start = time.time()
+            for i in range(count):
+                func(manifest, img_id)
+            elapsed = (time.time() - start) / count
+
+            print("%s %s chain of %d volumes: first %.6fs, next %.6fs"
+                  % (name, storage_type, length, first, elapsed))
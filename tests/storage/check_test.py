@@ -22,10 +22,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import errno
 import logging
 import os
 import pprint
 import re
+import resource
 import threading
 import time
 from contextlib import contextmanager
@@ -37,6 +39,7 @@ from monkeypatch import MonkeyPatch
 from monkeypatch import MonkeyPatchScope
 from testlib import VdsmTestCase
 from testlib import expandPermutations, permutations
+from testlib import namedTemporaryDir
 from testlib import start_thread
 from testlib import temporaryPath
 
@@ -458,6 +461,275 @@ class TestCheckService(VdsmTestCase):
             self.assertFalse(self.service.is_checking("/path"))
 
 
+class TestHelperChecker(VdsmTestCase):
+
+    def setUp(self):
+        self.loop = asyncevent.EventLoop()
+        self.pool = check.ReaderPool(self.loop, size=2, block_timeout=0.1)
+        self.results = []
+        self.checks = 1
+
+    def tearDown(self):
+        self.pool.close()
+        self.loop.close()
+
+    def complete(self, result):
+        self.results.append(result)
+        if len(self.results) == self.checks:
+            self.loop.stop()
+
+    def test_path_missing(self):
+        checker = check.HelperChecker(self.loop, "/no/such/path",
+                                      self.complete, pool=self.pool)
+        checker.start()
+        self.loop.run_forever()
+        pprint.pprint(self.results)
+        with self.assertRaises(exception.MiscFileReadException) as ctx:
+            self.results[0].delay()
+        self.assertIn("No such file or directory", str(ctx.exception))
+
+    def test_path_ok(self):
+        with temporaryPath(data=b"blah") as path:
+            checker = check.HelperChecker(self.loop, path, self.complete,
+                                          pool=self.pool)
+            checker.start()
+            self.loop.run_forever()
+            pprint.pprint(self.results)
+            delay = self.results[0].delay()
+            print("delay:", delay)
+            self.assertEqual(type(delay), float)
+
+    def test_reuse_helper(self):
+        self.checks = 3
+        with temporaryPath(data=b"blah") as path:
+            # Starting the helper may take more than the interval, so start
+            # it before starting the checker.
+            self.pool.read(path, lambda rc, data: self.loop.stop())
+            self.loop.run_forever()
+            helpers = list(self.pool._idle)
+            self.assertEqual(len(helpers), 1)
+
+            checker = check.HelperChecker(self.loop, path, self.complete,
+                                          interval=0.05, pool=self.pool)
+            checker.start()
+            self.loop.run_forever()
+            for result in self.results:
+                result.delay()
+            self.assertEqual(self.pool._idle, helpers)
+
+    def test_timeout(self):
+        # Expected events:
+        # +0.0 start checker
+        # +0.1 fail with timeout
+        # +0.2 loop stopped, read still blocked
+
+        def complete(result):
+            self.results.append(result)
+            self.loop.call_later(0.1, self.loop.stop)
+
+        with blocking_path() as path:
+            checker = check.HelperChecker(self.loop, path, complete,
+                                          interval=0.1, pool=self.pool)
+            checker.start()
+            self.loop.run_forever()
+
+        self.assertEqual(len(self.results), 1)
+        with self.assertRaises(exception.MiscFileReadException) as e:
+            self.results[0].delay()
+        self.assertIn("Read timeout", str(e.exception))
+
+    def test_blocked_path_isolation(self):
+        # A blocked read must not delay checking other paths.
+        self.checks = 3
+        with blocking_path() as blocked, \
+                temporaryPath(data=b"blah") as path:
+            blocked_checker = check.HelperChecker(
+                self.loop, blocked, self.complete, interval=10,
+                pool=self.pool)
+            blocked_checker.start()
+            # Starting a helper may be slow on a loaded machine, and a read
+            # not completed within the interval times out.
+            checker = check.HelperChecker(
+                self.loop, path, self.complete, interval=0.5,
+                pool=self.pool)
+            checker.start()
+            self.loop.run_forever()
+            for result in self.results:
+                self.assertEqual(result.path, path)
+                result.delay()
+            self.assertEqual(len(self.pool._busy), 1)
+
+    def test_blocked_helpers(self):
+        # When all helpers are blocked, reads are queued until another helper
+        # is started.
+        self.checks = 2
+        self.pool = check.ReaderPool(self.loop, size=1, block_timeout=0.1)
+        with blocking_path() as blocked, \
+                temporaryPath(data=b"blah") as path:
+            blocked_checker = check.HelperChecker(
+                self.loop, blocked, self.complete, interval=10,
+                pool=self.pool)
+            blocked_checker.start()
+            checker = check.HelperChecker(
+                self.loop, path, self.complete, interval=0.3,
+                pool=self.pool)
+            checker.start()
+            self.loop.run_forever()
+            for result in self.results:
+                self.assertEqual(result.path, path)
+                result.delay()
+            self.assertGreaterEqual(self.results[0].elapsed, 0.1)
+            self.assertEqual(len(self.pool._busy), 1)
+            self.assertEqual(len(self.pool._idle), 1)
+
+    def test_stop_blocked_checker(self):
+        # Closing the pool kills the blocked helper, completing the read.
+        with blocking_path() as path:
+            checker = check.HelperChecker(self.loop, path, self.complete,
+                                          pool=self.pool)
+            checker.start()
+            checker.stop()
+            self.loop.call_later(0.1, self.pool.close)
+            start_thread(self.wait_for_checker, checker)
+            self.loop.run_forever()
+        self.assertFalse(checker.is_running())
+        self.assertEqual(self.results, [])
+
+    def wait_for_checker(self, checker):
+        checker.wait(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+@expandPermutations
+class TestReadResult(VdsmTestCase):
+
+    @permutations([
+        # err, seconds
+        (b"0.000123", 0.000123),
+        (b"1.500000", 1.5),
+    ])
+    def test_success(self, err, seconds):
+        result = check.ReadResult("/path", 0, err, 0, 0)
+        self.assertEqual(result.delay(), seconds)
+
+    def test_error(self):
+        result = check.ReadResult("/path", 2, b"No such file or directory",
+                                  0, 0)
+        with self.assertRaises(exception.MiscFileReadException) as ctx:
+            result.delay()
+        self.assertIn("No such file or directory", str(ctx.exception))
+
+    def test_unexpected_output(self):
+        result = check.ReadResult("/path", 0, b"BAD", 0, 0)
+        self.assertRaises(exception.MiscFileReadException, result.delay)
+
+
+class TestHelperCheckService(VdsmTestCase):
+
+    def setUp(self):
+        self.service = check.CheckService(backend=check.HELPER)
+        self.service.start()
+        self.result = None
+        self.completed = threading.Event()
+
+    def tearDown(self):
+        self.service.stop()
+
+    def complete(self, result):
+        self.result = result
+        self.completed.set()
+
+    def test_start_checking(self):
+        with temporaryPath(data=b"blah") as path:
+            self.service.start_checking(path, self.complete)
+            self.assertTrue(self.completed.wait(5.0))
+            self.assertEqual(type(self.result.delay()), float)
+            self.assertTrue(self.service.stop_checking(path, timeout=1.0))
+
+    def test_unsupported_backend(self):
+        with self.assertRaises(ValueError):
+            check.CheckService(backend="no-such-backend")
+
+
+@expandPermutations
+class TestCheckerBenchmark(VdsmTestCase):
+
+    CHECKERS = 50
+    CHECKS = 1000
+
+    @pytest.mark.stress
+    @permutations([[check.DD], [check.HELPER]])
+    def test_cpu_usage(self, backend):
+        loop = asyncevent.EventLoop()
+        pool = check.ReaderPool(loop)
+        checkers = []
+        results = []
+
+        def complete(result):
+            result.delay()
+            results.append(result)
+            if len(results) == self.CHECKS:
+                for checker in checkers:
+                    checker.stop()
+                pool.close()
+                # Let the reapers wait for the child processes, so their cpu
+                # time is accounted.
+                loop.call_later(1.0, loop.stop)
+
+        with temporaryPath(data=b"blah") as path:
+            start_cpu = cpu_time()
+            start = time.time()
+            for i in range(self.CHECKERS):
+                if backend == check.HELPER:
+                    checker = check.HelperChecker(loop, path, complete,
+                                                  interval=0.1, pool=pool)
+                else:
+                    checker = check.DirectioChecker(loop, path, complete,
+                                                    interval=0.1)
+                checker.start()
+                checkers.append(checker)
+            loop.run_forever()
+            elapsed = time.time() - start - 1.0
+            cpu = cpu_time() - start_cpu
+        loop.close()
+
+        print("%s: %d checks in %.2f seconds, cpu time per 1000 checks: "
+              "%.3f seconds" % (backend, self.CHECKS, elapsed,
+                                cpu / self.CHECKS * 1000))
+
+
+def cpu_time():
+    """
+    Return user and system time used by this process and waited children.
+    """
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+@contextmanager
+def blocking_path():
+    """
+    Return a path blocking reader helpers until the context exits.
+
+    Opening a fifo for reading blocks until the fifo is opened for writing.
+    """
+    with namedTemporaryDir() as tmpdir:
+        path = os.path.join(tmpdir, "fifo")
+        os.mkfifo(path)
+        try:
+            yield path
+        finally:
+            # Unblock the reader helper if it is still waiting.
+            try:
+                os.close(os.open(path, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+
+
 @contextmanager
 def fake_dd(delay):
     """
@@ -23,11 +23,16 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import errno
 import fnmatch
+import glob
 import os
+import stat
 import time
 import uuid
 
+import pytest
+
 from storage.storagefakelib import fake_repo
 from testlib import VdsmTestCase
 from testlib import expandPermutations
@@ -47,6 +52,8 @@ class FileStorageDomainManifest(fileSD.FileStorageDomainManifest):
         self.mountpoint = os.path.dirname(domainpath)
         self.sdUUID = os.path.basename(domainpath)
         self._oop = oop
+        self._volumeCatalog = fileSD.VolumeCatalog(
+            os.path.join(domainpath, sd.DOMAIN_IMAGES))
 
     @property
     def oop(self):
@@ -63,18 +70,55 @@ class FileStorageDomain(fileSD.FileStorageDomain):
 
 
 class FakeGlob(object):
+    """
+    Glob a tree built from a list of files, matching every path component
+    separately like glob.glob().
+    """
 
     def __init__(self, files):
-        self.files = files
+        self.files = set(files)
+        self.tree = collections.defaultdict(set)
+        for path in files:
+            while True:
+                parent, name = os.path.split(path)
+                if not name:
+                    break
+                self.tree[parent].add(name)
+                path = parent
 
     def glob(self, pattern):
-        return fnmatch.filter(self.files, pattern)
+        dirname, basename = os.path.split(pattern)
+        if glob.has_magic(dirname):
+            dirs = self.glob(dirname)
+        else:
+            dirs = [dirname]
+        return [os.path.join(d, name) for d in dirs
+                for name in fnmatch.filter(self.tree.get(d, ()), basename)]
+
+
+class FakeOS(object):
+
+    def __init__(self, glob):
+        self._glob = glob
+
+    def stat(self, path):
+        if path in self._glob.tree:
+            mode = stat.S_IFDIR
+        elif path in self._glob.files:
+            mode = stat.S_IFREG
+        else:
+            raise OSError(errno.ENOENT, "No such file or directory")
+        return FakeStat(mode, 0.0)
+
+
+FakeStat = collections.namedtuple("FakeStat", "st_mode, st_mtime")
 
 
 class FakeOOP(object):
 
     def __init__(self, glob=None):
         self.glob = glob
+        self.os = FakeOS(glob) if glob else None
 
 
 class TestGetAllVolumes(VdsmTestCase):
@@ -175,6 +219,13 @@ class TestGetAllVolumes(VdsmTestCase):
         # on overloaded jenkins slave.
         self.assertTrue(elapsed < 1.0, "Elapsed time: %f seconds" % elapsed)
 
+        # Nothing changed, the cached catalog is used.
+        start = time.time()
+        dom.getAllVolumes()
+        elapsed = time.time() - start
+        print("%f seconds (cached)" % elapsed)
+        self.assertTrue(elapsed < 1.0, "Elapsed time: %f seconds" % elapsed)
+
 
 SDInfo = collections.namedtuple("SDInfo",
                                 "uuid, remote_path, mountpoint, dom_dir")
@@ -245,6 +296,250 @@ class TestVolumeOperations(VdsmTestCase):
                          allowActive=allow_active)
 
 
+class RecordingGlob(object):
+
+    def __init__(self):
+        self.patterns = []
+
+    def glob(self, pattern):
+        self.patterns.append(pattern)
+        return glob.glob(pattern)
+
+
+class RecordingOS(object):
+
+    def __init__(self):
+        self.stats = []
+
+    def stat(self, path):
+        self.stats.append(path)
+        return os.stat(path)
+
+
+class LocalOOP(object):
+    """
+    Access local files directly, recording glob patterns and stat paths.
+    """
+
+    def __init__(self):
+        self.glob = RecordingGlob()
+        self.os = RecordingOS()
+
+    @property
+    def globbed(self):
+        return self.glob.patterns
+
+    @property
+    def stated(self):
+        return self.os.stats
+
+
+# Modification time of catalog files, old enough to be cached.
+OLD_MTIME = time.time() - 3600
+
+
+@pytest.fixture
+def images_dir(tmpdir):
+    path = str(tmpdir.join(sd.DOMAIN_IMAGES))
+    os.mkdir(path)
+    return path
+
+
+def make_image(images_dir, img_id, vol_ids, mtime=OLD_MTIME):
+    img_dir = os.path.join(images_dir, img_id)
+    os.mkdir(img_dir)
+    for vol_id in vol_ids:
+        open(os.path.join(img_dir, vol_id + ".meta"), "w").close()
+    os.utime(img_dir, (mtime, mtime))
+    os.utime(images_dir, (mtime, mtime))
+
+
+def add_volume(images_dir, img_id, vol_id, mtime=OLD_MTIME):
+    img_dir = os.path.join(images_dir, img_id)
+    open(os.path.join(img_dir, vol_id + ".meta"), "w").close()
+    os.utime(img_dir, (mtime, mtime))
+
+
+def test_catalog_volumes(images_dir):
+    make_image(images_dir, "tmpl-img", ["tmpl"])
+    make_image(images_dir, "img", ["base", "top"])
+    os.link(os.path.join(images_dir, "tmpl-img", "tmpl.meta"),
+            os.path.join(images_dir, "img", "tmpl.meta"))
+    os.utime(os.path.join(images_dir, "img"), (OLD_MTIME, OLD_MTIME))
+
+    catalog = fileSD.VolumeCatalog(images_dir)
+    vols = catalog.volumes(LocalOOP())
+    assert sorted(vols) == ["base", "tmpl", "top"]
+    assert vols["base"] == (("img",), None)
+    assert vols["tmpl"].imgs[0] == "tmpl-img"
+    assert set(vols["tmpl"].imgs) == {"tmpl-img", "img"}
+    assert vols["tmpl"].parent == sd.BLANK_UUID
+
+    assert sorted(catalog.imageVolumes(LocalOOP(), "img")) == [
+        "base", "tmpl", "top"]
+    assert catalog.imageVolumes(LocalOOP(), "missing") == {}
+
+
+def test_catalog_cached(images_dir):
+    make_image(images_dir, "img-1", ["vol-1"])
+    make_image(images_dir, "img-2", ["vol-2"])
+    catalog = fileSD.VolumeCatalog(images_dir)
+    catalog.volumes(LocalOOP())
+
+    oop = LocalOOP()
+    assert sorted(catalog.volumes(oop)) == ["vol-1", "vol-2"]
+    assert oop.globbed == []
+
+
+def test_catalog_rescan_modified(images_dir):
+    make_image(images_dir, "img-1", ["vol-1"])
+    make_image(images_dir, "img-2", ["vol-2"])
+    catalog = fileSD.VolumeCatalog(images_dir)
+    catalog.volumes(LocalOOP())
+
+    add_volume(images_dir, "img-2", "vol-3", mtime=OLD_MTIME + 1)
+    oop = LocalOOP()
+    assert sorted(catalog.imageVolumes(oop, "img-2")) == ["vol-2", "vol-3"]
+    assert oop.globbed == [os.path.join(images_dir, "img-2", "*.meta")]
+    assert sorted(catalog.volumes(LocalOOP())) == ["vol-1", "vol-2", "vol-3"]
+
+
+def test_catalog_image_lookup(images_dir):
+    for i in range(10):
+        make_image(images_dir, "img-%d" % i, ["vol-%d" % i])
+    catalog = fileSD.VolumeCatalog(images_dir)
+    catalog.volumes(LocalOOP())
+    catalog.imageVolumes(LocalOOP(), "img-1")
+
+    # Only the images directory and the image directory are checked.
+    oop = LocalOOP()
+    assert sorted(catalog.imageVolumes(oop, "img-1")) == ["vol-1"]
+    assert oop.globbed == []
+    assert oop.stated == [images_dir, os.path.join(images_dir, "img-1")]
+
+
+def test_catalog_listing_cached(images_dir):
+    make_image(images_dir, "img-1", ["vol-1"])
+    make_image(images_dir, "img-2", ["vol-2"])
+    catalog = fileSD.VolumeCatalog(images_dir)
+    catalog.volumes(LocalOOP())
+
+    # Listing all the volumes checks every image directory, without
+    # scanning unmodified directories.
+    oop = LocalOOP()
+    assert sorted(catalog.volumes(oop)) == ["vol-1", "vol-2"]
+    assert sorted(oop.stated) == [
+        images_dir,
+        os.path.join(images_dir, "img-1"),
+        os.path.join(images_dir, "img-2"),
+    ]
+    assert oop.globbed == []
+
+
+def test_catalog_listing_volume_added(images_dir):
+    make_image(images_dir, "img-1", ["vol-1"])
+    make_image(images_dir, "img-2", ["vol-2"])
+    catalog = fileSD.VolumeCatalog(images_dir)
+    catalog.volumes(LocalOOP())
+
+    # A volume added by another host does not modify the images directory,
+    # only the modified image directory is rescanned.
+    add_volume(images_dir, "img-2", "vol-3", mtime=OLD_MTIME + 1)
+    oop = LocalOOP()
+    assert sorted(catalog.volumes(oop)) == ["vol-1", "vol-2", "vol-3"]
+    assert oop.globbed == [os.path.join(images_dir, "img-2", "*.meta")]
+
+
+def test_catalog_listing_new_images(images_dir):
+    make_image(images_dir, "img-1", ["vol-1"])
+    catalog = fileSD.VolumeCatalog(images_dir)
+    catalog.volumes(LocalOOP())
+
+    # When several images are added, all the image directories are
+    # rescanned using one glob.
+    make_image(images_dir, "img-2", ["vol-2"], mtime=OLD_MTIME + 1)
+    make_image(images_dir, "img-3", ["vol-3"], mtime=OLD_MTIME + 1)
+    oop = LocalOOP()
+    assert sorted(catalog.volumes(oop)) == ["vol-1", "vol-2", "vol-3"]
+    assert oop.globbed == [
+        os.path.join(images_dir, "*"),
+        os.path.join(images_dir, "*", "*.meta"),
+    ]
+
+
+def test_catalog_invalidate(images_dir):
+    make_image(images_dir, "img-1", ["vol-1"])
+    catalog = fileSD.VolumeCatalog(images_dir)
+    catalog.volumes(LocalOOP())
+
+    # Adding a volume within the mtime resolution does not change the
+    # directory mtime.
+    add_volume(images_dir, "img-1", "vol-2")
+    assert sorted(catalog.volumes(LocalOOP())) == ["vol-1"]
+
+    catalog.invalidate("img-1")
+    assert sorted(catalog.volumes(LocalOOP())) == ["vol-1", "vol-2"]
+
+
+def test_catalog_invalidate_new_image(images_dir):
+    make_image(images_dir, "img-1", ["vol-1"])
+    catalog = fileSD.VolumeCatalog(images_dir)
+    catalog.volumes(LocalOOP())
+
+    make_image(images_dir, "img-2", ["vol-2"])
+    catalog.invalidate("img-2")
+    assert sorted(catalog.volumes(LocalOOP())) == ["vol-1", "vol-2"]
+
+
+def test_catalog_image_removed(images_dir):
+    make_image(images_dir, "img-1", ["vol-1"])
+    make_image(images_dir, "img-2", ["vol-2"])
+    catalog = fileSD.VolumeCatalog(images_dir)
+    catalog.volumes(LocalOOP())
+
+    img_dir = os.path.join(images_dir, "img-2")
+    os.unlink(os.path.join(img_dir, "vol-2.meta"))
+    os.rmdir(img_dir)
+    assert sorted(catalog.volumes(LocalOOP())) == ["vol-1"]
+    assert catalog.images(LocalOOP()) == ["img-1"]
+
+
+def test_catalog_images(images_dir):
+    make_image(images_dir, "img-1", ["vol-1"])
+    make_image(images_dir, "img-2", [])
+    open(os.path.join(images_dir, "not-an-image"), "w").close()
+    catalog = fileSD.VolumeCatalog(images_dir)
+    assert sorted(catalog.images(LocalOOP())) == ["img-1", "img-2"]
+
+
+def test_catalog_no_images_dir(tmpdir):
+    images_dir = str(tmpdir.join(sd.DOMAIN_IMAGES))
+    catalog = fileSD.VolumeCatalog(images_dir)
+    assert catalog.volumes(LocalOOP()) == {}
+    os.mkdir(images_dir)
+    make_image(images_dir, "img-1", ["vol-1"])
+    assert sorted(catalog.volumes(LocalOOP())) == ["vol-1"]
+
+
+def test_catalog_racy(images_dir):
+    now = time.time()
+    make_image(images_dir, "img-1", ["vol-1"], mtime=now)
+    catalog = fileSD.VolumeCatalog(images_dir, clock=lambda: now)
+    catalog.volumes(LocalOOP())
+
+    # Modified too recently to trust the mtime, scanned again.
+    add_volume(images_dir, "img-1", "vol-2", mtime=now)
+    assert sorted(catalog.volumes(LocalOOP())) == ["vol-1", "vol-2"]
+
+    # Once the directory is old enough, the cache is used.
+    later = now + catalog.RACY_WINDOW
+    catalog = fileSD.VolumeCatalog(images_dir, clock=lambda: later)
+    catalog.volumes(LocalOOP())
+    oop = LocalOOP()
+    catalog.volumes(oop)
+    assert oop.globbed == []
+
+
 def add_filesd(repo, remote_path, sd_uuid, subdir=""):
     # Create mount directory in the repo
     mnt_dir = os.path.join(sc.REPO_MOUNT_DIR, subdir)
@@ -22,6 +22,9 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import threading
+from collections import defaultdict
+
 import pytest
 
 from storage.storagetestlib import FakeStorageDomainCache
@@ -45,8 +48,9 @@ class FakeConnectHSM(hsm.HSM):
 
 
 class FakeConnection(object):
-    def __init__(self, conInfo):
+    def __init__(self, conInfo, factory):
         self.conInfo = conInfo
+        self.factory = factory
         self.connected = False
 
     @property
@@ -54,9 +58,14 @@ class FakeConnection(object):
         return self.conInfo.params.id
 
     def connect(self):
+        other = self.factory.waits_for.get(self.id)
+        if other is not None:
+            if not self.factory.connected[other].wait(5):
+                raise Exception("Timeout waiting for %s" % other)
         if self.id.startswith("failing-"):
             raise Exception("Connection failed")
         self.connected = True
+        self.factory.connected[self.id].set()
 
     def disconnect(self):
         self.connected = False
@@ -65,9 +74,12 @@ class FakeConnection(object):
 class FakeConnectionFactory(object):
     def __init__(self):
         self.connections = {}
+        # Connection ids waiting until other connection is connected.
+        self.waits_for = {}
+        self.connected = defaultdict(threading.Event)
 
     def createConnection(self, conInfo):
-        conn = FakeConnection(conInfo)
+        conn = FakeConnection(conInfo, self)
         self.connections[conn.id] = conn
         return conn
 
@@ -160,6 +172,8 @@ def test_failed_connection(fake_hsm, conn_type):
                 {'status': 0, 'id': 'success-2'}
             ]
     }
+    for status in result['statuslist']:
+        assert status.pop('elapsed') >= 0
     assert expected == result
     sc = storageServer.ConnectionFactory.connections
     assert sc["success-1"].connected
@@ -180,3 +194,19 @@ def test_cache_update(fake_hsm):
     sc = storageServer.ConnectionFactory.connections
     assert sc['1'].connected
     assert hsm.sdCache.knownSDs['sd-uuid-1'] == nfs_find_method
+
+
+def test_connect_concurrently(fake_hsm):
+    # Connecting serially would time out connecting the first connection.
+    storageServer.ConnectionFactory.waits_for = {"1": "2"}
+    connections = [
+        {'id': '1', 'connection': '/my_sd', 'protocol_version': '3'},
+        {'id': 'failing-1', 'connection': '/my_sd2', 'protocol_version': '3'},
+        {'id': '2', 'connection': '/my_sd3', 'protocol_version': '3'},
+    ]
+    result = fake_hsm.connectStorageServer(
+        sd.NFS_DOMAIN, 'SPUID', connections, None)
+
+    # Statuses are reported in the order of the connections.
+    statuses = [(s['id'], s['status']) for s in result['statuslist']]
+    assert statuses == [('1', 0), ('failing-1', 100), ('2', 0)]
@@ -22,6 +22,7 @@ from __future__ import absolute_import
 from __future__ import division
 
 import os
+import threading
 from contextlib import contextmanager
 
 import six
@@ -215,3 +216,46 @@ class TestIscsiTarget(VdsmTestCase):
                 3260),
             2, "iqn.2014-06.com.example:t1")
         self.assertEqual(target.address, "[3ffe:2a00:100:7031::1]:3260,2")
+
+
+def test_add_node_concurrent_logins(monkeypatch):
+    # Logging in to an unreachable target must not delay logins to other
+    # targets.
+    logins = []
+    overlapped = []
+    lock = threading.Lock()
+    cond = threading.Condition(lock)
+
+    def execCmd(cmd, printable=None, sudo=False, sync=True):
+        if "-l" in cmd:
+            with cond:
+                logins.append(cmd)
+                cond.notify_all()
+                # Wait until the other login starts.
+                deadline = time.monotonic_time() + 2
+                while len(logins) < 2:
+                    remaining = deadline - time.monotonic_time()
+                    if remaining <= 0:
+                        break
+                    cond.wait(remaining)
+                overlapped.append(len(logins) == 2)
+        return 0, [], []
+
+    monkeypatch.setattr(iscsiadm.misc, "execCmd", execCmd)
+
+    iface = iscsi.IscsiInterface("default")
+    targets = [
+        iscsi.IscsiTarget(iscsi.IscsiPortal("10.0.0.%d" % i, 3260), 1,
+                          "iqn.2014-06.com.example:t%d" % i)
+        for i in range(2)
+    ]
+    threads = [threading.Thread(target=iscsi.addIscsiNode,
+                                args=(iface, target))
+               for target in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(logins) == 2
+    assert overlapped == [True, True]
@@ -21,10 +21,23 @@
 
 from __future__ import absolute_import
 from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import threading
+import time
+
+import pytest
 
 from testlib import VdsmTestCase
+from testlib import mock
+from testlib import namedTemporaryDir
 
 import vdsm.storage.lvm as lvm
+from vdsm.common import concurrent
+from vdsm.storage import constants as sc
+from vdsm.storage import udev
 
 
 class TestLvm(VdsmTestCase):
@@ -40,3 +53,534 @@ class TestLvm(VdsmTestCase):
                           "\\\\x22\\\\x28|\', \'r|.*|\' ]"
                           )
         self.assertEqual(expectedFilter, filter)
+
+
+class FakeLVM(object):
+    """
+    Simulate lvs and vgs output for LVMCache.cmd().
+    """
+
+    def __init__(self):
+        # vg name -> {lv name: tags}
+        self.vgs = {}
+        # vg name -> metadata sequence number
+        self.seqno = {}
+        self.calls = []
+        # If set, commands wait until this event is set.
+        self.blocked = None
+        # vgs fails without any output if any of these vgs is requested.
+        self.bad_vgs = set()
+        # (vg name, lv name) of open lvs.
+        self.opened = set()
+        self.started = threading.Event()
+
+    def add_lv(self, vg, lv, tags=()):
+        self.vgs.setdefault(vg, {})[lv] = tags
+        self.seqno[vg] = self.seqno.get(vg, 0) + 1
+
+    def remove_lv(self, vg, lv):
+        del self.vgs[vg][lv]
+        self.seqno[vg] += 1
+
+    def lv_line(self, vg, lv):
+        # LV_FIELDS + LVS_VG_FIELDS
+        return lvm.SEPARATOR.join([
+            "uuid-" + lv, lv, vg,
+            "-wi-ao----" if (vg, lv) in self.opened else "-wi-a-----",
+            "134217728", "0",
+            "/dev/mapper/pv(1)", ",".join(self.vgs[vg][lv]),
+            "uuid-" + vg, str(self.seqno[vg])])
+
+    def vg_line(self, vg):
+        # VG_FIELDS
+        return lvm.SEPARATOR.join([
+            "uuid-" + vg, vg, "wz--n-", "10737418240", "5368709120",
+            "134217728", "80", "40", "", "134217728", "67107328",
+            str(self.seqno[vg]), str(len(self.vgs[vg])), "1",
+            "/dev/mapper/pv"])
+
+    def __call__(self, cmd, devices=()):
+        self.calls.append(cmd)
+        self.started.set()
+        if self.blocked:
+            self.blocked.wait()
+        if cmd[0] == "pvs":
+            return 0, [], []
+        if cmd[0] == "vgs":
+            return self.vgs_cmd(cmd[len(lvm.VGS_CMD):])
+        return self.lvs_cmd(cmd[len(lvm.LVS_CMD):])
+
+    def vgs_cmd(self, names):
+        if self.bad_vgs.intersection(names):
+            return 5, [], ["Cannot process volume group"]
+        if not names:
+            names = list(self.vgs)
+        return 0, [self.vg_line(vg) for vg in names if vg in self.vgs], []
+
+    def lvs_cmd(self, names):
+        if not names:
+            names = list(self.vgs)
+        rc = 0
+        out = []
+        for name in names:
+            vg, _, lv = name.partition("/")
+            if vg not in self.vgs:
+                # Like lvs, report the other vgs, but fail.
+                rc = 5
+                continue
+            lvs = [lv] if lv else list(self.vgs[vg])
+            out.extend(self.lv_line(vg, lv) for lv in lvs
+                       if lv in self.vgs[vg])
+        return rc, out, []
+
+    @property
+    def lvs_calls(self):
+        return [cmd for cmd in self.calls if cmd[0] == "lvs"]
+
+
+def volume_tags(image, parent):
+    return (sc.TAG_PREFIX_IMAGE + image, sc.TAG_PREFIX_PARENT + parent,
+            sc.TAG_PREFIX_MD + "1")
+
+
+def fake_cache(vgs=2, images=2, volumes=3, reload_window=0):
+    """
+    Return a cache and fake lvs for vgs with images having chains of
+    volumes.
+    """
+    fake = FakeLVM()
+    for v in range(vgs):
+        vg = "vg-%d" % v
+        for i in range(images):
+            image = "%s-img-%d" % (vg, i)
+            parent = sc.BLANK_UUID
+            for n in range(volumes):
+                volume = "%s-vol-%d" % (image, n)
+                fake.add_lv(vg, volume, volume_tags(image, parent))
+                parent = volume
+    cache = lvm.LVMCache(reloadWindow=reload_window)
+    cache.cmd = fake
+    return cache, fake
+
+
+class TestLVMCache(VdsmTestCase):
+
+    def test_get_vg_lvs(self):
+        cache, fake = fake_cache()
+        lvs = cache.getLv("vg-0")
+        self.assertEqual(sorted(lv.name for lv in lvs),
+                         sorted(fake.vgs["vg-0"]))
+        self.assertEqual(len(fake.calls), 1)
+
+    def test_get_vg_lvs_cached(self):
+        cache, fake = fake_cache()
+        cache.getLv("vg-0")
+        cache.getLv("vg-0")
+        cache.getLv("vg-0", "vg-0-img-0-vol-0")
+        self.assertEqual(len(fake.calls), 1)
+
+    def test_lvs_by_tag(self):
+        cache, fake = fake_cache()
+        image = sc.TAG_PREFIX_IMAGE + "vg-1-img-1"
+        lvs = cache.getLvsByTag("vg-1", image)
+        self.assertEqual(sorted(lv.name for lv in lvs),
+                         ["vg-1-img-1-vol-0", "vg-1-img-1-vol-1",
+                          "vg-1-img-1-vol-2"])
+        parent = sc.TAG_PREFIX_PARENT + "vg-1-img-1-vol-0"
+        lvs = cache.getLvsByTag("vg-1", parent)
+        self.assertEqual([lv.name for lv in lvs], ["vg-1-img-1-vol-1"])
+
+    def test_lvs_by_tag_other_vg(self):
+        cache, fake = fake_cache()
+        image = sc.TAG_PREFIX_IMAGE + "vg-1-img-1"
+        self.assertEqual(cache.getLvsByTag("vg-0", image), [])
+
+    def test_tags_updated(self):
+        cache, fake = fake_cache()
+        cache.getLv("vg-0")
+        fake.add_lv("vg-0", "vg-0-img-0-vol-2",
+                    volume_tags("vg-0-img-1", sc.BLANK_UUID))
+        cache._invalidatelvs("vg-0", "vg-0-img-0-vol-2")
+        old = sc.TAG_PREFIX_IMAGE + "vg-0-img-0"
+        new = sc.TAG_PREFIX_IMAGE + "vg-0-img-1"
+        self.assertEqual(len(cache.getLvsByTag("vg-0", old)), 2)
+        self.assertEqual(len(cache.getLvsByTag("vg-0", new)), 4)
+
+    def test_invalidate_reloads_only_vg(self):
+        cache, fake = fake_cache()
+        cache.getLv("vg-0")
+        cache.getLv("vg-1")
+        cache._invalidatelvs("vg-1", "vg-1-img-0-vol-0")
+        cache.getLv("vg-0")
+        self.assertEqual(len(fake.calls), 2)
+        cache.getLv("vg-1")
+        self.assertEqual(len(fake.calls), 3)
+        self.assertEqual(fake.calls[-1][-1], "vg-1")
+
+    def test_invalidate_vg(self):
+        cache, fake = fake_cache()
+        cache.getLv("vg-0")
+        cache._invalidatelvs("vg-0")
+        cache.getLv("vg-0")
+        self.assertEqual(len(fake.calls), 2)
+
+    def test_remove_stale_lvs(self):
+        cache, fake = fake_cache()
+        cache.getLv("vg-0")
+        cache.getLv("vg-1")
+        del fake.vgs["vg-0"]["vg-0-img-0-vol-2"]
+        cache._invalidatelvs("vg-0")
+        lvs = cache.getLv("vg-0")
+        self.assertNotIn("vg-0-img-0-vol-2", [lv.name for lv in lvs])
+        image = sc.TAG_PREFIX_IMAGE + "vg-0-img-0"
+        self.assertEqual(len(cache.getLvsByTag("vg-0", image)), 2)
+        self.assertEqual(len(cache.getLv("vg-1")), 6)
+
+    def test_remove_lvs(self):
+        cache, fake = fake_cache()
+        cache.getLv("vg-0")
+        cache._removelvs("vg-0", ["vg-0-img-0-vol-1", "vg-0-img-0-vol-2"])
+        image = sc.TAG_PREFIX_IMAGE + "vg-0-img-0"
+        lvs = cache.getLvsByTag("vg-0", image)
+        self.assertEqual([lv.name for lv in lvs], ["vg-0-img-0-vol-0"])
+
+    def test_get_all_lvs(self):
+        cache, fake = fake_cache()
+        cache._reloadAllLvs()
+        self.assertEqual(len(cache.getAllLvs()), 12)
+        cache.getLv("vg-0")
+        cache.getLv("vg-1")
+        self.assertEqual(len(fake.calls), 1)
+
+    def test_flush(self):
+        cache, fake = fake_cache()
+        cache.getLv("vg-0")
+        cache.flush()
+        cache.getLv("vg-0")
+        self.assertEqual(len(fake.calls), 2)
+
+
+class TestLVMCacheBatchReload(VdsmTestCase):
+
+    # Note: this should be long enough so even on very loaded machine, all
+    # threads will start within this delay.
+    RELOAD_WINDOW = 0.5
+
+    def setUp(self):
+        self.cache, self.fake = fake_cache(
+            vgs=4, reload_window=self.RELOAD_WINDOW)
+
+    def run_threads(self, func, args):
+        """
+        Call func with the first arg, and while the call is running, call
+        it concurrently with the rest of the args.
+        """
+        results = {}
+
+        def run(arg):
+            results[arg] = func(arg)
+
+        self.fake.blocked = threading.Event()
+        threads = [concurrent.thread(run, args=(args[0],))]
+        threads[0].start()
+        try:
+            self.assertTrue(self.fake.started.wait(self.RELOAD_WINDOW))
+            for arg in args[1:]:
+                t = concurrent.thread(run, args=(arg,))
+                t.start()
+                threads.append(t)
+            # Let the other calls start while the first is running.
+            time.sleep(self.RELOAD_WINDOW / 2)
+        finally:
+            self.fake.blocked.set()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_reload_lvs(self):
+        vgs = ["vg-0", "vg-1", "vg-2", "vg-3"]
+        results = self.run_threads(self.cache.getLv, vgs)
+        self.assertEqual(len(self.fake.calls), 2)
+        self.assertEqual(sorted(self.fake.calls[1][len(lvm.LVS_CMD):]),
+                         vgs[1:])
+        for vg in vgs:
+            self.assertEqual(sorted(lv.name for lv in results[vg]),
+                             sorted(self.fake.vgs[vg]))
+
+    def test_reload_lvs_bad_vg(self):
+        vgs = ["vg-0", "vg-1", "no-such-vg"]
+        results = self.run_threads(self.cache.getLv, vgs)
+        # The batch of vg-1 and no-such-vg failed, and every vg was
+        # reloaded.
+        self.assertEqual(len(self.fake.calls), 4)
+        self.assertEqual(results["no-such-vg"], [])
+        for vg in ["vg-0", "vg-1"]:
+            self.assertEqual(sorted(lv.name for lv in results[vg]),
+                             sorted(self.fake.vgs[vg]))
+
+    def test_reload_vgs(self):
+        vgs = ["vg-0", "vg-1", "vg-2"]
+        results = self.run_threads(self.cache.getVg, vgs)
+        self.assertEqual(len(self.fake.calls), 2)
+        for vg in vgs:
+            self.assertEqual(results[vg].name, vg)
+
+    def test_reload_vgs_bad_vg(self):
+        self.fake.bad_vgs.add("vg-2")
+        vgs = ["vg-0", "vg-1", "vg-2"]
+        results = self.run_threads(self.cache.getVg, vgs)
+        # The batch of vg-1 and vg-2 failed, and every vg was reloaded.
+        self.assertEqual(len(self.fake.calls), 4)
+        self.assertEqual(results["vg-0"].name, "vg-0")
+        self.assertEqual(results["vg-1"].name, "vg-1")
+        self.assertIsNone(results["vg-2"])
+
+
+class TestLVMCacheEvents(VdsmTestCase):
+
+    def setUp(self):
+        self.cache, self.fake = fake_cache()
+        self.monitor = lvm.CacheMonitor(self.cache)
+        self.monitor.start()
+
+    def invalidate_vg(self, vg):
+        with mock.patch.object(lvm, "_lvminfo", self.cache):
+            lvm.invalidateVG(vg)
+
+    def test_invalidate_vg_not_modified(self):
+        self.cache.getLv("vg-0")
+        self.invalidate_vg("vg-0")
+        lvs = self.cache.getLv("vg-0")
+        self.assertEqual(len(lvs), 6)
+        self.assertEqual(len(self.fake.lvs_calls), 1)
+        self.assertEqual(self.fake.calls[-1][0], "vgs")
+
+    def test_invalidate_vg_modified(self):
+        self.cache.getLv("vg-0")
+        self.fake.add_lv("vg-0", "new-lv")
+        self.invalidate_vg("vg-0")
+        self.assertEqual(self.cache.getLv("vg-0", "new-lv").name, "new-lv")
+        self.assertEqual(len(self.fake.lvs_calls), 2)
+
+    def test_invalidate_vg_lv_removed(self):
+        self.cache.getLv("vg-0")
+        self.fake.remove_lv("vg-0", "vg-0-img-0-vol-2")
+        self.invalidate_vg("vg-0")
+        image = sc.TAG_PREFIX_IMAGE + "vg-0-img-0"
+        self.assertEqual(len(self.cache.getLvsByTag("vg-0", image)), 2)
+        self.assertEqual(len(self.fake.lvs_calls), 2)
+
+    def test_flush_not_modified(self):
+        self.cache.getLv("vg-0")
+        self.cache.getLv("vg-1")
+        self.cache.flush()
+        self.cache.getLv("vg-0")
+        self.cache.getLv("vg-1", "vg-1-img-0-vol-0")
+        self.assertEqual(len(self.fake.lvs_calls), 2)
+
+    def test_flush_modified(self):
+        self.cache.getLv("vg-0")
+        self.cache.getLv("vg-1")
+        self.fake.add_lv("vg-1", "new-lv")
+        self.cache.flush()
+        self.cache.getLv("vg-0")
+        self.cache.getLv("vg-1")
+        self.assertEqual(len(self.fake.lvs_calls), 3)
+        self.assertEqual(self.fake.lvs_calls[-1][-1], "vg-1")
+
+    def test_lv_removed_event(self):
+        lv = self.cache.getLv("vg-0", "vg-0-img-0-vol-0")
+        self.assertTrue(lv.active)
+        self.monitor.handle(
+            udev.LVEvent(udev.LV_REMOVED, "vg-0", "vg-0-img-0-vol-0"))
+        lv = self.cache.getLv("vg-0", "vg-0-img-0-vol-0")
+        self.assertFalse(lv.active)
+        self.assertFalse(lv.opened)
+        self.assertEqual(lv.attr.state, "-")
+        self.assertEqual(len(self.fake.calls), 1)
+
+    def test_lv_added_event(self):
+        self.cache.getLv("vg-0")
+        self.monitor.handle(
+            udev.LVEvent(udev.LV_REMOVED, "vg-0", "vg-0-img-0-vol-0"))
+        self.monitor.handle(
+            udev.LVEvent(udev.LV_ADDED, "vg-0", "vg-0-img-0-vol-0"))
+        lv = self.cache.getLv("vg-0", "vg-0-img-0-vol-0")
+        self.assertTrue(lv.active)
+        self.assertEqual(lv.attr.state, "a")
+        self.assertEqual(len(self.fake.calls), 1)
+
+    def test_lv_changed_event(self):
+        self.cache.getLv("vg-0")
+        self.monitor.handle(
+            udev.LVEvent(udev.LV_CHANGED, "vg-0", "vg-0-img-0-vol-0"))
+        self.cache.getLv("vg-0")
+        self.assertEqual(len(self.fake.lvs_calls), 1)
+        self.assertEqual(self.fake.calls[-1][0], "vgs")
+
+    def test_bootstrap_open_lv(self):
+        self.cache.getLv("vg-0")
+        self.cache.getLv("vg-1")
+        # Opening an lv does not emit an event, so the cache is not updated.
+        self.fake.opened.add(("vg-0", "vg-0-img-0-vol-0"))
+        deactivated = {}
+
+        def setLVAvailability(vg, lvs, available):
+            deactivated[vg] = sorted(lvs)
+
+        with mock.patch.object(lvm, "_lvminfo", self.cache), \
+                mock.patch.object(self.cache, "bootstrap"), \
+                mock.patch.object(lvm, "_setLVAvailability",
+                                  setLVAvailability):
+            lvm.bootstrap()
+
+        self.assertEqual(
+            deactivated["vg-0"],
+            sorted(lv for lv in self.fake.vgs["vg-0"]
+                   if lv != "vg-0-img-0-vol-0"))
+        self.assertEqual(deactivated["vg-1"], sorted(self.fake.vgs["vg-1"]))
+
+    def test_event_unknown_vg(self):
+        self.monitor.handle(udev.LVEvent(udev.LV_REMOVED, "vg-0", "lv"))
+        self.assertEqual(self.fake.calls, [])
+
+    def test_stop(self):
+        self.cache.getLv("vg-0")
+        self.monitor.stop()
+        self.invalidate_vg("vg-0")
+        self.cache.getLv("vg-0")
+        self.assertEqual(len(self.fake.lvs_calls), 2)
+
+
+class TestLVMCacheSnapshot(VdsmTestCase):
+
+    def setUp(self):
+        self.cache, self.fake = fake_cache()
+        self.cache.bootstrap()
+        # Simulate a restart.
+        self.snapshot = json.loads(json.dumps(self.cache.snapshot()))
+        self.mapped = set()
+
+    def bootstrap(self, skiplvs=()):
+        cache = lvm.LVMCache(reloadWindow=0)
+        cache.cmd = self.fake
+        self.fake.calls = []
+        with mock.patch.object(lvm.devicemapper, "getAllMappedDevices",
+                               lambda: self.mapped):
+            cache.bootstrap(snapshot=self.snapshot, skiplvs=skiplvs)
+        return cache
+
+    def map_lvs(self, vg):
+        self.mapped.update(lvm.getLvDmName(vg, lv) for lv in self.fake.vgs[vg])
+
+    def test_snapshot(self):
+        self.assertEqual(sorted(self.snapshot["vgs"]), ["vg-0", "vg-1"])
+        vg = self.snapshot["vgs"]["vg-0"]
+        self.assertEqual(vg["uuid"], "uuid-vg-0")
+        self.assertEqual(vg["seqno"], "6")
+        self.assertEqual(vg["pvs"], ["/dev/mapper/pv"])
+        self.assertEqual(len(vg["lvs"]), 6)
+
+    def test_snapshot_skips_stale_vg(self):
+        self.cache._invalidatelvs("vg-0", "vg-0-img-0-vol-0")
+        snapshot = self.cache.snapshot()
+        self.assertEqual(sorted(snapshot["vgs"]), ["vg-1"])
+
+    def test_restore_active_lvs(self):
+        self.map_lvs("vg-0")
+        self.map_lvs("vg-1")
+        skiplvs = list(self.fake.vgs["vg-0"]) + list(self.fake.vgs["vg-1"])
+        cache = self.bootstrap(skiplvs=skiplvs)
+        self.assertEqual(self.fake.lvs_calls, [])
+        lvs = cache.getLv("vg-0")
+        self.assertEqual(sorted(lv.name for lv in lvs),
+                         sorted(self.fake.vgs["vg-0"]))
+        self.assertTrue(all(lv.active for lv in lvs))
+        image = sc.TAG_PREFIX_IMAGE + "vg-1-img-1"
+        self.assertEqual(len(cache.getLvsByTag("vg-1", image)), 3)
+        self.assertEqual(self.fake.lvs_calls, [])
+
+    def test_restore_inactive_lvs(self):
+        cache = self.bootstrap()
+        self.assertEqual(self.fake.lvs_calls, [])
+        lv = cache.getLv("vg-0", "vg-0-img-0-vol-0")
+        self.assertFalse(lv.active)
+        self.assertFalse(lv.opened)
+        self.assertEqual(lv.attr.state, "-")
+
+    def test_reload_active_lvs(self):
+        # We cannot tell if active lvs are open, so they must be reloaded.
+        self.map_lvs("vg-1")
+        self.bootstrap()
+        self.assertEqual(len(self.fake.lvs_calls), 1)
+        self.assertEqual(self.fake.lvs_calls[0][len(lvm.LVS_CMD):], ["vg-1"])
+
+    def test_reload_modified_vg(self):
+        self.fake.add_lv("vg-1", "new-lv")
+        cache = self.bootstrap()
+        self.assertEqual(len(self.fake.lvs_calls), 1)
+        self.assertEqual(self.fake.lvs_calls[0][len(lvm.LVS_CMD):], ["vg-1"])
+        self.assertEqual(cache.getLv("vg-1", "new-lv").name, "new-lv")
+        self.assertEqual(len(self.fake.lvs_calls), 1)
+
+    def test_reload_unknown_version(self):
+        self.snapshot["version"] = lvm.SNAPSHOT_VERSION + 1
+        cache = self.bootstrap()
+        self.assertEqual(len(self.fake.lvs_calls), 1)
+        self.assertEqual(len(cache.getAllLvs()), 12)
+
+    def test_save_and_load(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "cache.json")
+            with mock.patch.object(lvm, "_lvminfo", self.cache):
+                lvm.saveSnapshot(path)
+            self.assertEqual(lvm._loadSnapshot(path), self.snapshot)
+
+    def test_load_missing(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "cache.json")
+            self.assertIsNone(lvm._loadSnapshot(path))
+
+    def test_load_invalid(self):
+        with namedTemporaryDir() as tmpdir:
+            path = os.path.join(tmpdir, "cache.json")
+            with open(path, "w") as f:
+                f.write("{invalid")
+            self.assertIsNone(lvm._loadSnapshot(path))
+
+
+class TestLVMCacheBenchmark(VdsmTestCase):
+
+    VGS = 10
+    IMAGES = 1000
+    VOLUMES = 5
+
+    @pytest.mark.stress
+    def test_benchmark(self):
+        cache, fake = fake_cache(
+            vgs=self.VGS, images=self.IMAGES, volumes=self.VOLUMES)
+        print()
+        self.benchmark("load all lvs", cache._reloadAllLvs)
+        self.benchmark("reload vg", lambda: cache._reloadlvs("vg-0"))
+
+        def invalidate_and_reload():
+            cache._invalidatelvs("vg-0", "vg-0-img-0-vol-0")
+            cache.getLv("vg-0")
+
+        self.benchmark("invalidate and reload vg", invalidate_and_reload)
+        self.benchmark("get vg lvs", lambda: cache.getLv("vg-0"),
+                       count=100)
+
+        image = sc.TAG_PREFIX_IMAGE + "vg-0-img-500"
+        with mock.patch.object(lvm, "_lvminfo", cache):
+            self.benchmark("lvs by image tag",
+                           lambda: lvm.lvsByTag("vg-0", image), count=100)
+
+    def benchmark(self, name, func, count=10):
+        start = time.time()
+        for i in range(count):
+            func()
+        elapsed = time.time() - start
+        print("%s (%d vgs, %d lvs per vg): %.3f msec per call"
+              % (name, self.VGS, self.IMAGES * self.VOLUMES,
+                 elapsed / count * 1000))
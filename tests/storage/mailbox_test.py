@@ -21,13 +21,18 @@
 from __future__ import absolute_import
 from __future__ import division
 
+from __future__ import print_function
+
 import collections
 import contextlib
 import io
+import mmap
 import threading
+import time
 import struct
 
 import pytest
+import six
 
 from testlib import mock
 
@@ -52,6 +57,19 @@ def mboxfiles(tmpdir):
     yield MboxFiles(str(inbox), str(outbox))
 
 
+def make_mailbox(*messages):
+    data = b"".join(messages).ljust(
+        sm.MAILBOX_SIZE - sm.CHECKSUM_BYTES, b"\0")
+    checksum = struct.pack('<l', sm.checksum(data, sm.CHECKSUM_BYTES))
+    return data + checksum
+
+
+def write_mailbox(path, host_id, mailbox):
+    with io.open(path, "r+b") as f:
+        f.seek(host_id * sm.MAILBOX_SIZE)
+        f.write(mailbox)
+
+
 def read_mbox(mboxfiles):
     with io.open(mboxfiles.inbox, 'rb') as inf, \
             io.open(mboxfiles.outbox, 'rb') as outf:
@@ -59,13 +77,14 @@ def read_mbox(mboxfiles):
 
 
 @contextlib.contextmanager
-def make_hsm_mailbox(mboxfiles, host_id):
+def make_hsm_mailbox(mboxfiles, host_id, **kwargs):
     mailbox = sm.HSM_Mailbox(
         hostID=host_id,
         poolID=SPUUID,
         inbox=mboxfiles.outbox,
         outbox=mboxfiles.inbox,
-        monitorInterval=MONITOR_INTERVAL)
+        monitorInterval=kwargs.pop("monitorInterval", MONITOR_INTERVAL),
+        **kwargs)
     try:
         yield mailbox
     finally:
@@ -75,13 +94,13 @@ def make_hsm_mailbox(mboxfiles, host_id):
 
 
 @contextlib.contextmanager
-def make_spm_mailbox(mboxfiles):
+def make_spm_mailbox(mboxfiles, monitorInterval=MONITOR_INTERVAL):
     mailbox = sm.SPM_MailMonitor(
         SPUUID,
         MAX_HOSTS,
         inbox=mboxfiles.inbox,
         outbox=mboxfiles.outbox,
-        monitorInterval=MONITOR_INTERVAL)
+        monitorInterval=monitorInterval)
     mailbox.start()
     try:
         yield mailbox
@@ -116,6 +135,70 @@ class TestSPMMailMonitor:
                 data = f.read()
             assert data == sm.EMPTYMAILBOX * MAX_HOSTS
 
+    def test_handle_changed_messages(self, mboxfiles):
+        host_id = 3
+        first = b"1xtnd" + b"a" * (sm.MESSAGE_SIZE - 5)
+        second = b"1xtnd" + b"b" * (sm.MESSAGE_SIZE - 5)
+        mailer = sm.SPM_MailMonitor(
+            SPUUID, MAX_HOSTS,
+            inbox=mboxfiles.inbox,
+            outbox=mboxfiles.outbox,
+            monitorInterval=MONITOR_INTERVAL)
+        try:
+            requests = []
+            mailer._queueRequest = lambda msg_id, msg: requests.append(
+                (msg_id, msg))
+            msg_id = host_id * sm.SLOTS_PER_MAILBOX
+
+            write_mailbox(mboxfiles.inbox, host_id, make_mailbox(first))
+            mailer._checkForMail()
+            assert requests == [(msg_id, first)]
+
+            # Unchanged messages are not handled again.
+            del requests[:]
+            write_mailbox(
+                mboxfiles.inbox, host_id, make_mailbox(first, second))
+            mailer._checkForMail()
+            mailer._checkForMail()
+            assert requests == [(msg_id + 1, second)]
+
+            # Mailbox with bad checksum is ignored...
+            del requests[:]
+            bad = make_mailbox(first, second)[:-sm.CHECKSUM_BYTES] + b"bad!"
+            write_mailbox(mboxfiles.inbox, host_id, bad)
+            mailer._checkForMail()
+            assert requests == []
+
+            # ...and its messages are new when it becomes valid.
+            write_mailbox(
+                mboxfiles.inbox, host_id, make_mailbox(first, second))
+            mailer._checkForMail()
+            assert requests == [(msg_id, first), (msg_id + 1, second)]
+        finally:
+            mailer.tp.joinAll(waitForTasks=False)
+
+    def test_clean_message(self, mboxfiles):
+        host_id = 3
+        mailer = sm.SPM_MailMonitor(
+            SPUUID, MAX_HOSTS,
+            inbox=mboxfiles.inbox,
+            outbox=mboxfiles.outbox,
+            monitorInterval=MONITOR_INTERVAL)
+        try:
+            write_mailbox(
+                mboxfiles.inbox, host_id, make_mailbox(sm.CLEAN_MESSAGE))
+            mailer._checkForMail()
+        finally:
+            mailer.tp.joinAll(waitForTasks=False)
+
+        inbox, outbox = read_mbox(mboxfiles)
+        msg_offset = host_id * sm.MAILBOX_SIZE
+        assert outbox[:msg_offset] == b"\0" * msg_offset
+        assert outbox[msg_offset:msg_offset + sm.MESSAGE_SIZE] == \
+            sm.CLEAN_MESSAGE
+        assert outbox[msg_offset + sm.MESSAGE_SIZE:] == b"\0" * (
+            len(outbox) - msg_offset - sm.MESSAGE_SIZE)
+
 
 class TestHSMMailbox:
 
@@ -148,6 +231,52 @@ class TestHSMMailbox:
                 data = f.read()
             assert data == dirty_outbox
 
+    def test_poll_interval(self, mboxfiles):
+        with make_hsm_mailbox(
+                mboxfiles, 7, monitorInterval=2, minPollInterval=0.25) as mb:
+            mailman = mb._mailman
+            assert mailman._nextPollInterval(True) == 0.25
+            assert mailman._nextPollInterval(False) == 0.5
+            assert mailman._nextPollInterval(False) == 1.0
+            assert mailman._nextPollInterval(False) == 2.0
+            assert mailman._nextPollInterval(False) == 2.0
+            assert mailman._nextPollInterval(True) == 0.25
+
+    def test_poll_interval_fixed(self, mboxfiles):
+        with make_hsm_mailbox(
+                mboxfiles, 7, monitorInterval=2, minPollInterval=2) as mb:
+            mailman = mb._mailman
+            assert mailman._nextPollInterval(True) == 2
+            assert mailman._nextPollInterval(False) == 2
+
+    def test_request_timeout(self, mboxfiles, monkeypatch):
+        reports = []
+        monkeypatch.setattr(sm.metrics, "send", reports.append)
+        with make_hsm_mailbox(
+                mboxfiles, 7, requestTimeout=2 * MONITOR_INTERVAL) as mb:
+            mb.sendExtendMsg(VOL_DATA, 100)
+            wait_for(lambda: mb.stats()["timeouts"] == 1)
+            stats = mb.stats()
+
+        assert stats["requests"] == 1
+        assert stats["replies"] == 0
+        assert stats["pending"] == 1
+        assert reports == [{"hosts.storage.mailbox.timeouts": 1}]
+
+
+VOL_DATA = dict(
+    poolID=SPUUID,
+    domainID='8adbc85e-e554-4ae0-b318-8a5465fe5fe1',
+    volumeID='d772f1c6-3ebb-43c3-a42e-73fcd8255a5f')
+
+
+def wait_for(predicate, timeout=MAILER_TIMEOUT):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise RuntimeError("Timeout waiting for %s" % predicate)
+        time.sleep(MONITOR_INTERVAL / 10)
+
 
 class TestCommunicate:
 
@@ -206,6 +335,174 @@ class TestCommunicate:
         assert outbox[msg_offset + 0x40:] == b'\0' * (
             0x1000 * MAX_HOSTS - 0x40 - msg_offset)
 
+    def test_round_trip_stats(self, mboxfiles, monkeypatch):
+        reports = []
+        monkeypatch.setattr(sm.metrics, "send", reports.append)
+        completed = threading.Event()
+
+        def spm_callback(msg_id, data):
+            spm_mm.sendReply(msg_id, sm.SPM_Extend_Message(VOL_DATA, 100))
+
+        def hsm_callback(volume_data):
+            completed.set()
+
+        with make_hsm_mailbox(mboxfiles, 7, minPollInterval=0.01) as hsm_mb:
+            with make_spm_mailbox(mboxfiles) as spm_mm:
+                spm_mm.registerMessageType(b"xtnd", spm_callback)
+                hsm_mb.sendExtendMsg(VOL_DATA, 100, hsm_callback)
+                assert completed.wait(20 * MONITOR_INTERVAL)
+                stats = hsm_mb.stats()
+
+        assert stats["requests"] == 1
+        assert stats["replies"] == 1
+        assert stats["timeouts"] == 0
+        assert stats["pending"] == 0
+        assert 0 < stats["rtt_last"] == stats["rtt_max"] == stats["rtt_avg"]
+        assert reports == [{"hosts.storage.mailbox.rtt": stats["rtt_last"]}]
+
+
+class TestLatency:
+
+    REQUESTS = 20
+
+    @pytest.mark.stress
+    def test_extend_request_latency(self, mboxfiles):
+        received = threading.Event()
+        completed = threading.Event()
+        host_latency = []
+        round_trip = []
+
+        def spm_callback(msg_id, data):
+            host_latency.append(time.time() - start)
+            received.set()
+            reply = sm.SPM_Extend_Message(VOL_DATA, 0)
+            spm_mm.sendReply(msg_id, reply)
+
+        def hsm_callback(volume_data):
+            round_trip.append(time.time() - start)
+            completed.set()
+
+        VOL_DATA = dict(
+            poolID=SPUUID,
+            domainID='8adbc85e-e554-4ae0-b318-8a5465fe5fe1',
+            volumeID='d772f1c6-3ebb-43c3-a42e-73fcd8255a5f')
+
+        with make_hsm_mailbox(mboxfiles, 7) as hsm_mb:
+            with make_spm_mailbox(mboxfiles) as spm_mm:
+                spm_mm.registerMessageType(b"xtnd", spm_callback)
+                for i in range(self.REQUESTS):
+                    received.clear()
+                    completed.clear()
+                    start = time.time()
+                    hsm_mb.sendExtendMsg(VOL_DATA, i + 1, hsm_callback)
+                    assert received.wait(20 * MONITOR_INTERVAL)
+                    assert completed.wait(20 * MONITOR_INTERVAL)
+
+        print()
+        for name, samples in (("host to spm", host_latency),
+                              ("round trip", round_trip)):
+            print("%s latency (interval=%.2f): min=%.3f avg=%.3f max=%.3f "
+                  "seconds"
+                  % (name, MONITOR_INTERVAL, min(samples),
+                     sum(samples) / len(samples), max(samples)))
+
+    @pytest.mark.stress
+    @pytest.mark.parametrize("active_hosts", [0, 10, 250])
+    def test_scan(self, tmpdir, active_hosts):
+        hosts = 250
+        scans = 500
+        inbox = tmpdir.join('inbox')
+        outbox = tmpdir.join('outbox')
+        inbox.write(sm.EMPTYMAILBOX * hosts)
+        outbox.write(sm.EMPTYMAILBOX * hosts)
+        mailer = sm.SPM_MailMonitor(
+            SPUUID, hosts,
+            inbox=str(inbox),
+            outbox=str(outbox),
+            monitorInterval=MONITOR_INTERVAL)
+        try:
+            mailer._queueRequest = lambda msg_id, msg: None
+            msg = b"1xtnd" + b"a" * (sm.MESSAGE_SIZE - 5)
+            for host_id in range(active_hosts):
+                write_mailbox(str(inbox), host_id, make_mailbox(msg))
+            start = time.time()
+            for i in range(scans):
+                mailer._checkForMail()
+            elapsed = time.time() - start
+        finally:
+            mailer.tp.joinAll(waitForTasks=False)
+
+        print("%d hosts, %d with pending mail: %d scans in %.3f seconds, "
+              "%.3f msec per scan"
+              % (hosts, active_hosts, scans, elapsed, elapsed / scans * 1000))
+
+
+class TestTwoHostsSimulation:
+
+    # Relative to production: SPM and HSM monitor interval of 2 seconds,
+    # volume extension taking 1 second.
+    MONITOR_INTERVAL = 0.2
+    EXTEND_TIME = 0.1
+    REQUESTS = 25
+
+    @pytest.mark.stress
+    @pytest.mark.parametrize("min_poll_interval", [
+        pytest.param(MONITOR_INTERVAL, id="fixed"),
+        pytest.param(MONITOR_INTERVAL / 8, id="adaptive"),
+    ])
+    def test_extend_latency(self, mboxfiles, min_poll_interval):
+        latency = []
+
+        def spm_callback(msg_id, data):
+            time.sleep(self.EXTEND_TIME)
+            size = int(data[37:53], 16)
+            spm_mm.sendReply(msg_id, sm.SPM_Extend_Message(VOL_DATA, size))
+
+        def run_host(hsm_mb):
+            completed = threading.Event()
+            for i in range(self.REQUESTS):
+                completed.clear()
+                start = time.time()
+                hsm_mb.sendExtendMsg(
+                    VOL_DATA, i + 1, lambda volume_data: completed.set())
+                if not completed.wait(MAILER_TIMEOUT):
+                    raise RuntimeError("Timeout waiting for extend")
+                latency.append(time.time() - start)
+
+        with make_spm_mailbox(
+                mboxfiles, monitorInterval=self.MONITOR_INTERVAL) as spm_mm:
+            spm_mm.registerMessageType(b"xtnd", spm_callback)
+            with make_hsm_mailbox(
+                    mboxfiles, 1,
+                    monitorInterval=self.MONITOR_INTERVAL,
+                    minPollInterval=min_poll_interval) as host1, \
+                    make_hsm_mailbox(
+                        mboxfiles, 2,
+                        monitorInterval=self.MONITOR_INTERVAL,
+                        minPollInterval=min_poll_interval) as host2:
+                threads = [threading.Thread(target=run_host, args=(mb,))
+                           for mb in (host1, host2)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                stats = [host1.stats(), host2.stats()]
+
+        assert len(latency) == 2 * self.REQUESTS
+        latency.sort()
+
+        def percentile(p):
+            return latency[int(len(latency) * p / 100) - 1]
+
+        print()
+        print("extend latency (monitor interval %.3f, min poll interval "
+              "%.3f): min=%.3f p50=%.3f p90=%.3f p99=%.3f max=%.3f seconds"
+              % (self.MONITOR_INTERVAL, min_poll_interval, latency[0],
+                 percentile(50), percentile(90), percentile(99),
+                 latency[-1]))
+        for host_id, host_stats in enumerate(stats, 1):
+            print("host %d: %s" % (host_id, host_stats))
+
 
 class TestExtendMessage:
 
@@ -251,6 +548,48 @@ class TestExtendMessage:
         assert called_msg.callback is None
 
 
+class ShortReadFileIO(io.FileIO):
+    """
+    Read at most one block in each readinto() call.
+    """
+
+    def readinto(self, buf):
+        tmp = mmap.mmap(-1, sm.BLOCK_SIZE)
+        try:
+            n = super(ShortReadFileIO, self).readinto(tmp)
+            buf[:n] = tmp[:n]
+            return n
+        finally:
+            tmp.close()
+
+
+class TestDirectRead:
+
+    def test_read(self, tmpdir):
+        path = tmpdir.join("mailbox")
+        path.write(b"x" * sm.MAILBOX_SIZE + b"y" * sm.MAILBOX_SIZE)
+        buf = mmap.mmap(-1, sm.MAILBOX_SIZE)
+        assert sm._direct_read(str(path), buf, sm.MAILBOX_SIZE) == \
+            sm.MAILBOX_SIZE
+        assert buf[:] == b"y" * sm.MAILBOX_SIZE
+
+    def test_short_reads(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(sm.io, "FileIO", ShortReadFileIO)
+        path = tmpdir.join("mailbox")
+        data = b"".join(six.int2byte(i) * sm.BLOCK_SIZE for i in range(8))
+        path.write(data)
+        buf = mmap.mmap(-1, len(data))
+        assert sm._direct_read(str(path), buf) == len(data)
+        assert buf[:] == data
+
+    def test_eof(self, tmpdir):
+        path = tmpdir.join("mailbox")
+        path.write(b"x" * sm.BLOCK_SIZE)
+        buf = mmap.mmap(-1, sm.MAILBOX_SIZE)
+        with pytest.raises(IOError):
+            sm._direct_read(str(path), buf)
+
+
 class TestValidation:
 
     def test_empty_mailbox(self):
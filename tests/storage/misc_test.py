@@ -872,6 +872,102 @@ class TestSamplingMethod(VdsmTestCase):
             return self.results.pop(0)
 
 
+class TestCoalescingMethod(VdsmTestCase):
+
+    # Note: this should be long enough so even on very loaded machine, all
+    # threads will start within this delay.
+    WINDOW = 0.5
+
+    def setUp(self):
+        self.calls = []
+        self.running = threading.Event()
+        self.resume = threading.Event()
+        self.resume.set()
+
+    def func(self, keys):
+        self.calls.append(list(keys))
+        self.running.set()
+        self.resume.wait()
+        if "error" in keys:
+            raise RuntimeError("No result for you!")
+        return {key: key.upper() for key in keys if key != "missing"}
+
+    def test_single_call(self):
+        method = misc.CoalescingMethod(self.func, 0)
+        self.assertEqual(method("a"), "A")
+        self.assertEqual(self.calls, [["a"]])
+
+    def test_missing_result(self):
+        method = misc.CoalescingMethod(self.func, 0)
+        self.assertIsNone(method("missing"))
+
+    def test_uncontended_call_does_not_wait(self):
+        method = misc.CoalescingMethod(self.func, self.WINDOW)
+        start = time.time()
+        self.assertEqual(method("a"), "A")
+        self.assertLess(time.time() - start, self.WINDOW)
+
+    def test_concurrent_calls(self):
+        method = misc.CoalescingMethod(self.func, self.WINDOW)
+        self.resume.clear()
+        first = SamplingThread(partial(method, "a"))
+        first.start()
+        self.running.wait()
+        # Calls made while the first call is running are merged.
+        threads = [SamplingThread(partial(method, key))
+                   for key in ("b", "b", "c")]
+        for t in threads:
+            t.start()
+        self.resume.set()
+        first.join()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(sorted(self.calls[1]), ["b", "c"])
+        self.assertEqual(first.result, "A")
+        self.assertEqual([t.result for t in threads], ["B", "B", "C"])
+
+    def test_call_while_running(self):
+        method = misc.CoalescingMethod(self.func, 0)
+        self.resume.clear()
+        first = SamplingThread(partial(method, "a"))
+        first.start()
+        self.running.wait()
+        # Must not join the running call.
+        second = SamplingThread(partial(method, "a"))
+        second.start()
+        self.resume.set()
+        first.join()
+        second.join()
+        self.assertEqual(self.calls, [["a"], ["a"]])
+        self.assertEqual(second.result, "A")
+
+    def test_error(self):
+        method = misc.CoalescingMethod(self.func, self.WINDOW)
+        self.resume.clear()
+        first = SamplingThread(partial(method, "a"))
+        first.start()
+        self.running.wait()
+        errors = []
+
+        def call(key):
+            try:
+                method(key)
+            except RuntimeError as e:
+                errors.append(e)
+
+        threads = [SamplingThread(partial(call, key))
+                   for key in ("b", "error")]
+        for t in threads:
+            t.start()
+        self.resume.set()
+        first.join()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(errors), 2)
+
+
 class SamplingThread(object):
 
     def __init__(self, func):
@@ -27,8 +27,12 @@ import time
 
 from contextlib import contextmanager
 
+import pytest
 from six.moves import queue
 
+from vdsm import executor
+from vdsm import schedule
+from vdsm.common.time import monotonic_time
 from vdsm.storage import exception as se
 from vdsm.storage import monitor
 
@@ -73,6 +77,12 @@ class FakeCheckService(object):
     def __init__(self):
         self.checkers = {}
 
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
     def start_checking(self, path, complete, interval=10.0):
         log.info("Start checking %r", path)
         if path in self.checkers:
@@ -116,7 +126,7 @@ class FakeDomain(object):
         log.debug("Performing selftest")
 
     def getMonitoringPath(self):
-        return "/path/to/metadata"
+        return "/path/to/%s/metadata" % self.sdUUID
 
     @maybefail
     def getStats(self):
@@ -221,6 +231,183 @@ def monitor_env(shutdown=False, refresh=300):
                 log.error("Error joining thread: %s", e)
 
 
+@contextmanager
+def scheduled_monitor_env(shutdown=False, workers=2):
+    config = make_config([
+        ("irs", "repo_stats_cache_refresh_timeout", "300")
+    ])
+    scheduler = schedule.Scheduler(clock=monotonic_time)
+    scheduler.start()
+    pool = executor.Executor("monitor", workers, 100, scheduler)
+    pool.start()
+    try:
+        with MonkeyPatchScope([
+            (monitor, "sdCache", FakeStorageDomainCache()),
+            (monitor, 'config', config),
+        ]):
+            event = FakeEvent()
+            checker = FakeCheckService()
+
+            def create(sdUUID):
+                return monitor.ScheduledMonitor(
+                    sdUUID, 'host_id', MONITOR_INTERVAL, event, checker,
+                    scheduler, pool)
+
+            thread = create('uuid')
+            env = MonitorEnv(thread, event, checker)
+            env.create = create
+            try:
+                yield env
+            finally:
+                thread.stop(shutdown=shutdown)
+                thread.join()
+    finally:
+        pool.stop(wait=False)
+        scheduler.stop()
+
+
+class TestScheduledMonitor(VdsmTestCase):
+
+    def test_produce_retry(self):
+        with scheduled_monitor_env() as env:
+            env.thread.start()
+
+            # First cycle will fail since domain does not exist
+            env.wait_for_cycle()
+            status = env.thread.getStatus()
+            self.assertTrue(status.actual)
+            self.assertIsInstance(status.error, se.StorageDomainDoesNotExist)
+            self.assertEqual(env.event.received, [(('uuid', False), {})])
+            del env.event.received[0]
+
+            # Next cycle should succeed, and the path check is started.
+            domain = FakeDomain("uuid")
+            monitor.sdCache.domains["uuid"] = domain
+            env.wait_for_cycle()
+            env.checker.complete(domain.getMonitoringPath(), FakeCheckResult())
+            status = env.thread.getStatus()
+            self.assertTrue(status.valid)
+            self.assertEqual(env.event.received, [(('uuid', True), {})])
+
+    def test_acquire_host_id(self):
+        with scheduled_monitor_env() as env:
+            domain = FakeDomain("uuid")
+            monitor.sdCache.domains["uuid"] = domain
+            env.thread.start()
+            env.wait_for_cycle()
+            env.checker.complete(domain.getMonitoringPath(), FakeCheckResult())
+            env.wait_for_cycle()
+            self.assertTrue(domain.acquired)
+            self.assertTrue(env.thread.getStatus().valid)
+
+    def test_stop(self):
+        with scheduled_monitor_env(shutdown=False) as env:
+            domain = FakeDomain("uuid")
+            monitor.sdCache.domains["uuid"] = domain
+            env.thread.start()
+            env.wait_for_cycle()
+            env.checker.complete(domain.getMonitoringPath(), FakeCheckResult())
+            env.wait_for_cycle()
+            self.assertTrue(domain.acquired)
+        self.assertFalse(domain.acquired)
+        self.assertNotIn(domain.getMonitoringPath(), env.checker.checkers)
+
+    def test_shutdown(self):
+        with scheduled_monitor_env(shutdown=True) as env:
+            domain = FakeDomain("uuid")
+            monitor.sdCache.domains["uuid"] = domain
+            env.thread.start()
+            env.wait_for_cycle()
+            env.checker.complete(domain.getMonitoringPath(), FakeCheckResult())
+            env.wait_for_cycle()
+        self.assertTrue(domain.acquired)
+
+    def test_stop_not_started(self):
+        with scheduled_monitor_env() as env:
+            pass
+        self.assertEqual(env.event.received, [])
+
+    def test_blocked_domain_isolated(self):
+        with scheduled_monitor_env(workers=1) as env:
+            blocked = FakeDomain("blocked")
+            unblock = threading.Event()
+            blocked.selftest = lambda: unblock.wait(CYCLE_TIMEOUT)
+            monitor.sdCache.domains["blocked"] = blocked
+            blocked_monitor = env.create("blocked")
+            blocked_monitor.start()
+
+            # The blocked domain is using the only worker, but the other
+            # domain is monitored by a new worker.
+            domain = FakeDomain("uuid")
+            monitor.sdCache.domains["uuid"] = domain
+            env.thread.start()
+            env.wait_for_cycle()
+            env.wait_for_cycle()
+            self.assertTrue(env.thread.getStatus().valid)
+            self.assertFalse(blocked_monitor.getStatus().actual)
+
+            unblock.set()
+            blocked_monitor.stop()
+            blocked_monitor.join()
+
+
+@expandPermutations
+class TestDomainMonitorScale(VdsmTestCase):
+
+    DOMAINS = 500
+    INTERVAL = 1.0
+
+    @pytest.mark.stress
+    @permutations([[0], [4]])
+    def test_monitor_domains(self, workers):
+        with MonkeyPatchScope([
+            (monitor, "sdCache", FakeStorageDomainCache()),
+            (monitor.check, "CheckService", FakeCheckService),
+        ]):
+            uuids = ["uuid-%03d" % i for i in range(self.DOMAINS)]
+            for sdUUID in uuids:
+                monitor.sdCache.domains[sdUUID] = FakeDomain(sdUUID)
+
+            threads = threading.active_count()
+            start = time.time()
+            dm = monitor.DomainMonitor(self.INTERVAL, workers=workers)
+            try:
+                for sdUUID in uuids:
+                    dm.startMonitoring(sdUUID, 1)
+                monitor_threads = threading.active_count() - threads
+
+                checker = dm._checker
+                deadline = start + 60
+                while True:
+                    for path in list(checker.checkers):
+                        checker.complete(path, FakeCheckResult())
+                    statuses = dict(dm.getDomainsStatus())
+                    if all(s.actual and s.valid and s.hasHostId
+                           for s in statuses.values()):
+                        break
+                    if time.time() > deadline:
+                        raise RuntimeError("Timeout waiting for monitors")
+                    time.sleep(0.1)
+                elapsed = time.time() - start
+
+                self.assertEqual(sorted(statuses), uuids)
+                for status in statuses.values():
+                    self.assertEqual(status.readDelay, 0.005)
+                    self.assertEqual(status.diskUtilization, ('100', '50'))
+                    self.assertTrue(status.masterValid)
+                    self.assertEqual(status.version, 1)
+            finally:
+                stop_start = time.time()
+                dm.stopMonitoring(uuids)
+                dm.shutdown()
+                stop_elapsed = time.time() - stop_start
+
+        print("workers=%d: %d domains, %d threads, all valid in %.2f "
+              "seconds, stopped in %.2f seconds"
+              % (workers, self.DOMAINS, monitor_threads, elapsed,
+                 stop_elapsed))
+
+
 class TestMonitorThreadIdle(VdsmTestCase):
 
     def test_initial_status(self):
@@ -0,0 +1,290 @@
+#
+# Copyright 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import threading
+import time
+
+import pytest
+
+from vdsm.storage import blockSD
+from vdsm.storage import constants as sc
+from vdsm.storage import exception as se
+from vdsm.storage import fileSD
+from vdsm.storage import glusterSD
+from vdsm.storage import localFsSD
+from vdsm.storage import nfsSD
+from vdsm.storage import sdc
+
+SD_UUID = "sd-uuid"
+
+
+MODULES = [blockSD, glusterSD, localFsSD, nfsSD]
+
+
+@pytest.fixture
+def domains(monkeypatch):
+    """
+    Fake the findDomainPaths and openDomain functions of the domain modules,
+    returning a dict mapping a module to the domains found in the module.
+    Every module records the lookups in the "calls" list. Lookups in modules
+    in "blocked" wait until the module event is set. Opening domains in
+    modules in "broken" fails.
+
+    When the test is done, blocked lookups are released, and we wait until
+    the prober threads exit, so they do not record lookups of the next test.
+    """
+    found = {"calls": [], "blocked": {}, "broken": set()}
+    for mod in MODULES:
+        found[mod] = set()
+
+        def findDomainPaths(sdUUIDs, mod=mod):
+            found["calls"].append(mod)
+            if mod in found["blocked"]:
+                found["blocked"][mod].wait()
+            return {sdUUID: sdUUID for sdUUID in sdUUIDs
+                    if sdUUID in found[mod]}
+
+        def openDomain(domainPath, mod=mod):
+            if mod in found["broken"]:
+                raise RuntimeError("Cannot open %s" % domainPath)
+            return (mod, domainPath)
+
+        monkeypatch.setattr(mod, "findDomainPaths", findDomainPaths)
+        monkeypatch.setattr(mod, "openDomain", openDomain)
+
+    yield found
+
+    for event in found["blocked"].values():
+        event.set()
+    for t in threading.enumerate():
+        if t.name.startswith("sdc/"):
+            t.join()
+
+
+@pytest.fixture
+def types_path(tmpdir):
+    return str(tmpdir.join("domain-types.json"))
+
+
+def make_cache(types_path, window=0):
+    return sdc.StorageDomainCache(
+        sc.REPO_DATA_CENTER, types_path, discovery_window=window)
+
+
+def test_find_domain(domains, types_path):
+    domains[nfsSD].add(SD_UUID)
+    cache = make_cache(types_path)
+    assert cache._findUnfetchedDomain(SD_UUID) == (nfsSD, SD_UUID)
+    assert sorted_modules(domains["calls"]) == MODULES
+    with open(types_path) as f:
+        assert json.load(f) == {SD_UUID: nfsSD.__name__}
+
+
+def test_find_known_type(domains, types_path):
+    domains[nfsSD].add(SD_UUID)
+    cache = make_cache(types_path)
+    cache._findUnfetchedDomain(SD_UUID)
+    del domains["calls"][:]
+
+    # Simulate a restart.
+    cache = make_cache(types_path)
+    assert cache._findUnfetchedDomain(SD_UUID) == (nfsSD, SD_UUID)
+    assert domains["calls"] == [nfsSD]
+
+
+def test_find_stale_type(domains, types_path):
+    with open(types_path, "w") as f:
+        json.dump({SD_UUID: nfsSD.__name__}, f)
+    domains[localFsSD].add(SD_UUID)
+    cache = make_cache(types_path)
+    assert cache._findUnfetchedDomain(SD_UUID) == (localFsSD, SD_UUID)
+    # The known module is not probed again.
+    assert domains["calls"][0] == nfsSD
+    assert sorted_modules(domains["calls"][1:]) == [
+        blockSD, glusterSD, localFsSD]
+    with open(types_path) as f:
+        assert json.load(f) == {SD_UUID: localFsSD.__name__}
+
+
+def test_find_missing_domain(domains, types_path):
+    cache = make_cache(types_path)
+    with pytest.raises(se.StorageDomainDoesNotExist):
+        cache._findUnfetchedDomain(SD_UUID)
+    assert sorted_modules(domains["calls"]) == MODULES
+
+
+@pytest.mark.parametrize("data", [
+    "{invalid",
+    "[]",
+    json.dumps({SD_UUID: "os"}),
+])
+def test_find_invalid_types(domains, types_path, data):
+    with open(types_path, "w") as f:
+        f.write(data)
+    domains[blockSD].add(SD_UUID)
+    cache = make_cache(types_path)
+    assert cache._findUnfetchedDomain(SD_UUID) == (blockSD, SD_UUID)
+    with open(types_path) as f:
+        assert json.load(f) == {SD_UUID: blockSD.__name__}
+
+
+def test_find_many(domains, types_path):
+    domains[blockSD].add("block-sd")
+    domains[nfsSD].add("nfs-sd")
+    domains[localFsSD].add("local-sd")
+    cache = make_cache(types_path)
+    found = cache._findUnfetchedDomains(["block-sd", "nfs-sd", "local-sd",
+                                         "missing-sd"])
+    assert found == {
+        "block-sd": (blockSD, "block-sd"),
+        "nfs-sd": (nfsSD, "nfs-sd"),
+        "local-sd": (localFsSD, "local-sd"),
+    }
+    # Every module scanned once.
+    assert sorted_modules(domains["calls"]) == MODULES
+
+
+def test_find_first_module(domains, types_path):
+    domains[localFsSD].add(SD_UUID)
+    domains[nfsSD].add(SD_UUID)
+    cache = make_cache(types_path)
+    assert cache._findUnfetchedDomain(SD_UUID) == (localFsSD, SD_UUID)
+
+
+def test_find_open_error(domains, types_path):
+    # Opening the domain using the first module fails, so the next module
+    # finding it is used.
+    domains[blockSD].add(SD_UUID)
+    domains[nfsSD].add(SD_UUID)
+    domains["broken"].add(blockSD)
+    cache = make_cache(types_path)
+    assert cache._findUnfetchedDomain(SD_UUID) == (nfsSD, SD_UUID)
+    with open(types_path) as f:
+        assert json.load(f) == {SD_UUID: nfsSD.__name__}
+
+
+def test_find_open_error_missing(domains, types_path):
+    domains[blockSD].add(SD_UUID)
+    domains["broken"].add(blockSD)
+    cache = make_cache(types_path)
+    with pytest.raises(se.StorageDomainDoesNotExist):
+        cache._findUnfetchedDomain(SD_UUID)
+
+
+def test_find_skip_slow_module(domains, types_path):
+    # Scanning nfs mounts is blocked, but the domain was found in a module
+    # scanned before nfs.
+    blocked = domains["blocked"][nfsSD] = threading.Event()
+    domains[blockSD].add(SD_UUID)
+    cache = make_cache(types_path)
+    try:
+        assert cache._findUnfetchedDomain(SD_UUID) == (blockSD, SD_UUID)
+    finally:
+        blocked.set()
+
+
+def test_find_slow_module_single_scan(domains, types_path):
+    # Lookups while nfs mounts scan is blocked do not start more scans.
+    blocked = domains["blocked"][nfsSD] = threading.Event()
+    sd_uuids = ["sd-%d" % i for i in range(3)]
+    domains[blockSD].update(sd_uuids)
+    cache = make_cache(types_path)
+    try:
+        for sd_uuid in sd_uuids:
+            assert cache._findUnfetchedDomain(sd_uuid) == (blockSD, sd_uuid)
+        assert domains["calls"].count(nfsSD) == 1
+    finally:
+        blocked.set()
+
+    # The pending lookups are merged into one scan.
+    deadline = time.time() + 2
+    while domains["calls"].count(nfsSD) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    assert domains["calls"].count(nfsSD) == 2
+
+
+def test_find_wait_for_slow_module(domains, types_path):
+    # The domain may be found in the blocked module, so we must wait.
+    blocked = domains["blocked"][glusterSD] = threading.Event()
+    domains[nfsSD].add(SD_UUID)
+    cache = make_cache(types_path)
+    result = []
+    t = threading.Thread(
+        target=lambda: result.append(cache._findUnfetchedDomain(SD_UUID)))
+    t.start()
+    try:
+        t.join(0.2)
+        assert t.is_alive()
+    finally:
+        blocked.set()
+        t.join()
+    assert result == [(nfsSD, SD_UUID)]
+
+
+def test_find_concurrent_lookups(domains, types_path):
+    sd_uuids = ["sd-%d" % i for i in range(10)]
+    domains[blockSD].update(sd_uuids)
+    window = 0.2
+    cache = make_cache(types_path, window=window)
+    results = {}
+
+    def lookup(sd_uuid):
+        results[sd_uuid] = cache._findUnfetchedDomain(sd_uuid)
+
+    # The first lookup runs immediately, and blocks scanning blockSD.
+    blocked = domains["blocked"][blockSD] = threading.Event()
+    threads = [threading.Thread(target=lookup, args=(sd_uuids[0],))]
+    threads[0].start()
+    try:
+        while not domains["calls"]:
+            time.sleep(0.01)
+        # Lookups started while the first is running are merged.
+        for sd_uuid in sd_uuids[1:]:
+            t = threading.Thread(target=lookup, args=(sd_uuid,))
+            t.start()
+            threads.append(t)
+        time.sleep(window / 2)
+    finally:
+        blocked.set()
+    for t in threads:
+        t.join()
+
+    assert results == {sd_uuid: (blockSD, sd_uuid) for sd_uuid in sd_uuids}
+    # The other lookups were done using one scan of every module. Modules
+    # after blockSD may not have been called yet.
+    assert domains["calls"].count(blockSD) == 2
+    assert len(domains["calls"]) <= 2 * len(MODULES)
+
+
+def test_get_uuids(monkeypatch, types_path):
+    monkeypatch.setattr(blockSD, "getStorageDomainsList", lambda: ["block"])
+    monkeypatch.setattr(fileSD, "getStorageDomainsList", lambda: ["file"])
+    cache = make_cache(types_path)
+    assert cache.getUUIDs() == ["block", "file"]
+
+
+def sorted_modules(modules):
+    return sorted(modules, key=MODULES.index)
@@ -128,6 +128,18 @@ class FakeDomainManifest(object):
     def getAllVolumes(self):
         pass
 
+    @recorded
+    def getImageChain(self, imgUUID, volUUID=None):
+        pass
+
+    @recorded
+    def invalidateImage(self, imgUUID):
+        pass
+
+    @recorded
+    def getVolsOfImage(self, imgUUID):
+        pass
+
     @recorded
     def getReservedId(self):
         pass
@@ -732,6 +744,9 @@ class DomainTestMixin(object):
         ['purgeImage', 4],
         ['getAllImages', 0],
         ['getAllVolumes', 0],
+        ['getImageChain', 2],
+        ['invalidateImage', 1],
+        ['getVolsOfImage', 1],
         ['getReservedId', 0],
         ['acquireHostId', 2],
         ['releaseHostId', 3],
@@ -96,6 +96,7 @@ class FakeLVM(object):
                      tags=(initialTag,),
                      vg_mda_size=str(metadataSize),
                      vg_mda_free=None,
+                     vg_seqno='1',
                      lv_count='0',
                      pv_count=str(len(devices)),
                      pv_name=pv_name,
@@ -217,6 +218,9 @@ class FakeLVM(object):
         tags -= set(delTags)
         lv_md['tags'] = tuple(tags)
 
+    def replaceLVTag(self, vg, lv, deltag, addtag):
+        self.changeLVTags(vg, lv, delTags=(deltag,), addTags=(addtag,))
+
     def lvsByTag(self, vgName, tag):
         return [lv for lv in self.getLV(vgName) if tag in lv.tags]
 
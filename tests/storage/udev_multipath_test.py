@@ -437,3 +437,76 @@ def test_loopback_event(tmpdir):
 
             # We expect an event about our loop device
             assert devices[0].get("DEVNAME") == loop.path
+
+
+@pytest.mark.parametrize("device,expected", [
+    (
+        FakeDevice(
+            ACTION="add",
+            DM_UUID="LVM-fake-uuid-1",
+            DM_VG_NAME="vg-name",
+            DM_LV_NAME="lv-name"),
+        udev.LVEvent(
+            type=udev.LV_ADDED,
+            vg_name="vg-name",
+            lv_name="lv-name")
+    ),
+    (
+        FakeDevice(
+            ACTION="change",
+            DM_UUID="LVM-fake-uuid-1",
+            DM_VG_NAME="vg-name",
+            DM_LV_NAME="lv-name"),
+        udev.LVEvent(
+            type=udev.LV_CHANGED,
+            vg_name="vg-name",
+            lv_name="lv-name")
+    ),
+    (
+        FakeDevice(
+            ACTION="remove",
+            DM_UUID="LVM-fake-uuid-1",
+            DM_VG_NAME="vg-name",
+            DM_LV_NAME="lv-name"),
+        udev.LVEvent(
+            type=udev.LV_REMOVED,
+            vg_name="vg-name",
+            lv_name="lv-name")
+    ),
+])
+def test_report_lv_events(device, expected):
+    listener = udev.LVMListener()
+    mon = Monitor()
+    listener.register(mon)
+    listener._callback(device)
+
+    assert mon.calls == [expected]
+
+
+@pytest.mark.parametrize("device", [
+    # Multipath device
+    FakeDevice(ACTION="remove",
+               DM_UUID="mpath-fake-uuid-3"),
+    # Internal LV layer
+    FakeDevice(ACTION="add",
+               DM_UUID="LVM-fake-uuid-1-real",
+               DM_VG_NAME="vg-name",
+               DM_LV_NAME="lv-name",
+               DM_LV_LAYER="real"),
+    # Missing LV name
+    FakeDevice(ACTION="add",
+               DM_UUID="LVM-fake-uuid-1",
+               DM_NAME="vg--name-lv--name"),
+    # The "action" is not supported
+    FakeDevice(ACTION="move",
+               DM_UUID="LVM-fake-uuid-1",
+               DM_VG_NAME="vg-name",
+               DM_LV_NAME="lv-name"),
+])
+def test_filter_lv_event(device):
+    listener = udev.LVMListener()
+    mon = Monitor()
+    listener.register(mon)
+    listener._callback(device)
+
+    assert mon.calls == []
@@ -171,6 +171,14 @@ class TestVolumeMetadata(VdsmTestCase):
         self.assertRaises(ValueError,
                           volume.VolumeMetadata.from_lines, lines)
 
+    def test_from_block(self):
+        params = make_init_params(ctime=FAKE_TIME)
+        md = volume.VolumeMetadata(**params)
+        data = md.storage_format().encode("utf-8").ljust(
+            sc.METADATA_SIZE, b"\0")
+        parsed = volume.VolumeMetadata.from_block(data)
+        self.assertEqual(md.storage_format(), parsed.storage_format())
+
     def test_from_lines(self):
         data = make_md_dict()
         lines = make_lines(**data)
@@ -64,6 +64,16 @@ class FailingWriter(xlease.DirectFile):
         raise WriteError
 
 
+class CountingWriter(xlease.DirectFile):
+    def __init__(self, path):
+        super(CountingWriter, self).__init__(path)
+        self.writes = []
+
+    def pwrite(self, offset, buf):
+        self.writes.append((offset, len(buf)))
+        super(CountingWriter, self).pwrite(offset, buf)
+
+
 class TestIndex(VdsmTestCase):
 
     @MonkeyPatch(time, 'time', lambda: 123456789)
@@ -310,6 +320,158 @@ class TestIndex(VdsmTestCase):
             self.assertEqual(leases[uuids[2]]["offset"],
                              xlease.USER_RESOURCE_BASE + xlease.SLOT_SIZE * 2)
 
+    @MonkeyPatch(xlease, "sanlock", FakeSanlock())
+    def test_add_many(self):
+        with make_volume() as vol:
+            vol.add(make_uuid())
+            lease_ids = [make_uuid() for i in range(20)]
+            infos = vol.add_many(lease_ids)
+            self.assertEqual([info.resource for info in infos], lease_ids)
+            leases = vol.leases()
+            sanlock = xlease.sanlock
+            for i, info in enumerate(infos):
+                # Added after the first lease.
+                offset = xlease.lease_offset(i + 1)
+                self.assertEqual(info.offset, offset)
+                self.assertEqual(leases[info.resource],
+                                 {"offset": offset, "updating": False})
+                self.assertEqual(vol.lookup(info.resource), info)
+                res = sanlock.read_resource(info.path, info.offset)
+                self.assertEqual(res["lockspace"], vol.lockspace)
+                self.assertEqual(res["resource"], info.resource)
+            # The index was reloaded from storage.
+            self.assertEqual(load_leases(vol.path), leases)
+
+    @MonkeyPatch(xlease, "sanlock", FakeSanlock())
+    def test_add_many_writes(self):
+        with make_volume() as base:
+            file = CountingWriter(base.path)
+            with utils.closing(file):
+                vol = xlease.LeasesVolume(file)
+                with utils.closing(vol):
+                    vol.add_many([make_uuid() for i in range(20)])
+                    # Mark updating, updating records, records, clear
+                    # updating.
+                    self.assertEqual(file.writes, [
+                        (xlease.INDEX_BASE, xlease.BLOCK_SIZE),
+                        (xlease.INDEX_BASE + xlease.RECORD_BASE,
+                         3 * xlease.BLOCK_SIZE),
+                        (xlease.INDEX_BASE + xlease.RECORD_BASE,
+                         3 * xlease.BLOCK_SIZE),
+                        (xlease.INDEX_BASE, xlease.BLOCK_SIZE),
+                    ])
+
+    @MonkeyPatch(xlease, "sanlock", FakeSanlock())
+    def test_add_many_exists(self):
+        with make_volume() as vol:
+            lease_id = make_uuid()
+            vol.add(lease_id)
+            with self.assertRaises(xlease.LeaseExists):
+                vol.add_many([make_uuid(), lease_id])
+            self.assertEqual(list(vol.leases()), [lease_id])
+
+    def test_add_many_duplicate(self):
+        with make_volume() as vol:
+            lease_id = make_uuid()
+            with self.assertRaises(xlease.LeaseExists):
+                vol.add_many([lease_id, lease_id])
+            self.assertEqual(vol.leases(), {})
+
+    def test_add_many_no_space(self):
+        with make_volume() as vol:
+            lease_ids = [make_uuid() for i in range(xlease.MAX_RECORDS + 1)]
+            with self.assertRaises(xlease.NoSpace) as e:
+                vol.add_many(lease_ids)
+            self.assertEqual(e.exception.lease_id, lease_ids[-1])
+            self.assertEqual(vol.leases(), {})
+
+    @MonkeyPatch(xlease, "sanlock", FakeSanlock())
+    def test_add_many_sanlock_failure(self):
+        with make_volume() as vol:
+            lease_ids = [make_uuid() for i in range(3)]
+            sanlock = xlease.sanlock
+            sanlock.errors["write_resource"] = sanlock.SanlockException
+            with self.assertRaises(sanlock.SanlockException):
+                vol.add_many(lease_ids)
+            leases = vol.leases()
+            for lease_id in lease_ids:
+                self.assertTrue(leases[lease_id]["updating"])
+            # The index must be rebuilt.
+            with self.assertRaises(xlease.IndexIsUpdating):
+                load_leases(vol.path)
+
+    @MonkeyPatch(xlease, "sanlock", FakeSanlock())
+    def test_remove_many(self):
+        with make_volume() as vol:
+            lease_ids = [make_uuid() for i in range(20)]
+            infos = vol.add_many(lease_ids)
+            vol.remove_many(lease_ids[1::2])
+            self.assertEqual(sorted(vol.leases()), sorted(lease_ids[::2]))
+            sanlock = xlease.sanlock
+            for info in infos[1::2]:
+                res = sanlock.read_resource(info.path, info.offset)
+                self.assertEqual(res["lockspace"], "")
+                self.assertEqual(res["resource"], "")
+            # Removed slots are reused.
+            info = vol.add(make_uuid())
+            self.assertEqual(info.offset, infos[1].offset)
+            self.assertEqual(load_leases(vol.path), vol.leases())
+
+    @MonkeyPatch(xlease, "sanlock", FakeSanlock())
+    def test_remove_many_missing(self):
+        with make_volume() as vol:
+            lease_id = make_uuid()
+            vol.add(lease_id)
+            with self.assertRaises(xlease.NoSuchLease):
+                vol.remove_many([lease_id, make_uuid()])
+            with self.assertRaises(xlease.NoSuchLease):
+                vol.remove_many([lease_id, lease_id])
+            self.assertEqual(list(vol.leases()), [lease_id])
+
+    def test_find_free_records(self):
+        # Records in different blocks, since write_records() does not update
+        # the index.
+        used = xlease.Record(make_uuid(), 0)
+        with make_volume((0, used), (8, used)) as vol:
+            index = vol._index
+            self.assertEqual(index.find_free_record(), 1)
+            self.assertEqual(index.find_free_records(8),
+                             [1, 2, 3, 4, 5, 6, 7, 9])
+
+    def test_lookup_first_record(self):
+        # Duplicate records are invalid, but the index must find the same
+        # record found before using the index.
+        record = xlease.Record(make_uuid(), 0)
+        with make_volume((12, record), (3, record)) as vol:
+            self.assertEqual(vol.lookup(record.resource).offset,
+                             xlease.lease_offset(3))
+
+    @pytest.mark.slow
+    @MonkeyPatch(xlease, "sanlock", FakeSanlock())
+    def test_time_add_many(self):
+        count = 500
+        with make_volume() as vol:
+            lease_ids = [make_uuid() for i in range(count)]
+            start = time.time()
+            for lease_id in lease_ids:
+                vol.add(lease_id)
+            elapsed = time.time() - start
+            print("%d adds in %.6f seconds" % (count, elapsed))
+            start = time.time()
+            for lease_id in lease_ids:
+                vol.lookup(lease_id)
+            elapsed = time.time() - start
+            print("%d lookups in %.6f seconds" % (count, elapsed))
+            start = time.time()
+            vol.remove_many(lease_ids)
+            elapsed = time.time() - start
+            print("remove_many of %d leases in %.6f seconds"
+                  % (count, elapsed))
+            start = time.time()
+            vol.add_many(lease_ids)
+            elapsed = time.time() - start
+            print("add_many of %d leases in %.6f seconds" % (count, elapsed))
+
     @pytest.mark.slow
     def test_time_lookup(self):
         setup = """
@@ -474,6 +636,14 @@ def make_volume(*records):
                 yield vol
 
 
+def load_leases(path):
+    file = xlease.DirectFile(path)
+    with utils.closing(file):
+        vol = xlease.LeasesVolume(file)
+        with utils.closing(vol):
+            return vol.leases()
+
+
 @contextmanager
 def make_leases():
     with namedTemporaryDir() as tmpdir:
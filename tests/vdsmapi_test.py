@@ -20,16 +20,22 @@
 
 from __future__ import absolute_import
 from __future__ import division
+from __future__ import print_function
 
 import json
 import logging
+import time
+import uuid
 import yaml
 
 from io import StringIO
 from textwrap import dedent
 
+import pytest
+
 from nose.plugins.attrib import attr
 from vdsm.api import vdsmapi
+from vdsm.common import concurrent
 from vdsm.api.schema_inconsistency_formatter \
     import SchemaInconsistencyFormatter
 from vdsm.common.compat import pickle
@@ -1065,3 +1071,160 @@ class SchemaInconsistencyFormatterTest(TestCaseBase):
         self.assertIn(u'call_arg_keys":[', log_entries)
         self.assertIn(u'\t"a",', log_entries)
         self.assertIn(u'\t"b"', log_entries)
+
+
+def _vm_create_params(nics):
+    vm_id = str(uuid.uuid4())
+    devices = [{'deviceType': 'interface',
+                'device': 'bridge',
+                'deviceId': str(uuid.uuid4()),
+                'alias': 'net%d' % i,
+                'nicModel': 'virtio',
+                'macAddr': '00:1a:4a:16:01:%02x' % i,
+                'network': 'ovirtmgmt',
+                'filter': 'vdsm-no-mac-spoofing',
+                'linkActive': True,
+                'address': {'type': 'pci',
+                            'domain': '0x0000',
+                            'bus': '0x00',
+                            'slot': '0x%02x' % (i + 3),
+                            'function': '0x0'}}
+               for i in range(nics)]
+    return {'vmID': vm_id,
+            'vmParams': {'vmId': vm_id,
+                         'vmName': 'vm',
+                         'memSize': 1024,
+                         'smp': '2',
+                         'kvmEnable': 'true',
+                         'transparentHugePages': 'true',
+                         'timeOffset': '0',
+                         'nice': '0',
+                         'acpiEnable': 'true',
+                         'vmType': 'kvm',
+                         'emulatedMachine': 'pc',
+                         'memGuaranteedSize': 1024,
+                         'cpuType': 'Conroe',
+                         'maxMemSize': 4096,
+                         'maxMemSlots': 16,
+                         'smartcardEnable': 'false',
+                         'pitReinjection': 'false',
+                         'displayNetwork': 'ovirtmgmt',
+                         'maxVCpus': '16',
+                         'custom': {'key': 'value'},
+                         'display': 'qxl',
+                         'devices': devices}}
+
+
+def _running_vm_stats(disks):
+    disks_stats = {}
+    for i in range(disks):
+        disks_stats['vd%s' % chr(ord('a') + i)] = {
+            'readLatency': '0',
+            'writtenBytes': '0',
+            'writeOps': '0',
+            'apparentsize': '1073741824',
+            'readOps': '0',
+            'writeLatency': '0',
+            'imageID': str(uuid.uuid4()),
+            'readBytes': '0',
+            'flushLatency': '0',
+            'readRate': '0.0',
+            'truesize': '0',
+            'writeRate': '0.0'}
+    return {'vcpuCount': '1',
+            'displayInfo': [{'tlsPort': '5900',
+                             'ipAddress': '0',
+                             'type': 'spice',
+                             'port': '-1'}],
+            'hash': '-3472228600028768455',
+            'acpiEnable': 'true',
+            'guestFQDN': '',
+            'vmId': str(uuid.uuid4()),
+            'pid': '32632',
+            'timeOffset': '0',
+            'session': 'Unknown',
+            'displayPort': '-1',
+            'memUsage': '0',
+            'guestIPs': '',
+            'pauseCode': 'NOERR',
+            'username': 'Unknown',
+            'kvmEnable': 'true',
+            'network': {'vnet0': {'macAddr': '00:1a:4a:16:01:51',
+                                  'rxDropped': '1572',
+                                  'tx': '0',
+                                  'rxErrors': '0',
+                                  'txDropped': '0',
+                                  'rx': '90',
+                                  'txErrors': '0',
+                                  'state': 'unknown',
+                                  'sampleTime': 4319358.22,
+                                  'speed': '1000',
+                                  'name': 'vnet0'}},
+            'cpuUser': '0.57',
+            'disks': disks_stats,
+            'monitorResponse': '0',
+            'elapsedTime': '2560',
+            'vmType': 'kvm',
+            'cpuSys': '0.20',
+            'status': 'Up',
+            'guestCPUCount': -1,
+            'clientIp': '',
+            'statusTime': '4319358220',
+            'vmName': 'vm'}
+
+
+class SchemaBenchmarkTests(TestCaseBase):
+
+    def test_vm_create(self):
+        rep = vdsmapi.MethodRep('VM', 'create')
+        _schema.verify_args(rep, _vm_create_params(8))
+
+    def test_get_all_vm_stats(self):
+        rep = vdsmapi.MethodRep('Host', 'getAllVmStats')
+        _schema.verify_retval(rep, [_running_vm_stats(4)])
+
+    def test_concurrent_verification(self):
+        # Validators are compiled on first use; threads using a fresh schema
+        # must never see partly compiled validators.
+        schema = vdsmapi.Schema.vdsm_api(strict_mode=True)
+        rep = vdsmapi.MethodRep('Host', 'getAllVmStats')
+        stats = [_running_vm_stats(4)]
+        errors = []
+
+        def verify():
+            try:
+                schema.verify_retval(rep, stats)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [concurrent.thread(verify) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+
+    @pytest.mark.stress
+    def test_benchmark_vm_create(self):
+        rep = vdsmapi.MethodRep('VM', 'create')
+        params = _vm_create_params(8)
+        count = 1000
+        start = time.time()
+        for i in range(count):
+            _schema.verify_args(rep, params)
+        elapsed = time.time() - start
+        print("VM.create verify_args: %.1f usec per call"
+              % (elapsed / count * 1000000))
+
+    @pytest.mark.stress
+    def test_benchmark_get_all_vm_stats(self):
+        rep = vdsmapi.MethodRep('Host', 'getAllVmStats')
+        stats = [_running_vm_stats(4) for i in range(500)]
+        count = 10
+        start = time.time()
+        for i in range(count):
+            _schema.verify_retval(rep, stats)
+        elapsed = time.time() - start
+        print("Host.getAllVmStats verify_retval, %d vms: %.1f msec per call"
+              % (len(stats), elapsed / count * 1000))
@@ -107,6 +107,27 @@ ON_REBOOT_RESTART = """
 </domain>
 """
 
+ALIASED_DEVICES = """
+<domain>
+    <uuid>xyz</uuid>
+    <devices>
+        <disk device="disk">
+            <alias name="ua-disk"/>
+        </disk>
+        <interface type="bridge">
+            <alias name="net0"/>
+        </interface>
+        <controller type="usb"/>
+        <hostdev>
+            <source>
+                <address bus="1"/>
+            </source>
+            <address bus="0"/>
+        </hostdev>
+    </devices>
+</domain>
+"""
+
 NO_REBOOT = """
 <domain>
     <uuid>xyz</uuid>
@@ -178,6 +199,42 @@ class DomainDescriptorTests(XMLTestCase):
             expected
         )
 
+    @permutations([
+        [DomainDescriptor, 'ua-disk', 'disk'],
+        [DomainDescriptor, 'net0', 'interface'],
+        [MutableDomainDescriptor, 'ua-disk', 'disk'],
+        [MutableDomainDescriptor, 'net0', 'interface'],
+    ])
+    def test_device_element_by_alias(self, descriptor, alias, tag):
+        desc = descriptor(ALIASED_DEVICES)
+        element = desc.get_device_element_by_alias(alias)
+        self.assertEqual(element.tag, tag)
+
+    @permutations([[DomainDescriptor], [MutableDomainDescriptor]])
+    def test_device_element_by_alias_missing(self, descriptor):
+        desc = descriptor(ALIASED_DEVICES)
+        self.assertIsNone(desc.get_device_element_by_alias('missing'))
+
+    @permutations([[DomainDescriptor], [MutableDomainDescriptor]])
+    def test_device_element_by_alias_no_devices(self, descriptor):
+        desc = descriptor(NO_DEVICES)
+        self.assertIsNone(desc.get_device_element_by_alias('ua-disk'))
+
+    @permutations([[DomainDescriptor], [MutableDomainDescriptor]])
+    def test_device_elements_nested(self, descriptor):
+        # Elements are searched in the entire devices tree.
+        desc = descriptor(ALIASED_DEVICES)
+        addresses = list(desc.get_device_elements('address'))
+        self.assertEqual([a.get('bus') for a in addresses], ['1', '0'])
+
+    def test_device_elements_cached(self):
+        desc = DomainDescriptor(ALIASED_DEVICES)
+        first = list(desc.get_device_elements('disk'))
+        second = list(desc.get_device_elements('disk'))
+        self.assertEqual(len(first), 1)
+        self.assertIs(first[0], second[0])
+        self.assertIs(desc.get_device_element_by_alias('ua-disk'), first[0])
+
     @permutations([
         # attrs, expected_devs
         [{}, 3],
@@ -28,10 +28,12 @@ import threading
 import libvirt
 
 from vdsm.common import response
+from vdsm.virt.vmdevices.storage import BlockInfo
 from vdsm.virt.vmdevices.storage import Drive, DISK_TYPE, BLOCK_THRESHOLD
 from vdsm.virt.vmdevices import hwclass
 from vdsm.virt.utils import TimedAcquireLock
 from vdsm.virt import drivemonitor
+from vdsm.virt import extendmanager
 from vdsm.virt import vm
 from vdsm.virt import vmstatus
 from vdsm import utils
@@ -96,6 +98,7 @@ def make_env(events_enabled, drive_infos):
 
         cif = FakeClientIF()
         cif.irs = irs
+        cif.extend_manager = extendmanager.ExtendManager(irs, timeout=60)
         yield FakeVM(cif, dom, drives), dom, drives
 
 
@@ -103,6 +106,11 @@ def allocation_threshold_for_resize_mb(block_info, drive):
     return block_info['physical'] - drive.watermarkLimit
 
 
+def to_block_info(block_info):
+    return BlockInfo(block_info['capacity'], block_info['allocation'],
+                     block_info['physical'])
+
+
 class DiskExtensionTestBase(VdsmTestCase):
     # helpers
 
@@ -195,6 +203,61 @@ class TestDiskExtensionWithPolling(DiskExtensionTestBase):
         self.assertEqual(len(testvm.cif.irs.extensions), 1)
         self.check_extension(vdb, drives[1], testvm.cif.irs.extensions[0])
 
+    def test_extend_drive_using_block_info(self):
+        with make_env(
+                events_enabled=False,
+                drive_infos=self.DRIVE_INFOS) as (testvm, dom, drives):
+            vdb = dom.block_info['/virtio/1']
+            vdb['allocation'] = allocation_threshold_for_resize_mb(
+                vdb, drives[1]) + 1 * MB
+            block_info = {drive.name: to_block_info(dom.block_info[drive.path])
+                          for drive in drives}
+            # Using blockInfo() will fail now.
+            dom.block_info.clear()
+
+            extended = testvm.monitor_drives(block_info)
+
+        self.assertEqual(extended, True)
+        self.assertEqual(len(testvm.cif.irs.extensions), 1)
+        self.check_extension(vdb, drives[1], testvm.cif.irs.extensions[0])
+
+    def test_extend_drive_missing_block_info(self):
+        with make_env(
+                events_enabled=False,
+                drive_infos=self.DRIVE_INFOS) as (testvm, dom, drives):
+            vda = dom.block_info['/virtio/0']
+            vda['allocation'] = 0 * MB
+            vdb = dom.block_info['/virtio/1']
+            vdb['allocation'] = allocation_threshold_for_resize_mb(
+                vdb, drives[1]) + 1 * MB
+            # No block info for vdb, fall back to blockInfo().
+            block_info = {drives[0].name: to_block_info(vda)}
+
+            extended = testvm.monitor_drives(block_info)
+
+        self.assertEqual(extended, True)
+        self.assertEqual(len(testvm.cif.irs.extensions), 1)
+        self.check_extension(vdb, drives[1], testvm.cif.irs.extensions[0])
+
+    def test_no_extension_stale_block_info(self):
+        with make_env(
+                events_enabled=False,
+                drive_infos=self.DRIVE_INFOS) as (testvm, dom, drives):
+            vda = dom.block_info['/virtio/0']
+            vda['allocation'] = 0 * MB
+            vdb = dom.block_info['/virtio/1']
+            vdb['allocation'] = allocation_threshold_for_resize_mb(
+                vdb, drives[1]) + 1 * MB
+            block_info = {drive.name: to_block_info(dom.block_info[drive.path])
+                          for drive in drives}
+            # vdb was extended after block info was sampled.
+            vdb['physical'] += CHUNK_SIZE
+            drives[1].apparentsize = vdb['physical']
+
+            extended = testvm.monitor_drives(block_info)
+
+        self.assertEqual(extended, False)
+
     def test_extend_drive_allocation_equals_next_size(self):
         with make_env(
                 events_enabled=False,
@@ -644,10 +707,12 @@ class FakeIRS(object):
 
     def sendExtendMsg(self, poolID, volInfo, newSize, func):
         self.extensions.append((poolID, volInfo, newSize, func))
+        return response.success()
 
-    def refreshVolume(self, domainID, poolID, imageID, volumeID):
-        key = (domainID, poolID, imageID, volumeID)
-        self.refreshes.append(key)
+    def refreshVolumes(self, domainID, poolID, volumeIDs):
+        for volumeID in volumeIDs:
+            self.refreshes.append((domainID, poolID, volumeID))
+        return response.success()
 
     def getVolumeSize(self, domainID, poolID, imageID, volumeID):
         # For block storage we "truesize" and "apparentsize" are always
@@ -715,7 +780,8 @@ def simulate_extend_callback(irs, extension_id):
 
     func(volInfo)
 
-    # Calling refreshVolume is critical in this flow.
+    # Refreshing the volume is critical in this flow.
     # Check this indeed happened.
-    if key != irs.refreshes[extension_id]:
+    refreshed = (volInfo['domainID'], volInfo['poolID'], volInfo['volumeID'])
+    if refreshed != irs.refreshes[extension_id]:
         raise AssertionError('Volume %s not refreshed' % key)
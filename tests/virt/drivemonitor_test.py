@@ -436,6 +436,28 @@ class TestDrivemonitor(VdsmTestCase):
         with make_env(events_enabled=True) as (mon, vm):
             self._check_monitored_drives(mon, vm, disk_confs, expected)
 
+    def test_block_info(self):
+        stats = {
+            'block.count': 3,
+            'block.0.name': 'vda',
+            'block.0.capacity': 4 * GB,
+            'block.0.allocation': 1 * GB,
+            'block.0.physical': 2 * GB,
+            # Partial stats, for example cdrom without media.
+            'block.1.name': 'hdc',
+            'block.2.name': 'vdb',
+            'block.2.capacity': 8 * GB,
+            'block.2.allocation': 512 * MB,
+            'block.2.physical': 1 * GB,
+        }
+        self.assertEqual(drivemonitor.block_info(stats), {
+            'vda': storage.BlockInfo(4 * GB, 1 * GB, 2 * GB),
+            'vdb': storage.BlockInfo(8 * GB, 512 * MB, 1 * GB),
+        })
+
+    def test_block_info_no_block_stats(self):
+        self.assertEqual(drivemonitor.block_info({'state.state': 1}), {})
+
     def _check_monitored_drives(self, mon, vm, disk_confs, expected):
         for conf in disk_confs:
             drive = make_drive(self.log, **conf)
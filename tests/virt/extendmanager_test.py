@@ -0,0 +1,258 @@
+#
+# Copyright 2018 Red Hat, Inc.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+# Refer to the README and COPYING files for full details of the license
+#
+
+from __future__ import absolute_import
+from __future__ import division
+
+import threading
+
+import pytest
+
+from vdsm.common import response
+from vdsm.virt import extendmanager
+
+POOL_ID = "pool-id"
+TIMEOUT = 60
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeIRS(object):
+
+    def __init__(self):
+        self.extensions = []
+        self.refreshes = []
+        self.refresh_error = False
+        # If set, refreshVolumes waits until this event is set.
+        self.refresh_blocked = None
+        self.refresh_started = threading.Event()
+        # If set, sendExtendMsg fails with this error.
+        self.send_error = None
+
+    def sendExtendMsg(self, poolID, volInfo, newSize, func):
+        if isinstance(self.send_error, Exception):
+            raise self.send_error
+        if self.send_error:
+            return response.error(self.send_error)
+        self.extensions.append((poolID, volInfo, newSize, func))
+        return response.success()
+
+    def refreshVolumes(self, domainID, poolID, volumeIDs):
+        self.refreshes.append((domainID, poolID, sorted(volumeIDs)))
+        self.refresh_started.set()
+        if self.refresh_blocked:
+            self.refresh_blocked.wait()
+        if self.refresh_error:
+            return response.error("unexpected")
+        return response.success()
+
+    # testing helper
+    def reply(self, index):
+        poolID, volInfo, newSize, func = self.extensions[index]
+        func(volInfo)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def irs():
+    return FakeIRS()
+
+
+@pytest.fixture
+def manager(irs, clock):
+    return extendmanager.ExtendManager(irs, timeout=TIMEOUT, clock=clock)
+
+
+def vol_info(vol_id, domain_id="sd-id"):
+    return {
+        "domainID": domain_id,
+        "poolID": POOL_ID,
+        "imageID": "img-" + vol_id,
+        "volumeID": vol_id,
+        "name": "vd" + vol_id,
+    }
+
+
+def test_extend(manager, irs, clock):
+    completed = []
+    assert manager.extend(POOL_ID, vol_info("a"), 2048, completed.append)
+    assert len(irs.extensions) == 1
+    assert manager.stats()["inflight"] == 1
+
+    clock.now += 2.0
+    irs.reply(0)
+
+    assert completed == [vol_info("a")]
+    assert irs.refreshes == [("sd-id", POOL_ID, ["a"])]
+    stats = manager.stats()
+    assert stats["requests"] == 1
+    assert stats["completed"] == 1
+    assert stats["refreshes"] == 1
+    assert stats["inflight"] == 0
+    assert stats["latency_max"] == 2.0
+
+
+def test_extend_duplicate(manager, irs, clock):
+    assert manager.extend(POOL_ID, vol_info("a"), 2048, lambda v: None)
+    clock.now += TIMEOUT - 1
+    assert not manager.extend(POOL_ID, vol_info("a"), 3072, lambda v: None)
+    assert len(irs.extensions) == 1
+    assert manager.stats()["duplicates"] == 1
+
+
+def test_extend_after_completion(manager, irs):
+    manager.extend(POOL_ID, vol_info("a"), 2048, lambda v: None)
+    irs.reply(0)
+    assert manager.extend(POOL_ID, vol_info("a"), 3072, lambda v: None)
+    assert len(irs.extensions) == 2
+
+
+@pytest.mark.parametrize("error", [
+    "unexpected",
+    RuntimeError("unexpected"),
+])
+def test_extend_send_error(manager, irs, error):
+    irs.send_error = error
+    assert not manager.extend(POOL_ID, vol_info("a"), 2048, lambda v: None)
+    stats = manager.stats()
+    assert stats["requests"] == 0
+    assert stats["inflight"] == 0
+
+    # Retrying is not dropped as a duplicate.
+    irs.send_error = None
+    assert manager.extend(POOL_ID, vol_info("a"), 2048, lambda v: None)
+    assert len(irs.extensions) == 1
+    stats = manager.stats()
+    assert stats["requests"] == 1
+    assert stats["duplicates"] == 0
+    assert stats["inflight"] == 1
+
+
+def test_extend_after_timeout(manager, irs, clock):
+    completed = []
+    manager.extend(POOL_ID, vol_info("a"), 2048, completed.append)
+    clock.now += TIMEOUT
+    assert manager.extend(POOL_ID, vol_info("a"), 2048, completed.append)
+    assert len(irs.extensions) == 2
+
+    # Late reply for the first request does not drop the second request.
+    irs.reply(0)
+    assert manager.stats()["inflight"] == 1
+    irs.reply(1)
+    assert manager.stats()["inflight"] == 0
+    assert len(completed) == 2
+
+
+def test_batch_refresh(manager, irs):
+    completed = []
+    for vol_id in "abc":
+        manager.extend(POOL_ID, vol_info(vol_id), 2048, completed.append)
+    manager.extend(POOL_ID, vol_info("d", domain_id="sd2-id"), 2048,
+                   completed.append)
+
+    # Block the first refresh, so the other replies are queued.
+    irs.refresh_blocked = threading.Event()
+    first = threading.Thread(target=irs.reply, args=(0,))
+    first.start()
+    try:
+        assert irs.refresh_started.wait(1)
+        for i in range(1, 4):
+            irs.reply(i)
+        assert manager.stats()["refresh_queue"] == 3
+    finally:
+        irs.refresh_blocked.set()
+        first.join()
+
+    # The queued replies were refreshed by the first caller, using one
+    # refresh per domain.
+    assert sorted(irs.refreshes) == [
+        ("sd-id", POOL_ID, ["a"]),
+        ("sd-id", POOL_ID, ["b", "c"]),
+        ("sd2-id", POOL_ID, ["d"]),
+    ]
+    assert len(completed) == 4
+    stats = manager.stats()
+    assert stats["refreshes"] == 2
+    assert stats["refresh_queue"] == 0
+    assert stats["inflight"] == 0
+
+
+def test_refresh_error(manager, irs):
+    # The callback must be called to verify the volume size.
+    completed = []
+    irs.refresh_error = True
+    manager.extend(POOL_ID, vol_info("a"), 2048, completed.append)
+    irs.reply(0)
+    assert completed == [vol_info("a")]
+    assert manager.stats()["inflight"] == 0
+
+
+def test_callback_error(manager, irs):
+    def fail(vol_info):
+        raise RuntimeError("callback failed")
+
+    completed = []
+    manager.extend(POOL_ID, vol_info("a"), 2048, fail)
+    manager.extend(POOL_ID, vol_info("b"), 2048, completed.append)
+    irs.reply(0)
+    irs.reply(1)
+    assert completed == [vol_info("b")]
+    assert manager.stats()["completed"] == 2
+
+
+def test_latency_percentiles(manager, irs, clock):
+    for i in range(100):
+        manager.extend(POOL_ID, vol_info(str(i)), 2048, lambda v: None)
+        clock.now += 1
+    for i in range(100):
+        irs.reply(i)
+
+    # Latency of request i is 100 - i.
+    stats = manager.stats()
+    assert stats["latency_p50"] == 51
+    assert stats["latency_p90"] == 91
+    assert stats["latency_p99"] == 100
+    assert stats["latency_max"] == 100
+
+
+def test_stats_empty(manager):
+    assert manager.stats() == {
+        "requests": 0,
+        "duplicates": 0,
+        "completed": 0,
+        "refreshes": 0,
+        "inflight": 0,
+        "refresh_queue": 0,
+        "latency_p50": 0.0,
+        "latency_p90": 0.0,
+        "latency_p99": 0.0,
+        "latency_max": 0.0,
+    }
@@ -23,8 +23,11 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 from collections import namedtuple
+import errno
 import json
 import logging
+import socket
+import time
 import timeit
 
 import six
@@ -164,6 +167,37 @@ class TestFiltering(TestCaseBase):
                u"none": None}
         self.assertEqual(raw, guestagent._filterObject(raw))
 
+    def test_parse_line_escaped_chars(self):
+        agent = guestagent.GuestAgent(None, None, None, lambda: None,
+                                      lambda: None, lambda: None)
+        line = b'{"__name__": "x", "a\\u0000": ["b\\b", "c\\f", "d\\u001F"]}'
+        name, args = agent._parseLine(line)
+        self.assertEqual(name, u"x")
+        self.assertEqual(args, {u"a\ufffd": [u"b\ufffd", u"c\ufffd",
+                                             u"d\ufffd"]})
+
+    def test_parse_line_valid_chars(self):
+        agent = guestagent.GuestAgent(None, None, None, lambda: None,
+                                      lambda: None, lambda: None)
+        line = (b'{"__name__": "x", "a": "\\u00e9\\t\\n", '
+                b'"b": "\\ud83d\\ude00", "c": "\xc3\xa9"}')
+        name, args = agent._parseLine(line)
+        self.assertEqual(args, {u"a": u"\u00e9\t\n",
+                                u"b": json.loads(u'"\\ud83d\\ude00"'),
+                                u"c": u"\u00e9"})
+
+    def test_parse_line_skip_filtering(self):
+        agent = guestagent.GuestAgent(None, None, None, lambda: None,
+                                      lambda: None, lambda: None)
+
+        def fail(obj):
+            raise AssertionError("Unexpected filtering of %r" % obj)
+
+        line = b'{"__name__": "x", "a": ["b\\\\", "c\\n", 1]}'
+        with MonkeyPatchScope([(guestagent, "_filterObject", fail)]):
+            name, args = agent._parseLine(line)
+        self.assertEqual(args, {u"a": [u"b\\", u"c\n", 1]})
+
     @slowtest
     def test_filter_object_timing(self):
         setup = """
@@ -309,6 +343,131 @@ class TestGuestIFHandleData(TestCaseBase):
                     # the message should have been put into the guestInfo dict
                     self.assertEqual(self.fakeGuestAgent.guestInfo[k], v)
 
+    def testManyMessages(self):
+        self.fakeGuestAgent.MAX_MESSAGE_SIZE = 2 ** 20
+        data = b"".join(
+            self.dataToMessage("host-name", {"name": "host-%d" % i}).encode(
+                "utf-8")
+            for i in range(100))
+        self.fakeGuestAgent._handleData(data[:-10])
+        self.assertEqual(self.fakeGuestAgent.guestInfo["guestName"],
+                         "host-98")
+        self.fakeGuestAgent._handleData(data[-10:])
+        self.assertEqual(self.fakeGuestAgent.guestInfo["guestName"],
+                         "host-99")
+        self.assertEqual(len(self.fakeGuestAgent._buffer), 0)
+
+    def testRateLimit(self):
+        self.fakeGuestAgent.MAX_MESSAGE_SIZE = 2 ** 20
+        now = [100.0]
+        msg = self.dataToMessage("host-name", {"name": "%s"})
+        size = len(msg) - 1
+        self.fakeGuestAgent.MAX_RATE = size * 2
+        with MonkeyPatchScope([
+            (guestagent, "monotonic_time", lambda: now[0]),
+        ]):
+            for name in ("a", "b", "c"):
+                self.fakeGuestAgent._handleData(
+                    (msg % name).encode("utf-8"))
+            # The third message exceeded the rate.
+            self.assertEqual(self.fakeGuestAgent.guestInfo["guestName"], "b")
+
+            # Next second, the message is processed.
+            now[0] += 1
+            self.fakeGuestAgent._handleData((msg % "d").encode("utf-8"))
+            self.assertEqual(self.fakeGuestAgent.guestInfo["guestName"], "d")
+
+
+class FakeSocket(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.reads = 0
+
+    def recv(self, size):
+        if not self.data:
+            raise socket.error(errno.EAGAIN, "Try again")
+        self.reads += 1
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+class TestGuestIFChannelRead(TestCaseBase):
+
+    def setUp(self):
+        self.agent = guestagent.GuestAgent(None, None, self.log,
+                                           lambda: None,
+                                           lambda: None,
+                                           lambda: None)
+        self.agent._stopped = False
+
+    def test_read_budget(self):
+        self.agent.MAX_READ_SIZE = 2 ** 17
+        self.agent._sock = FakeSocket(b"x" * 2 ** 18)
+        self.assertTrue(self.agent._onChannelRead())
+        # Data left in the socket is read on the next event.
+        self.assertEqual(self.agent._sock.reads, 2)
+        self.assertEqual(len(self.agent._sock.data), 2 ** 17)
+        self.assertTrue(self.agent._onChannelRead())
+        self.assertEqual(self.agent._sock.reads, 4)
+        self.assertEqual(self.agent._sock.data, b"")
+
+    def test_read_until_would_block(self):
+        self.agent._sock = FakeSocket(b"x" * 100)
+        self.assertTrue(self.agent._onChannelRead())
+        self.assertEqual(self.agent._sock.reads, 1)
+
+
+class TestGuestIFThroughput(TestCaseBase):
+
+    GUESTS = 500
+
+    def messages(self):
+        apps = ["application-%d-1.0.%d.x86_64" % (i, i) for i in range(500)]
+        msgs = [
+            {"__name__": "heartbeat", "free-ram": 1024000,
+             "memory-stat": _INPUTS[0]["memory-stat"]},
+            {"__name__": "applications", "applications": apps},
+            {"__name__": "disks-usage", "disks": _INPUTS[5]["disks"]},
+            {"__name__": "host-name", "name": u"h\u00f4te"},
+        ]
+        return b"".join(json.dumps(m).encode("utf-8") + b"\n" for m in msgs)
+
+    @slowtest
+    def test_throughput(self):
+        agents = []
+        for i in range(self.GUESTS):
+            agent = guestagent.GuestAgent(None, None, self.log,
+                                          lambda: None,
+                                          lambda: None,
+                                          lambda: None)
+            agent._stopped = False
+            agents.append(agent)
+
+        data = self.messages()
+        chunk_size = 4096
+        chunks = [data[i:i + chunk_size]
+                  for i in range(0, len(data), chunk_size)]
+        rounds = 5
+
+        start = time.time()
+        for r in range(rounds):
+            # Like the channel listener, handle some data from every guest
+            # before handling more data from the same guest.
+            for chunk in chunks:
+                for agent in agents:
+                    agent._handleData(chunk)
+        elapsed = time.time() - start
+
+        total = len(data) * rounds * self.GUESTS
+        print("%d guests: %.2f MiB in %.2f seconds (%.2f MiB/s, "
+              "%d messages/s)" % (
+                  self.GUESTS, total / 2**20, elapsed,
+                  total / 2**20 / elapsed,
+                  4 * rounds * self.GUESTS / elapsed))
+        for agent in agents:
+            self.assertEqual(agent.guestInfo["guestName"], u"h\u00f4te")
+
 
 class DiskMappingTests(TestCaseBase):
 
@@ -26,6 +26,8 @@ import logging
 import threading
 import time
 
+import libvirt
+
 from vdsm import executor
 from vdsm import schedule
 from vdsm import throttledlog
@@ -33,7 +35,9 @@ from vdsm.common import exception
 from vdsm.common.time import monotonic_time
 from vdsm.virt import migration
 from vdsm.virt import periodic
+from vdsm.virt import sampling
 from vdsm.virt import vmstatus
+from vdsm.virt.vmdevices.storage import BlockInfo
 
 
 from monkeypatch import MonkeyPatchScope
@@ -46,6 +50,9 @@ import fakelib
 import vmfakelib as fake
 
 
+GB = 1024 ** 3
+
+
 @expandPermutations
 class TimeoutTests(TestCaseBase):
 
@@ -587,3 +594,186 @@ class PeriodicActionTests(TestCaseBase):
         vm.disk_devices = [ro_drive, rw_drive]
         periodic.UpdateVolumes(vm)._execute()
         self.assertEqual([d.name for d in vm.updated_drives], [rw_drive.name])
+
+
+class DriveWatermarkDispatcherTests(TestCaseBase):
+
+    def setUp(self):
+        self.clock = _FakeClock()
+        self.stats_cache = sampling.StatsCache(clock=self.clock)
+        self.conn = _FakeConnection()
+        self.vms = {}
+
+    def test_use_cached_stats(self):
+        vm = self._add_vm('vm-1')
+        self.clock.now = 10
+        self.stats_cache.put({'vm-1': _block_stats(1 * GB)}, 10)
+        self.clock.now = 11
+        self._dispatch()
+        self.assertEqual(self.conn.calls, [])
+        self.assertEqual(vm.monitored, [{'vda': _block_info(1 * GB)}])
+
+    def test_sample_stale_and_missing_stats(self):
+        stale = self._add_vm('vm-stale')
+        missing = self._add_vm('vm-missing')
+        self.clock.now = 10
+        self.stats_cache.put({'vm-stale': _block_stats(1 * GB)}, 10)
+        self.clock.now = 13
+        self.conn.stats = {'vm-stale': _block_stats(2 * GB),
+                           'vm-missing': _block_stats(3 * GB)}
+        self._dispatch()
+        # One call for all the VMs.
+        self.assertEqual([sorted(call) for call in self.conn.calls],
+                         [['vm-missing', 'vm-stale']])
+        self.assertEqual(stale.monitored, [{'vda': _block_info(2 * GB)}])
+        self.assertEqual(missing.monitored, [{'vda': _block_info(3 * GB)}])
+
+    def test_skip_vms_not_needing_monitoring(self):
+        vm = self._add_vm('vm-1', monitoring_needed=False)
+        self._dispatch()
+        self.assertEqual(self.conn.calls, [])
+        self.assertEqual(vm.monitored, [])
+
+    def test_fallback_on_error(self):
+        vm = self._add_vm('vm-1')
+        self.conn.fail = True
+        self._dispatch()
+        self.assertEqual(vm.monitored, [None])
+
+    def test_skip_unresponsive_vm(self):
+        vm = self._add_vm('vm-1')
+        unresponsive = self._add_vm('vm-unresponsive')
+        unresponsive.ready = False
+        disp = self._dispatcher()
+        disp()
+        self.assertEqual(self.conn.calls, [['vm-1']])
+        self.assertEqual(unresponsive.monitored, [])
+
+        # The VM is not sampled for a while, even if it looks responsive,
+        # and falls back to blockInfo().
+        unresponsive.ready = True
+        disp()
+        self.assertEqual(self.conn.calls, [['vm-1'], ['vm-1']])
+        self.assertEqual(unresponsive.monitored, [None])
+        self.assertEqual(len(vm.monitored), 2)
+
+    def test_skip_vms_of_blocked_call(self):
+        hung = self._add_vm('vm-hung')
+        blocked = self.conn.blocked['vm-hung'] = threading.Event()
+        disp = self._dispatcher()
+        t = threading.Thread(target=disp)
+        t.start()
+        try:
+            while not self.conn.calls:
+                time.sleep(0.01)
+            # The VMs of the blocked call fall back to blockInfo(), and
+            # the other VMs are sampled.
+            vm = self._add_vm('vm-1')
+            self.conn.stats = {'vm-1': _block_stats(1 * GB)}
+            disp()
+            self.assertEqual(self.conn.calls, [['vm-hung'], ['vm-1']])
+            self.assertEqual(hung.monitored, [None])
+            self.assertEqual(vm.monitored, [{'vda': _block_info(1 * GB)}])
+        finally:
+            blocked.set()
+            t.join()
+
+        # The VMs of the blocked call are skipped for a while.
+        disp()
+        self.assertEqual(self.conn.calls[2:], [['vm-1']])
+
+    def _add_vm(self, vm_id, monitoring_needed=True):
+        vm = _FakeWatermarkVM(vm_id, monitoring_needed)
+        self.vms[vm_id] = vm
+        return vm
+
+    def _dispatcher(self):
+        return periodic.DriveWatermarkDispatcher(
+            self.conn, lambda: self.vms, self.stats_cache, _FakeExecutor(),
+            timeout=1, max_age=2)
+
+    def _dispatch(self):
+        self._dispatcher()()
+
+
+class _FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class _FakeDriveMonitor(object):
+
+    def __init__(self, monitoring_needed):
+        self._monitoring_needed = monitoring_needed
+
+    def monitoring_needed(self):
+        return self._monitoring_needed
+
+
+class _FakeLibvirtDomain(object):
+
+    def __init__(self, vm_id):
+        self._vm_id = vm_id
+
+    def UUIDString(self):
+        return self._vm_id
+
+
+class _FakeDomain(object):
+
+    def __init__(self, vm_id):
+        self._dom = _FakeLibvirtDomain(vm_id)
+
+
+class _FakeWatermarkVM(_FakeVM):
+
+    def __init__(self, vm_id, monitoring_needed):
+        super(_FakeWatermarkVM, self).__init__(vm_id, vm_id)
+        self.drive_monitor = _FakeDriveMonitor(monitoring_needed)
+        self._dom = _FakeDomain(vm_id)
+        self.monitored = []
+        self.ready = True
+
+    def isDomainReadyForCommands(self):
+        return self.ready
+
+    def monitor_drives(self, block_info=None):
+        self.monitored.append(block_info)
+
+
+class _FakeConnection(object):
+
+    def __init__(self):
+        self.stats = {}
+        self.calls = []
+        self.fail = False
+        self.blocked = {}  # {vm_id: threading.Event}
+
+    def domainListGetStats(self, doms, stats=0, flags=0):
+        vm_ids = [dom.UUIDString() for dom in doms]
+        self.calls.append(vm_ids)
+        for vm_id in vm_ids:
+            if vm_id in self.blocked:
+                self.blocked[vm_id].wait()
+        if self.fail:
+            raise libvirt.libvirtError("Fake error")
+        return [(dom, self.stats[dom.UUIDString()]) for dom in doms
+                if dom.UUIDString() in self.stats]
+
+
+def _block_stats(allocation):
+    return {
+        'block.count': 1,
+        'block.0.name': 'vda',
+        'block.0.capacity': 10 * GB,
+        'block.0.allocation': allocation,
+        'block.0.physical': 5 * GB,
+    }
+
+
+def _block_info(allocation):
+    return BlockInfo(10 * GB, allocation, 5 * GB)
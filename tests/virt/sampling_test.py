@@ -222,11 +222,156 @@ class StatsCacheTests(TestCaseBase):
         self.assertTrue(res.is_empty())
         self.assertEqual(res.stats_age, 100)
 
+    def test_get_last(self):
+        self._feed_cache((
+            ({'a': 'foo'}, 1),
+        ))
+        self.fake_monotonic_time.freeze(value=3)
+        self.assertEqual(self.cache.get_last('a'), ('foo', 2))
+
+    def test_get_last_missing(self):
+        self.assertEqual(self.cache.get_last('a'), (None, None))
+        self._feed_cache((
+            ({'a': 'foo'}, 1),
+            ({'b': 'bar'}, 2),
+        ))
+        self.assertEqual(self.cache.get_last('a'), (None, None))
+
     def _feed_cache(self, samples):
         for sample in samples:
             self.cache.put(*sample)
 
 
+class StatsTableTests(TestCaseBase):
+
+    def setUp(self):
+        self.table = sampling.StatsTable(capacity=2)
+
+    def test_unknown_vm(self):
+        self.assertIs(self.table.deltas('x'), None)
+
+    def test_vm_counters(self):
+        self.table.put({'a': {'cpu.time': 10, 'cpu.user': 3}})
+        self.table.put({'a': {'cpu.time': 25, 'cpu.user': 4}})
+        deltas = self.table.deltas('a')
+        self.assertEqual(deltas.values,
+                         {'cpu.time': 15, 'cpu.user': 1})
+
+    def test_missing_in_first_sample(self):
+        self.table.put({'a': {'cpu.time': 10}})
+        self.table.put({'a': {'cpu.time': 25, 'cpu.user': 4}})
+        deltas = self.table.deltas('a')
+        self.assertEqual(deltas.values, {'cpu.time': 15})
+
+    def test_device_index_changes(self):
+        self.table.put({'a': {
+            'block.count': 2,
+            'block.0.name': 'hdc',
+            'block.0.rd.bytes': 100,
+            'block.1.name': 'vda',
+            'block.1.rd.bytes': 1000,
+        }})
+        self.table.put({'a': {
+            'block.count': 3,
+            'block.0.name': 'sda',
+            'block.0.rd.bytes': 1,
+            'block.1.name': 'vda',
+            'block.1.rd.bytes': 3000,
+            'block.2.name': 'hdc',
+            'block.2.rd.bytes': 200,
+        }})
+        deltas = self.table.deltas('a')
+        self.assertEqual(deltas.devices['block'], {'vda': 1, 'hdc': 2})
+        self.assertEqual(deltas.values, {
+            'block.1.rd.bytes': 2000,
+            'block.2.rd.bytes': 100,
+        })
+
+    def test_missing_device_name(self):
+        self.table.put({'a': {'net.count': 1, 'net.0.rx.bytes': 1}})
+        self.table.put({'a': {'net.count': 1, 'net.0.rx.bytes': 2}})
+        deltas = self.table.deltas('a')
+        self.assertEqual(deltas.devices['net'], {})
+        self.assertEqual(deltas.values, {})
+
+    def test_vm_not_in_last_sample(self):
+        self.table.put({'a': {'cpu.time': 1}, 'b': {'cpu.time': 1}})
+        self.table.put({'a': {'cpu.time': 2}})
+        self.assertEqual(self.table.deltas('a').values,
+                         {'cpu.time': 1})
+        self.assertEqual(self.table.deltas('b').values, {})
+
+    def test_grow(self):
+        vms = ['vm%d' % i for i in range(5)]
+        self.table.put(dict((vm, {'cpu.time': 0}) for vm in vms))
+        self.table.put(dict((vm, {'cpu.time': i})
+                            for i, vm in enumerate(vms)))
+        self.assertEqual(len(self.table), 5)
+        for i, vm in enumerate(vms):
+            self.assertEqual(self.table.deltas(vm).values,
+                             {'cpu.time': i})
+
+    def test_remove(self):
+        self.table.put({'a': {'cpu.time': 1}, 'b': {'cpu.time': 1}})
+        self.table.put({'a': {'cpu.time': 2}, 'b': {'cpu.time': 3}})
+        self.table.remove('a')
+        self.assertIs(self.table.deltas('a'), None)
+        # The row is reused, without leaking the counters of 'a'.
+        self.table.put({'c': {'cpu.time': 5}, 'b': {'cpu.time': 4}})
+        self.assertEqual(self.table.deltas('c').values, {})
+        self.assertEqual(self.table.deltas('b').values,
+                         {'cpu.time': 1})
+
+    def test_remove_unknown(self):
+        self.table.remove('x')
+        self.assertEqual(len(self.table), 0)
+
+
+class StatsCacheDeltasTests(TestCaseBase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = sampling.StatsCache(clock=self.clock,
+                                         table=sampling.StatsTable())
+
+    def test_no_table(self):
+        cache = sampling.StatsCache(clock=self.clock)
+        cache.put({'a': {'cpu.time': 1}}, 1)
+        cache.put({'a': {'cpu.time': 2}}, 2)
+        sample, deltas = cache.get_with_deltas('a')
+        self.assertFalse(sample.is_empty())
+        self.assertIs(deltas, None)
+
+    def test_empty(self):
+        sample, deltas = self.cache.get_with_deltas('a')
+        self.assertTrue(sample.is_empty())
+        self.assertIs(deltas, None)
+
+    def test_get_with_deltas(self):
+        self.cache.put({'a': {'cpu.time': 1}}, 1)
+        self.cache.put({'a': {'cpu.time': 3}}, 2)
+        sample, deltas = self.cache.get_with_deltas('a')
+        self.assertEqual(sample.last_value, {'cpu.time': 3})
+        self.assertEqual(deltas.values, {'cpu.time': 2})
+
+    def test_stale_sample_ignored(self):
+        self.cache.put({'a': {'cpu.time': 1}}, 1)
+        self.cache.put({'a': {'cpu.time': 3}}, 3)
+        self.cache.put({'a': {'cpu.time': 100}}, 2)
+        _, deltas = self.cache.get_with_deltas('a')
+        self.assertEqual(deltas.values, {'cpu.time': 2})
+
+    def test_remove(self):
+        self.cache.add('a')
+        self.cache.put({'a': {'cpu.time': 1}}, 1)
+        self.cache.put({'a': {'cpu.time': 3}}, 2)
+        self.cache.remove('a')
+        self.cache.put({'b': {'cpu.time': 3}}, 3)
+        sample, deltas = self.cache.get_with_deltas('a')
+        self.assertTrue(sample.is_empty())
+        self.assertIs(deltas, None)
+
+
 class NumaNodeMemorySampleTests(TestCaseBase):
 
     def _monkeyPatchedMemorySample(self, freeMemory, totalMemory):
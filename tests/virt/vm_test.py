@@ -874,6 +874,25 @@ class TestVm(XMLTestCase):
                 testvm._devices
             )
 
+    def testUpdateDomainDescriptorUnchanged(self):
+        with fake.VM() as testvm:
+            domain = testvm._domain
+            testvm._dom = fake.Domain(xml=domain.xml)
+            vm.Vm._updateDomainDescriptor(testvm)
+            self.assertIs(testvm._domain, domain)
+
+    def testUpdateDomainDescriptorChanged(self):
+        with fake.VM() as testvm:
+            domain = testvm._domain
+            xml = ('<domain><uuid>%s</uuid><devices><sound model="ich6"/>'
+                   '</devices></domain>' % testvm.id)
+            testvm._dom = fake.Domain(xml=xml)
+            vm.Vm._updateDomainDescriptor(testvm)
+            self.assertIsNot(testvm._domain, domain)
+            self.assertEqual(testvm._domain.xml, xml)
+            self.assertNotEqual(testvm._domain.devices_hash,
+                                domain.devices_hash)
+
 
 class ExpectedError(Exception):
     pass
@@ -21,6 +21,9 @@
 from __future__ import absolute_import
 from __future__ import division
 
+import threading
+import time
+
 import libvirt
 
 from vdsm.common import libvirtconnection
@@ -31,6 +34,7 @@ from vdsm.virt import recovery
 from monkeypatch import MonkeyPatchScope
 from monkeypatch import Patch
 from testlib import VdsmTestCase as TestCaseBase
+from testlib import make_config
 from testlib import permutations, expandPermutations
 import vmfakelib as fake
 
@@ -139,6 +143,60 @@ class TestAllDomains(TestCaseBase):
             set(('b',))
         )
 
+    def test_domain_unexpected_error(self):
+        """
+        Unexpected error fetching a domain XML fails the recovery before
+        recovering any domain, so it can be retried.
+        """
+        def fail(*args, **kwargs):
+            raise libvirt.libvirtError("Fake error")
+
+        self.conn.domains['a'].XMLDesc = fail
+        with self.assertRaises(libvirt.libvirtError):
+            recovery.all_domains(self.cif)
+        self.assertEqual(self.cif.vmRequests, {})
+
+    def test_recover_many_domains(self):
+        vm_uuids = ['vm-%03d' % i for i in range(300)]
+        self.conn.domains = _make_domains_collection(
+            [(vm_uuid, False) for vm_uuid in vm_uuids])
+        timings = recovery.all_domains(self.cif)
+        self.assertEqual(set(self.cif.vmRequests), set(vm_uuids))
+        self.assertEqual(sorted(timings), ['fetch', 'parse', 'register'])
+
+    def test_recover_concurrently(self):
+        workers = 10
+        running = [0]
+        max_running = [0]
+        lock = threading.Lock()
+        create_vm = self.cif.createVm
+
+        def slow_create_vm(vmParams, vmRecover=False):
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return create_vm(vmParams, vmRecover=vmRecover)
+
+        vm_uuids = ['vm-%03d' % i for i in range(200)]
+        self.conn.domains = _make_domains_collection(
+            [(vm_uuid, False) for vm_uuid in vm_uuids])
+        cfg = make_config([('vars', 'recovery_workers', str(workers))])
+        with MonkeyPatchScope([
+            (recovery, 'config', cfg),
+            (self.cif, 'createVm', slow_create_vm),
+        ]):
+            start = time.time()
+            recovery.all_domains(self.cif)
+            elapsed = time.time() - start
+
+        self.assertEqual(set(self.cif.vmRequests), set(vm_uuids))
+        self.assertEqual(max_running[0], workers)
+        # Recovering serially would take more than 2 seconds.
+        self.assertLess(elapsed, 1.0)
+
     def test_recover_and_destroy_failure(self):
         """
         We find VMs to recover through libvirt, but Vdsm fail to create
@@ -23,10 +23,13 @@ from __future__ import division
 
 import copy
 import logging
+import time
 import uuid
 
+import pytest
 import six
 
+from vdsm.virt import sampling
 from vdsm.virt import vmstats
 
 from fakelib import FakeLogger
@@ -638,6 +641,84 @@ class BalloonStatsTests(VmStatsTestCase):
 
 # helpers
 
+@expandPermutations
+class ProduceWithDeltasTests(VmStatsTestCase):
+
+    def setUp(self):
+        super(ProduceWithDeltasTests, self).setUp()
+        first, last = copy.deepcopy(self.samples)
+        _ensure_delta(first, last, 'cpu.time', 2 * 10 ** 9)
+        _ensure_delta(first, last, 'block.0.wr.bytes', 4096)
+        _ensure_delta(first, last, 'block.2.wr.bytes', 8192)
+        _ensure_delta(first, last, 'block.0.wr.reqs', 2)
+        _ensure_delta(first, last, 'block.2.wr.reqs', 4)
+        _ensure_delta(first, last, 'block.0.wr.times', 2000)
+        _ensure_delta(first, last, 'block.2.wr.times', 3000)
+        last['balloon.available'] = 4194304
+        last['balloon.swap_in'] = 100
+        first['balloon.swap_in'] = 0
+        self.first = first
+        self.last = last
+        self.vm = FakeVM(
+            nics=(FakeNic(name='vnet0', model='virtio',
+                          mac_addr='00:1a:4a:16:01:51',
+                          is_hostdevice=False),
+                  FakeNic(name='vnet1', model='virtio',
+                          mac_addr='00:1a:4a:16:01:52',
+                          is_hostdevice=False)),
+            drives=(FakeDrive(name='hdc', size=700 * 1024 * 1024),
+                    FakeDrive(name='hdd', size=700 * 1024 * 1024),
+                    FakeDrive(name='vda', size=10 * 1024 * 1024 * 1024)))
+
+    def test_same_stats(self):
+        table = sampling.StatsTable()
+        table.put({self.vm.id: self.first})
+        table.put({self.vm.id: self.last})
+        deltas = table.deltas(self.vm.id)
+
+        expected = vmstats.produce(self.vm, self.first, self.last,
+                                   self.interval)
+        actual = vmstats.produce(self.vm, self.first, self.last,
+                                 self.interval, deltas)
+        for stats in (expected, actual):
+            for nic_stats in six.itervalues(stats['network']):
+                del nic_stats['sampleTime']
+
+        self.assertEqual(actual, expected)
+
+    @pytest.mark.stress
+    @permutations([(50,), (500,), (2000,)])
+    def test_benchmark(self, vms_count):
+        vms = [copy.copy(self.vm) for _ in range(vms_count)]
+        for vm in vms:
+            vm.id = str(uuid.uuid4())
+        first = dict((vm.id, self.first) for vm in vms)
+        last = dict((vm.id, self.last) for vm in vms)
+
+        start = time.time()
+        for vm in vms:
+            vmstats.produce(vm, first[vm.id], last[vm.id], self.interval)
+        dict_elapsed = time.time() - start
+
+        # Filling the table happens in the sampling thread, not while
+        # serving getAllVmStats, so it is reported on its own.
+        start = time.time()
+        table = sampling.StatsTable()
+        table.put(first)
+        table.put(last)
+        put_elapsed = time.time() - start
+
+        start = time.time()
+        for vm in vms:
+            vmstats.produce(vm, first[vm.id], last[vm.id], self.interval,
+                            table.deltas(vm.id))
+        table_elapsed = time.time() - start
+
+        print("%d vms: produce with dicts %.3fs, with table %.3fs, "
+              "table put %.3fs"
+              % (vms_count, dict_elapsed, table_elapsed, put_elapsed))
+
+
 def _ensure_delta(stats_before, stats_after, key, delta):
     """
     Set stats_before[key] and stats_after[key] so that
@@ -647,6 +728,124 @@ def _ensure_delta(stats_before, stats_after, key, delta):
     stats_after[key] = abs(delta)
 
 
+class StatsTrackerTests(VmStatsTestCase):
+
+    def setUp(self):
+        self.tracker = vmstats.StatsTracker(history=2)
+        self.vm1 = {'vmId': 'vm1', 'status': 'Up', 'cpuUser': '1.00'}
+        self.vm2 = {'vmId': 'vm2', 'status': 'Up', 'cpuUser': '2.00'}
+
+    def test_first_report_is_full(self):
+        delta = self.tracker.delta([self.vm1, self.vm2])
+        self.assertTrue(delta['full'])
+        self.assertEqual(
+            sorted(delta['changed'], key=lambda stats: stats['vmId']),
+            [self.vm1, self.vm2])
+        self.assertEqual(delta['removedFields'], {})
+        self.assertEqual(delta['removed'], [])
+
+    def test_unknown_token_is_full(self):
+        delta = self.tracker.delta([self.vm1], since='no-such-token')
+        self.assertTrue(delta['full'])
+        self.assertEqual(delta['changed'], [self.vm1])
+
+    def test_tokens_are_unique(self):
+        first = self.tracker.delta([self.vm1])
+        second = self.tracker.delta([self.vm1])
+        other = vmstats.StatsTracker().delta([self.vm1])
+        self.assertEqual(
+            len(set([first['token'], second['token'], other['token']])), 3)
+
+    def test_unchanged(self):
+        token = self.tracker.delta([self.vm1, self.vm2])['token']
+        delta = self.tracker.delta([self.vm1, self.vm2], since=token)
+        self.assertFalse(delta['full'])
+        self.assertEqual(delta['changed'], [])
+        self.assertEqual(delta['removed'], [])
+
+    def test_changed_fields_only(self):
+        token = self.tracker.delta([self.vm1, self.vm2])['token']
+        vm1 = dict(self.vm1, cpuUser='5.00', guestName='guest')
+        delta = self.tracker.delta([vm1, self.vm2], since=token)
+        self.assertEqual(
+            delta['changed'],
+            [{'vmId': 'vm1', 'cpuUser': '5.00', 'guestName': 'guest'}])
+
+    def test_removed_fields(self):
+        token = self.tracker.delta([self.vm1, self.vm2])['token']
+        vm1 = {'vmId': 'vm1', 'status': 'Paused'}
+        vm2 = {'vmId': 'vm2', 'status': 'Up'}
+        delta = self.tracker.delta([vm1, vm2], since=token)
+        self.assertEqual(
+            sorted(delta['changed'], key=lambda stats: stats['vmId']),
+            [{'vmId': 'vm1', 'status': 'Paused'}, {'vmId': 'vm2'}])
+        self.assertEqual(
+            delta['removedFields'], {'vm1': ['cpuUser'], 'vm2': ['cpuUser']})
+
+    def test_no_removed_fields(self):
+        token = self.tracker.delta([self.vm1])['token']
+        vm1 = dict(self.vm1, cpuUser='5.00')
+        delta = self.tracker.delta([vm1], since=token)
+        self.assertEqual(delta['removedFields'], {})
+
+    def test_added_and_removed_vms(self):
+        token = self.tracker.delta([self.vm1])['token']
+        delta = self.tracker.delta([self.vm2], since=token)
+        self.assertEqual(delta['changed'], [self.vm2])
+        self.assertEqual(delta['removed'], ['vm1'])
+
+    def test_nested_changes(self):
+        self.vm1['network'] = {'vnet0': {'rxDropped': '0'}}
+        token = self.tracker.delta([self.vm1])['token']
+        # The caller may change the stats it reported, we must not miss it.
+        self.vm1['network']['vnet0']['rxDropped'] = '1'
+        delta = self.tracker.delta([self.vm1], since=token)
+        self.assertEqual(
+            delta['changed'],
+            [{'vmId': 'vm1', 'network': {'vnet0': {'rxDropped': '1'}}}])
+
+    def test_nested_unchanged(self):
+        self.vm1['disks'] = {'vda': {'readBytes': '0'}, 'vdb': {}}
+        self.vm1['ioTune'] = [{'name': 'vda'}]
+        token = self.tracker.delta([self.vm1])['token']
+        vm1 = dict(self.vm1, disks={'vdb': {}, 'vda': {'readBytes': '0'}},
+                   ioTune=[{'name': 'vda'}])
+        delta = self.tracker.delta([vm1], since=token)
+        self.assertEqual(delta['changed'], [])
+
+    def test_scalar_replaced_by_nested(self):
+        self.vm1['guestIPs'] = ''
+        token = self.tracker.delta([self.vm1])['token']
+        vm1 = dict(self.vm1, guestIPs=[''])
+        delta = self.tracker.delta([vm1], since=token)
+        self.assertEqual(delta['changed'], [{'vmId': 'vm1', 'guestIPs': ['']}])
+
+    def test_scalar_type_changed(self):
+        self.vm1['guestCPUCount'] = 1
+        token = self.tracker.delta([self.vm1])['token']
+        vm1 = dict(self.vm1, guestCPUCount=True)
+        delta = self.tracker.delta([vm1], since=token)
+        self.assertEqual(
+            delta['changed'], [{'vmId': 'vm1', 'guestCPUCount': True}])
+
+    def test_expired_token(self):
+        token = self.tracker.delta([self.vm1])['token']
+        self.tracker.delta([self.vm1])
+        self.tracker.delta([self.vm1])
+        delta = self.tracker.delta([self.vm1], since=token)
+        self.assertTrue(delta['full'])
+
+    def test_independent_clients(self):
+        first = self.tracker.delta([self.vm1])['token']
+        vm1 = dict(self.vm1, cpuUser='5.00')
+        second = self.tracker.delta([vm1])['token']
+        self.assertEqual(
+            self.tracker.delta([vm1], since=first)['changed'],
+            [{'vmId': 'vm1', 'cpuUser': '5.00'}])
+        self.assertEqual(
+            self.tracker.delta([vm1], since=second)['changed'], [])
+
+
 class FakeNic(object):
 
     def __init__(self, name, model, mac_addr, is_hostdevice):
@@ -667,6 +866,7 @@ class FakeDrive(object):
         self.domainID = str(uuid.uuid4())
         self.poolID = str(uuid.uuid4())
         self.volumeID = str(uuid.uuid4())
+        self.iotune = {}
 
     def __contains__(self, item):
         # isVdsmImage support